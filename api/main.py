@@ -1,29 +1,222 @@
 """
 API REST para Shelu Music Studio
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
 import sys
 import json
-from datetime import datetime
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import unquote
 
 # Añadir src al path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from src.youtube_service import search_youtube, download_audio
-from src.separation_service import separate_audio_task, get_separation_status
-from src.file_manager import organize_by_artist, list_songs, get_separated_files, get_music_tree, get_library_stats
+from src.youtube_service import search_youtube
+from src.separation_service import get_separation_status
+from src.file_manager import organize_by_artist, list_songs, get_separated_files, get_music_tree, get_library_stats, resolve_music_file, library_metrics
+from src.task_store import FINISHED_STATUSES, get_task_store
+from src.jobs import (
+    JobWorker,
+    submit_job,
+    submit_unique_job,
+    is_finished,
+    preempt_batch_jobs,
+    queue_metrics,
+    stream_filter,
+)
+from src.metrics import REGISTRY, HTTP_REQUEST_SECONDS, render_metrics, start_snapshot_writer
+from src.profiling import (
+    SamplingProfiler,
+    PROFILE_FORMATS,
+    available_formats,
+    new_profile_id,
+    profile_path,
+    save_sampling_profile,
+    should_profile_request,
+)
+from src.mixdown import parse_mix_settings, stream_mix
+from src.waveform import generate_peaks, encode_peak_level, audio_duration
+from src.stem_container import playable_file
+from src.capabilities import capability_report
+from src.scheduling import AdmissionRejected, check_admission, fair_key_for, validate_priority
+from src.analysis import shutdown_analysis_pool
+from src.batch_export import DEFAULT_EXPORT_MODEL, archive_path_for, plan_export
+from src.excerpts import excerpt_stem_path, excerpt_urls, find_excerpt, validate_window
+from src.storage import maintain_storage, record_access
+from src.config import TASK_EVICT_INTERVAL, JOB_MODE, MUSIC_DIR, STORAGE_INTERVAL, DOWNLOAD_WAIT_TIMEOUT
+
+
+# Estado de tareas (compartido entre workers y persistente entre reinicios)
+task_store = get_task_store()
+
+# Intervalo de revisión del stream de tareas y de keep-alive (segundos)
+TASK_STREAM_INTERVAL = 0.5
+TASK_STREAM_KEEPALIVE = 15
+
+# Intervalo de espera a que termine una descarga (segundos)
+DOWNLOAD_WAIT_INTERVAL = 0.25
+
+
+async def evict_tasks_periodically():
+    """
+    Eliminar de forma periódica las tareas terminadas caducadas
+    """
+    while True:
+        await asyncio.sleep(TASK_EVICT_INTERVAL)
+        try:
+            evicted = await asyncio.to_thread(task_store.evict_expired)
+            if evicted:
+                print(f"🧹 {evicted} tareas caducadas eliminadas")
+        except Exception as e:
+            print(f"Error al limpiar tareas: {e}")
+
+
+async def maintain_storage_periodically():
+    """
+    Limpiar temporales abandonados y aplicar los presupuestos de disco
+    
+    Con varios workers de uvicorn sólo limpia el que tiene el turno
+    (``acquire_lease``); si muere, otro lo toma en la siguiente pasada tras
+    caducar.
+    """
+    while True:
+        try:
+            if await asyncio.to_thread(task_store.acquire_lease, "storage", STORAGE_INTERVAL * 1.5):
+                await asyncio.to_thread(maintain_storage)
+        except Exception as e:
+            print(f"Error al limpiar el almacenamiento: {e}")
+        await asyncio.sleep(STORAGE_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Recuperar tareas interrumpidas al arrancar y lanzar las limpiezas
+    periódicas (tareas caducadas y almacenamiento)
+    """
+    recovered = task_store.recover_interrupted()
+    if recovered:
+        print(f"⚠️  {recovered} tareas interrumpidas recuperadas (los trabajos vuelven a la cola)")
+    task_store.evict_expired()
+    
+    # Métricas: estado compartido calculado al leer y snapshot de este proceso
+    REGISTRY.add_collector(lambda: queue_metrics(task_store))
+    REGISTRY.add_collector(library_metrics)
+    start_snapshot_writer()
+    
+    # En modo inline este proceso ejecuta también los trabajos encolados;
+    # en modo external lo hacen los procesos de src/worker.py
+    job_worker = None
+    if JOB_MODE == "inline":
+        job_worker = JobWorker(task_store)
+        job_worker.start()
+    
+    eviction = asyncio.create_task(evict_tasks_periodically())
+    storage = asyncio.create_task(maintain_storage_periodically())
+    yield
+    eviction.cancel()
+    storage.cancel()
+    if job_worker:
+        job_worker.stop(timeout=5)
+    shutdown_analysis_pool()
+
 
 app = FastAPI(
     title="Shelu Music Studio API",
     description="API para descarga y separación de audio de YouTube",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Ruta (plantilla) de cada endpoint para etiquetar las métricas HTTP
+_route_paths = {}
+
+
+def route_label(request: Request) -> str:
+    """
+    Plantilla de la ruta atendida (``/api/task/{task_id}``) o ``unmatched``
+    """
+    endpoint = request.scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if not _route_paths:
+        for route in app.routes:
+            _route_paths[getattr(route, "endpoint", None) or getattr(route, "app", None)] = route.path
+    return _route_paths.get(endpoint, "unmatched")
+
+
+@app.middleware("http")
+async def http_metrics(request: Request, call_next):
+    """
+    Medir la latencia de cada petición por ruta
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route_label(request),
+            status=str(status)
+        )
+
+
+@app.middleware("http")
+async def request_profiling(request: Request, call_next):
+    """
+    Perfilar la petición por muestreo si se pidió (ver ``src/profiling.py``)
+    
+    El ID del perfil se devuelve en la cabecera ``X-Profile-Id``.
+    """
+    if not should_profile_request(request.url.path, request.headers):
+        return await call_next(request)
+    
+    profile_id = new_profile_id("request")
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+        await asyncio.to_thread(save_sampling_profile, profiler, profile_id)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+@app.middleware("http")
+async def preview_cache_headers(request: Request, call_next):
+    """
+    Permitir cachear los segmentos y manifiestos de previsualización
+    """
+    response = await call_next(request)
+    if ".preview/" in request.url.path and response.status_code in (200, 206, 304):
+        response.headers.setdefault("Cache-Control", "public, max-age=3600")
+    return response
+
+
+@app.middleware("http")
+async def library_access(request: Request, call_next):
+    """
+    Registrar el uso de las canciones servidas desde /music (pistas,
+    previsualizaciones) para borrar antes las que no se usan
+    """
+    response = await call_next(request)
+    if request.url.path.startswith("/music/") and response.status_code in (200, 206, 304):
+        path = os.path.join(MUSIC_DIR, unquote(request.url.path[len("/music/"):]))
+        await asyncio.to_thread(record_access, path)
+    return response
+
+
 # Montar directorio de archivos estáticos
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/music", StaticFiles(directory="music"), name="music")
@@ -46,10 +239,15 @@ class SeparateRequest(BaseModel):
     file_path: str
     model: str = "htdemucs_6s"
     artist: Optional[str] = None
+    priority: str = "interactive"  # interactive o batch
+    user: Optional[str] = None  # clave de reparto justo (por defecto el artista)
+    start: Optional[float] = None  # con start/duration sólo se separa ese fragmento
+    duration: Optional[float] = None
 
 
-# Estado de tareas
-tasks_status = {}
+class ExportRequest(BaseModel):
+    artist: Optional[str] = None  # None = toda la biblioteca
+    model: str = DEFAULT_EXPORT_MODEL  # para las canciones sin pistas
 
 
 @app.get("/")
@@ -71,100 +269,373 @@ async def search_music(request: SearchRequest):
 
 
 @app.post("/api/download")
-async def download_music(request: DownloadRequest, background_tasks: BackgroundTasks):
+async def download_music(request: DownloadRequest, http_request: Request):
     """
     Descargar audio de YouTube
+    
+    La descarga se encola y la ejecuta un worker; la petición espera a que
+    termine sin ocupar un hilo. Las peticiones del mismo video se unen a la
+    descarga en curso. Si no termina en SHELU_DOWNLOAD_WAIT_TIMEOUT se
+    responde 202 con el ``task_id`` para seguirla en /api/task/{task_id}.
     """
+    # Validar que el artista no esté vacío
+    if not request.artist or not request.artist.strip():
+        raise HTTPException(status_code=400, detail="El nombre del artista es obligatorio")
+    
     try:
-        # Validar que el artista no esté vacío
-        if not request.artist or not request.artist.strip():
-            raise HTTPException(status_code=400, detail="El nombre del artista es obligatorio")
-        
-        # Generar ID de tarea
-        task_id = f"download_{request.video_id}_{datetime.now().timestamp()}"
-        
-        # Inicializar estado
-        tasks_status[task_id] = {
-            "status": "downloading",
-            "progress": 0,
-            "message": "Descargando audio..."
-        }
-        
-        # Descargar en segundo plano
-        file_path = download_audio(
-            video_id=request.video_id,
-            title=request.title,
-            artist=request.artist
+        task, _ = await asyncio.to_thread(
+            submit_unique_job,
+            task_store,
+            "download",
+            {
+                "video_id": request.video_id,
+                "title": request.title,
+                "artist": request.artist,
+                "profile": should_profile_request(http_request.url.path, http_request.headers)
+            },
+            ["video_id"]
         )
+        task_id = task["task_id"]
         
-        if file_path:
-            tasks_status[task_id] = {
-                "status": "completed",
-                "progress": 100,
-                "message": "Descarga completada",
-                "file_path": file_path
-            }
-            return {
-                "success": True,
-                "task_id": task_id,
-                "file_path": file_path
-            }
-        else:
-            tasks_status[task_id] = {
-                "status": "error",
-                "message": "Error al descargar"
-            }
-            raise HTTPException(status_code=500, detail="Error al descargar el audio")
-            
+        deadline = time.monotonic() + DOWNLOAD_WAIT_TIMEOUT
+        while not is_finished(task) and time.monotonic() < deadline:
+            await asyncio.sleep(DOWNLOAD_WAIT_INTERVAL)
+            task = await asyncio.to_thread(task_store.get, task_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if not is_finished(task):
+        return JSONResponse(
+            status_code=202,
+            content={"success": True, "task_id": task_id, "status": task["status"]}
+        )
+    
+    if task is None or task["status"] != "completed":
+        raise HTTPException(status_code=500, detail="Error al descargar el audio")
+    
+    return {
+        "success": True,
+        "task_id": task_id,
+        "file_path": task["file_path"]
+    }
 
 
 @app.post("/api/separate")
-async def separate_music(request: SeparateRequest, background_tasks: BackgroundTasks):
+def separate_music(request: SeparateRequest, http_request: Request):
     """
     Separar audio en pistas
+    
+    La separación se encola; su progreso se consulta en /api/task/{task_id}
+    o /api/tasks/stream. Si la espera estimada para su prioridad supera el
+    límite se responde 429 con ``Retry-After``.
+    
+    Con ``start`` y/o ``duration`` sólo se separa ese fragmento (ver
+    ``src/excerpts.py``).
     """
     try:
-        # Generar ID de tarea
-        task_id = f"separate_{datetime.now().timestamp()}"
-        
-        # Inicializar estado
-        tasks_status[task_id] = {
-            "status": "processing",
-            "progress": 0,
-            "message": "Iniciando separación..."
-        }
-        
-        # Ejecutar separación en segundo plano
-        background_tasks.add_task(
-            separate_audio_task,
-            task_id=task_id,
+        priority = validate_priority(request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if request.start is not None or request.duration is not None:
+        return separate_excerpt_request(request)
+    
+    try:
+        check_admission(task_store, priority)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after + 0.5))}
+        )
+    
+    try:
+        task = submit_job(
+            task_store,
+            "separate",
+            {
+                "file_path": request.file_path,
+                "model": request.model,
+                "artist": request.artist,
+                "profile": should_profile_request(http_request.url.path, http_request.headers)
+            },
             file_path=request.file_path,
             model=request.model,
-            artist=request.artist,
-            tasks_status=tasks_status
+            priority=priority,
+            fair_key=fair_key_for(request.user, request.artist, request.file_path)
         )
+        if priority != "batch":
+            preempt_batch_jobs(task_store)
         
         return {
             "success": True,
-            "task_id": task_id,
-            "message": "Separación iniciada"
+            "task_id": task["task_id"],
+            "message": "Separación en cola"
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def separate_excerpt_request(request: SeparateRequest):
+    """
+    Separar sólo un fragmento de la canción
+    
+    Si el fragmento ya está separado se devuelven sus pistas directamente;
+    si no, se encola un trabajo ``excerpt`` (no pasa por el control de
+    admisión: son unos segundos de audio).
+    """
+    try:
+        file_path = resolve_music_file(request.file_path)
+        start, duration = validate_window(request.start, request.duration)
+        length = audio_duration(file_path)
+        if length is not None and start >= length:
+            raise ValueError("El fragmento empieza después del final de la canción")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        excerpt = find_excerpt(file_path, start, duration, request.model)
+        if excerpt:
+            return {
+                "success": True,
+                "excerpt_id": excerpt["excerpt_id"],
+                "stems": excerpt_urls(excerpt),
+                "message": "Fragmento ya separado"
+            }
+        
+        job = {"file_path": file_path, "start": start, "duration": duration, "model": request.model}
+        task, created = submit_unique_job(
+            task_store, "excerpt", job, list(job), file_path=file_path, model=request.model
+        )
+        return {
+            "success": True,
+            "task_id": task["task_id"],
+            "message": "Fragmento en cola" if created else "Fragmento en curso"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/excerpt/{excerpt_id}/{stem}")
+def get_excerpt_stem(excerpt_id: str, stem: str):
+    """
+    Servir una pista de un fragmento separado
+    """
+    try:
+        path = excerpt_stem_path(excerpt_id, stem)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return FileResponse(path, media_type="audio/mpeg", headers={"Cache-Control": "public, max-age=3600"})
+
+
+@app.post("/api/export/instrumental")
+def export_instrumentals(request: ExportRequest):
+    """
+    Exportar las versiones instrumentales de un artista o de la biblioteca
+    
+    La exportación se encola (una sola a la vez por artista); al terminar la
+    tarea incluye ``download_url`` con el ZIP. Repetirla tras una
+    interrupción reutiliza las canciones ya generadas.
+    """
+    try:
+        songs = plan_export(request.artist)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not songs:
+        raise HTTPException(status_code=400, detail="No hay canciones que exportar")
+    
+    try:
+        task, created = submit_unique_job(
+            task_store,
+            "export",
+            {"artist": request.artist, "model": request.model},
+            ["artist"],
+            artist=request.artist,
+            total_songs=len(songs)
+        )
+        return {
+            "success": True,
+            "task_id": task["task_id"],
+            "total_songs": len(songs),
+            "message": "Exportación en cola" if created else "Exportación en curso"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/export/{export_id}/archive")
+def download_export(export_id: str):
+    """
+    Descargar el ZIP de una exportación terminada
+    """
+    try:
+        archive_path = archive_path_for(export_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.exists(archive_path):
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return FileResponse(
+        archive_path,
+        media_type="application/zip",
+        filename=os.path.basename(archive_path)
+    )
+
+
 @app.get("/api/task/{task_id}")
-async def get_task_status(task_id: str):
+def get_task_status(task_id: str):
     """
     Obtener estado de una tarea
     """
-    if task_id not in tasks_status:
+    task = task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Tarea no encontrada")
     
-    return tasks_status[task_id]
+    return task
+
+
+@app.delete("/api/task/{task_id}")
+def cancel_task(task_id: str):
+    """
+    Cancelar una tarea
+    
+    Una tarea en cola se cancela al momento. Una en marcha queda marcada
+    (``cancel_requested``) y se detiene en su siguiente punto de cancelación
+    (el subproceso de Demucs se termina, la inferencia en proceso para entre
+    segmentos y la descarga entre bloques); su estado pasa a ``cancelled``
+    y se borran los archivos a medio generar.
+    """
+    task = task_store.cancel(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    if task["status"] in FINISHED_STATUSES and task["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail="La tarea ya ha terminado")
+    
+    return {
+        "success": True,
+        "task": task,
+        "message": "Tarea cancelada" if task["status"] == "cancelled" else "Cancelando tarea"
+    }
+
+
+@app.get("/api/tasks")
+def list_tasks(
+    ids: Optional[str] = None,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    since: Optional[float] = None,
+    limit: int = 500
+):
+    """
+    Obtener varias tareas en una sola petición junto con métricas de la cola
+    
+    Args:
+        ids: IDs de tareas separados por comas
+        status: Estados separados por comas (admite running, queued, finished)
+        type: Tipo de tarea (download, separate)
+        since: Sólo tareas modificadas desde este timestamp (segundos epoch)
+        limit: Máximo de tareas devueltas
+    """
+    try:
+        task_ids = list(filter(None, ids.split(","))) if ids is not None else None
+        statuses = list(filter(None, status.split(","))) if status else None
+        
+        tasks = task_store.list_tasks(
+            ids=task_ids,
+            statuses=statuses,
+            task_type=type,
+            since=since,
+            limit=max(1, min(limit, 5000))
+        )
+        return {"success": True, "tasks": tasks, "queue": task_store.queue_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/tasks/stream")
+async def stream_tasks(ids: Optional[str] = None, type: Optional[str] = None):
+    """
+    Emitir los cambios de estado de las tareas (Server-Sent Events)
+    
+    Cada cambio se envía como un evento ``task`` con el estado completo de la
+    tarea. Con ``ids`` (separados por comas) sólo se envían esas tareas, y al
+    conectar se envía su estado para que el cliente recupere lo que se haya
+    perdido durante una reconexión. Con ``type`` (separados por comas) sólo
+    las de esos tipos; sin ``type`` ni ``ids`` no se envían los trabajos
+    internos (``artifacts``).
+    """
+    initial_ids = list(filter(None, (ids or "").split(",")))
+    wanted = stream_filter(
+        initial_ids if ids is not None else None,
+        list(filter(None, type.split(","))) if type else None
+    )
+    
+    async def event_stream():
+        # Sólo interesan los cambios a partir de ahora
+        cursor = await asyncio.to_thread(task_store.current_cursor)
+        last_message = time.monotonic()
+        
+        yield "retry: 3000\n\n"
+        
+        for task_id in initial_ids:
+            task = await asyncio.to_thread(task_store.get, task_id)
+            if task and wanted(task):
+                yield f"event: task\ndata: {json.dumps(task, default=str)}\n\n"
+        
+        while True:
+            cursor, changed = await asyncio.to_thread(task_store.changes_since, cursor)
+            for task in filter(wanted, changed):
+                yield f"event: task\ndata: {json.dumps(task, default=str)}\n\n"
+                last_message = time.monotonic()
+            
+            if time.monotonic() - last_message > TASK_STREAM_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_message = time.monotonic()
+            
+            await asyncio.sleep(TASK_STREAM_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Métricas en formato de texto de Prometheus
+    
+    Incluye las de todos los procesos (API y workers) que comparten ``data/``.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/profile/{profile_id}")
+def get_profile(profile_id: str, format: Optional[str] = None):
+    """
+    Descargar el perfil de una tarea o petición
+    
+    Args:
+        profile_id: ID de la tarea o valor de la cabecera X-Profile-Id
+        format: speedscope o pstats (por defecto el primero disponible)
+    """
+    formats = available_formats(profile_id)
+    if not formats:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    
+    profile_format = format or formats[0]
+    if profile_format not in formats:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Formato no disponible; disponibles: {', '.join(formats)}"
+        )
+    
+    return FileResponse(
+        profile_path(profile_id, profile_format),
+        media_type="application/json" if profile_format == "speedscope" else "application/octet-stream",
+        filename=profile_id + PROFILE_FORMATS[profile_format]
+    )
 
 
 @app.get("/api/songs")
@@ -191,6 +662,93 @@ async def get_separated(song_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/mix/{artist}/{song}")
+def mix_song(
+    artist: str,
+    song: str,
+    gain: Optional[str] = None,
+    mute: Optional[str] = None,
+    pan: Optional[str] = None,
+    format: str = "mp3",
+    bitrate: str = "192k",
+    normalize: bool = False
+):
+    """
+    Mezclar las pistas de una canción en el servidor
+    
+    Ejemplo: ``/api/mix/Queen/Bohemian Rhapsody?gain=vocals:0.5&mute=drums&pan=bass:-0.3``
+    
+    Con ``normalize=true`` se aplica la ganancia de sonoridad de la canción.
+    
+    La mezcla se envía según se codifica; las mezclas ya generadas con los
+    mismos ajustes se sirven directamente desde caché.
+    """
+    try:
+        settings = parse_mix_settings(gain=gain, mute=mute, pan=pan)
+        cached_path, stream, media_type = stream_mix(
+            artist, song, settings, output_format=format, bitrate=bitrate, normalize=normalize
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    record_access(os.path.join(MUSIC_DIR, artist, song))
+    headers = {"Cache-Control": "public, max-age=86400"}
+    if cached_path:
+        return FileResponse(cached_path, media_type=media_type, headers=headers)
+    return StreamingResponse(stream, media_type=media_type, headers=headers)
+
+
+@app.get("/api/peaks/{file_path:path}")
+def get_peaks(file_path: str, level: Optional[int] = None, width: Optional[int] = None):
+    """
+    Obtener la forma de onda precalculada de una canción o pista
+    
+    Devuelve un único nivel de la pirámide de picos en binario (ver
+    ``src/waveform.py``). Con ``width`` se elige el nivel adecuado para
+    dibujar a ese ancho; si los picos no existen se generan en el momento.
+    """
+    try:
+        audio_path = resolve_music_file(file_path)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    record_access(audio_path)
+    peaks_path = generate_peaks(audio_path)
+    if not peaks_path:
+        raise HTTPException(status_code=500, detail="No se pudo calcular la forma de onda")
+    
+    return Response(
+        content=encode_peak_level(peaks_path, level=level, width=width),
+        media_type="application/octet-stream",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+
+@app.get("/api/stem/{file_path:path}")
+def get_stem_audio(file_path: str):
+    """
+    Servir una pista como archivo independiente
+    
+    Acepta rutas normales y referencias ``<contenedor>#<pista>`` (con ``#``
+    codificado como ``%23``); las pistas de un contenedor se extraen sin
+    recodificar la primera vez y se sirven con soporte de rangos.
+    """
+    try:
+        audio_path = resolve_music_file(file_path)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    record_access(audio_path)
+    try:
+        playable = playable_file(audio_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return FileResponse(playable, media_type="audio/mpeg", headers={"Cache-Control": "public, max-age=3600"})
+
+
 @app.get("/api/artists")
 async def get_artists():
     """
@@ -221,8 +779,18 @@ async def get_tree():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/capabilities")
+def get_capabilities():
+    """
+    Herramientas y paquetes disponibles (FFmpeg, Deno, Demucs, dispositivo)
+    
+    Se calcula la primera vez y queda en caché en el proceso.
+    """
+    return {"success": True, "capabilities": capability_report()}
+
+
 @app.get("/api/stats")
-async def get_stats():
+def get_stats():
     """
     Obtener estadísticas de la biblioteca
     """
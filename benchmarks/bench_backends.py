@@ -0,0 +1,145 @@
+"""
+Benchmark de los motores de separación
+
+Separa la misma canción con cada motor (``torch``, ``onnx``...) en un
+proceso nuevo cada vez, para que la memoria y el tiempo de carga de uno no
+se mezclen con los del siguiente, y compara:
+
+- carga del modelo (importar torch u ONNX Runtime y leer los pesos),
+- separación (y cuántas veces más rápido que tiempo real),
+- pico de memoria residente del proceso,
+- diferencia máxima de las pistas con las del primer motor.
+
+Uso:
+    python benchmarks/bench_backends.py cancion.mp3 [--backends torch,onnx]
+                                        [--model htdemucs] [--seconds 30]
+                                        [--json salida.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child(backend: str, path: str, model: str, seconds: float, output: str) -> Dict:
+    """
+    Medir un motor dentro de este proceso (lo llama ``bench_backend``)
+    """
+    sys.path.insert(0, ROOT)
+    from src.audio_io import SAMPLE_RATE, decode_file
+    from src.separation_backends import get_backend
+    
+    audio = decode_file(path)
+    if seconds:
+        audio = audio[:int(seconds * SAMPLE_RATE)]
+    options = {"model": model, "device": "cpu"}
+    engine = get_backend(backend)
+    
+    start = time.perf_counter()
+    engine.load(options)
+    load_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    sources = engine.separate(audio, None, options)
+    separate_seconds = time.perf_counter() - start
+    
+    np.savez(output, **sources)
+    duration = len(audio) / SAMPLE_RATE
+    return {
+        "backend": backend,
+        "audio_seconds": round(duration, 2),
+        "load_seconds": load_seconds,
+        "separate_seconds": separate_seconds,
+        "realtime_factor": duration / separate_seconds if separate_seconds else None,
+        # ru_maxrss está en KiB en Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def bench_backend(backend: str, path: str, model: str, seconds: float, work_dir: str) -> Dict:
+    """
+    Medir un motor en un proceso hijo
+    """
+    output = os.path.join(work_dir, f"{backend}.npz")
+    cmd = [sys.executable, os.path.abspath(__file__), path, "--child", backend,
+           "--model", model, "--seconds", str(seconds), "--json", output]
+    process = subprocess.run(cmd, capture_output=True, text=True)
+    if process.returncode != 0:
+        error = (process.stderr.strip().splitlines() or ["error"])[-1]
+        return {"backend": backend, "error": error}
+    with open(f"{output}.json") as f:
+        result = json.load(f)
+    result["stems_file"] = output
+    return result
+
+
+def max_difference(path_a: str, path_b: str) -> Optional[float]:
+    """
+    Mayor diferencia absoluta entre las pistas comunes de dos separaciones
+    """
+    a, b = np.load(path_a), np.load(path_b)
+    common = set(a.files) & set(b.files)
+    if not common:
+        return None
+    return max(float(np.abs(a[stem] - b[stem]).max()) for stem in common)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los motores de separación")
+    parser.add_argument("file", help="Archivo de audio a separar")
+    parser.add_argument("--backends", default="torch,onnx",
+                        help="Motores separados por comas (torch, onnx, demucs_cli, null)")
+    parser.add_argument("--model", default="htdemucs")
+    parser.add_argument("--seconds", type=float, default=30, help="Separar sólo los primeros N segundos (0 = todo)")
+    parser.add_argument("--json", default=None, help="Guardar los resultados en JSON")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    path = os.path.abspath(args.file)
+    if args.child:
+        result = run_child(args.child, path, args.model, args.seconds, args.json)
+        with open(f"{args.json}.json", "w") as f:
+            json.dump(result, f)
+        return
+    
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for backend in args.backends.split(","):
+            print(f"⏱️  {backend}...")
+            results.append(bench_backend(backend.strip(), path, args.model, args.seconds, work_dir))
+        
+        reference = next((result for result in results if "error" not in result), None)
+        for result in results:
+            if "error" not in result and result is not reference:
+                result["max_difference"] = max_difference(reference["stems_file"], result["stems_file"])
+        for result in results:
+            result.pop("stems_file", None)
+    
+    print(f"\n🎛️  Motores de separación ({args.model}, {os.path.basename(path)})")
+    print(f"  {'motor':<11} {'carga':>8} {'separar':>9} {'x real':>7} {'RSS MB':>8} {'dif. máx':>9}")
+    for result in results:
+        if "error" in result:
+            print(f"  {result['backend']:<11} ✗ {result['error']}")
+            continue
+        difference = result.get("max_difference")
+        print(f"  {result['backend']:<11} {result['load_seconds']:7.2f}s {result['separate_seconds']:8.2f}s "
+              f"{result['realtime_factor'] or 0:7.1f} {result['peak_rss_mb']:8.0f} "
+              f"{'' if difference is None else f'{difference:.2e}':>9}")
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"model": args.model, "file": path, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
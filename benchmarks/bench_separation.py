@@ -0,0 +1,132 @@
+"""
+Benchmark de la entrada de las separaciones
+
+Mide por separado lo que cuesta preparar la entrada de Demucs:
+
+- decodificar y remuestrear el MP3 (lo que hace cada ejecución de Demucs
+  sin caché, y la primera con ella),
+- leer la entrada ya decodificada de ``data/cache/inputs`` (lo que queda
+  en las siguientes separaciones de la misma canción con cualquier modelo).
+
+Con ``--model`` ejecuta además Demucs con el MP3 y con la entrada en caché
+para ver el tiempo total de separación en ambos casos.
+
+Las cachés se crean en una carpeta temporal, sin tocar las de ``data/``.
+
+Uso:
+    python benchmarks/bench_separation.py cancion.mp3 [otra.mp3 ...]
+                                          [--runs 3] [--model htdemucs]
+                                          [--json salida.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_all(path: str) -> float:
+    """
+    Leer un audio completo como lo hace Demucs (FFmpeg a float32 44.1 kHz)
+    y devolver los segundos empleados
+    """
+    from src.audio_io import decode_blocks
+    
+    start = time.perf_counter()
+    for _ in decode_blocks(path, sample_rate=44100):
+        pass
+    return time.perf_counter() - start
+
+
+def run_demucs(input_path: str, model: str, output_dir: str) -> float:
+    from src.capabilities import demucs_executable, torch_device
+    
+    start = time.perf_counter()
+    subprocess.run(
+        [demucs_executable() or "demucs", "--mp3", "--mp3-bitrate", "320",
+         "-n", model, "-d", torch_device(), "-o", output_dir, input_path],
+        capture_output=True,
+        check=True
+    )
+    return time.perf_counter() - start
+
+
+def bench_file(path: str, runs: int, model: str, work_dir: str) -> Dict:
+    from src.input_cache import _content_hash, content_hash, decode_input, ensure_decoded_input, prepare_input
+    
+    decode, hashing, cached_read = [], [], []
+    for i in range(runs):
+        output_path = os.path.join(work_dir, f"decode_{i}.wav")
+        decode.append(decode_input(path, output_path))
+        os.remove(output_path)
+    
+    cache_path = ensure_decoded_input(path)
+    for _ in range(runs):
+        # Hash sin memorizar (lo que cuesta la primera consulta de cada proceso)
+        _content_hash.cache_clear()
+        start = time.perf_counter()
+        content_hash(path)
+        hashing.append(time.perf_counter() - start)
+        cached_read.append(read_all(cache_path))
+    mp3_read = [read_all(path) for _ in range(runs)]
+    
+    result = {
+        "file": path,
+        "input_mb": round(os.path.getsize(cache_path) / (1024 * 1024), 1),
+        "decode_seconds": statistics.median(decode),
+        "mp3_read_seconds": statistics.median(mp3_read),
+        "cached_read_seconds": statistics.median(cached_read),
+        "hash_seconds": statistics.median(hashing),
+    }
+    
+    if model:
+        result["demucs_mp3_seconds"] = run_demucs(path, model, os.path.join(work_dir, "mp3"))
+        cached_input = prepare_input(path, work_dir)
+        result["demucs_cached_seconds"] = run_demucs(cached_input, model, os.path.join(work_dir, "cached"))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la entrada de las separaciones")
+    parser.add_argument("files", nargs="+", help="Archivos de audio a medir")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default=None, help="Ejecutar también Demucs con este modelo")
+    parser.add_argument("--json", default=None, help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+    
+    files = [os.path.abspath(path) for path in args.files]
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # La configuración se lee al importar: apuntar las cachés a la
+        # carpeta temporal antes de importar nada de src
+        os.environ["SHELU_DATA_DIR"] = os.path.join(work_dir, "data")
+        os.environ.setdefault("SHELU_INPUT_CACHE_MB", "100000")
+        sys.path.insert(0, ROOT)
+        
+        for path in files:
+            results.append(bench_file(path, args.runs, args.model, work_dir))
+    
+    print(f"🎛️  Entrada de las separaciones ({args.runs} ejecuciones, mediana)")
+    print(f"  {'decodificar':>12} {'leer MP3':>9} {'leer caché':>11} {'hash':>7} {'MB':>7}  archivo")
+    for result in results:
+        print(f"  {result['decode_seconds']:11.3f}s {result['mp3_read_seconds']:8.3f}s "
+              f"{result['cached_read_seconds']:10.3f}s {result['hash_seconds']:6.3f}s "
+              f"{result['input_mb']:7.1f}  {os.path.basename(result['file'])}")
+        if "demucs_mp3_seconds" in result:
+            print(f"  {'':12} Demucs ({args.model}): {result['demucs_mp3_seconds']:.2f}s con MP3, "
+                  f"{result['demucs_cached_seconds']:.2f}s con la entrada en caché")
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "model": args.model, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark del tiempo de arranque de la API
+
+Importa ``api.main`` en procesos nuevos (con ``-X importtime``) y muestra el
+tiempo total, el coste de importación por módulo y si se han cargado
+módulos pesados que deberían importarse sólo al usarse (yt_dlp, torch...).
+
+Uso:
+    python benchmarks/bench_startup.py [--runs 5] [--top 15]
+                                       [--max-seconds 1.5] [--json salida.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que no deben cargarse al arrancar la API
+HEAVY_MODULES = ("yt_dlp", "torch", "torchaudio", "demucs")
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Extraer de la salida de -X importtime el tiempo propio y acumulado (µs)
+    de cada módulo
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # cabecera
+        modules[parts[2].strip()] = (self_us, cumulative_us)
+    return modules
+
+
+def run_once(module: str, workdir: str) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """
+    Importar el módulo en un proceso nuevo y medir el tiempo total
+    """
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "SHELU_DATA_DIR": os.path.join(workdir, "data"),
+    }
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=workdir,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"❌ Error al importar {module}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque de la API")
+    parser.add_argument("--module", default="api.main", help="Módulo a importar")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Módulos más costosos a mostrar")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fallar si la mediana supera este tiempo")
+    parser.add_argument("--json", default=None, help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        # La API monta estas carpetas al importarse
+        for folder in ("music", "separated", "static"):
+            os.makedirs(os.path.join(workdir, folder))
+        
+        # Primera ejecución para calentar la caché de bytecode y del disco
+        run_once(args.module, workdir)
+        
+        totals: List[float] = []
+        imports: List[float] = []
+        runs = []
+        for _ in range(args.runs):
+            elapsed, modules = run_once(args.module, workdir)
+            totals.append(elapsed)
+            imports.append(modules.get(args.module, (0, 0))[1] / 1e6)
+            runs.append(modules)
+    
+    # Usar la ejecución mediana para el desglose por módulo
+    median_run = runs[sorted(range(len(totals)), key=totals.__getitem__)[len(totals) // 2]]
+    top = sorted(median_run.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    heavy = sorted(
+        name for name in median_run
+        if name.split(".")[0] in HEAVY_MODULES
+    )
+    
+    print(f"🚀 Arranque de {args.module} ({args.runs} ejecuciones)")
+    print(f"  Proceso completo: mediana {statistics.median(totals):.3f}s  "
+          f"(min {min(totals):.3f}s, max {max(totals):.3f}s)")
+    print(f"  Importación:      mediana {statistics.median(imports):.3f}s")
+    print(f"  Módulos cargados: {len(median_run)}")
+    print()
+    print(f"  {'propio (ms)':>12} {'acumulado (ms)':>15}  módulo")
+    for name, (self_us, cumulative_us) in top:
+        print(f"  {self_us / 1000:12.1f} {cumulative_us / 1000:15.1f}  {name}")
+    print()
+    
+    if heavy:
+        print(f"⚠️  Módulos pesados importados al arrancar: {', '.join(heavy[:10])}")
+    else:
+        print("✓ No se importan módulos pesados al arrancar")
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "module": args.module,
+                "runs": args.runs,
+                "total_seconds": totals,
+                "import_seconds": imports,
+                "modules_loaded": len(median_run),
+                "heavy_modules": heavy,
+                "top": [
+                    {"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000}
+                    for name, (self_us, cumulative_us) in top
+                ],
+            }, f, indent=2)
+    
+    if args.max_seconds is not None and statistics.median(totals) > args.max_seconds:
+        print(f"❌ La mediana supera el límite de {args.max_seconds}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Sustituto local de yt-dlp para las pruebas de carga
+
+Implementa lo que usa ``src/youtube_service.py`` (``YoutubeDL`` con
+``extract_info("ytsearchN:...")`` y ``download([url])``) sin salir a
+internet:
+
+- Las búsquedas devuelven videos de un catálogo fijo de
+  ``SHELU_FAKE_CATALOG`` IDs elegidos según la consulta, así que distintos
+  usuarios acaban pidiendo a veces el mismo video (como en la realidad).
+- Las descargas esperan ``SHELU_FAKE_DOWNLOAD_LATENCY`` segundos (llamando
+  a los ``progress_hooks`` como una descarga real) y generan con FFmpeg un MP3 de ``SHELU_FAKE_AUDIO_SECONDS`` segundos (acordes y
+  ruido filtrado distintos por video) en la ruta de ``outtmpl``.
+
+Se activa poniendo ``benchmarks/fakes`` al principio de ``PYTHONPATH``.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+from typing import Dict, List
+
+
+CATALOG_SIZE = int(os.environ.get("SHELU_FAKE_CATALOG", 50))
+AUDIO_SECONDS = float(os.environ.get("SHELU_FAKE_AUDIO_SECONDS", 30))
+DOWNLOAD_LATENCY = float(os.environ.get("SHELU_FAKE_DOWNLOAD_LATENCY", 1.0))
+SEARCH_LATENCY = float(os.environ.get("SHELU_FAKE_SEARCH_LATENCY", 0.3))
+
+# Llamadas a los progress_hooks durante la espera de una descarga
+PROGRESS_STEPS = 10
+
+__version__ = "0.0.0-fake"
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:12], 16)
+
+
+def video_id_for(index: int) -> str:
+    """
+    ID de 11 caracteres (como los de YouTube) del video ``index`` del catálogo
+    """
+    return f"fake{index:07d}"
+
+
+def _search(query: str, count: int) -> List[Dict]:
+    first = _digest(query.lower()) % CATALOG_SIZE
+    entries = []
+    for offset in range(min(count, CATALOG_SIZE)):
+        index = (first + offset) % CATALOG_SIZE
+        entries.append({
+            "id": video_id_for(index),
+            "title": f"Tema {index:03d}",
+            "channel": f"Artista {index % 7}",
+            "duration": AUDIO_SECONDS,
+            "thumbnail": None,
+        })
+    return entries
+
+
+def _generate_audio(video_id: str, output_path: str):
+    """
+    Generar un MP3 estéreo reconocible por video (tres tonos y ruido rosa)
+    """
+    root = 110 * 2 ** ((_digest(video_id) % 12) / 12)
+    sources = [
+        f"sine=frequency={root * ratio:.2f}:sample_rate=44100:duration={AUDIO_SECONDS}"
+        for ratio in (1, 1.25, 1.5)
+    ] + [f"anoisesrc=color=pink:amplitude=0.1:sample_rate=44100:duration={AUDIO_SECONDS}"]
+    inputs = []
+    for source in sources:
+        inputs += ["-f", "lavfi", "-i", source]
+    ffmpeg = shutil.which("ffmpeg") or "ffmpeg"
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-nostdin", "-y", *inputs,
+         "-filter_complex", f"amix=inputs={len(sources)}:normalize=1,volume=2",
+         "-ac", "2", "-c:a", "libmp3lame", "-b:a", "192k", output_path],
+        capture_output=True,
+        check=True
+    )
+
+
+class YoutubeDL:
+    """
+    Subconjunto de ``yt_dlp.YoutubeDL`` que usa la aplicación
+    """
+    
+    def __init__(self, params: Dict = None):
+        self.params = params or {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *_):
+        return False
+    
+    def extract_info(self, url: str, download: bool = False) -> Dict:
+        if not url.startswith("ytsearch"):
+            raise DownloadError(f"URL no soportada por el sustituto: {url}")
+        count, _, query = url[len("ytsearch"):].partition(":")
+        time.sleep(SEARCH_LATENCY)
+        return {"entries": _search(query, int(count or 1))}
+    
+    def download(self, urls: List[str]) -> int:
+        for url in urls:
+            video_id = url.rsplit("v=", 1)[-1]
+            template = self.params.get("outtmpl", "%(id)s.%(ext)s")
+            output_path = template.replace("%(id)s", video_id).replace("%(ext)s", "mp3")
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+            temp_path = f"{output_path}.part.mp3"
+            for step in range(PROGRESS_STEPS):
+                time.sleep(DOWNLOAD_LATENCY / PROGRESS_STEPS)
+                self._progress(video_id, temp_path, step + 1)
+            _generate_audio(video_id, temp_path)
+            os.replace(temp_path, output_path)
+        return 0
+    
+    def _progress(self, video_id: str, temp_path: str, step: int):
+        status = {
+            "status": "downloading",
+            "filename": temp_path,
+            "downloaded_bytes": step,
+            "total_bytes": PROGRESS_STEPS,
+            "info_dict": {"id": video_id},
+        }
+        for hook in self.params.get("progress_hooks", []):
+            hook(status)
@@ -0,0 +1,350 @@
+"""
+Prueba de carga de la API sin YouTube ni Demucs reales
+
+Arranca la API (``uvicorn api.main:app``, y opcionalmente procesos worker
+como ``serve.py``) en una carpeta temporal con sustitutos locales:
+
+- ``benchmarks/fakes/yt_dlp``: búsquedas sobre un catálogo fijo y descargas
+  que generan audio con FFmpeg tras una latencia configurable.
+- ``benchmarks/fakes/bin/demucs``: separación falsa con latencia
+  configurable (escribe pistas reales, así que picos, previsualizaciones,
+  sonoridad, análisis y pistas silenciosas se ejecutan como siempre).
+
+Después lanza N usuarios virtuales que repiten una sesión realista
+(explorar el árbol, buscar, descargar, separar y consultar la tarea hasta
+que termina) y muestra, por endpoint, peticiones, errores, rendimiento y
+latencias p50/p95/p99.
+
+Uso:
+    python benchmarks/loadtest.py [--users 10] [--duration 60]
+                                  [--demucs-seconds 2] [--download-seconds 1]
+                                  [--audio-seconds 30] [--job-workers 0]
+                                  [--json salida.json]
+    python benchmarks/loadtest.py --url http://localhost:8000   # servidor ya arrancado
+
+Con ``--backends real`` no se usan los sustitutos (sólo para entornos de
+pruebas con YouTube y Demucs disponibles).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKES_DIR = os.path.join(ROOT, "benchmarks", "fakes")
+
+# Consultas de búsqueda de los usuarios virtuales
+QUERIES = [
+    "rock clásico", "jazz en directo", "salsa", "flamenco", "indie pop",
+    "bossa nova", "metal", "boleros", "funk", "blues acústico",
+]
+
+FINISHED_STATUSES = ("completed", "error", "interrupted", "cancelled")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Percentil por rango más cercano (q entre 0 y 100)
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Stats:
+    """
+    Latencias y códigos de respuesta por endpoint (seguro entre hilos)
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[Tuple[float, int]]] = {}
+    
+    def record(self, endpoint: str, seconds: float, status: int):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((seconds, status))
+    
+    def summary(self, elapsed: float) -> List[Dict]:
+        rows = []
+        with self._lock:
+            items = sorted(self.samples.items())
+        for endpoint, samples in items:
+            latencies = [seconds for seconds, _ in samples]
+            statuses: Dict[str, int] = {}
+            for _, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(samples),
+                # 429 es una respuesta esperada del control de admisión
+                "errors": sum(1 for _, status in samples if status >= 500 or status == 0),
+                "statuses": statuses,
+                "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+                "mean_ms": statistics.mean(latencies) * 1000,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "max_ms": max(latencies) * 1000,
+            })
+        return rows
+
+
+class Client:
+    """
+    Cliente HTTP mínimo que registra cada petición en ``Stats``
+    """
+    
+    def __init__(self, base_url: str, stats: Stats, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.timeout = timeout
+    
+    def request(self, method: str, path: str, endpoint: str, body: Optional[Dict] = None) -> Tuple[int, Optional[Dict]]:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={"Content-Type": "application/json"} if data else {}
+        )
+        start = time.perf_counter()
+        status, payload = 0, None
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status = response.status
+                payload = json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            status = e.code
+            e.read()
+        except (urllib.error.URLError, OSError, ValueError):
+            status = 0
+        self.stats.record(f"{method} {endpoint}", time.perf_counter() - start, status)
+        return status, payload
+
+
+class VirtualUser(threading.Thread):
+    """
+    Usuario que repite una sesión: explorar, buscar, descargar, separar y
+    consultar la tarea hasta que termina
+    """
+    
+    def __init__(self, user_id: int, client: Client, args, deadline: float):
+        super().__init__(daemon=True)
+        self.user_id = user_id
+        self.client = client
+        self.args = args
+        self.deadline = deadline
+        self.rng = random.Random(args.seed * 1000 + user_id)
+    
+    def think(self):
+        if self.args.think > 0:
+            time.sleep(min(self.rng.expovariate(1 / self.args.think), self.args.think * 5))
+    
+    def alive(self) -> bool:
+        return time.time() < self.deadline
+    
+    def browse(self):
+        self.client.request("GET", "/api/music-tree", "/api/music-tree")
+        if self.rng.random() < 0.3:
+            self.client.request("GET", "/api/songs", "/api/songs")
+    
+    def run(self):
+        while self.alive():
+            self.browse()
+            self.think()
+            
+            status, payload = self.client.request(
+                "POST", "/api/search", "/api/search",
+                {"query": self.rng.choice(QUERIES), "max_results": 5}
+            )
+            results = (payload or {}).get("results") or []
+            if status != 200 or not results or not self.alive():
+                continue
+            video = self.rng.choice(results)
+            self.think()
+            
+            status, payload = self.client.request(
+                "POST", "/api/download", "/api/download",
+                {"video_id": video["video_id"], "title": video["title"], "artist": video["channel"]}
+            )
+            if status != 200 or not self.alive() or self.rng.random() >= self.args.separate_ratio:
+                continue
+            self.think()
+            
+            status, payload = self.client.request(
+                "POST", "/api/separate", "/api/separate",
+                {"file_path": payload["file_path"], "model": self.args.model,
+                 "artist": video["channel"], "user": f"loadtest-{self.user_id}"}
+            )
+            if status == 200:
+                self.poll(payload["task_id"])
+    
+    def poll(self, task_id: str):
+        while self.alive():
+            time.sleep(self.args.poll_interval)
+            status, task = self.client.request("GET", f"/api/task/{task_id}", "/api/task/{task_id}")
+            if status != 200 or (task or {}).get("status") in FINISHED_STATUSES:
+                return
+            # Mientras espera sigue mirando la biblioteca de vez en cuando
+            if self.rng.random() < 0.2:
+                self.browse()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, workdir: str) -> Tuple[str, List[subprocess.Popen]]:
+    """
+    Arrancar la API (y los workers) en ``workdir`` con los sustitutos
+    """
+    for folder in ("music", "separated", "static"):
+        os.makedirs(os.path.join(workdir, folder), exist_ok=True)
+    
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "SHELU_DATA_DIR": os.path.join(workdir, "data"),
+        "SHELU_FAKE_DEMUCS_SECONDS": str(args.demucs_seconds),
+        "SHELU_FAKE_DOWNLOAD_LATENCY": str(args.download_seconds),
+        "SHELU_FAKE_AUDIO_SECONDS": str(args.audio_seconds),
+        "SHELU_FAKE_CATALOG": str(args.catalog),
+    }
+    if args.backends == "fake":
+        env["PYTHONPATH"] = os.pathsep.join([FAKES_DIR, ROOT])
+        env["PATH"] = os.pathsep.join([os.path.join(FAKES_DIR, "bin"), env.get("PATH", "")])
+    
+    output = None if args.server_logs else subprocess.DEVNULL
+    processes = []
+    if args.job_workers:
+        env.update({"SHELU_JOB_MODE": "external", "SHELU_TASK_STORE": "sqlite"})
+        for _ in range(args.job_workers):
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "src.worker"], cwd=workdir, env=env,
+                stdout=output, stderr=output
+            ))
+    
+    port = free_port()
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app",
+         "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.api_workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=output, stderr=output
+    ))
+    return f"http://127.0.0.1:{port}", processes
+
+
+def wait_until_ready(base_url: str, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + "/api/stats", timeout=5):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    raise SystemExit(f"❌ La API no respondió en {timeout:.0f}s")
+
+
+def stop_server(processes: List[subprocess.Popen]):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def print_report(rows: List[Dict], elapsed: float, users: int):
+    total = sum(row["requests"] for row in rows)
+    print(f"📈 {users} usuarios virtuales, {elapsed:.1f}s, {total} peticiones "
+          f"({total / elapsed if elapsed else 0:.1f}/s)")
+    print(f"  {'endpoint':<26} {'peticiones':>10} {'errores':>8} {'req/s':>7} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'máx ms':>9}  códigos")
+    for row in rows:
+        codes = " ".join(f"{code}×{count}" for code, count in sorted(row["statuses"].items()))
+        print(f"  {row['endpoint']:<26} {row['requests']:>10} {row['errors']:>8} "
+              f"{row['throughput_rps']:>7.2f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}  {codes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API con backends falsos")
+    parser.add_argument("--users", type=int, default=10, help="Usuarios virtuales")
+    parser.add_argument("--duration", type=float, default=60, help="Duración en segundos")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Segundos para arrancar todos los usuarios")
+    parser.add_argument("--think", type=float, default=1.0, help="Pausa media entre acciones (s)")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Consulta de tareas (s)")
+    parser.add_argument("--separate-ratio", type=float, default=0.5,
+                        help="Fracción de descargas que se separan después")
+    parser.add_argument("--model", default="htdemucs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout por petición (s)")
+    parser.add_argument("--url", default=None, help="Usar un servidor ya arrancado")
+    parser.add_argument("--backends", choices=("fake", "real"), default="fake")
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--job-workers", type=int, default=0,
+                        help="Procesos worker (0 = la API ejecuta los trabajos)")
+    parser.add_argument("--demucs-seconds", type=float, default=2.0, help="Latencia del Demucs falso")
+    parser.add_argument("--download-seconds", type=float, default=1.0, help="Latencia de las descargas falsas")
+    parser.add_argument("--audio-seconds", type=float, default=30, help="Duración del audio generado")
+    parser.add_argument("--catalog", type=int, default=50, help="Videos distintos del catálogo falso")
+    parser.add_argument("--server-logs", action="store_true", help="Mostrar la salida del servidor")
+    parser.add_argument("--json", default=None, help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix="shelu-loadtest-") as workdir:
+        processes: List[subprocess.Popen] = []
+        base_url = args.url
+        try:
+            if base_url is None:
+                base_url, processes = start_server(args, workdir)
+            wait_until_ready(base_url)
+            
+            stats = Stats()
+            client = Client(base_url, stats, args.timeout)
+            start = time.time()
+            deadline = start + args.duration
+            users = []
+            for user_id in range(args.users):
+                user = VirtualUser(user_id, client, args, deadline)
+                user.start()
+                users.append(user)
+                time.sleep(args.ramp_up / max(args.users, 1))
+            for user in users:
+                # Las peticiones en curso al llegar el final pueden tardar
+                user.join(timeout=max(0.0, deadline - time.time()) + args.timeout)
+            elapsed = time.time() - start
+        finally:
+            stop_server(processes)
+    
+    rows = stats.summary(elapsed)
+    print_report(rows, elapsed, args.users)
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "users": args.users,
+                "duration_seconds": elapsed,
+                "backends": args.backends,
+                "demucs_seconds": args.demucs_seconds,
+                "download_seconds": args.download_seconds,
+                "endpoints": rows,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Arrancar la aplicación completa en modo multiproceso
+
+Lanza N procesos de la API (uvicorn --workers) que sólo atienden HTTP y
+encolan trabajos, más M procesos worker (src/worker.py) que ejecutan las
+descargas y separaciones. Todos comparten el estado a través de
+data/tasks.db (SQLite).
+
+Uso:
+    python serve.py --api-workers 4 --job-workers 1
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from src.config import SEPARATION_SLOTS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shelu Music Studio (API + workers)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--api-workers", type=int, default=os.cpu_count() or 2,
+                        help="Procesos de la API")
+    parser.add_argument("--job-workers", type=int, default=1,
+                        help="Procesos que ejecutan descargas y separaciones")
+    parser.add_argument("--download-slots", type=int, default=None,
+                        help="Descargas simultáneas por worker")
+    parser.add_argument("--separation-slots", type=int, default=None,
+                        help="Separaciones simultáneas por worker")
+    args = parser.parse_args()
+    
+    root = os.path.dirname(os.path.abspath(__file__))
+    for folder in ("music", "separated"):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    env = {
+        **os.environ,
+        "SHELU_JOB_MODE": "external",
+        "SHELU_TASK_STORE": "sqlite",
+        # Capacidad total para estimar esperas en el control de admisión
+        "SHELU_SEPARATION_CAPACITY": str(
+            args.job_workers * (args.separation_slots if args.separation_slots is not None else SEPARATION_SLOTS)
+        ),
+    }
+    
+    worker_cmd = [sys.executable, "-m", "src.worker"]
+    if args.download_slots is not None:
+        worker_cmd += ["--download-slots", str(args.download_slots)]
+    if args.separation_slots is not None:
+        worker_cmd += ["--separation-slots", str(args.separation_slots)]
+    
+    api_cmd = [
+        sys.executable, "-m", "uvicorn", "api.main:app",
+        "--host", args.host,
+        "--port", str(args.port),
+        "--workers", str(args.api_workers),
+    ]
+    
+    print(f"🚀 API en http://localhost:{args.port} ({args.api_workers} procesos)")
+    print(f"⚙️  {args.job_workers} procesos worker")
+    
+    processes = [subprocess.Popen(worker_cmd, cwd=root, env=env) for _ in range(args.job_workers)]
+    processes.append(subprocess.Popen(api_cmd, cwd=root, env=env))
+    
+    stopping = False
+    
+    def shutdown(*_):
+        nonlocal stopping
+        stopping = True
+    
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    
+    try:
+        # Si cualquier proceso termina se detiene todo
+        while not stopping and all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+    finally:
+        print("\n🛑 Deteniendo procesos...")
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
+    sys.exit(0 if stopping else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Análisis de tempo y tonalidad a partir de las pistas separadas
+
+Tras publicar las pistas de una canción se estiman:
+
+- **BPM** con la pista de batería: envolvente de ataques (flujo espectral
+  con compresión logarítmica) y autocorrelación en el rango de 60-200 BPM,
+  ponderada hacia tempos habituales para no elegir el doble o la mitad.
+- **Tonalidad** con las pistas armónicas (bajo, "other" y, si existen,
+  piano y guitarra): cromagrama acumulado comparado con los perfiles de
+  Krumhansl-Kessler de las 24 tonalidades.
+
+El audio se decodifica en bloques y cada bloque se procesa de una vez con
+NumPy (ventanas con ``sliding_window_view`` + ``rfft``), así que la memoria
+no depende de la duración de la canción. El análisis se ejecuta en un
+proceso aparte con prioridad baja para no quitar CPU a Demucs, y el
+resultado se guarda en el índice de la biblioteca.
+
+Uso para analizar canciones ya separadas::
+    
+    python -m src.analysis [--force]
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.audio_io import decode_blocks
+from src.config import ANALYSIS_ENABLED, ANALYSIS_WORKERS
+from src.library_index import get_analysis, record_analysis
+from src.stem_container import audio_mtime, has_stems, list_stems
+
+
+# Versión del algoritmo (los resultados de versiones anteriores se recalculan)
+ANALYSIS_VERSION = 1
+
+# Envolvente de ataques
+ONSET_SAMPLE_RATE = 22050
+ONSET_FFT = 1024
+ONSET_HOP = 512
+MIN_BPM = 60
+MAX_BPM = 200
+# Tempo preferido y anchura (en octavas) del peso que se aplica a la autocorrelación
+PRIOR_BPM = 120
+PRIOR_OCTAVES = 1.0
+
+# Cromagrama
+CHROMA_SAMPLE_RATE = 11025
+CHROMA_FFT = 8192
+CHROMA_HOP = 4096
+CHROMA_MIN_FREQ = 55.0
+CHROMA_MAX_FREQ = 2000.0
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# Perfiles de Krumhansl-Kessler (empezando en la tónica)
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# Pistas que se usan para cada estimación
+RHYTHM_STEMS = ("drums",)
+HARMONIC_STEMS = ("bass", "other", "piano", "guitar")
+
+# Por debajo de esta energía una pista se considera vacía
+SILENCE_THRESHOLD = 1e-6
+
+
+def _framed_spectra(
+    blocks: Iterable[np.ndarray],
+    n_fft: int,
+    hop: int
+) -> Iterable[np.ndarray]:
+    """
+    Espectros de magnitud de ventanas consecutivas de un flujo mono
+    
+    Las muestras que no completan una ventana pasan al bloque siguiente.
+    
+    Yields:
+        Arrays (ventanas, n_fft // 2 + 1) por bloque
+    """
+    window = np.hanning(n_fft).astype(np.float32)
+    carry = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        samples = np.concatenate([carry, block.mean(axis=1)])
+        if len(samples) < n_fft:
+            carry = samples
+            continue
+        frames = sliding_window_view(samples, n_fft)[::hop]
+        yield np.abs(np.fft.rfft(frames * window, axis=1))
+        carry = samples[len(frames) * hop:]
+
+
+def onset_envelope(blocks: Iterable[np.ndarray]) -> np.ndarray:
+    """
+    Envolvente de ataques: suma del aumento de magnitud (log) entre ventanas
+    
+    Args:
+        blocks: Bloques (frames, canales) a ONSET_SAMPLE_RATE
+    
+    Returns:
+        Un valor por ventana de ONSET_HOP muestras
+    """
+    envelope: List[np.ndarray] = []
+    previous: Optional[np.ndarray] = None
+    for spectra in _framed_spectra(blocks, ONSET_FFT, ONSET_HOP):
+        spectra = np.log1p(100 * spectra)
+        if previous is not None:
+            spectra = np.concatenate([previous[None, :], spectra])
+        else:
+            envelope.append(np.zeros(1, dtype=spectra.dtype))
+        envelope.append(np.maximum(np.diff(spectra, axis=0), 0).sum(axis=1))
+        previous = spectra[-1]
+    return np.concatenate(envelope) if envelope else np.zeros(0)
+
+
+def estimate_tempo(envelope: np.ndarray, frame_rate: float) -> Tuple[Optional[float], float]:
+    """
+    Estimar el tempo con la autocorrelación de la envolvente de ataques
+    
+    Args:
+        envelope: Envolvente de ataques
+        frame_rate: Valores de la envolvente por segundo
+    
+    Returns:
+        Tupla (BPM o None si no hay ritmo claro, confianza 0-1)
+    """
+    min_lag = int(np.floor(60 * frame_rate / MAX_BPM))
+    max_lag = int(np.ceil(60 * frame_rate / MIN_BPM))
+    if len(envelope) < 2 * max_lag:
+        return None, 0.0
+    
+    onsets = envelope - envelope.mean()
+    # Autocorrelación por FFT (con relleno para evitar la circular)
+    size = 1 << int(np.ceil(np.log2(2 * len(onsets))))
+    spectrum = np.fft.rfft(onsets, size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:max_lag + 2]
+    if autocorr[0] <= 0:
+        return None, 0.0
+    autocorr /= autocorr[0]
+    
+    lags = np.arange(min_lag, max_lag + 1)
+    bpms = 60 * frame_rate / lags
+    prior = np.exp(-0.5 * (np.log2(bpms / PRIOR_BPM) / PRIOR_OCTAVES) ** 2)
+    best = lags[np.argmax(autocorr[lags] * prior)]
+    
+    # Interpolación parabólica para afinar el retardo entre ventanas
+    left, center, right = autocorr[best - 1], autocorr[best], autocorr[best + 1]
+    denominator = left - 2 * center + right
+    offset = 0.5 * (left - right) / denominator if denominator < 0 else 0.0
+    lag = best + float(np.clip(offset, -0.5, 0.5))
+    
+    return round(60 * frame_rate / lag, 1), round(float(np.clip(center, 0, 1)), 3)
+
+
+def _chroma_filter(sample_rate: int = CHROMA_SAMPLE_RATE, n_fft: int = CHROMA_FFT) -> np.ndarray:
+    """
+    Matriz (12, bins) que suma la magnitud de cada bin en su clase de nota
+    """
+    freqs = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    valid = (freqs >= CHROMA_MIN_FREQ) & (freqs <= CHROMA_MAX_FREQ)
+    pitch_class = np.zeros(len(freqs), dtype=int)
+    midi = 69 + 12 * np.log2(freqs[valid] / 440.0)
+    pitch_class[valid] = np.round(midi).astype(int) % 12
+    
+    matrix = np.zeros((12, len(freqs)), dtype=np.float32)
+    matrix[pitch_class[valid], np.flatnonzero(valid)] = 1.0
+    return matrix
+
+
+def chroma_profile(blocks: Iterable[np.ndarray]) -> np.ndarray:
+    """
+    Cromagrama total de un flujo de audio
+    
+    Cada ventana se normaliza antes de sumarla para que los pasajes fuertes
+    no dominen la estimación.
+    
+    Args:
+        blocks: Bloques (frames, canales) a CHROMA_SAMPLE_RATE
+    
+    Returns:
+        Energía por clase de nota (12 valores, C a B)
+    """
+    matrix = _chroma_filter()
+    total = np.zeros(12)
+    for spectra in _framed_spectra(blocks, CHROMA_FFT, CHROMA_HOP):
+        chroma = (spectra ** 2) @ matrix.T
+        norms = chroma.sum(axis=1, keepdims=True)
+        voiced = norms[:, 0] > SILENCE_THRESHOLD
+        total += (chroma[voiced] / norms[voiced]).sum(axis=0)
+    return total
+
+
+def estimate_key(chroma: np.ndarray) -> Tuple[Optional[str], float]:
+    """
+    Elegir la tonalidad cuyo perfil se parece más al cromagrama
+    
+    Returns:
+        Tupla (p. ej. "A minor" o None si no hay contenido armónico,
+        confianza 0-1 como diferencia de correlación con la segunda mejor)
+    """
+    if chroma.sum() <= SILENCE_THRESHOLD:
+        return None, 0.0
+    
+    scores = []
+    for tonic in range(12):
+        for mode, profile in (("major", MAJOR_PROFILE), ("minor", MINOR_PROFILE)):
+            correlation = np.corrcoef(chroma, np.roll(profile, tonic))[0, 1]
+            scores.append((correlation, f"{NOTE_NAMES[tonic]} {mode}"))
+    scores.sort(reverse=True)
+    
+    confidence = max(0.0, scores[0][0] - scores[1][0])
+    return scores[0][1], round(float(min(confidence, 1.0)), 3)
+
+
+def _find_stems(stems_folder: str, names: Iterable[str]) -> List[str]:
+    stems = list_stems(stems_folder)
+    return [stems[name] for name in names if name in stems]
+
+
+def analyze_stems(stems_folder: str) -> Dict:
+    """
+    Estimar BPM y tonalidad a partir de la carpeta de pistas de una canción
+    
+    Returns:
+        Diccionario con bpm, bpm_confidence, key y key_confidence (None si
+        falta la pista necesaria o está vacía)
+    """
+    result = {"bpm": None, "bpm_confidence": 0.0, "key": None, "key_confidence": 0.0}
+    
+    rhythm = _find_stems(stems_folder, RHYTHM_STEMS)
+    if rhythm:
+        envelope = onset_envelope(decode_blocks(rhythm[0], sample_rate=ONSET_SAMPLE_RATE, channels=1))
+        result["bpm"], result["bpm_confidence"] = estimate_tempo(envelope, ONSET_SAMPLE_RATE / ONSET_HOP)
+    
+    harmonic = _find_stems(stems_folder, HARMONIC_STEMS)
+    if harmonic:
+        chroma = np.zeros(12)
+        for path in harmonic:
+            chroma += chroma_profile(decode_blocks(path, sample_rate=CHROMA_SAMPLE_RATE, channels=1))
+        result["key"], result["key_confidence"] = estimate_key(chroma)
+    
+    return result
+
+
+def _stems_mtime(stems_folder: str) -> float:
+    paths = _find_stems(stems_folder, (*RHYTHM_STEMS, *HARMONIC_STEMS))
+    return max((audio_mtime(path) for path in paths), default=0.0)
+
+
+def analyze_song(song_path: str, stems_folder: str, force: bool = False) -> Optional[Dict]:
+    """
+    Analizar una canción y guardar el resultado en el índice
+    
+    Si ya hay un análisis de esta versión posterior a las pistas actuales,
+    se devuelve sin recalcular.
+    
+    Args:
+        song_path: Ruta del MP3 original (clave en el índice)
+        stems_folder: Carpeta con las pistas separadas
+        force: Recalcular aunque exista
+    
+    Returns:
+        El análisis guardado o None si falla
+    """
+    try:
+        stems_mtime = _stems_mtime(stems_folder)
+        cached = get_analysis(song_path)
+        if (not force and cached and cached["version"] == ANALYSIS_VERSION
+                and cached["stems_mtime"] >= stems_mtime):
+            return cached
+        
+        start = time.perf_counter()
+        result = analyze_stems(stems_folder)
+        record_analysis(song_path, version=ANALYSIS_VERSION, stems_mtime=stems_mtime, **result)
+        print(f"🎼 Análisis de {song_path}: {result['bpm']} BPM, {result['key']} "
+              f"({time.perf_counter() - start:.1f}s)")
+        return get_analysis(song_path)
+    except Exception as e:
+        print(f"Error al analizar {song_path}: {e}")
+        return None
+
+
+def _lower_priority():
+    """
+    Inicializador de los procesos de análisis: prioridad baja para que el
+    sistema dé preferencia a Demucs y a la API
+    """
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass  # Windows
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: los procesos de la API y del worker tienen hilos en marcha
+            _pool = ProcessPoolExecutor(
+                max_workers=ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority
+            )
+        return _pool
+
+
+def schedule_analysis(song_path: str, stems_folder: str) -> Optional[Future]:
+    """
+    Encargar el análisis de una canción al pool en segundo plano sin esperar
+    
+    Returns:
+        Future del análisis o None si está desactivado
+    """
+    if not ANALYSIS_ENABLED:
+        return None
+    try:
+        return _get_pool().submit(analyze_song, song_path, stems_folder)
+    except Exception as e:
+        print(f"Error al encargar el análisis de {song_path}: {e}")
+        return None
+
+
+def shutdown_analysis_pool(wait: bool = False):
+    """
+    Cerrar el pool de análisis (los análisis pendientes se descartan si no
+    se espera; ``python -m src.analysis`` los completa más tarde)
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=not wait)
+            _pool = None
+
+
+def main():
+    from src.file_manager import list_songs
+    
+    parser = argparse.ArgumentParser(description="Analizar BPM y tonalidad de las canciones separadas")
+    parser.add_argument("--force", action="store_true", help="Recalcular aunque ya estén analizadas")
+    args = parser.parse_args()
+    
+    for song in list_songs():
+        stems_folder = os.path.splitext(song["file_path"])[0]
+        if has_stems(stems_folder):
+            analyze_song(song["file_path"], stems_folder, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
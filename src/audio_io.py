@@ -0,0 +1,275 @@
+"""
+Lectura y escritura de audio mediante FFmpeg
+
+Decodifica a bloques float32 de tamaño fijo (para procesarlos con NumPy sin
+cargar la canción entera) y codifica flujos de bloques de vuelta a MP3/Opus.
+
+Además de rutas normales acepta referencias ``<contenedor>#<pista>`` a una
+pista de un contenedor multipista (ver ``src/stem_container.py``).
+"""
+import re
+import subprocess
+import tempfile
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.capabilities import ffmpeg_executable
+from src.stem_container import split_stem_ref, stream_info
+
+
+# Formato interno de trabajo
+SAMPLE_RATE = 44100
+CHANNELS = 2
+BLOCK_FRAMES = 65536
+
+# Formatos de salida soportados: (argumentos de FFmpeg, tipo MIME)
+OUTPUT_FORMATS = {
+    "mp3": (["-c:a", "libmp3lame", "-f", "mp3"], "audio/mpeg"),
+    "opus": (["-c:a", "libopus", "-f", "ogg"], "audio/ogg"),
+}
+
+
+_DURATION = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """
+    Duración en segundos que anuncia la cabecera de un audio (de su
+    contenedor si es una referencia a una pista)
+    
+    Returns:
+        Duración o None si FFmpeg no la conoce
+    """
+    container, _ = split_stem_ref(path)
+    result = subprocess.run(
+        [ffmpeg_executable(), "-hide_banner", "-nostdin", "-i", container],
+        capture_output=True
+    )
+    match = _DURATION.search(result.stderr.decode("utf-8", errors="replace"))
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _read_exact(stream, size: int) -> bytes:
+    """
+    Leer ``size`` bytes de un pipe (o menos si termina)
+    """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def input_args(path: str) -> List[str]:
+    """
+    Argumentos de entrada de FFmpeg para una ruta o referencia a una pista
+    de un contenedor (que elige su flujo y descarta su relleno inicial)
+    """
+    container, stem = split_stem_ref(path)
+    if stem is None:
+        return ["-i", path]
+    index, skip = stream_info(container, stem)
+    args = ["-i", container, "-map", f"0:a:{index}"]
+    if skip:
+        args += ["-af", _trim_filter(skip)]
+    return args
+
+
+def _trim_filter(skip: int) -> str:
+    return f"atrim=start_sample={skip},asetpts=PTS-STARTPTS"
+
+
+def _iter_pcm(cmd: List[str], block_frames: int, channels: int) -> Iterator[np.ndarray]:
+    """
+    Ejecutar FFmpeg y leer su salida f32le en bloques (frames, channels)
+    
+    Raises:
+        RuntimeError: Si FFmpeg falla (tras entregar lo que haya decodificado)
+    """
+    # stderr a un archivo: con un pipe sin leer, muchos errores seguidos
+    # llenarían el buffer y bloquearían a FFmpeg
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        frame_bytes = 4 * channels
+        try:
+            while True:
+                data = _read_exact(process.stdout, block_frames * frame_bytes)
+                usable = len(data) - len(data) % frame_bytes
+                if usable:
+                    yield np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, channels)
+                if len(data) < block_frames * frame_bytes:
+                    break
+            # Fin de la salida: un código distinto de 0 es una decodificación
+            # incompleta, no el final del audio
+            if process.wait() != 0:
+                stderr.seek(0)
+                detail = stderr.read().decode("utf-8", errors="replace").strip()
+                raise RuntimeError(f"FFmpeg terminó con código {process.returncode}: {detail[-500:]}")
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+
+def decode_blocks(
+    path: str,
+    block_frames: int = BLOCK_FRAMES,
+    sample_rate: int = SAMPLE_RATE,
+    channels: int = CHANNELS,
+    start: Optional[float] = None,
+    duration: Optional[float] = None
+) -> Iterator[np.ndarray]:
+    """
+    Decodificar un archivo de audio en bloques float32
+    
+    Args:
+        path: Archivo de audio
+        block_frames: Frames por bloque (el último puede ser más corto)
+        sample_rate: Frecuencia de muestreo de salida
+        channels: Canales de salida
+        start: Segundo inicial (opcional)
+        duration: Duración a decodificar en segundos (opcional)
+        
+    Yields:
+        Arrays de forma (frames, channels)
+    """
+    cmd = [ffmpeg_executable(), "-v", "error", "-nostdin"]
+    if start:
+        cmd += ["-ss", str(start)]
+    if duration:
+        cmd += ["-t", str(duration)]
+    cmd += [
+        *input_args(path),
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", str(channels), "-ar", str(sample_rate),
+        "-"
+    ]
+    yield from _iter_pcm(cmd, block_frames, channels)
+
+
+def decode_multi_blocks(
+    container: str,
+    streams: List[Tuple[int, int]],
+    block_frames: int = BLOCK_FRAMES,
+    sample_rate: int = SAMPLE_RATE
+) -> Iterator[np.ndarray]:
+    """
+    Decodificar varias pistas de un contenedor con un único FFmpeg
+    
+    Los flujos se convierten a estéreo y se intercalan con ``amerge``, así
+    que todas las pistas llegan alineadas en el mismo bloque.
+    
+    Args:
+        container: Contenedor multipista
+        streams: Pares (índice del flujo, muestras iniciales a descartar)
+            como los de ``stream_info``
+        
+    Yields:
+        Arrays de forma (frames, pistas, CHANNELS)
+    """
+    chains = [
+        f"[0:a:{index}]{_trim_filter(skip) + ',' if skip else ''}aresample={sample_rate},"
+        f"aformat=sample_fmts=flt:channel_layouts=stereo[s{i}]"
+        for i, (index, skip) in enumerate(streams)
+    ]
+    inputs = "".join(f"[s{i}]" for i in range(len(streams)))
+    merge = f"{inputs}amerge=inputs={len(streams)}[out]" if len(streams) > 1 else f"{inputs}anull[out]"
+    cmd = [
+        ffmpeg_executable(), "-v", "error", "-nostdin",
+        "-i", container,
+        "-filter_complex", ";".join(chains + [merge]),
+        "-map", "[out]",
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-"
+    ]
+    channels = CHANNELS * len(streams)
+    for block in _iter_pcm(cmd, block_frames, channels):
+        yield block.reshape(len(block), len(streams), CHANNELS)
+
+
+def decode_file(path: str, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS) -> np.ndarray:
+    """
+    Decodificar un archivo completo a un array (frames, channels)
+    """
+    blocks = list(decode_blocks(path, sample_rate=sample_rate, channels=channels))
+    if not blocks:
+        return np.zeros((0, channels), dtype=np.float32)
+    return np.concatenate(blocks)
+
+
+def encode_blocks(
+    blocks: Iterable[np.ndarray],
+    output_format: str = "mp3",
+    bitrate: str = "192k",
+    sample_rate: int = SAMPLE_RATE,
+    channels: int = CHANNELS,
+    read_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    """
+    Codificar un flujo de bloques float32 y devolver los bytes según se generan
+    
+    Los bloques se escriben en FFmpeg desde un hilo aparte para poder leer la
+    salida codificada a la vez y enviarla progresivamente.
+    """
+    codec_args, _ = OUTPUT_FORMATS[output_format]
+    cmd = [
+        ffmpeg_executable(), "-v", "error", "-nostdin",
+        "-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "-",
+        *codec_args, "-b:a", bitrate,
+        "-"
+    ]
+    process = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    errors: List[BaseException] = []
+    
+    def feed():
+        try:
+            for block in blocks:
+                try:
+                    process.stdin.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+                except (BrokenPipeError, ValueError, OSError):
+                    # El lector se cerró (cliente desconectado)
+                    break
+        except BaseException as e:
+            # Error al producir los bloques (decodificación, mezcla...): la
+            # salida quedaría truncada, así que se relanza al consumidor
+            errors.append(e)
+        finally:
+            # Cerrar los decodificadores de origen aunque no se hayan agotado
+            if hasattr(blocks, "close"):
+                blocks.close()
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+    
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    try:
+        while True:
+            chunk = process.stdout.read1(read_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        writer.join()
+    
+    if errors:
+        raise errors[0]
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg terminó con código {process.returncode}")
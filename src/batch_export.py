@@ -0,0 +1,340 @@
+"""
+Exportación por lotes de versiones instrumentales (karaoke)
+
+Para un artista o toda la biblioteca genera la versión "todo menos la voz"
+de cada canción y las reúne en un único ZIP:
+
+- Canciones con pistas separadas: mezcla de todas las pistas salvo
+  ``vocals`` (sin volver a separar).
+- Canciones sin pistas: separación en dos pistas con Demucs
+  (``--two-stems vocals``) y se usa ``no_vocals``.
+
+Las canciones se reparten en un pool de procesos. Cada versión se escribe
+de forma atómica en ``data/exports/<id>/files/`` y el progreso se guarda en
+``manifest.json``; si la exportación se interrumpe, al repetirla se
+reutilizan las versiones ya generadas que sigan al día. Lo mismo al
+cancelarla: se descartan las canciones pendientes, se esperan las que están
+en marcha y lo generado se reutiliza la próxima vez.
+
+Uso::
+    
+    python -m src.batch_export [--artist NOMBRE] [--model htdemucs] [--workers N]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from src.audio_io import encode_blocks
+from src.cancellation import JobCancelled, check_cancelled
+from src.capabilities import torch_device
+from src.config import CANCEL_POLL_INTERVAL, EXPORTS_DIR, EXPORT_WORKERS
+from src.file_manager import get_song_stems
+from src.mixdown import mix_blocks
+from src.separation_backends import get_backend
+from src.stem_container import audio_mtime, has_stems
+from src.storage import keep_fresh
+
+
+# Pista que se elimina en la versión instrumental
+VOCALS_STEM = "vocals"
+
+# Modelo por defecto para las canciones sin pistas (más rápido que el de 6)
+DEFAULT_EXPORT_MODEL = "htdemucs"
+
+OUTPUT_BITRATE = "320k"
+
+_EXPORT_ID = re.compile(r"^[\w\-]+$")
+
+
+def export_id_for(artist: Optional[str]) -> str:
+    """
+    ID estable de la exportación de un artista (o de toda la biblioteca)
+    
+    Es estable para que repetir la misma exportación reanude la anterior.
+    """
+    return "instrumental_" + re.sub(r"[^\w\-]+", "_", artist or "biblioteca").strip("_")
+
+
+def export_dir_for(export_id: str) -> str:
+    """
+    Carpeta de trabajo de una exportación
+    
+    Raises:
+        ValueError: Si el ID no es válido
+    """
+    if not _EXPORT_ID.match(export_id):
+        raise ValueError("ID de exportación no válido")
+    return os.path.join(EXPORTS_DIR, export_id)
+
+
+def archive_path_for(export_id: str) -> str:
+    """
+    Ruta del ZIP final de una exportación
+    """
+    return export_dir_for(export_id) + ".zip"
+
+
+def plan_export(artist: Optional[str] = None, music_dir: str = "music") -> List[Dict]:
+    """
+    Listar las canciones a exportar
+    
+    Args:
+        artist: Carpeta del artista (None = toda la biblioteca)
+        music_dir: Carpeta de la biblioteca
+    
+    Returns:
+        Lista de {artist, song, file_path, has_stems}
+    
+    Raises:
+        ValueError: Si el artista no existe
+    """
+    if artist is not None:
+        if artist in ("", ".", "..") or os.sep in artist or "/" in artist:
+            raise ValueError("Artista no válido")
+        if not os.path.isdir(os.path.join(music_dir, artist)):
+            raise ValueError(f"El artista no existe: {artist}")
+        artists = [artist]
+    elif os.path.isdir(music_dir):
+        artists = sorted(
+            folder for folder in os.listdir(music_dir)
+            if os.path.isdir(os.path.join(music_dir, folder))
+        )
+    else:
+        artists = []
+    
+    songs = []
+    for artist_folder in artists:
+        artist_path = os.path.join(music_dir, artist_folder)
+        for item in sorted(os.listdir(artist_path)):
+            if not item.endswith('.mp3'):
+                continue
+            song = os.path.splitext(item)[0]
+            songs.append({
+                "artist": artist_folder,
+                "song": song,
+                "file_path": os.path.join(artist_path, item).replace('\\', '/'),
+                "has_stems": has_stems(os.path.join(artist_path, song)),
+            })
+    return songs
+
+
+def _output_name(entry: Dict) -> str:
+    return os.path.join(entry["artist"], f"{entry['song']} (Instrumental).mp3")
+
+
+def _source_mtime(entry: Dict) -> float:
+    """
+    Última modificación de lo que se usa para generar la versión
+    """
+    if entry["has_stems"]:
+        stems = get_song_stems(entry["artist"], entry["song"])
+        return max((audio_mtime(path) for path in stems.values()), default=0.0)
+    return os.path.getmtime(entry["file_path"])
+
+
+def _mix_without_vocals(artist: str, song: str, output_path: str):
+    """
+    Mezclar todas las pistas de una canción salvo la voz
+    """
+    stems = get_song_stems(artist, song)
+    accompaniment = {stem: path for stem, path in stems.items() if stem != VOCALS_STEM}
+    if not accompaniment:
+        raise ValueError("La canción sólo tiene pista de voz")
+    
+    with open(output_path, "wb") as f:
+        for chunk in encode_blocks(mix_blocks(accompaniment, {}), "mp3", OUTPUT_BITRATE):
+            f.write(chunk)
+
+
+def _separate_without_vocals(file_path: str, model: str, output_path: str):
+    """
+    Separar en voz / resto y quedarse con el resto
+    """
+    with tempfile.TemporaryDirectory(dir=EXPORTS_DIR) as temp_output:
+        fresh = keep_fresh(temp_output)
+        try:
+            paths = get_backend().separate_file(
+                file_path,
+                os.path.join(temp_output, "stems"),
+                stems=[f"no_{VOCALS_STEM}"],
+                options={
+                    "model": model,
+                    "device": torch_device(),
+                    "output_format": "mp3",
+                    "bitrate": OUTPUT_BITRATE,
+                    "work_dir": temp_output,
+                }
+            )
+        finally:
+            fresh.set()
+        no_vocals = paths.get(f"no_{VOCALS_STEM}")
+        if not no_vocals:
+            raise RuntimeError(f"No se generó la pista sin voz de {file_path}")
+        shutil.move(no_vocals, output_path)
+
+
+def render_instrumental(entry: Dict, output_path: str, model: str) -> str:
+    """
+    Generar la versión instrumental de una canción (se ejecuta en el pool)
+    
+    Args:
+        entry: Canción de ``plan_export``
+        output_path: Archivo de salida (se escribe de forma atómica)
+        model: Modelo de Demucs para las canciones sin pistas
+    
+    Returns:
+        Cómo se ha generado: "stems" o "separated"
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if entry["has_stems"]:
+            _mix_without_vocals(entry["artist"], entry["song"], temp_path)
+            method = "stems"
+        else:
+            _separate_without_vocals(entry["file_path"], model, temp_path)
+            method = "separated"
+        os.replace(temp_path, output_path)
+        return method
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _write_manifest(path: str, manifest: Dict):
+    manifest["updated_at"] = time.time()
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def _build_archive(export_id: str, files_dir: str, entries: List[Dict]) -> str:
+    """
+    Reunir las versiones generadas en un ZIP (sin recomprimir los MP3)
+    """
+    archive_path = archive_path_for(export_id)
+    temp_path = f"{archive_path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for entry in entries:
+            if entry["status"] in ("done", "reused"):
+                name = _output_name(entry)
+                archive.write(os.path.join(files_dir, name), arcname=name.replace('\\', '/'))
+    os.replace(temp_path, archive_path)
+    return archive_path
+
+
+def run_export(
+    artist: Optional[str] = None,
+    model: str = DEFAULT_EXPORT_MODEL,
+    workers: int = EXPORT_WORKERS,
+    on_progress: Optional[Callable[[int, int, Dict], None]] = None
+) -> Dict:
+    """
+    Exportar las versiones instrumentales de un artista o de la biblioteca
+    
+    Args:
+        artist: Carpeta del artista (None = toda la biblioteca)
+        model: Modelo de Demucs para las canciones sin pistas
+        workers: Procesos del pool
+        on_progress: Función (terminadas, total, canción) llamada tras cada canción
+    
+    Returns:
+        Manifiesto final con el estado de cada canción y la ruta del ZIP
+    """
+    export_id = export_id_for(artist)
+    export_dir = export_dir_for(export_id)
+    files_dir = os.path.join(export_dir, "files")
+    manifest_path = os.path.join(export_dir, "manifest.json")
+    os.makedirs(files_dir, exist_ok=True)
+    
+    entries = plan_export(artist)
+    manifest = {
+        "export_id": export_id,
+        "artist": artist,
+        "model": model,
+        "started_at": time.time(),
+        "songs": entries,
+    }
+    
+    # Reanudar: las versiones ya generadas y al día no se repiten
+    pending = []
+    for entry in entries:
+        output_path = os.path.join(files_dir, _output_name(entry))
+        if os.path.exists(output_path) and os.path.getmtime(output_path) >= _source_mtime(entry):
+            entry["status"] = "reused"
+        else:
+            entry["status"] = "pending"
+            pending.append(entry)
+    _write_manifest(manifest_path, manifest)
+    
+    finished = len(entries) - len(pending)
+    if on_progress:
+        on_progress(finished, len(entries), {})
+    
+    if pending:
+        # spawn: el pool puede crearse desde un proceso con hilos en marcha
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context) as pool:
+            futures = {
+                pool.submit(render_instrumental, entry, os.path.join(files_dir, _output_name(entry)), model): entry
+                for entry in pending
+            }
+            remaining = set(futures)
+            while remaining:
+                try:
+                    check_cancelled()
+                except JobCancelled:
+                    # Las canciones en marcha terminan (no se pueden parar
+                    # sin matar el pool) y se reutilizan al repetirla
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise
+                done, remaining = wait(remaining, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entry = futures[future]
+                    try:
+                        entry["method"] = future.result()
+                        entry["status"] = "done"
+                    except Exception as e:
+                        print(f"Error al exportar {entry['file_path']}: {e}")
+                        entry["status"] = "error"
+                        entry["error"] = str(e)
+                    finished += 1
+                    _write_manifest(manifest_path, manifest)
+                    if on_progress:
+                        on_progress(finished, len(entries), entry)
+    
+    manifest["archive"] = _build_archive(export_id, files_dir, entries)
+    manifest["finished_at"] = time.time()
+    _write_manifest(manifest_path, manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar versiones instrumentales en un ZIP")
+    parser.add_argument("--artist", default=None, help="Carpeta del artista (por defecto toda la biblioteca)")
+    parser.add_argument("--model", default=DEFAULT_EXPORT_MODEL, help="Modelo de Demucs para canciones sin pistas")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="Procesos en paralelo")
+    args = parser.parse_args()
+    
+    def progress(done: int, total: int, entry: Dict):
+        if entry:
+            print(f"[{done}/{total}] {entry['status']}: {entry['artist']} - {entry['song']}")
+    
+    manifest = run_export(args.artist, model=args.model, workers=args.workers, on_progress=progress)
+    errors = [entry for entry in manifest["songs"] if entry["status"] == "error"]
+    print(f"📦 Exportación guardada en: {manifest['archive']}")
+    if errors:
+        print(f"⚠️  {len(errors)} canciones con errores (repetir la exportación para reintentarlas)")
+
+
+if __name__ == "__main__":
+    main()
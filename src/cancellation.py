@@ -0,0 +1,197 @@
+"""
+Cancelación cooperativa de trabajos
+
+Cada trabajo en marcha tiene un ``CancelToken`` que ``JobWorker`` activa
+cuando la tarea se marca para cancelar (``DELETE /api/task/{task_id}``) o
+para desplazar (un trabajo interactivo necesita su hueco). El trabajo se
+entera en sus puntos de cancelación:
+
+- ``check_cancelled()`` entre bloques de inferencia, segmentos o canciones,
+- ``run_process()`` para subprocesos (demucs, ...): los termina al vuelo,
+- ``wait()`` en lugar de ``time.sleep``.
+
+El token activo es local al hilo (``cancellable``) para que las funciones
+de separación y descarga no tengan que recibirlo como argumento; fuera de un
+trabajo no hay token y los puntos de cancelación no hacen nada.
+
+``JobCancelled`` hereda de ``BaseException`` (como ``KeyboardInterrupt``)
+para atravesar los ``except Exception`` que convierten errores en
+``None`` o en estado ``error``; la limpieza va en bloques ``finally``.
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+
+# Motivos de cancelación
+CANCELLED = "cancelled"
+PREEMPTED = "preempted"
+
+# Cada cuánto comprueba run_process si hay que terminar el subproceso (segundos)
+PROCESS_POLL_INTERVAL = 0.2
+
+# Tiempo que se da a un subproceso para salir antes de matarlo (segundos)
+TERMINATE_GRACE_SECONDS = 5.0
+
+
+class JobCancelled(BaseException):
+    """
+    El trabajo se ha cancelado o desplazado
+    
+    Attributes:
+        reason: "cancelled" o "preempted"
+    """
+    
+    def __init__(self, reason: str = CANCELLED):
+        self.reason = reason
+        super().__init__(f"Trabajo {'desplazado' if reason == PREEMPTED else 'cancelado'}")
+
+
+class CancelToken:
+    """
+    Señal de cancelación de un trabajo (se activa desde otro hilo)
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+    
+    def cancel(self, reason: str = CANCELLED):
+        """Pedir la cancelación (la primera razón es la que cuenta)"""
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def raise_if_cancelled(self):
+        """
+        Raises:
+            JobCancelled: Si se ha pedido la cancelación
+        """
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+    
+    def wait(self, timeout: float):
+        """
+        Esperar ``timeout`` segundos salvo que se cancele antes
+        
+        Raises:
+            JobCancelled: Si se cancela durante la espera
+        """
+        self._event.wait(timeout)
+        self.raise_if_cancelled()
+
+
+_local = threading.local()
+
+
+def current_token() -> Optional[CancelToken]:
+    """Token del trabajo que se ejecuta en este hilo (o None)"""
+    return getattr(_local, "token", None)
+
+
+@contextmanager
+def cancellable(token: CancelToken) -> Iterator[CancelToken]:
+    """
+    Activar ``token`` en este hilo mientras dura el bloque
+    """
+    previous = current_token()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def check_cancelled():
+    """
+    Punto de cancelación: no hace nada salvo que el trabajo se haya cancelado
+    
+    Raises:
+        JobCancelled: Si el trabajo de este hilo se ha cancelado
+    """
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def wait(seconds: float):
+    """
+    ``time.sleep`` que se interrumpe si el trabajo se cancela
+    
+    Raises:
+        JobCancelled: Si el trabajo se cancela durante la espera
+    """
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.wait(seconds)
+
+
+def _terminate(process: subprocess.Popen):
+    """
+    Terminar un subproceso y los suyos (demucs lanza ffmpeg y workers)
+    """
+    try:
+        if os.name == "nt":
+            process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+        process.wait(TERMINATE_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        process.wait()
+
+
+def run_process(cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """
+    Ejecutar un comando como ``subprocess.run(cmd, check=True,
+    capture_output=True)`` pero terminándolo si el trabajo se cancela
+    
+    Raises:
+        JobCancelled: Si el trabajo se cancela (el subproceso ya ha terminado)
+        subprocess.CalledProcessError: Si el comando falla
+    """
+    token = current_token()
+    if token is None:
+        return subprocess.run(cmd, check=True, capture_output=True, **kwargs)
+    
+    token.raise_if_cancelled()
+    if os.name != "nt":
+        # Grupo de procesos propio para terminar también a sus hijos
+        kwargs.setdefault("start_new_session", True)
+    
+    # Hilo lector: con stdout/stderr en PIPE, sondear con wait() podría
+    # bloquear el subproceso al llenarse la tubería
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+    output = {}
+    reader = threading.Thread(
+        target=lambda: output.update(zip(("stdout", "stderr"), process.communicate())),
+        daemon=True
+    )
+    reader.start()
+    
+    while reader.is_alive():
+        if token.cancelled:
+            _terminate(process)
+            reader.join()
+            token.raise_if_cancelled()
+        reader.join(PROCESS_POLL_INTERVAL)
+    
+    stdout, stderr = output.get("stdout"), output.get("stderr")
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
@@ -0,0 +1,124 @@
+"""
+Descubrimiento de herramientas externas (una vez por proceso)
+
+Localizar FFmpeg, Deno y Demucs o elegir el dispositivo de torch implica
+recorrer rutas con glob, consultar el PATH o importar torch. Cada consulta
+se hace la primera vez que se necesita y queda en caché para el resto del
+proceso; ``capability_report()`` reúne todo para diagnóstico.
+"""
+import importlib.metadata
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+
+from src.download_music import find_ffmpeg
+
+
+# Ubicaciones habituales de Deno en Windows (runtime JS para yt-dlp)
+DENO_PATHS = [
+    os.path.expandvars(r'%USERPROFILE%\.deno\bin\deno.exe'),
+    os.path.expandvars(r'%LOCALAPPDATA%\deno\bin\deno.exe'),
+    r'C:\Program Files\deno\deno.exe',
+    # Ruta de instalación de WinGet
+    os.path.expandvars(r'%LOCALAPPDATA%\Microsoft\WinGet\Packages\DenoLand.Deno_Microsoft.Winget.Source_8wekyb3d8bbwe\deno.exe'),
+]
+
+# Paquetes Python de los que se informa la versión (sin importarlos)
+REPORTED_PACKAGES = ("fastapi", "uvicorn", "yt-dlp", "numpy", "demucs", "torch")
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_location() -> Optional[str]:
+    """
+    Carpeta de FFmpeg instalada por winget (None si se usa el del PATH)
+    """
+    return find_ffmpeg()
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_executable() -> str:
+    """
+    Ruta del ejecutable de FFmpeg
+    """
+    ffmpeg_dir = ffmpeg_location()
+    if ffmpeg_dir:
+        for name in ("ffmpeg.exe", "ffmpeg"):
+            candidate = os.path.join(ffmpeg_dir, name)
+            if os.path.exists(candidate):
+                return candidate
+    return shutil.which("ffmpeg") or "ffmpeg"
+
+
+@lru_cache(maxsize=1)
+def deno_location() -> Optional[str]:
+    """
+    Ruta de Deno si está instalado
+    """
+    for deno_path in DENO_PATHS:
+        if os.path.exists(deno_path):
+            return deno_path
+    return shutil.which("deno")
+
+
+@lru_cache(maxsize=1)
+def demucs_executable() -> Optional[str]:
+    """
+    Ruta del ejecutable de Demucs en el PATH
+    """
+    return shutil.which("demucs")
+
+
+@lru_cache(maxsize=1)
+def torch_device() -> str:
+    """
+    Dispositivo para Demucs: "cuda" si torch ve una GPU, si no "cpu"
+    
+    torch se importa en un subproceso para no cargarlo (ni su memoria) en
+    la API o el worker, que sólo lanzan Demucs como proceso aparte.
+    """
+    if importlib.util.find_spec("torch") is None:
+        return "cpu"
+    try:
+        result = subprocess.run(
+            [sys.executable, "-c", "import torch; print(torch.cuda.is_available())"],
+            capture_output=True,
+            text=True,
+            timeout=120
+        )
+        return "cuda" if result.stdout.strip() == "True" else "cpu"
+    except Exception as e:
+        print(f"Error al consultar torch: {e}")
+        return "cpu"
+
+
+def _package_version(package: str) -> Optional[str]:
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+@lru_cache(maxsize=1)
+def capability_report() -> Dict:
+    """
+    Informe de herramientas y paquetes disponibles en este proceso
+    
+    Returns:
+        Diccionario con rutas de ffmpeg/deno/demucs, dispositivo de torch,
+        versiones de paquetes y el tiempo que costó descubrirlo
+    """
+    start = time.perf_counter()
+    report = {
+        "ffmpeg": ffmpeg_executable(),
+        "deno": deno_location(),
+        "demucs": demucs_executable(),
+        "torch_device": torch_device(),
+        "packages": {package: _package_version(package) for package in REPORTED_PACKAGES},
+    }
+    report["discovery_seconds"] = round(time.perf_counter() - start, 3)
+    return report
@@ -0,0 +1,209 @@
+"""
+Configuración central de rutas de la aplicación
+"""
+import os
+
+
+# Carpetas de la biblioteca
+MUSIC_DIR = os.environ.get("SHELU_MUSIC_DIR", "music")
+SEPARATED_DIR = os.environ.get("SHELU_SEPARATED_DIR", "separated")
+
+# Carpeta de estado interno (índices, descargas parciales, cachés)
+DATA_DIR = os.environ.get("SHELU_DATA_DIR", "data")
+
+# Índice de la biblioteca (video_id -> archivo)
+LIBRARY_DB = os.path.join(DATA_DIR, "library.db")
+
+# Descargas en curso o interrumpidas (.part reanudables)
+DOWNLOADS_DIR = os.path.join(DATA_DIR, "downloads")
+
+# Almacén de estado de tareas: "sqlite" (compartido entre procesos) o "memory"
+TASK_STORE_BACKEND = os.environ.get("SHELU_TASK_STORE", "sqlite")
+TASKS_DB = os.path.join(DATA_DIR, "tasks.db")
+
+# Las tareas terminadas se eliminan pasado este tiempo (segundos)
+TASK_TTL_SECONDS = float(os.environ.get("SHELU_TASK_TTL", 24 * 3600))
+
+# Máximo de tareas terminadas que se conservan aunque no hayan caducado
+TASK_MAX_FINISHED = int(os.environ.get("SHELU_TASK_MAX_FINISHED", 5000))
+
+# Cada cuánto se ejecuta la limpieza de tareas caducadas (segundos)
+TASK_EVICT_INTERVAL = float(os.environ.get("SHELU_TASK_EVICT_INTERVAL", 600))
+
+# Al arrancar, los trabajos que estaban en marcha cuando murió su proceso
+# vuelven a la cola (como mucho MAX_RESUMES veces, por si son ellos los que
+# tumban el proceso); si no, quedan como "interrupted"
+RESUME_INTERRUPTED = os.environ.get("SHELU_RESUME_INTERRUPTED", "1") == "1"
+MAX_RESUMES = int(os.environ.get("SHELU_MAX_RESUMES", 3))
+
+# Latido de los procesos que ejecutan trabajos (segundos): cada JobWorker lo
+# renueva cada TASK_HEARTBEAT_INTERVAL y un trabajo en marcha cuyo proceso
+# lleva más de TASK_HEARTBEAT_TIMEOUT sin latir se da por muerto
+TASK_HEARTBEAT_INTERVAL = float(os.environ.get("SHELU_TASK_HEARTBEAT_INTERVAL", 10))
+TASK_HEARTBEAT_TIMEOUT = float(os.environ.get("SHELU_TASK_HEARTBEAT_TIMEOUT", 60))
+
+# Puntos de control de las separaciones largas: las entradas de al menos
+# SHELU_CHECKPOINT_MIN_SECONDS (0 = nunca, p. ej. 1200 para sesiones de más
+# de 20 minutos) se separan por fragmentos de SHELU_CHECKPOINT_CHUNK_SECONDS
+# y cada fragmento terminado se guarda para que un trabajo reanudado sólo
+# separe los que faltan. Fragmentar cuesta tiempo (contexto repetido y, con
+# la CLI de Demucs, cargar el modelo en cada fragmento), así que por defecto
+# se separa de una vez
+CHECKPOINTS_DIR = os.path.join(DATA_DIR, "checkpoints")
+CHECKPOINT_MIN_SECONDS = float(os.environ.get("SHELU_CHECKPOINT_MIN_SECONDS", 0))
+CHECKPOINT_CHUNK_SECONDS = float(os.environ.get("SHELU_CHECKPOINT_CHUNK_SECONDS", 300))
+
+# Cachés de audio generado
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+MIX_CACHE_DIR = os.path.join(CACHE_DIR, "mix")
+
+# Caché de audio decodificado (float32 en .npy, se lee con np.memmap):
+# tamaño máximo en MB antes de expulsar lo menos usado (0 = desactivada)
+DECODED_CACHE_DIR = os.path.join(CACHE_DIR, "decoded")
+DECODED_CACHE_MAX_MB = float(os.environ.get("SHELU_DECODED_CACHE_MB", 4096))
+
+# Caché de entradas de Demucs ya decodificadas (WAV float32 a 44.1 kHz, por
+# hash del contenido) para volver a separar con otro modelo sin decodificar
+# el MP3: tamaño máximo en MB (0 = desactivada)
+INPUT_CACHE_DIR = os.path.join(CACHE_DIR, "inputs")
+INPUT_CACHE_MAX_MB = float(os.environ.get("SHELU_INPUT_CACHE_MB", 2048))
+
+# Versiones de previsualización (Opus de bajo bitrate en segmentos):
+# desactivadas salvo SHELU_PREVIEWS=1, porque generarlas vuelve a decodificar
+# cada pista (decenas de segundos por canción separada)
+PREVIEWS_ENABLED = os.environ.get("SHELU_PREVIEWS", "0") == "1"
+PREVIEW_BITRATE = os.environ.get("SHELU_PREVIEW_BITRATE", "48k")
+PREVIEW_SEGMENT_SECONDS = float(os.environ.get("SHELU_PREVIEW_SEGMENT_SECONDS", 10))
+
+# Ejecución de trabajos (descargas y separaciones):
+#   "inline": el proceso de la API ejecuta los trabajos en hilos propios
+#   "external": la API sólo encola y los ejecutan procesos de src/worker.py
+JOB_MODE = os.environ.get("SHELU_JOB_MODE", "inline")
+
+# Trabajos simultáneos por proceso worker según tipo
+DOWNLOAD_SLOTS = int(os.environ.get("SHELU_DOWNLOAD_SLOTS", 4))
+SEPARATION_SLOTS = int(os.environ.get("SHELU_SEPARATION_SLOTS", 1))
+EXPORT_SLOTS = int(os.environ.get("SHELU_EXPORT_SLOTS", 1))
+EXCERPT_SLOTS = int(os.environ.get("SHELU_EXCERPT_SLOTS", 1))
+# Formas de onda, previsualizaciones y sonoridad tras publicar un audio
+ARTIFACT_SLOTS = int(os.environ.get("SHELU_ARTIFACT_SLOTS", 1))
+
+# Cada cuánto buscan trabajo nuevo los workers (segundos)
+JOB_POLL_INTERVAL = float(os.environ.get("SHELU_JOB_POLL_INTERVAL", 0.5))
+
+# Máximo que espera POST /api/download a la descarga antes de responder 202
+# con el task_id (segundos)
+DOWNLOAD_WAIT_TIMEOUT = float(os.environ.get("SHELU_DOWNLOAD_WAIT_TIMEOUT", 120))
+
+# Instantáneas de métricas por proceso (agregadas por /metrics)
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("SHELU_METRICS_FLUSH_INTERVAL", 5))
+
+# Perfilado (desactivado por defecto):
+#   SHELU_PROFILING=1 permite pedir el perfil de una petición con la cabecera
+#   X-Shelu-Profile: 1 (y de los trabajos que encole)
+#   SHELU_PROFILE_JOBS=1 perfila todas las descargas y separaciones
+#   SHELU_PROFILE_ROUTES=/api/music-tree,... perfila siempre esas rutas
+PROFILING_ENABLED = os.environ.get("SHELU_PROFILING", "0") == "1"
+PROFILE_ALL_JOBS = os.environ.get("SHELU_PROFILE_JOBS", "0") == "1"
+PROFILE_ROUTES = [r for r in os.environ.get("SHELU_PROFILE_ROUTES", "").split(",") if r]
+
+# Perfilador de los trabajos: "sampling" (speedscope) o "cprofile" (pstats)
+PROFILER = os.environ.get("SHELU_PROFILER", "sampling")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("SHELU_PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("SHELU_PROFILE_MAX_FILES", 200))
+
+# Clases de prioridad de los trabajos y su peso en el reparto de huecos
+# (con 8:1, de cada 9 trabajos que empiezan con ambas colas llenas, 8 son
+# interactivos)
+PRIORITY_WEIGHTS = {
+    "interactive": float(os.environ.get("SHELU_WEIGHT_INTERACTIVE", 8)),
+    "batch": float(os.environ.get("SHELU_WEIGHT_BATCH", 1)),
+}
+
+# Separaciones simultáneas en todo el despliegue (serve.py lo calcula)
+SEPARATION_CAPACITY = int(os.environ.get("SHELU_SEPARATION_CAPACITY", SEPARATION_SLOTS))
+
+# Desplazar separaciones batch en marcha cuando hay interactivas esperando
+# con todos los huecos ocupados (se vuelven a encolar y empiezan de nuevo)
+PREEMPT_BATCH = os.environ.get("SHELU_PREEMPT_BATCH", "0") == "1"
+
+# Cada cuánto mira el worker si hay que cancelar sus trabajos en marcha (segundos)
+CANCEL_POLL_INTERVAL = float(os.environ.get("SHELU_CANCEL_POLL_INTERVAL", 1.0))
+
+# Duración supuesta de una separación mientras no hay historial (segundos)
+SEPARATION_ESTIMATE_SECONDS = float(os.environ.get("SHELU_SEPARATION_ESTIMATE", 180))
+
+# Espera máxima estimada admitida por clase antes de responder 429 (segundos)
+ADMISSION_MAX_WAIT = {
+    "interactive": float(os.environ.get("SHELU_MAX_WAIT_INTERACTIVE", 900)),
+    "batch": float(os.environ.get("SHELU_MAX_WAIT_BATCH", 7 * 24 * 3600)),
+}
+
+# Análisis de tempo y tonalidad tras separar (procesos en segundo plano)
+ANALYSIS_ENABLED = os.environ.get("SHELU_ANALYSIS", "1") == "1"
+ANALYSIS_WORKERS = int(os.environ.get("SHELU_ANALYSIS_WORKERS", 1))
+
+# Normalización de sonoridad al reproducir (EBU R128): nivel objetivo en LUFS
+# y pico real máximo tras aplicar la ganancia (dBTP)
+LOUDNESS_TARGET_LUFS = float(os.environ.get("SHELU_LOUDNESS_TARGET", -14))
+TRUE_PEAK_CEILING = float(os.environ.get("SHELU_TRUE_PEAK_CEILING", -1))
+
+# Exportaciones por lotes (versiones instrumentales): carpeta de trabajo y
+# procesos que reparten las canciones de cada exportación
+EXPORTS_DIR = os.path.join(DATA_DIR, "exports")
+EXPORT_WORKERS = int(os.environ.get("SHELU_EXPORT_WORKERS", 2))
+
+# Motor de separación (src/separation_backends): "demucs_cli" (ejecutable
+# demucs), "torch" (Demucs dentro del proceso), "onnx" (ONNX Runtime con
+# modelos exportados en ONNX_MODELS_DIR) o "null" (pruebas)
+SEPARATION_BACKEND = os.environ.get("SHELU_SEPARATION_BACKEND", "demucs_cli")
+ONNX_MODELS_DIR = os.environ.get("SHELU_ONNX_MODELS_DIR", os.path.join(DATA_DIR, "models", "onnx"))
+
+# Formato en que se guardan las pistas separadas:
+#   "folder": un archivo por pista en music/<artist>/<song>/
+#   "container": un único music/<artist>/<song>.stems.mka multipista
+STEM_STORAGE = os.environ.get("SHELU_STEM_STORAGE", "folder")
+
+# Separación rápida de un fragmento (previsualización de pistas): duración
+# por defecto y máxima del fragmento (segundos) y carpeta de resultados
+EXCERPT_DEFAULT_SECONDS = float(os.environ.get("SHELU_EXCERPT_SECONDS", 30))
+EXCERPT_MAX_SECONDS = float(os.environ.get("SHELU_EXCERPT_MAX_SECONDS", 60))
+EXCERPTS_DIR = os.path.join(CACHE_DIR, "excerpts")
+
+# Pistas silenciosas (p. ej. guitar/piano de htdemucs_6s en canciones sin
+# esos instrumentos): una pista se descarta tras separar si su nivel RMS y
+# su pico quedan por debajo de estos umbrales (dBFS)
+SILENT_STEM_RMS_DB = float(os.environ.get("SHELU_SILENT_STEM_RMS_DB", -55))
+SILENT_STEM_PEAK_DB = float(os.environ.get("SHELU_SILENT_STEM_PEAK_DB", -35))
+
+# Presupuesto de disco por clase de archivo regenerable (MB, 0 = sin
+# límite): al superarlo se borra lo usado hace más tiempo (src/storage.py).
+# Los originales descargados nunca se borran.
+STORAGE_BUDGETS_MB = {
+    "stems": float(os.environ.get("SHELU_BUDGET_STEMS_MB", 0)),
+    "previews": float(os.environ.get("SHELU_BUDGET_PREVIEWS_MB", 0)),
+    "peaks": float(os.environ.get("SHELU_BUDGET_PEAKS_MB", 0)),
+    "mix": float(os.environ.get("SHELU_BUDGET_MIX_MB", 1024)),
+    "stem_cache": float(os.environ.get("SHELU_BUDGET_STEM_CACHE_MB", 2048)),
+    "decoded": DECODED_CACHE_MAX_MB,
+    "inputs": INPUT_CACHE_MAX_MB,
+    "excerpts": float(os.environ.get("SHELU_BUDGET_EXCERPTS_MB", 1024)),
+    "exports": float(os.environ.get("SHELU_BUDGET_EXPORTS_MB", 0)),
+}
+
+# Límite conjunto de todas las clases regenerables (MB, 0 = sin límite)
+STORAGE_TOTAL_BUDGET_MB = float(os.environ.get("SHELU_STORAGE_BUDGET_MB", 0))
+
+# No se borra nada usado en los últimos segundos indicados (reproducciones o
+# separaciones en curso)
+STORAGE_MIN_IDLE_SECONDS = float(os.environ.get("SHELU_STORAGE_MIN_IDLE", 600))
+
+# Cada cuánto aplica la API los presupuestos y limpia temporales (segundos)
+STORAGE_INTERVAL = float(os.environ.get("SHELU_STORAGE_INTERVAL", 900))
+
+# Antigüedad a partir de la que un temporal (separated/_temp, *.tmp) se
+# considera abandonado, y la de las descargas parciales (.part) sin reanudar
+TEMP_MAX_AGE_SECONDS = float(os.environ.get("SHELU_TEMP_MAX_AGE", 6 * 3600))
+PARTIAL_MAX_AGE_SECONDS = float(os.environ.get("SHELU_PARTIAL_MAX_AGE", 7 * 24 * 3600))
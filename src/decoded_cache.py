@@ -0,0 +1,315 @@
+"""
+Caché de audio decodificado
+
+Guarda canciones y pistas ya decodificadas como float32 estéreo a
+SAMPLE_RATE en archivos ``.npy`` (``data/cache/decoded/<clave>.npy``) que se
+abren con ``np.memmap``: leer cualquier tramo es tomar una vista del mapa,
+sin decodificar MP3 ni copiar datos, y el sistema operativo mantiene en
+memoria sólo las páginas que se usan.
+
+- La caché se rellena "de paso": la primera mezcla de una canción decodifica
+  como siempre y escribe los bloques en la caché mientras los envía; las
+  siguientes leen directamente del mapa.
+- La clave incluye ruta, tamaño y fecha del archivo de origen, así que al
+  volver a separar una canción sus entradas antiguas dejan de usarse.
+- Sólo se guarda una decodificación completa: FFmpeg debe terminar bien y
+  los frames leídos deben cubrir la duración que anuncia la cabecera (un
+  MP3 truncado se decodifica "bien" hasta donde llega).
+- Al superar ``SHELU_DECODED_CACHE_MB`` se borran las entradas usadas hace
+  más tiempo (cada acierto actualiza la fecha del archivo). Un mapa abierto
+  sigue siendo válido aunque su archivo se borre.
+"""
+import hashlib
+import io
+import os
+import threading
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from src.audio_io import (
+    BLOCK_FRAMES, CHANNELS, SAMPLE_RATE, decode_blocks, decode_multi_blocks, probe_duration
+)
+from src.config import DECODED_CACHE_DIR, DECODED_CACHE_MAX_MB
+from src.metrics import record_cache
+from src.stem_container import source_file, stem_ref, stream_info
+
+
+DECODED_EXTENSION = ".npy"
+
+_DTYPE = np.dtype("<f4")
+
+# Diferencia admitida entre lo decodificado y la duración de la cabecera
+# (relleno del codificador, pistas recortadas): la mayor de las dos
+DURATION_TOLERANCE_SECONDS = 1.0
+DURATION_TOLERANCE_RATIO = 0.02
+
+
+def cache_enabled() -> bool:
+    return DECODED_CACHE_MAX_MB > 0
+
+
+def cache_path_for(path: str) -> str:
+    """
+    Archivo de caché de un audio (ruta o referencia a una pista de un
+    contenedor) en su versión actual
+    """
+    stat = os.stat(source_file(path))
+    payload = f"{path}|{stat.st_size}|{stat.st_mtime}|{SAMPLE_RATE}|{CHANNELS}"
+    key = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(DECODED_CACHE_DIR, key + DECODED_EXTENSION)
+
+
+def _expected_frames(path: str) -> Optional[int]:
+    """
+    Frames que debería dar la decodificación completa de un audio
+    """
+    duration = probe_duration(path)
+    return int(duration * SAMPLE_RATE) if duration else None
+
+
+def _header(frames: int) -> bytes:
+    """
+    Cabecera .npy de un array (frames, CHANNELS) float32
+    
+    NumPy deja hueco en la cabecera para que la primera dimensión crezca,
+    así que su longitud no depende del número de frames y se puede reservar
+    antes de saberlo.
+    """
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, {
+        "descr": np.lib.format.dtype_to_descr(_DTYPE),
+        "fortran_order": False,
+        "shape": (frames, CHANNELS),
+    })
+    return buffer.getvalue()
+
+
+class _DecodedWriter:
+    """
+    Escritura incremental de una entrada de la caché (atómica al terminar)
+    """
+    
+    def __init__(self, cache_path: str, expected_frames: Optional[int] = None):
+        os.makedirs(DECODED_CACHE_DIR, exist_ok=True)
+        self.cache_path = cache_path
+        self.expected_frames = expected_frames
+        self.temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.header_size = len(_header(0))
+        self.frames = 0
+        self._file = open(self.temp_path, "wb")
+        self._file.write(b"\0" * self.header_size)
+    
+    def write(self, block: np.ndarray):
+        self._file.write(np.ascontiguousarray(block, dtype=_DTYPE).tobytes())
+        self.frames += len(block)
+    
+    def is_complete(self) -> bool:
+        """
+        Comprobar que se ha escrito toda la duración esperada
+        """
+        if not self.expected_frames:
+            return True
+        tolerance = max(DURATION_TOLERANCE_SECONDS * SAMPLE_RATE, DURATION_TOLERANCE_RATIO * self.expected_frames)
+        return self.frames >= self.expected_frames - tolerance
+    
+    def commit(self):
+        header = _header(self.frames)
+        if not self.frames or len(header) != self.header_size:
+            self.abort()
+            return
+        if not self.is_complete():
+            print(f"⚠️  Decodificación incompleta ({self.frames}/{self.expected_frames} frames), "
+                  f"no se guarda en caché: {self.cache_path}")
+            self.abort()
+            return
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.close()
+        os.replace(self.temp_path, self.cache_path)
+        enforce_budget()
+    
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def _open_cached(path: str) -> Optional[np.ndarray]:
+    """
+    Abrir una entrada existente (marcándola como usada) o None
+    """
+    try:
+        cache_path = cache_path_for(path)
+        decoded = np.load(cache_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+    return decoded
+
+
+def open_decoded(path: str, populate: bool = True) -> Optional[np.ndarray]:
+    """
+    Mapa en memoria (frames, CHANNELS) float32 de un audio decodificado
+    
+    Args:
+        path: Archivo o referencia a una pista de un contenedor
+        populate: Decodificar y guardar en la caché si no está
+    
+    Returns:
+        Array de sólo lectura respaldado por el archivo de caché, o None si
+        no está en caché (y no se pide rellenarla) o la caché está desactivada
+    """
+    if not cache_enabled():
+        return None
+    
+    decoded = _open_cached(path)
+    if decoded is not None or not populate:
+        record_cache("decoded", hit=decoded is not None)
+        return decoded
+    
+    for _ in cached_blocks(path):
+        pass
+    return _open_cached(path)
+
+
+def read_range(path: str, start: float = 0.0, duration: Optional[float] = None) -> np.ndarray:
+    """
+    Tramo de un audio decodificado (frames, CHANNELS)
+    
+    Con la caché activada devuelve una vista del mapa, sin copia; si no,
+    decodifica sólo ese tramo.
+    """
+    decoded = open_decoded(path)
+    if decoded is None:
+        blocks = list(decode_blocks(path, start=start, duration=duration))
+        return np.concatenate(blocks) if blocks else np.zeros((0, CHANNELS), dtype=_DTYPE)
+    
+    first = int(round(start * SAMPLE_RATE))
+    last = len(decoded) if duration is None else first + int(round(duration * SAMPLE_RATE))
+    return decoded[first:last]
+
+
+def _views(decoded: np.ndarray, block_frames: int) -> Iterator[np.ndarray]:
+    for start in range(0, len(decoded), block_frames):
+        yield decoded[start:start + block_frames]
+
+
+def cached_blocks(path: str, block_frames: int = BLOCK_FRAMES) -> Iterator[np.ndarray]:
+    """
+    Bloques (frames, CHANNELS) de un audio, desde la caché si está
+    
+    Si no está, decodifica como ``decode_blocks`` y guarda los bloques en la
+    caché según se leen (la entrada sólo se publica si se llega al final).
+    """
+    decoded = _open_cached(path) if cache_enabled() else None
+    if decoded is not None:
+        record_cache("decoded", hit=True)
+        yield from _views(decoded, block_frames)
+        return
+    
+    blocks = decode_blocks(path, block_frames)
+    if not cache_enabled():
+        yield from blocks
+        return
+    
+    record_cache("decoded", hit=False)
+    writer = _DecodedWriter(cache_path_for(path), _expected_frames(path))
+    completed = False
+    try:
+        for block in blocks:
+            writer.write(block)
+            yield block
+        completed = True
+    finally:
+        blocks.close()
+        if completed:
+            writer.commit()
+        else:
+            writer.abort()
+
+
+def cached_container_blocks(
+    container: str,
+    stems: List[str],
+    block_frames: int = BLOCK_FRAMES
+) -> Iterator[List[np.ndarray]]:
+    """
+    Bloques alineados de varias pistas de un mismo contenedor
+    
+    Si todas están en caché se leen de sus mapas; si no, se decodifican
+    todas con un único FFmpeg y se guardan en la caché por separado.
+    
+    Yields:
+        Lista con un bloque (frames, CHANNELS) por pista
+    """
+    refs = [stem_ref(container, stem) for stem in stems]
+    maps = [_open_cached(ref) for ref in refs] if cache_enabled() else [None] * len(refs)
+    if all(decoded is not None for decoded in maps):
+        record_cache("decoded", hit=True)
+        for start in range(0, max(len(decoded) for decoded in maps), block_frames):
+            yield [decoded[start:start + block_frames] for decoded in maps]
+        return
+    
+    blocks = decode_multi_blocks(container, [stream_info(container, stem) for stem in stems], block_frames)
+    if cache_enabled():
+        expected_frames = _expected_frames(container)
+        writers = [_DecodedWriter(cache_path_for(ref), expected_frames) for ref in refs]
+    else:
+        writers = []
+    if writers:
+        record_cache("decoded", hit=False)
+    completed = False
+    try:
+        for stacked in blocks:
+            per_stem = [stacked[:, i] for i in range(len(stems))]
+            for writer, block in zip(writers, per_stem):
+                writer.write(block)
+            yield per_stem
+        completed = True
+    finally:
+        blocks.close()
+        for writer in writers:
+            if completed:
+                writer.commit()
+            else:
+                writer.abort()
+
+
+def enforce_budget(max_bytes: Optional[float] = None) -> int:
+    """
+    Borrar las entradas usadas hace más tiempo hasta quedar dentro del límite
+    
+    Returns:
+        Bytes liberados
+    """
+    if max_bytes is None:
+        max_bytes = DECODED_CACHE_MAX_MB * 1024 * 1024
+    if not os.path.isdir(DECODED_CACHE_DIR):
+        return 0
+    
+    entries = []
+    for file in os.listdir(DECODED_CACHE_DIR):
+        if file.endswith(DECODED_EXTENSION):
+            path = os.path.join(DECODED_CACHE_DIR, file)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    return freed
@@ -3,7 +3,6 @@ Módulo para descargar música desde YouTube
 """
 import os
 import glob
-import yt_dlp
 
 
 def find_ffmpeg():
@@ -32,6 +31,8 @@ def download_audio_from_youtube(search_query, output_folder='music'):
     # Encontrar FFmpeg
     ffmpeg_location = find_ffmpeg()
     
+    import yt_dlp
+    
     # Configuración de yt-dlp
     ydl_opts = {
         'format': 'bestaudio/best',
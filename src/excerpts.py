@@ -0,0 +1,227 @@
+"""
+Separación rápida de un fragmento (previsualización de pistas)
+
+Separar una canción completa con ``htdemucs_6s`` en CPU tarda varias veces
+su duración. Para saber si merece la pena, ``/api/separate`` acepta una
+ventana (``start`` y ``duration``, p. ej. 30 s desde el estribillo) y sólo
+se separa ese fragmento:
+
+- Si la canción ya tiene pistas, el fragmento se recorta de ellas (sin
+  Demucs).
+- Si no, se recorta el original a WAV y Demucs separa sólo ese trozo.
+
+Los resultados se guardan aparte de la biblioteca, en
+``data/cache/excerpts/<canción>/<ventana>/`` con un ``meta.json`` que se
+escribe al final, y se reutilizan mientras la canción no cambie. Al terminar
+la separación completa de la canción se descartan.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Dict, Optional, Tuple
+
+from src.audio_io import input_args
+from src.capabilities import ffmpeg_executable, torch_device
+from src.config import EXCERPTS_DIR, EXCERPT_DEFAULT_SECONDS, EXCERPT_MAX_SECONDS
+from src.separation_backends import get_backend
+from src.stem_container import list_stems
+
+
+META_NAME = "meta.json"
+EXCERPT_BITRATE = "192k"
+
+_EXCERPT_ID = re.compile(r"^([0-9a-f]{16})_([0-9a-f]{16})$")
+
+
+def validate_window(start: Optional[float], duration: Optional[float]) -> Tuple[float, float]:
+    """
+    Normalizar la ventana del fragmento
+    
+    Raises:
+        ValueError: Si la ventana no es válida
+    """
+    start = float(start or 0.0)
+    duration = float(duration or EXCERPT_DEFAULT_SECONDS)
+    if start < 0:
+        raise ValueError("El inicio del fragmento no puede ser negativo")
+    if not 0 < duration <= EXCERPT_MAX_SECONDS:
+        raise ValueError(f"La duración del fragmento debe estar entre 0 y {EXCERPT_MAX_SECONDS:g} s")
+    return round(start, 3), round(duration, 3)
+
+
+def _song_key(file_path: str) -> str:
+    return hashlib.sha256(file_path.replace('\\', '/').encode("utf-8")).hexdigest()[:16]
+
+
+def excerpt_id_for(file_path: str, start: float, duration: float, model: str) -> str:
+    """
+    ID del fragmento de una canción en su versión actual
+    
+    Cambia si el archivo cambia (tamaño o fecha) o con otra ventana o modelo.
+    """
+    stat = os.stat(file_path)
+    window = f"{stat.st_size}|{stat.st_mtime}|{start:.3f}|{duration:.3f}|{model}"
+    return f"{_song_key(file_path)}_{hashlib.sha256(window.encode('utf-8')).hexdigest()[:16]}"
+
+
+def excerpt_dir_for(excerpt_id: str) -> str:
+    """
+    Carpeta de un fragmento
+    
+    Raises:
+        ValueError: Si el ID no es válido
+    """
+    match = _EXCERPT_ID.match(excerpt_id)
+    if not match:
+        raise ValueError("ID de fragmento no válido")
+    return os.path.join(EXCERPTS_DIR, match.group(1), match.group(2))
+
+
+def excerpt_urls(excerpt: Dict) -> Dict[str, str]:
+    """
+    URL de cada pista de un fragmento
+    """
+    return {stem: f"/api/excerpt/{excerpt['excerpt_id']}/{stem}" for stem in excerpt["stems"]}
+
+
+def load_excerpt(excerpt_id: str) -> Optional[Dict]:
+    """
+    Leer un fragmento terminado
+    
+    Returns:
+        Contenido de su ``meta.json`` o None si no existe
+    """
+    try:
+        with open(os.path.join(excerpt_dir_for(excerpt_id), META_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find_excerpt(file_path: str, start: float, duration: float, model: str) -> Optional[Dict]:
+    """
+    Fragmento ya separado de esa ventana (si existe y está al día)
+    """
+    return load_excerpt(excerpt_id_for(file_path, start, duration, model))
+
+
+def excerpt_stem_path(excerpt_id: str, stem: str) -> str:
+    """
+    Archivo de una pista de un fragmento
+    
+    Raises:
+        ValueError: Si el fragmento o la pista no existen
+    """
+    excerpt = load_excerpt(excerpt_id)
+    if not excerpt or stem not in excerpt["stems"]:
+        raise ValueError("Fragmento no encontrado")
+    return os.path.join(excerpt_dir_for(excerpt_id), f"{stem}.mp3")
+
+
+def _cut(path: str, start: float, duration: float, output_path: str, codec_args):
+    subprocess.run(
+        [ffmpeg_executable(), "-v", "error", "-nostdin", "-y",
+         "-ss", str(start), "-t", str(duration), *input_args(path),
+         *codec_args, output_path],
+        capture_output=True,
+        check=True
+    )
+
+
+def _cut_full_stems(stems: Dict[str, str], start: float, duration: float, output_dir: str):
+    """
+    Recortar la ventana de las pistas completas ya separadas
+    """
+    for stem, path in stems.items():
+        _cut(path, start, duration, os.path.join(output_dir, f"{stem}.mp3"),
+             ["-c:a", "libmp3lame", "-b:a", EXCERPT_BITRATE])
+
+
+def _separate_window(file_path: str, start: float, duration: float, model: str, output_dir: str):
+    """
+    Recortar la ventana del original y separarla
+    """
+    with tempfile.TemporaryDirectory(dir=EXCERPTS_DIR) as work_dir:
+        excerpt_path = os.path.join(work_dir, "excerpt.wav")
+        _cut(file_path, start, duration, excerpt_path, ["-c:a", "pcm_s16le"])
+        
+        # El recorte ya es un WAV: no pasa por la caché de entradas
+        get_backend().separate_file(
+            excerpt_path,
+            output_dir,
+            options={
+                "model": model,
+                "device": torch_device(),
+                "output_format": "mp3",
+                "bitrate": EXCERPT_BITRATE,
+                "work_dir": work_dir,
+                "cache_input": False,
+            }
+        )
+
+
+def separate_excerpt(file_path: str, start: float, duration: float, model: str) -> Dict:
+    """
+    Separar (o reutilizar) un fragmento de una canción
+    
+    Args:
+        file_path: MP3 de la biblioteca
+        start: Segundo inicial
+        duration: Duración en segundos
+        model: Modelo de Demucs (si hay que separar)
+    
+    Returns:
+        Metadatos del fragmento (excerpt_id, stems, source...)
+    """
+    excerpt_id = excerpt_id_for(file_path, start, duration, model)
+    cached = load_excerpt(excerpt_id)
+    if cached:
+        return cached
+    
+    output_dir = excerpt_dir_for(excerpt_id)
+    temp_dir = f"{output_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    
+    try:
+        full_stems = list_stems(os.path.splitext(file_path)[0])
+        if full_stems:
+            _cut_full_stems(full_stems, start, duration, temp_dir)
+            source = "stems"
+        else:
+            _separate_window(file_path, start, duration, model, temp_dir)
+            source = "separated"
+        
+        excerpt = {
+            "excerpt_id": excerpt_id,
+            "file_path": file_path.replace('\\', '/'),
+            "start": start,
+            "duration": duration,
+            "model": model,
+            "source": source,
+            "stems": sorted(os.path.splitext(file)[0] for file in os.listdir(temp_dir) if file.endswith(".mp3")),
+            "created_at": time.time(),
+        }
+        with open(os.path.join(temp_dir, META_NAME), "w", encoding="utf-8") as f:
+            json.dump(excerpt, f, ensure_ascii=False, indent=1)
+        
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(temp_dir, output_dir)
+        return excerpt
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def discard_excerpts(file_path: str):
+    """
+    Borrar los fragmentos de una canción (tras separarla completa)
+    """
+    song_dir = os.path.join(EXCERPTS_DIR, _song_key(file_path))
+    if os.path.isdir(song_dir):
+        shutil.rmtree(song_dir, ignore_errors=True)
+        print(f"🗑️  Fragmentos de previsualización descartados: {file_path}")
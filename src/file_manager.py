@@ -3,8 +3,15 @@ Gestor de archivos y organización por artista
 """
 import os
 from typing import List, Dict, Optional
+from urllib.parse import quote
 import json
 
+from src.previews import preview_manifest_for
+from src.library_index import get_all_analyses, get_all_loudness, get_all_silent_stems, get_all_stem_indexes
+from src.stem_container import list_stems, split_stem_ref, stem_ref, stream_index
+from src.metrics import Gauge, LIBRARY_SCAN_SECONDS, timed
+from src.storage import cached_storage_usage
+
 
 def list_songs(artist: Optional[str] = None) -> List[Dict]:
     """
@@ -22,6 +29,9 @@ def list_songs(artist: Optional[str] = None) -> List[Dict]:
     if not os.path.exists(music_dir):
         return songs
     
+    analyses = get_all_analyses()
+    loudness = get_all_loudness()
+    
     if artist:
         # Listar canciones de un artista específico
         artist_dir = os.path.join(music_dir, artist)
@@ -34,7 +44,9 @@ def list_songs(artist: Optional[str] = None) -> List[Dict]:
                         'title': os.path.splitext(file)[0],
                         'artist': artist,
                         'file_path': file_path,
-                        'size': os.path.getsize(file_path)
+                        'size': os.path.getsize(file_path),
+                        **analysis_fields(analyses, file_path),
+                        **loudness_fields(loudness, file_path)
                     })
     else:
         # Listar todas las canciones
@@ -51,12 +63,52 @@ def list_songs(artist: Optional[str] = None) -> List[Dict]:
                         'title': os.path.splitext(file)[0],
                         'artist': artist_name,
                         'file_path': file_path,
-                        'size': os.path.getsize(file_path)
+                        'size': os.path.getsize(file_path),
+                        **analysis_fields(analyses, file_path),
+                        **loudness_fields(loudness, file_path)
                     })
     
     return sorted(songs, key=lambda x: (x['artist'], x['title']))
 
 
+def analysis_fields(analyses: Dict[str, Dict], file_path: str) -> Dict:
+    """
+    Campos de tempo y tonalidad de una canción para los listados
+    
+    Args:
+        analyses: Resultado de ``get_all_analyses()``
+        file_path: Ruta del MP3
+        
+    Returns:
+        Diccionario con bpm y key (None si aún no se ha analizado)
+    """
+    analysis = analyses.get(file_path.replace('\\', '/')) or {}
+    return {
+        'bpm': analysis.get('bpm'),
+        'key': analysis.get('key'),
+    }
+
+
+def loudness_fields(loudness: Dict[str, Dict], file_path: str) -> Dict:
+    """
+    Campos de sonoridad de un audio para los listados
+    
+    Args:
+        loudness: Resultado de ``get_all_loudness()``
+        file_path: Ruta del audio
+        
+    Returns:
+        Diccionario con lufs, true_peak_db y gain_db (ganancia de
+        normalización; None si aún no se ha medido)
+    """
+    measured = loudness.get(file_path.replace('\\', '/')) or {}
+    return {
+        'lufs': measured.get('integrated_lufs'),
+        'true_peak_db': measured.get('true_peak_db'),
+        'gain_db': measured.get('gain_db'),
+    }
+
+
 def get_separated_files(song_id: str) -> Dict:
     """
     Obtener archivos separados de una canción
@@ -91,6 +143,98 @@ def get_separated_files(song_id: str) -> Dict:
     return {}
 
 
+def resolve_music_file(file_path: str) -> str:
+    """
+    Validar que una ruta relativa apunte a un archivo dentro de la biblioteca
+    
+    Args:
+        file_path: Ruta tipo ``music/<artist>/<song>.mp3`` o referencia a una
+            pista de un contenedor
+        
+    Returns:
+        La misma ruta normalizada
+        
+    Raises:
+        ValueError: Si la ruta sale de la carpeta de música o no existe
+    """
+    container, stem = split_stem_ref(file_path)
+    music_dir = os.path.abspath("music")
+    full_path = os.path.abspath(container)
+    if os.path.commonpath([music_dir, full_path]) != music_dir or not os.path.isfile(full_path):
+        raise ValueError("Archivo no válido")
+    relative = os.path.relpath(full_path).replace('\\', '/')
+    if stem is None:
+        return relative
+    try:
+        stream_index(relative, stem)
+    except KeyError:
+        raise ValueError("Pista no válida")
+    return stem_ref(relative, stem)
+
+
+def peaks_url(file_path: str) -> str:
+    """
+    URL del endpoint de forma de onda de un archivo de audio
+    """
+    return "/api/peaks/" + quote(file_path.replace('\\', '/'))
+
+
+def stream_url(file_path: str) -> str:
+    """
+    URL para reproducir un audio: el archivo estático o, para las pistas de
+    un contenedor, el endpoint que las sirve por separado
+    """
+    if split_stem_ref(file_path)[1] is None:
+        return "/" + quote(file_path.replace('\\', '/'))
+    return "/api/stem/" + quote(file_path.replace('\\', '/'))
+
+
+def preview_url(file_path: str) -> Optional[str]:
+    """
+    URL del manifiesto de previsualización de un audio (si existe)
+    """
+    manifest = preview_manifest_for(file_path)
+    return "/" + quote(manifest.replace('\\', '/')) if manifest else None
+
+
+def resolve_song_folder(artist: str, song: str) -> str:
+    """
+    Obtener la carpeta de pistas de una canción validando que esté dentro
+    de la biblioteca
+    
+    Args:
+        artist: Nombre de la carpeta del artista
+        song: Nombre de la canción (sin extensión)
+        
+    Returns:
+        Ruta de la carpeta ``music/<artist>/<song>``
+        
+    Raises:
+        ValueError: Si la ruta sale de la carpeta de música
+    """
+    music_dir = os.path.abspath("music")
+    song_folder = os.path.abspath(os.path.join(music_dir, artist, song))
+    if os.path.commonpath([music_dir, song_folder]) != music_dir or song_folder == music_dir:
+        raise ValueError("Ruta de canción no válida")
+    return os.path.join("music", artist, song)
+
+
+def get_song_stems(artist: str, song: str) -> Dict[str, str]:
+    """
+    Obtener las pistas separadas de una canción
+    
+    Args:
+        artist: Nombre de la carpeta del artista
+        song: Nombre de la canción (sin extensión)
+        
+    Returns:
+        Diccionario {nombre_pista: ruta} (vacío si no está separada). Si
+        las pistas están en un contenedor, la ruta es una referencia
+        ``<contenedor>#<pista>`` (ver ``src/stem_container.py``)
+    """
+    return list_stems(resolve_song_folder(artist, song))
+
+
 def organize_by_artist(file_path: str, artist: str) -> str:
     """
     Organizar archivo por artista
@@ -119,10 +263,16 @@ def organize_by_artist(file_path: str, artist: str) -> str:
     return new_path
 
 
-def get_library_stats() -> Dict:
+@timed(LIBRARY_SCAN_SECONDS, operation="library_stats")
+def get_library_stats(include_storage: bool = True) -> Dict:
     """
     Obtener estadísticas de la biblioteca
     
+    Args:
+        include_storage: Incluir el uso de disco por clase de archivo
+            (``storage``: originales, pistas, previsualizaciones, cachés...;
+            se recalcula como mucho una vez por minuto)
+    
     Returns:
         Diccionario con estadísticas
     """
@@ -138,6 +288,7 @@ def get_library_stats() -> Dict:
     
     # Contar canciones y artistas
     if os.path.exists(music_dir):
+        stem_indexes = get_all_stem_indexes()
         artists = set()
         for artist_folder in os.listdir(music_dir):
             artist_path = os.path.join(music_dir, artist_folder)
@@ -151,19 +302,22 @@ def get_library_stats() -> Dict:
                         
                         # Verificar si tiene stems
                         song_name = os.path.splitext(item)[0]
-                        stems_folder = os.path.join(artist_path, song_name)
-                        if os.path.isdir(stems_folder):
+                        stems = list_stems(os.path.join(artist_path, song_name), stem_indexes)
+                        if stems:
                             stats['total_separated'] += 1
-                            stem_files = [f for f in os.listdir(stems_folder) if f.endswith('.mp3') or f.endswith('.wav')]
-                            stats['total_stems'] += len(stem_files)
+                            stats['total_stems'] += len(stems)
         
         stats['total_artists'] = len(artists)
     
     stats['total_size_mb'] = round(stats['total_size_mb'], 2)
     
+    if include_storage:
+        stats['storage'] = cached_storage_usage()
+    
     return stats
 
 
+@timed(LIBRARY_SCAN_SECONDS, operation="music_tree")
 def get_music_tree() -> Dict:
     """
     Obtener estructura de árbol de la biblioteca
@@ -177,6 +331,11 @@ def get_music_tree() -> Dict:
     if not os.path.exists(music_dir):
         return {'artists': []}
     
+    analyses = get_all_analyses()
+    loudness = get_all_loudness()
+    silent_stems = get_all_silent_stems()
+    stem_indexes = get_all_stem_indexes()
+    
     # Recorrer carpetas de artistas
     for artist_folder in sorted(os.listdir(music_dir)):
         artist_path = os.path.join(music_dir, artist_folder)
@@ -196,27 +355,37 @@ def get_music_tree() -> Dict:
             # Si es un archivo MP3, es una canción
             if item.endswith('.mp3'):
                 song_name = os.path.splitext(item)[0]
-                stems_folder = os.path.join(artist_path, song_name)
-                has_stems = os.path.isdir(stems_folder)
+                stems = list_stems(os.path.join(artist_path, song_name), stem_indexes)
+                has_stems = bool(stems)
                 
                 song_data = {
                     'name': song_name,
                     'file_path': item_path.replace('\\', '/'),
+                    'peaks_url': peaks_url(item_path),
+                    'preview_url': preview_url(item_path),
                     'has_stems': has_stems,
-                    'stems': []
+                    **analysis_fields(analyses, item_path),
+                    **loudness_fields(loudness, item_path),
+                    'stems': [],
+                    # Pistas descartadas al separar por estar vacías
+                    'silent_stems': [
+                        entry for entry in silent_stems.get(item_path.replace('\\', '/'), [])
+                        if entry['stem'] not in stems
+                    ] if has_stems else []
                 }
                 
                 # Si tiene stems, listarlos
-                if has_stems:
-                    for stem_file in sorted(os.listdir(stems_folder)):
-                        if stem_file.endswith('.mp3') or stem_file.endswith('.wav'):
-                            stem_path = os.path.join(stems_folder, stem_file)
-                            stem_name = os.path.splitext(stem_file)[0]
-                            song_data['stems'].append({
-                                'name': stem_name,
-                                'file_path': stem_path.replace('\\', '/'),
-                                'size': os.path.getsize(stem_path)
-                            })
+                for stem_name, stem_path in stems.items():
+                    in_container = split_stem_ref(stem_path)[1] is not None
+                    song_data['stems'].append({
+                        'name': stem_name,
+                        'file_path': stem_path.replace('\\', '/'),
+                        'stream_url': stream_url(stem_path),
+                        'peaks_url': peaks_url(stem_path),
+                        'preview_url': preview_url(stem_path),
+                        'size': None if in_container else os.path.getsize(stem_path),
+                        **loudness_fields(loudness, stem_path)
+                    })
                 
                 artist_data['songs'].append(song_data)
         
@@ -224,3 +393,29 @@ def get_music_tree() -> Dict:
             tree.append(artist_data)
     
     return {'artists': tree}
+
+
+def library_metrics() -> List[Gauge]:
+    """
+    Métricas del tamaño de la biblioteca (se calculan al leer /metrics)
+    """
+    stats = get_library_stats(include_storage=False)
+    gauges = [
+        ("shelu_library_songs", "Canciones descargadas", stats['total_songs']),
+        ("shelu_library_artists", "Artistas en la biblioteca", stats['total_artists']),
+        ("shelu_library_separated_songs", "Canciones con pistas separadas", stats['total_separated']),
+        ("shelu_library_stems", "Pistas separadas", stats['total_stems']),
+        ("shelu_library_size_bytes", "Tamaño de las canciones descargadas", round(stats['total_size_mb'] * 1024 * 1024)),
+    ]
+    
+    metrics = []
+    for name, help_text, value in gauges:
+        gauge = Gauge(name, help_text, register=False)
+        gauge.set(value)
+        metrics.append(gauge)
+    
+    storage = Gauge("shelu_storage_bytes", "Espacio en disco por clase de archivo", ("class",), register=False)
+    for artifact_class, usage in cached_storage_usage().items():
+        storage.set(usage['bytes'], **{"class": artifact_class})
+    metrics.append(storage)
+    return metrics
@@ -0,0 +1,185 @@
+"""
+Caché de entradas de Demucs ya decodificadas
+
+Es habitual separar una canción con ``htdemucs`` y después con
+``htdemucs_ft`` o ``htdemucs_6s`` para comparar, y cada ejecución de Demucs
+vuelve a decodificar y remuestrear el MP3. La primera separación guarda la
+entrada decodificada como WAV float32 estéreo a 44.1 kHz (la frecuencia de
+los modelos) en ``data/cache/inputs/<hash del contenido>.wav``; las
+siguientes, con cualquier modelo, pasan ese WAV a Demucs, que sólo tiene
+que leerlo.
+
+- La clave es el SHA-256 del contenido, así que sirve aunque el archivo se
+  mueva o se renombre y deja de usarse si cambia.
+- Demucs nombra la carpeta de salida como el archivo de entrada, así que el
+  WAV se enlaza (o copia) en la carpeta de trabajo con el nombre de la
+  canción.
+- Al superar ``SHELU_INPUT_CACHE_MB`` se borran las entradas usadas hace más
+  tiempo; con 0 la caché se desactiva y Demucs recibe el MP3 como antes.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+from functools import lru_cache
+from typing import Optional
+
+from src.capabilities import ffmpeg_executable
+from src.config import INPUT_CACHE_DIR, INPUT_CACHE_MAX_MB
+from src.metrics import INPUT_DECODE_SECONDS, record_cache
+
+
+# Formato de las entradas: el que Demucs usa internamente
+INPUT_SAMPLE_RATE = 44100
+INPUT_CHANNELS = 2
+INPUT_EXTENSION = ".wav"
+
+HASH_CHUNK = 1024 * 1024
+
+
+def cache_enabled() -> bool:
+    return INPUT_CACHE_MAX_MB > 0
+
+
+@lru_cache(maxsize=256)
+def _content_hash(path: str, size: int, mtime: float) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(path: str) -> str:
+    """
+    SHA-256 del contenido de un archivo (memorizado por tamaño y fecha)
+    """
+    stat = os.stat(path)
+    return _content_hash(os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+
+def cache_path_for(path: str) -> str:
+    """
+    Archivo de caché de la entrada decodificada de un audio
+    """
+    return os.path.join(INPUT_CACHE_DIR, content_hash(path)[:32] + INPUT_EXTENSION)
+
+
+def decode_input(path: str, output_path: str) -> float:
+    """
+    Decodificar y remuestrear un audio a WAV float32 con FFmpeg
+    
+    Returns:
+        Segundos empleados
+    """
+    start = time.perf_counter()
+    subprocess.run(
+        [ffmpeg_executable(), "-v", "error", "-nostdin", "-y", "-i", path,
+         "-map", "0:a:0", "-c:a", "pcm_f32le",
+         "-ar", str(INPUT_SAMPLE_RATE), "-ac", str(INPUT_CHANNELS),
+         "-f", "wav", output_path],
+        capture_output=True,
+        check=True
+    )
+    return time.perf_counter() - start
+
+
+def ensure_decoded_input(path: str) -> Optional[str]:
+    """
+    Obtener la entrada decodificada de un audio, decodificándola si no está
+    
+    Returns:
+        Ruta del WAV en la caché o None si la caché está desactivada
+    """
+    if not cache_enabled():
+        return None
+    
+    cache_path = cache_path_for(path)
+    if os.path.exists(cache_path):
+        record_cache("input", hit=True)
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return cache_path
+    
+    record_cache("input", hit=False)
+    os.makedirs(INPUT_CACHE_DIR, exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        elapsed = decode_input(path, temp_path)
+        os.replace(temp_path, cache_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    INPUT_DECODE_SECONDS.observe(elapsed)
+    print(f"💾 Entrada decodificada en {elapsed:.2f}s: {path}")
+    enforce_budget()
+    return cache_path
+
+
+def prepare_input(path: str, work_dir: str) -> str:
+    """
+    Archivo que hay que pasar a Demucs para separar un audio
+    
+    Enlaza la entrada decodificada en ``work_dir`` con el nombre de la
+    canción (Demucs nombra así la carpeta de salida). Si la caché está
+    desactivada o falla, devuelve el archivo original.
+    """
+    try:
+        cache_path = ensure_decoded_input(path)
+    except Exception as e:
+        print(f"⚠️  No se pudo decodificar la entrada de {path}: {e}")
+        return path
+    if cache_path is None:
+        return path
+    
+    song_name = os.path.splitext(os.path.basename(path))[0]
+    link_path = os.path.join(work_dir, song_name + INPUT_EXTENSION)
+    os.makedirs(work_dir, exist_ok=True)
+    if os.path.exists(link_path):
+        os.remove(link_path)
+    try:
+        os.link(cache_path, link_path)
+    except OSError:
+        # Otro sistema de archivos (o sin enlaces duros): copiar
+        shutil.copyfile(cache_path, link_path)
+    return link_path
+
+
+def enforce_budget(max_bytes: Optional[float] = None) -> int:
+    """
+    Borrar las entradas usadas hace más tiempo hasta quedar dentro del límite
+    
+    Returns:
+        Bytes liberados
+    """
+    if max_bytes is None:
+        max_bytes = INPUT_CACHE_MAX_MB * 1024 * 1024
+    if not os.path.isdir(INPUT_CACHE_DIR):
+        return 0
+    
+    entries = []
+    for file in os.listdir(INPUT_CACHE_DIR):
+        if file.endswith(INPUT_EXTENSION):
+            path = os.path.join(INPUT_CACHE_DIR, file)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        freed += size
+    return freed
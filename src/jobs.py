@@ -0,0 +1,554 @@
+"""
+Cola de trabajos pesados (descargas, separaciones, fragmentos, exportaciones
+y derivados)
+
+Los trabajos se guardan como tareas ``queued`` en el almacén de tareas con
+los argumentos en el campo ``job``. Cualquier proceso con un ``JobWorker``
+(la propia API en modo inline o ``src/worker.py``) los toma con
+``claim_next`` y publica el progreso en la misma tarea, así que la API no
+necesita saber dónde se ejecutan.
+
+Para cancelar, la API marca la tarea (``TaskStore.cancel`` o
+``preempt_batch_jobs``) y el ``JobWorker`` que la ejecuta activa su
+``CancelToken`` (ver ``src/cancellation.py``).
+
+Las formas de onda, previsualizaciones y medidas de sonoridad de un audio
+recién publicado van en un trabajo ``artifacts`` aparte: la descarga o
+separación termina en cuanto el audio está en la biblioteca y, mientras
+tanto, los picos y la sonoridad se calculan si se piden.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.config import (
+    DOWNLOAD_SLOTS,
+    SEPARATION_SLOTS,
+    EXPORT_SLOTS,
+    EXCERPT_SLOTS,
+    ARTIFACT_SLOTS,
+    JOB_POLL_INTERVAL,
+    CANCEL_POLL_INTERVAL,
+    TASK_HEARTBEAT_INTERVAL,
+)
+from src.cancellation import CANCELLED, PREEMPTED, CancelToken, JobCancelled, cancellable, check_cancelled
+from src.scheduling import select_preemptions
+from src.task_store import TaskStore, FINISHED_STATUSES, QUEUED_STATUSES, RUNNING_STATUSES
+from src.youtube_service import download_audio
+from src.separation_service import separate_audio_task
+from src.batch_export import run_export
+from src.excerpts import excerpt_urls, separate_excerpt
+from src.waveform import audio_duration, generate_peaks, generate_peaks_for_folder
+from src.previews import generate_previews_for_song
+from src.loudness import ensure_loudness, ensure_loudness_for_folder
+from src.profiling import profile_job, should_profile_job
+from src.metrics import (
+    Gauge,
+    JOB_DURATION_SECONDS,
+    JOB_WAIT_SECONDS,
+    JOB_WORKER_SLOTS,
+    JOB_WORKERS_BUSY,
+    SEPARATION_REALTIME_FACTOR,
+)
+
+
+def run_download_job(task_id: str, job: Dict, task_store: TaskStore):
+    """
+    Ejecutar un trabajo de descarga
+    
+    Args:
+        task_id: ID de la tarea
+        job: Argumentos de ``download_audio`` (video_id, title, artist)
+        task_store: Almacén de estados de tareas
+    """
+    task_store.update(task_id, status="downloading", progress=0, message="Descargando audio...")
+    
+    file_path = download_audio(
+        video_id=job["video_id"],
+        title=job["title"],
+        artist=job["artist"]
+    )
+    
+    if file_path:
+        task_store.update(
+            task_id,
+            status="completed",
+            progress=100,
+            message="Descarga completada",
+            file_path=file_path,
+            finished_at=time.time()
+        )
+        queue_artifacts(task_store, file_path)
+    else:
+        task_store.update(
+            task_id,
+            status="error",
+            message="Error al descargar",
+            finished_at=time.time()
+        )
+
+
+def run_separation_job(task_id: str, job: Dict, task_store: TaskStore):
+    """
+    Ejecutar un trabajo de separación
+    
+    Args:
+        task_id: ID de la tarea
+        job: Argumentos de ``separate_audio_task`` (file_path, model, artist)
+        task_store: Almacén de estados de tareas
+    """
+    separate_audio_task(
+        task_id=task_id,
+        file_path=job["file_path"],
+        model=job["model"],
+        artist=job.get("artist"),
+        task_store=task_store
+    )
+    
+    task = task_store.get(task_id)
+    if task and task["status"] == "completed":
+        queue_artifacts(task_store, job["file_path"], task["output_dir"])
+
+
+def run_excerpt_job(task_id: str, job: Dict, task_store: TaskStore):
+    """
+    Ejecutar la separación rápida de un fragmento
+    
+    Args:
+        task_id: ID de la tarea
+        job: Argumentos de ``separate_excerpt`` (file_path, start, duration, model)
+        task_store: Almacén de estados de tareas
+    """
+    task_store.update(
+        task_id,
+        status="processing",
+        started_at=time.time(),
+        progress=10,
+        message="Separando fragmento..."
+    )
+    try:
+        excerpt = separate_excerpt(job["file_path"], job["start"], job["duration"], job["model"])
+    except Exception as e:
+        print(f"[{task_id}] Error al separar el fragmento: {e}")
+        task_store.update(task_id, status="error", message=f"Error: {e}", finished_at=time.time())
+        return
+    
+    task_store.update(
+        task_id,
+        status="completed",
+        progress=100,
+        message="Fragmento separado",
+        excerpt_id=excerpt["excerpt_id"],
+        excerpt_source=excerpt["source"],
+        stems=excerpt_urls(excerpt),
+        finished_at=time.time()
+    )
+
+
+def run_export_job(task_id: str, job: Dict, task_store: TaskStore):
+    """
+    Ejecutar una exportación por lotes de versiones instrumentales
+    
+    Args:
+        task_id: ID de la tarea
+        job: Argumentos de ``run_export`` (artist, model)
+        task_store: Almacén de estados de tareas
+    """
+    task_store.update(task_id, status="processing", progress=0, message="Preparando exportación...")
+    
+    def progress(done: int, total: int, entry: Dict):
+        task_store.update(
+            task_id,
+            progress=int(done * 100 / total) if total else 100,
+            message=f"Exportando {done}/{total} canciones..."
+        )
+    
+    manifest = run_export(job.get("artist"), model=job["model"], on_progress=progress)
+    songs = manifest["songs"]
+    errors = sum(1 for entry in songs if entry["status"] == "error")
+    task_store.update(
+        task_id,
+        status="completed",
+        progress=100,
+        message=f"Exportación completada ({len(songs) - errors}/{len(songs)} canciones)",
+        export_id=manifest["export_id"],
+        errors=errors,
+        download_url=f"/api/export/{manifest['export_id']}/archive",
+        finished_at=time.time()
+    )
+
+
+def run_artifacts_job(task_id: str, job: Dict, task_store: TaskStore):
+    """
+    Generar los derivados de un audio recién publicado
+    
+    Args:
+        task_id: ID de la tarea
+        job: file_path (MP3 de la canción) y stems_dir (carpeta o contenedor
+            de sus pistas si viene de una separación)
+        task_store: Almacén de estados de tareas
+    """
+    file_path, stems_dir = job["file_path"], job.get("stems_dir")
+    steps = [
+        ("Generando formas de onda...",
+         lambda: generate_peaks_for_folder(stems_dir) if stems_dir else generate_peaks(file_path)),
+        ("Generando previsualizaciones...",
+         lambda: generate_previews_for_song(file_path, stems_dir)),
+        ("Midiendo sonoridad...",
+         lambda: ensure_loudness_for_folder(stems_dir) if stems_dir else ensure_loudness(file_path)),
+    ]
+    for i, (message, step) in enumerate(steps):
+        check_cancelled()
+        task_store.update(task_id, status="processing", progress=int(i * 100 / len(steps)), message=message)
+        step()
+    
+    task_store.update(
+        task_id,
+        status="completed",
+        progress=100,
+        message="Derivados generados",
+        finished_at=time.time()
+    )
+
+
+def queue_artifacts(task_store: TaskStore, file_path: str, stems_dir: Optional[str] = None):
+    """
+    Encolar los derivados de un audio recién publicado (sin esperarlos)
+    
+    Un fallo al encolar no afecta al trabajo que acaba de publicar el audio:
+    los picos y la sonoridad se calculan igualmente al pedirlos.
+    """
+    try:
+        submit_unique_job(
+            task_store,
+            "artifacts",
+            {"file_path": file_path, "stems_dir": stems_dir},
+            ["file_path", "stems_dir"],
+            title=os.path.basename(file_path),
+            priority="batch"
+        )
+    except Exception as e:
+        print(f"⚠️  No se pudieron encolar los derivados de {file_path}: {e}")
+
+
+# Tipo de tarea -> función que la ejecuta
+JOB_HANDLERS: Dict[str, Callable[[str, Dict, TaskStore], None]] = {
+    "download": run_download_job,
+    "separate": run_separation_job,
+    "excerpt": run_excerpt_job,
+    "export": run_export_job,
+    "artifacts": run_artifacts_job,
+}
+
+# Trabajos internos que el stream de tareas no envía salvo que se pidan
+INTERNAL_TASK_TYPES = ("artifacts",)
+
+# Trabajos simultáneos por proceso según tipo
+DEFAULT_SLOTS = {
+    "download": DOWNLOAD_SLOTS,
+    "separate": SEPARATION_SLOTS,
+    "excerpt": EXCERPT_SLOTS,
+    "export": EXPORT_SLOTS,
+    "artifacts": ARTIFACT_SLOTS,
+}
+
+
+def submit_job(task_store: TaskStore, task_type: str, job: Dict, **fields) -> Dict:
+    """
+    Encolar un trabajo
+    
+    Args:
+        task_store: Almacén de estados de tareas
+        task_type: Tipo de trabajo (ver JOB_HANDLERS)
+        job: Argumentos del trabajo
+        **fields: Campos adicionales visibles en el estado de la tarea
+    
+    Returns:
+        Estado inicial de la tarea
+    """
+    return task_store.create(_new_task_id(task_type), task_type, **_queued_fields(task_type, job, fields))
+
+
+def submit_unique_job(
+    task_store: TaskStore,
+    task_type: str,
+    job: Dict,
+    match_keys: List[str],
+    **fields
+) -> Tuple[Dict, bool]:
+    """
+    Encolar un trabajo salvo que ya haya uno en cola o en marcha con los
+    mismos valores de ``job`` en ``match_keys``
+    
+    Sirve para unir peticiones repetidas (p. ej. el mismo video) a un
+    trabajo existente aunque lo haya encolado otro proceso de la API; la
+    comprobación es atómica en el almacén.
+    
+    Returns:
+        Tupla (estado de la tarea, True si se ha encolado un trabajo nuevo)
+    """
+    return task_store.create_unique(
+        _new_task_id(task_type),
+        task_type,
+        {key: job.get(key) for key in match_keys},
+        **_queued_fields(task_type, job, fields)
+    )
+
+
+def _new_task_id(task_type: str) -> str:
+    # Sufijo aleatorio: varios procesos de la API pueden encolar a la vez
+    return f"{task_type}_{datetime.now().timestamp()}_{uuid.uuid4().hex[:6]}"
+
+
+def _queued_fields(task_type: str, job: Dict, fields: Dict) -> Dict:
+    if task_type not in JOB_HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {task_type}")
+    return {
+        "status": "queued",
+        "progress": 0,
+        "message": "En cola...",
+        "job": job,
+        **fields,
+    }
+
+
+def preempt_batch_jobs(task_store: TaskStore, task_type: str = "separate") -> List[str]:
+    """
+    Desplazar trabajos batch en marcha para dar hueco a interactivos en cola
+    
+    Sólo marca las tareas (``preempt_requested``); el worker que las
+    ejecuta las detiene y las devuelve a la cola. No hace nada salvo con
+    SHELU_PREEMPT_BATCH=1 (ver ``select_preemptions``).
+    
+    Returns:
+        IDs de las tareas desplazadas
+    """
+    preemptions = select_preemptions(task_store, task_type)
+    for victim_id, task_id in preemptions.items():
+        task_store.update(victim_id, preempt_requested=task_id, message="Dejando hueco a un trabajo prioritario...")
+        print(f"⏸️  {victim_id} desplazada por {task_id}")
+    return list(preemptions)
+
+
+def queue_metrics(task_store: TaskStore) -> List[Gauge]:
+    """
+    Métricas de la cola compartida (se calculan al leer /metrics)
+    """
+    tasks = Gauge("shelu_tasks", "Tareas en el almacén por estado", ("status",), register=False)
+    for status, total in task_store.queue_stats()["by_status"].items():
+        tasks.set(total, status=status)
+    
+    depth = Gauge("shelu_queue_depth", "Trabajos en cola por tipo", ("type",), register=False)
+    running = Gauge("shelu_jobs_running", "Trabajos en marcha por tipo", ("type",), register=False)
+    for task_type in JOB_HANDLERS:
+        depth.set(0, type=task_type)
+        running.set(0, type=task_type)
+    
+    for gauge, statuses in ((depth, QUEUED_STATUSES), (running, RUNNING_STATUSES)):
+        for task_type, total in task_store.count_tasks(statuses=list(statuses), group_by="type").items():
+            gauge.inc(total, type=task_type)
+    
+    return [tasks, depth, running]
+
+
+def stream_filter(ids: Optional[List[str]], task_types: Optional[List[str]]) -> Callable[[Dict], bool]:
+    """
+    Filtro de las tareas que envía un stream de progreso
+    
+    Args:
+        ids: Sólo estas tareas (None = todas)
+        task_types: Sólo estos tipos (None = todos salvo INTERNAL_TASK_TYPES,
+            que sí se envían si se piden por ID)
+    """
+    watched = set(ids) if ids is not None else None
+    types = set(task_types) if task_types is not None else None
+    
+    def wanted(task: Dict) -> bool:
+        if watched is not None and task["task_id"] not in watched:
+            return False
+        if types is not None:
+            return task["type"] in types
+        return watched is not None or task["type"] not in INTERNAL_TASK_TYPES
+    
+    return wanted
+
+
+def is_finished(task: Optional[Dict]) -> bool:
+    """
+    Comprobar si una tarea ha terminado (o ya no existe)
+    """
+    return task is None or task["status"] in FINISHED_STATUSES
+
+
+class JobWorker:
+    """
+    Ejecuta trabajos de la cola en hilos, con un máximo por tipo
+    
+    Cada hueco (slot) es un hilo que toma un trabajo de su tipo, lo ejecuta
+    y vuelve a buscar; así una separación larga no bloquea las descargas y
+    el número de separaciones simultáneas queda acotado por proceso.
+    """
+    
+    def __init__(
+        self,
+        task_store: TaskStore,
+        slots: Optional[Dict[str, int]] = None,
+        poll_interval: float = JOB_POLL_INTERVAL
+    ):
+        self.task_store = task_store
+        self.slots = slots if slots is not None else DEFAULT_SLOTS
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # Tokens de los trabajos en marcha en este proceso
+        self._tokens: Dict[str, CancelToken] = {}
+        self._tokens_lock = threading.Lock()
+    
+    def start(self):
+        """Arrancar los hilos de trabajo"""
+        for task_type, count in self.slots.items():
+            JOB_WORKER_SLOTS.inc(count, type=task_type)
+            for i in range(count):
+                thread = threading.Thread(
+                    target=self._run_slot,
+                    args=(task_type,),
+                    name=f"job-{task_type}-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        
+        watcher = threading.Thread(target=self._watch_tasks, name="job-watch", daemon=True)
+        watcher.start()
+        self._threads.append(watcher)
+        print(f"⚙️  Worker de trabajos iniciado: {self.slots}")
+    
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Dejar de tomar trabajos y esperar a que terminen los que están en marcha
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+    
+    def _run_slot(self, task_type: str):
+        handler = JOB_HANDLERS[task_type]
+        while not self._stop.is_set():
+            try:
+                task = self.task_store.claim_next([task_type])
+            except Exception as e:
+                print(f"Error al buscar trabajos ({task_type}): {e}")
+                task = None
+            
+            if task is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            
+            self._run_job(task, handler)
+    
+    def _watch_tasks(self):
+        """
+        Vigilar los trabajos mientras el worker está en marcha
+        
+        - Activa el token de los trabajos en marcha marcados para cancelar
+          (una sola consulta por intervalo para todos los del proceso).
+        - Cada TASK_HEARTBEAT_INTERVAL renueva el latido de este proceso y
+          devuelve a la cola los trabajos de procesos que ya no laten, sin
+          esperar a un reinicio.
+        """
+        last_beat = 0.0
+        while not self._stop.wait(CANCEL_POLL_INTERVAL):
+            if time.monotonic() - last_beat >= TASK_HEARTBEAT_INTERVAL:
+                last_beat = time.monotonic()
+                self._beat()
+            self._check_cancellations()
+    
+    def _beat(self):
+        try:
+            self.task_store.heartbeat()
+            recovered = self.task_store.recover_interrupted()
+        except Exception as e:
+            print(f"Error al renovar el latido: {e}")
+            return
+        if recovered:
+            print(f"⚠️  {recovered} tareas de procesos caídos recuperadas")
+    
+    def _check_cancellations(self):
+        with self._tokens_lock:
+            tokens = dict(self._tokens)
+        if not tokens:
+            return
+        try:
+            tasks = self.task_store.list_tasks(ids=list(tokens))
+        except Exception as e:
+            print(f"Error al comprobar cancelaciones: {e}")
+            return
+        for task in tasks:
+            if task.get("cancel_requested"):
+                tokens[task["task_id"]].cancel(CANCELLED)
+            elif task.get("preempt_requested"):
+                tokens[task["task_id"]].cancel(PREEMPTED)
+    
+    def _finish_cancelled(self, task_id: str, reason: str) -> Optional[str]:
+        """
+        Dejar en su estado final un trabajo detenido por su token
+        
+        Returns:
+            Resultado para las métricas: "cancelled", "preempted" o None si
+            la tarea ya no estaba activa (se queda como esté)
+        """
+        task = self.task_store.finish_stopped(task_id, reason)
+        if task is None:
+            return None
+        if task["status"] == "queued":
+            print(f"[{task_id}] ⏸️  Desplazada, vuelve a la cola")
+            return PREEMPTED
+        print(f"[{task_id}] 🛑 Cancelada")
+        return CANCELLED
+    
+    def _run_job(self, task: Dict, handler: Callable[[str, Dict, TaskStore], None]):
+        task_id, task_type = task["task_id"], task["type"]
+        job = task.get("job") or {}
+        JOB_WAIT_SECONDS.observe(task["started_at"] - task["created_at"], type=task_type)
+        JOB_WORKERS_BUSY.inc(type=task_type)
+        start = time.perf_counter()
+        profile_formats: List[str] = []
+        outcome: Optional[str] = None
+        token = CancelToken()
+        with self._tokens_lock:
+            self._tokens[task_id] = token
+        try:
+            with cancellable(token), profile_job(task_id, enabled=should_profile_job(job)) as profile_formats:
+                handler(task_id, job, self.task_store)
+        except JobCancelled as e:
+            outcome = self._finish_cancelled(task_id, e.reason)
+        except Exception as e:
+            print(f"[{task_id}] Excepción: {e}")
+            self.task_store.update(
+                task_id,
+                status="error",
+                message=f"Error: {e}",
+                finished_at=time.time()
+            )
+        finally:
+            with self._tokens_lock:
+                self._tokens.pop(task_id, None)
+            JOB_WORKERS_BUSY.dec(type=task_type)
+        
+        elapsed = time.perf_counter() - start
+        if profile_formats:
+            self.task_store.update(task_id, profile=profile_formats)
+        
+        final = self.task_store.get(task_id)
+        status = outcome or (final["status"] if final else "unknown")
+        model = job.get("model", "")
+        JOB_DURATION_SECONDS.observe(elapsed, type=task_type, model=model, status=status)
+        
+        if task_type == "separate" and status == "completed":
+            duration = audio_duration(job["file_path"])
+            if duration:
+                SEPARATION_REALTIME_FACTOR.observe(elapsed / duration, model=model)
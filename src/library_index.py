@@ -0,0 +1,417 @@
+"""
+Índice persistente de la biblioteca (SQLite)
+
+Relaciona cada video de YouTube con el archivo descargado para poder
+reutilizar descargas aunque cambie el título, y guarda el análisis de
+tempo y tonalidad de cada canción separada, la sonoridad medida de cada
+canción y pista, el índice de pistas de los contenedores multipista, las
+pistas descartadas por silenciosas y cuándo se usó por última vez cada
+canción (para decidir qué archivos derivados borrar primero).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from src.config import LIBRARY_DB
+
+_local = threading.local()
+# Proceso en el que ya se ha creado el esquema
+_schema = {"pid": None}
+_schema_lock = threading.Lock()
+
+
+def _create_schema(conn: sqlite3.Connection):
+    """
+    Crear las tablas que no existan
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tracks (
+            video_id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            artist TEXT,
+            title TEXT,
+            downloaded_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_file ON tracks(file_path)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analysis (
+            file_path TEXT PRIMARY KEY,
+            bpm REAL,
+            bpm_confidence REAL,
+            key TEXT,
+            key_confidence REAL,
+            version INTEGER NOT NULL,
+            stems_mtime REAL NOT NULL,
+            analyzed_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loudness (
+            file_path TEXT PRIMARY KEY,
+            integrated_lufs REAL,
+            true_peak_db REAL,
+            gain_db REAL NOT NULL,
+            mtime REAL NOT NULL,
+            analyzed_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stem_containers (
+            file_path TEXT PRIMARY KEY,
+            stems TEXT NOT NULL,
+            mtime REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS silent_stems (
+            file_path TEXT NOT NULL,
+            stem TEXT NOT NULL,
+            rms_db REAL,
+            peak_db REAL,
+            detected_at REAL NOT NULL,
+            PRIMARY KEY (file_path, stem)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS song_access (
+            file_path TEXT PRIMARY KEY,
+            accessed_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def _connection() -> sqlite3.Connection:
+    # Una conexión por hilo y proceso (no se comparten tras un fork); el
+    # esquema se crea con la primera de cada proceso
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        os.makedirs(os.path.dirname(LIBRARY_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(LIBRARY_DB, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        with _schema_lock:
+            if _schema["pid"] != os.getpid():
+                with conn:
+                    _create_schema(conn)
+                _schema["pid"] = os.getpid()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    """
+    Abrir una transacción sobre el índice (conexión reutilizada del hilo)
+    """
+    conn = _connection()
+    with conn:
+        yield conn
+
+
+def get_track_by_video(video_id: str) -> Optional[Dict]:
+    """
+    Obtener la pista registrada para un video
+    
+    Args:
+        video_id: ID del video de YouTube
+    
+    Returns:
+        Diccionario con la pista o None si no está registrada
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM tracks WHERE video_id = ?", (video_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def get_track_by_file(file_path: str) -> Optional[Dict]:
+    """
+    Obtener el video registrado para un archivo de la biblioteca
+    
+    Args:
+        file_path: Ruta del MP3 en la biblioteca
+    
+    Returns:
+        Diccionario con la pista o None si ningún video usa ese archivo
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM tracks WHERE file_path = ? ORDER BY downloaded_at DESC LIMIT 1",
+            (file_path.replace('\\', '/'),),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def record_track(video_id: str, file_path: str, artist: Optional[str], title: str):
+    """
+    Registrar (o actualizar) la pista descargada de un video
+    
+    Args:
+        video_id: ID del video de YouTube
+        file_path: Ruta del MP3 en la biblioteca
+        artist: Nombre del artista
+        title: Título de la canción
+    """
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO tracks (video_id, file_path, artist, title, downloaded_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(video_id) DO UPDATE SET
+                file_path = excluded.file_path,
+                artist = excluded.artist,
+                title = excluded.title,
+                downloaded_at = excluded.downloaded_at
+            """,
+            (video_id, file_path.replace('\\', '/'), artist, title, time.time()),
+        )
+
+
+def get_analysis(file_path: str) -> Optional[Dict]:
+    """
+    Obtener el análisis de tempo y tonalidad de una canción
+    
+    Args:
+        file_path: Ruta del MP3 en la biblioteca
+    
+    Returns:
+        Diccionario con el análisis o None si no se ha analizado
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM analysis WHERE file_path = ?", (file_path.replace('\\', '/'),)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def get_all_analyses() -> Dict[str, Dict]:
+    """
+    Obtener todos los análisis de una vez (para los listados)
+    
+    Returns:
+        Diccionario {file_path: análisis}
+    """
+    with _connect() as conn:
+        rows = conn.execute("SELECT * FROM analysis").fetchall()
+    return {row["file_path"]: dict(row) for row in rows}
+
+
+def record_analysis(
+    file_path: str,
+    bpm: Optional[float],
+    bpm_confidence: float,
+    key: Optional[str],
+    key_confidence: float,
+    version: int,
+    stems_mtime: float
+):
+    """
+    Guardar (o reemplazar) el análisis de una canción
+    
+    Args:
+        file_path: Ruta del MP3 en la biblioteca
+        bpm: Tempo estimado (None si no hay ritmo claro)
+        bpm_confidence: Confianza del tempo (0-1)
+        key: Tonalidad estimada, p. ej. "A minor"
+        key_confidence: Confianza de la tonalidad (0-1)
+        version: Versión del algoritmo de análisis
+        stems_mtime: Fecha de modificación de las pistas analizadas
+    """
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO analysis
+                (file_path, bpm, bpm_confidence, key, key_confidence,
+                 version, stems_mtime, analyzed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (file_path.replace('\\', '/'), bpm, bpm_confidence, key, key_confidence,
+             version, stems_mtime, time.time()),
+        )
+
+
+def get_loudness(file_path: str) -> Optional[Dict]:
+    """
+    Obtener la sonoridad medida de una canción o pista
+    
+    Args:
+        file_path: Ruta del audio en la biblioteca
+    
+    Returns:
+        Diccionario con la medida o None si no se ha medido
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM loudness WHERE file_path = ?", (file_path.replace('\\', '/'),)
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def get_all_loudness() -> Dict[str, Dict]:
+    """
+    Obtener todas las medidas de sonoridad de una vez (para los listados)
+    
+    Returns:
+        Diccionario {file_path: medida}
+    """
+    with _connect() as conn:
+        rows = conn.execute("SELECT * FROM loudness").fetchall()
+    return {row["file_path"]: dict(row) for row in rows}
+
+
+def record_loudness(
+    file_path: str,
+    integrated_lufs: Optional[float],
+    true_peak_db: Optional[float],
+    gain_db: float,
+    mtime: float
+):
+    """
+    Guardar (o reemplazar) la sonoridad medida de un audio
+    
+    Args:
+        file_path: Ruta del audio en la biblioteca
+        integrated_lufs: Sonoridad integrada (None si es silencio)
+        true_peak_db: Pico real en dBTP (None si es silencio)
+        gain_db: Ganancia de normalización a aplicar al reproducir
+        mtime: Fecha de modificación del audio medido
+    """
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO loudness
+                (file_path, integrated_lufs, true_peak_db, gain_db, mtime, analyzed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (file_path.replace('\\', '/'), integrated_lufs, true_peak_db, gain_db,
+             mtime, time.time()),
+        )
+
+
+def get_stem_index(file_path: str) -> Optional[Dict]:
+    """
+    Obtener el índice de pistas guardado de un contenedor
+    
+    Returns:
+        Diccionario con stems (lista de {"name", "codec"}) y mtime, o None
+    """
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM stem_containers WHERE file_path = ?", (file_path.replace('\\', '/'),)
+        ).fetchone()
+    if not row:
+        return None
+    return {"stems": json.loads(row["stems"]), "mtime": row["mtime"]}
+
+
+def get_all_stem_indexes() -> Dict[str, Dict]:
+    """
+    Obtener todos los índices de pistas de una vez (para los listados)
+    
+    Returns:
+        Diccionario {file_path del contenedor: {"stems", "mtime"}}
+    """
+    with _connect() as conn:
+        rows = conn.execute("SELECT * FROM stem_containers").fetchall()
+    return {row["file_path"]: {"stems": json.loads(row["stems"]), "mtime": row["mtime"]} for row in rows}
+
+
+def record_stem_index(file_path: str, stems: List[Dict], mtime: float):
+    """
+    Guardar el índice de pistas de un contenedor
+    
+    Args:
+        file_path: Ruta del contenedor
+        stems: Pistas en orden de flujo
+        mtime: Fecha de modificación del contenedor
+    """
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO stem_containers (file_path, stems, mtime) VALUES (?, ?, ?)",
+            (file_path.replace('\\', '/'), json.dumps(stems), mtime),
+        )
+
+
+def get_all_silent_stems() -> Dict[str, List[Dict]]:
+    """
+    Obtener todas las pistas silenciosas de una vez (para los listados)
+    
+    Returns:
+        Diccionario {file_path de la canción: [{"stem", "rms_db", "peak_db"}]}
+    """
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT file_path, stem, rms_db, peak_db FROM silent_stems ORDER BY file_path, stem"
+        ).fetchall()
+    silent: Dict[str, List[Dict]] = {}
+    for row in rows:
+        silent.setdefault(row["file_path"], []).append(
+            {"stem": row["stem"], "rms_db": row["rms_db"], "peak_db": row["peak_db"]}
+        )
+    return silent
+
+
+def record_silent_stems(file_path: str, stems: List[Dict]):
+    """
+    Reemplazar las pistas silenciosas registradas de una canción
+    
+    Args:
+        file_path: Ruta del MP3 de la canción
+        stems: Lista de {"stem", "rms_db", "peak_db"} (vacía para borrarlas)
+    """
+    file_path = file_path.replace('\\', '/')
+    detected_at = time.time()
+    with _connect() as conn:
+        conn.execute("DELETE FROM silent_stems WHERE file_path = ?", (file_path,))
+        conn.executemany(
+            """
+            INSERT INTO silent_stems (file_path, stem, rms_db, peak_db, detected_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(file_path, stem["stem"], stem["rms_db"], stem["peak_db"], detected_at) for stem in stems],
+        )
+
+
+def get_all_song_access() -> Dict[str, float]:
+    """
+    Último uso registrado de cada canción
+    
+    Returns:
+        Diccionario {file_path de la canción: timestamp}
+    """
+    with _connect() as conn:
+        rows = conn.execute("SELECT file_path, accessed_at FROM song_access").fetchall()
+    return {row["file_path"]: row["accessed_at"] for row in rows}
+
+
+def record_song_accesses(accesses: Dict[str, float]):
+    """
+    Registrar de una vez el último uso de varias canciones
+    
+    Args:
+        accesses: Diccionario {file_path de la canción: timestamp}
+    """
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO song_access (file_path, accessed_at) VALUES (?, ?)",
+            [(path.replace('\\', '/'), accessed_at) for path, accessed_at in accesses.items()],
+        )
@@ -0,0 +1,299 @@
+"""
+Medición de sonoridad (EBU R128 / ITU-R BS.1770-4)
+
+Mide la sonoridad integrada (LUFS) y el pico real (dBTP) de cada canción y
+pista en una sola pasada por bloques, y guarda en el índice de la
+biblioteca la ganancia que la lleva al nivel objetivo. El reproductor y la
+mezcla del servidor aplican esa ganancia al reproducir, así que normalizar
+no requiere volver a codificar ningún archivo.
+
+Todo el filtrado se hace por bloques con NumPy:
+
+- Ponderación K: los dos biquads de la norma (estante + paso alto) se
+  aproximan por su respuesta al impulso truncada (4096 muestras a 48 kHz,
+  donde ya ha caído por debajo de -160 dB) y se aplican por FFT.
+- Pico real: sobremuestreo x4 polifásico; las cuatro fases (12 coeficientes
+  cada una) se calculan con un único producto de matrices sobre ventanas
+  deslizantes del bloque.
+
+Uso para medir la biblioteca existente::
+    
+    python -m src.loudness [--force]
+"""
+import argparse
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.audio_io import decode_blocks
+from src.config import LOUDNESS_TARGET_LUFS, TRUE_PEAK_CEILING
+from src.library_index import get_loudness, record_loudness
+from src.metrics import record_cache
+from src.stem_container import audio_mtime, list_stems
+
+
+# Frecuencia de los coeficientes de la norma
+MEASURE_SAMPLE_RATE = 48000
+
+# Biquads de la ponderación K a 48 kHz: (b, a)
+K_SHELF = (
+    [1.53512485958697, -2.69169618940638, 1.19839281085285],
+    [1.0, -1.69065929318241, 0.73248077421585],
+)
+K_HIGHPASS = (
+    [1.0, -2.0, 1.0],
+    [1.0, -1.99004745483398, 0.99007225036621],
+)
+K_TAPS = 4096
+
+# Tamaño de las FFT de la convolución por bloques
+FFT_SIZE = 65536
+
+# Bloques de medida de 400 ms solapados al 75% (pasos de 100 ms)
+STEP_SECONDS = 0.1
+STEPS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Sobremuestreo para el pico real
+OVERSAMPLING = 4
+TAPS_PER_PHASE = 12
+
+# Límite de la ganancia aplicada (dB)
+MAX_GAIN_DB = 12.0
+
+
+def _biquad_impulse(b: List[float], a: List[float], x: np.ndarray) -> np.ndarray:
+    """
+    Aplicar un biquad (forma directa I) a una señal corta
+    """
+    y = np.zeros_like(x)
+    x1 = x2 = y1 = y2 = 0.0
+    for n, value in enumerate(x):
+        y[n] = b[0] * value + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+        x2, x1 = x1, value
+        y2, y1 = y1, y[n]
+    return y
+
+
+@lru_cache(maxsize=1)
+def k_weighting_taps() -> np.ndarray:
+    """
+    Respuesta al impulso truncada de la ponderación K
+    """
+    impulse = np.zeros(K_TAPS)
+    impulse[0] = 1.0
+    return _biquad_impulse(*K_HIGHPASS, _biquad_impulse(*K_SHELF, impulse))
+
+
+@lru_cache(maxsize=1)
+def oversampling_taps() -> np.ndarray:
+    """
+    Filtros polifásicos (fases, coeficientes) de interpolación x4 (sinc con
+    ventana de Kaiser)
+    """
+    length = OVERSAMPLING * TAPS_PER_PHASE
+    n = np.arange(length) - (length - 1) / 2
+    prototype = np.sinc(n / OVERSAMPLING) * np.kaiser(length, 8.0)
+    return prototype.reshape(TAPS_PER_PHASE, OVERSAMPLING).T * OVERSAMPLING / prototype.sum()
+
+
+class _BlockConvolver:
+    """
+    Convolución por bloques (solapamiento y suma por FFT) de una señal
+    multicanal con un filtro largo
+    """
+    
+    def __init__(self, taps: np.ndarray, channels: int):
+        self.taps = taps
+        self.tail = np.zeros((len(taps) - 1, channels))
+        self._spectrum = np.fft.rfft(taps, FFT_SIZE)[:, None]
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filtrar un bloque (la salida tiene su misma longitud)
+        """
+        # Trozos que, con la cola del filtro, llenan justo una FFT de FFT_SIZE
+        chunk = FFT_SIZE - len(self.taps) + 1
+        return np.concatenate([
+            self._process_chunk(block[start:start + chunk])
+            for start in range(0, len(block), chunk)
+        ]) if len(block) else block
+    
+    def _process_chunk(self, chunk: np.ndarray) -> np.ndarray:
+        spectrum = np.fft.rfft(chunk, FFT_SIZE, axis=0) * self._spectrum
+        full = np.fft.irfft(spectrum, FFT_SIZE, axis=0)[:len(chunk) + len(self.taps) - 1]
+        full[:len(self.tail)] += self.tail
+        self.tail = full[len(chunk):].copy()
+        return full[:len(chunk)]
+
+
+class _TruePeakMeter:
+    """
+    Pico real por sobremuestreo x4 polifásico
+    """
+    
+    def __init__(self, channels: int):
+        self.phases = oversampling_taps()[:, ::-1].T.astype(np.float32)
+        self.history = np.zeros((TAPS_PER_PHASE - 1, channels), dtype=np.float32)
+        self.peak = 0.0
+    
+    def process(self, block: np.ndarray):
+        samples = np.concatenate([self.history, block])
+        self.history = samples[len(samples) - (TAPS_PER_PHASE - 1):]
+        self.peak = max(self.peak, float(np.abs(block).max(initial=0.0)))
+        for channel in range(samples.shape[1]):
+            # (frames, coeficientes) @ (coeficientes, fases): las cuatro
+            # muestras interpoladas de cada frame a la vez
+            windows = sliding_window_view(samples[:, channel], TAPS_PER_PHASE)
+            interpolated = windows @ self.phases
+            self.peak = max(self.peak, float(np.abs(interpolated).max(initial=0.0)))
+
+
+def measure_blocks(
+    blocks: Iterable[np.ndarray],
+    sample_rate: int = MEASURE_SAMPLE_RATE
+) -> Dict[str, Optional[float]]:
+    """
+    Medir sonoridad integrada y pico real de un flujo de bloques
+    
+    Args:
+        blocks: Bloques (frames, canales) float32 a 48 kHz
+    
+    Returns:
+        Diccionario con integrated_lufs y true_peak_db (None si es silencio)
+    """
+    convolver: Optional[_BlockConvolver] = None
+    meter: Optional[_TruePeakMeter] = None
+    step = int(sample_rate * STEP_SECONDS)
+    
+    step_powers: List[np.ndarray] = []
+    pending = np.zeros((0, 0))
+    
+    for block in blocks:
+        if convolver is None:
+            convolver = _BlockConvolver(k_weighting_taps(), block.shape[1])
+            meter = _TruePeakMeter(block.shape[1])
+            pending = np.zeros((0, block.shape[1]))
+        meter.process(block)
+        weighted = convolver.process(block)
+        
+        # Energía media por canal de cada paso completo de 100 ms
+        pending = np.concatenate([pending, weighted])
+        usable = len(pending) // step * step
+        if usable:
+            squared = pending[:usable].reshape(-1, step, pending.shape[1]) ** 2
+            step_powers.append(squared.mean(axis=1))
+        pending = pending[usable:]
+    
+    peak = meter.peak if meter else 0.0
+    true_peak_db = 20 * np.log10(peak) if peak > 0 else None
+    if not step_powers:
+        return {"integrated_lufs": None, "true_peak_db": true_peak_db}
+    
+    steps = np.concatenate(step_powers)
+    if len(steps) < STEPS_PER_BLOCK:
+        return {"integrated_lufs": None, "true_peak_db": true_peak_db}
+    
+    # Bloques de 400 ms: media de 4 pasos consecutivos, suma de canales
+    windows = sliding_window_view(steps, STEPS_PER_BLOCK, axis=0)
+    block_power = windows.mean(axis=2).sum(axis=1)
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+    
+    gated = block_power[block_loudness > ABSOLUTE_GATE]
+    if not len(gated):
+        return {"integrated_lufs": None, "true_peak_db": true_peak_db}
+    relative = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = block_power[(block_loudness > ABSOLUTE_GATE) & (block_loudness > relative)]
+    
+    integrated = -0.691 + 10 * np.log10(gated.mean())
+    return {
+        "integrated_lufs": round(float(integrated), 2),
+        "true_peak_db": round(float(true_peak_db), 2) if true_peak_db is not None else None,
+    }
+
+
+def normalization_gain(
+    integrated_lufs: Optional[float],
+    true_peak_db: Optional[float],
+    target: float = LOUDNESS_TARGET_LUFS,
+    ceiling: float = TRUE_PEAK_CEILING
+) -> float:
+    """
+    Ganancia (dB) que lleva el audio al objetivo sin pasar del pico máximo
+    """
+    if integrated_lufs is None:
+        return 0.0
+    gain = target - integrated_lufs
+    if true_peak_db is not None:
+        gain = min(gain, ceiling - true_peak_db)
+    return round(float(np.clip(gain, -MAX_GAIN_DB, MAX_GAIN_DB)), 2)
+
+
+def ensure_loudness(audio_path: str, force: bool = False) -> Optional[Dict]:
+    """
+    Medir un audio y guardar su ganancia si no está medido o ha cambiado
+    
+    Args:
+        audio_path: Archivo de audio de la biblioteca
+        force: Volver a medir aunque esté al día
+    
+    Returns:
+        La medida guardada o None si falla
+    """
+    try:
+        mtime = audio_mtime(audio_path)
+        cached = get_loudness(audio_path)
+        if not force and cached and cached["mtime"] >= mtime:
+            record_cache("loudness", hit=True)
+            return cached
+        
+        record_cache("loudness", hit=False)
+        measured = measure_blocks(decode_blocks(audio_path, sample_rate=MEASURE_SAMPLE_RATE))
+        gain_db = normalization_gain(measured["integrated_lufs"], measured["true_peak_db"])
+        record_loudness(audio_path, gain_db=gain_db, mtime=mtime, **measured)
+        return get_loudness(audio_path)
+    except Exception as e:
+        print(f"Error al medir la sonoridad de {audio_path}: {e}")
+        return None
+
+
+def ensure_loudness_for_folder(folder: str) -> List[Dict]:
+    """
+    Medir todas las pistas de una canción (carpeta o contenedor)
+    """
+    measured = []
+    for stem_path in list_stems(folder).values():
+        result = ensure_loudness(stem_path)
+        if result:
+            measured.append(result)
+    return measured
+
+
+def gain_to_linear(gain_db: Optional[float]) -> float:
+    """
+    Convertir una ganancia en dB a factor lineal
+    """
+    return float(10 ** ((gain_db or 0.0) / 20))
+
+
+def main():
+    from src.file_manager import list_songs
+    
+    parser = argparse.ArgumentParser(description="Medir la sonoridad de canciones y pistas")
+    parser.add_argument("--force", action="store_true", help="Volver a medir aunque estén al día")
+    args = parser.parse_args()
+    
+    # list_songs recorre también las carpetas de pistas
+    for song in list_songs():
+        result = ensure_loudness(song["file_path"], force=args.force)
+        if result:
+            print(f"🔊 {song['file_path']}: {result['integrated_lufs']} LUFS, "
+                  f"{result['true_peak_db']} dBTP -> {result['gain_db']:+.2f} dB")
+
+
+if __name__ == "__main__":
+    main()
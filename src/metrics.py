@@ -0,0 +1,428 @@
+"""
+Métricas de la aplicación en formato de texto de Prometheus
+
+Contadores, gauges e histogramas ligeros (un lock por métrica, buckets
+fijos) sin dependencias externas. Cada proceso guarda periódicamente una
+instantánea en ``data/metrics/<pid>.json`` y el endpoint ``/metrics`` suma
+las de todos los procesos vivos, de modo que las métricas de los workers de
+uvicorn y de ``src/worker.py`` aparecen juntas.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.config import METRICS_DIR, METRICS_FLUSH_INTERVAL
+from src.task_store import _pid_alive
+
+
+# Buckets por defecto (segundos) para operaciones cortas, como peticiones HTTP
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Buckets para trabajos largos (descargas y separaciones)
+JOB_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+# Buckets para el factor de tiempo real (tiempo de proceso / duración del audio)
+RTF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 4, 8)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    """
+    Base de las métricas: nombre, ayuda, etiquetas y valores por etiquetas
+    """
+    
+    kind = ""
+    
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        register: bool = True
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: Dict[LabelValues, object] = {}
+        self._lock = threading.Lock()
+        # Las métricas calculadas al leer (collectors) no se registran
+        if register:
+            REGISTRY.register(self)
+    
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+    
+    def snapshot(self) -> Dict[LabelValues, object]:
+        """Copia de los valores actuales"""
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+    
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    """Contador monótono"""
+    
+    kind = "counter"
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Valor que sube y baja"""
+    
+    kind = "gauge"
+    
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Histograma con buckets acumulativos fijos
+    
+    Cada serie se guarda como [recuentos por bucket..., suma, total].
+    """
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        register: bool = True
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labels, register)
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+    
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Medir la duración de un bloque"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+
+class Registry:
+    """
+    Conjunto de métricas del proceso
+    """
+    
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], List[Metric]]] = []
+    
+    def register(self, metric: Metric):
+        self.metrics[metric.name] = metric
+    
+    def add_collector(self, collector: Callable[[], List[Metric]]):
+        """
+        Registrar una función que genera métricas en el momento de leerlas
+        (estado global como la cola o la biblioteca; no se suman entre procesos)
+        """
+        self._collectors.append(collector)
+    
+    def snapshot(self) -> Dict:
+        """Instantánea serializable de las métricas del proceso"""
+        return {
+            name: {
+                "kind": metric.kind,
+                "help": metric.help,
+                "labels": list(metric.labels),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "values": [[list(key), value] for key, value in metric.snapshot().items()],
+            }
+            for name, metric in self.metrics.items()
+        }
+    
+    def collect(self) -> List[Metric]:
+        metrics = []
+        for collector in self._collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                print(f"Error al calcular métricas: {e}")
+        return metrics
+
+
+REGISTRY = Registry()
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_snapshot():
+    """
+    Guardar la instantánea de este proceso para que otros la agreguen
+    """
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(temp_path, path)
+
+
+_writer_started = False
+_writer_lock = threading.Lock()
+
+
+def start_snapshot_writer(interval: float = METRICS_FLUSH_INTERVAL):
+    """
+    Guardar la instantánea del proceso cada ``interval`` segundos
+    """
+    global _writer_started
+    with _writer_lock:
+        if _writer_started:
+            return
+        _writer_started = True
+    
+    def run():
+        wakeup = threading.Event()
+        while not wakeup.wait(interval):
+            try:
+                write_snapshot()
+            except Exception as e:
+                print(f"Error al guardar métricas: {e}")
+    
+    threading.Thread(target=run, name="metrics-writer", daemon=True).start()
+
+
+def _read_snapshots() -> List[Dict]:
+    """
+    Leer las instantáneas de los demás procesos vivos (borrando las huérfanas)
+    """
+    snapshots = []
+    if not os.path.isdir(METRICS_DIR):
+        return snapshots
+    
+    for file in os.listdir(METRICS_DIR):
+        if not file.endswith(".json"):
+            continue
+        try:
+            pid = int(file[:-5])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        
+        path = os.path.join(METRICS_DIR, file)
+        if not _pid_alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots: List[Dict]) -> Dict:
+    """
+    Sumar instantáneas de varios procesos serie a serie
+    """
+    merged: Dict[str, Dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "values": {}})
+            for key, value in metric["values"]:
+                key = tuple(key)
+                current = target["values"].get(key)
+                if current is None:
+                    target["values"][key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    target["values"][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target["values"][key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: List[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(name, value) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _render_metric(name: str, metric: Dict) -> List[str]:
+    lines = [f"# HELP {name} {metric['help']}", f"# TYPE {name} {metric['kind']}"]
+    labels = metric["labels"]
+    for key, value in sorted(metric["values"].items()):
+        if metric["kind"] == "histogram":
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels, key, ('le', _format_number(bound)))} {cumulative}"
+                )
+            lines.append(f"{name}_bucket{_format_labels(labels, key, ('le', '+Inf'))} {value[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels, key)} {_format_number(value[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels, key)} {value[-1]}")
+        else:
+            lines.append(f"{name}{_format_labels(labels, key)} {_format_number(value)}")
+    return lines
+
+
+def render_metrics() -> str:
+    """
+    Generar el texto de ``/metrics`` con las métricas de todos los procesos
+    """
+    merged = _merge([REGISTRY.snapshot(), *_read_snapshots()])
+    for metric in REGISTRY.collect():
+        merged[metric.name] = {
+            "kind": metric.kind,
+            "help": metric.help,
+            "labels": list(metric.labels),
+            "buckets": list(getattr(metric, "buckets", ())),
+            "values": metric.snapshot(),
+        }
+    
+    lines: List[str] = []
+    for name in sorted(merged):
+        lines.extend(_render_metric(name, merged[name]))
+    return "\n".join(lines) + "\n"
+
+
+# --- Métricas de la aplicación ---
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "shelu_http_request_duration_seconds",
+    "Duración de las peticiones HTTP por ruta",
+    ("method", "route", "status"),
+)
+
+JOB_DURATION_SECONDS = Histogram(
+    "shelu_job_duration_seconds",
+    "Duración de los trabajos desde que se toman hasta que terminan",
+    ("type", "model", "status"),
+    buckets=JOB_BUCKETS,
+)
+
+JOB_WAIT_SECONDS = Histogram(
+    "shelu_job_wait_seconds",
+    "Tiempo en cola de los trabajos antes de empezar",
+    ("type",),
+    buckets=JOB_BUCKETS,
+)
+
+SEPARATION_REALTIME_FACTOR = Histogram(
+    "shelu_separation_realtime_factor",
+    "Tiempo de separación dividido por la duración del audio",
+    ("model",),
+    buckets=RTF_BUCKETS,
+)
+
+INPUT_DECODE_SECONDS = Histogram(
+    "shelu_input_decode_seconds",
+    "Tiempo de decodificar y remuestrear la entrada de una separación",
+)
+
+JOB_WORKER_SLOTS = Gauge(
+    "shelu_job_worker_slots",
+    "Huecos de trabajo disponibles en los procesos worker",
+    ("type",),
+)
+
+JOB_WORKERS_BUSY = Gauge(
+    "shelu_job_workers_busy",
+    "Huecos de trabajo ocupados ahora mismo",
+    ("type",),
+)
+
+CACHE_REQUESTS = Counter(
+    "shelu_cache_requests_total",
+    "Consultas a cachés por resultado (hit/miss)",
+    ("cache", "result"),
+)
+
+STORAGE_EVICTED_BYTES = Counter(
+    "shelu_storage_evicted_bytes_total",
+    "Bytes de archivos regenerables borrados por superar su presupuesto",
+    ("class",),
+)
+
+LIBRARY_SCAN_SECONDS = Histogram(
+    "shelu_library_scan_duration_seconds",
+    "Duración de los recorridos de la biblioteca",
+    ("operation",),
+)
+
+
+def timed(histogram: Histogram, **labels):
+    """
+    Decorador que mide la duración de cada llamada en un histograma
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache: str, hit: bool):
+    """
+    Registrar un acierto o fallo de caché
+    """
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,298 @@
+"""
+Mezcla de pistas separadas en el servidor
+
+Decodifica las pistas de una canción, las mezcla con NumPy en bloques de
+tamaño fijo (ganancia, mute y panorama por pista) y codifica el resultado
+según se genera. Las mezclas completas se guardan en caché por ajustes.
+
+Con ``normalize`` se aplica además a todas las pistas la ganancia de
+sonoridad medida para la canción original (ver ``src/loudness.py``), así la
+mezcla suena al nivel objetivo sin cambiar el balance entre pistas.
+
+Si las pistas están en un contenedor multipista se decodifican todas con un
+único FFmpeg en lugar de uno por pista. Las pistas decodificadas se guardan
+en la caché de ``src/decoded_cache.py``, así que volver a mezclar una
+canción con otros ajustes no decodifica nada.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.audio_io import encode_blocks, OUTPUT_FORMATS, CHANNELS
+from src.config import MIX_CACHE_DIR
+from src.file_manager import get_song_stems, resolve_song_folder
+from src.loudness import ensure_loudness, gain_to_linear
+from src.metrics import record_cache
+from src.decoded_cache import cached_blocks, cached_container_blocks
+from src.stem_container import source_file, split_stem_ref
+
+
+# Límites de los ajustes por pista
+MAX_GAIN = 4.0
+
+# Extensión de archivo por formato de salida
+FORMAT_EXTENSIONS = {"mp3": "mp3", "opus": "ogg"}
+
+
+def _parse_pairs(value: Optional[str]) -> Dict[str, float]:
+    """
+    Convertir ``"vocals:0.5,drums:1.2"`` en ``{"vocals": 0.5, "drums": 1.2}``
+    """
+    pairs = {}
+    for item in filter(None, (value or "").split(",")):
+        stem, _, number = item.partition(":")
+        try:
+            pairs[stem.strip()] = float(number)
+        except ValueError:
+            raise ValueError(f"Valor no válido para '{stem}': {number!r}")
+    return pairs
+
+
+def parse_mix_settings(
+    gain: Optional[str] = None,
+    mute: Optional[str] = None,
+    pan: Optional[str] = None
+) -> Dict[str, Dict]:
+    """
+    Construir los ajustes de mezcla a partir de los parámetros de la URL
+    
+    Args:
+        gain: Ganancias lineales ``stem:valor`` separadas por comas
+        mute: Pistas silenciadas separadas por comas
+        pan: Panorama ``stem:valor`` (-1 izquierda, 0 centro, 1 derecha)
+        
+    Returns:
+        Diccionario {stem: {"gain", "mute", "pan"}} sólo con las pistas indicadas
+    """
+    settings: Dict[str, Dict] = {}
+    
+    for stem, value in _parse_pairs(gain).items():
+        settings.setdefault(stem, {})["gain"] = min(max(value, 0.0), MAX_GAIN)
+    for stem, value in _parse_pairs(pan).items():
+        settings.setdefault(stem, {})["pan"] = min(max(value, -1.0), 1.0)
+    for stem in filter(None, (mute or "").split(",")):
+        settings.setdefault(stem.strip(), {})["mute"] = True
+    
+    return settings
+
+
+def _stem_gains(settings: Dict) -> np.ndarray:
+    """
+    Ganancia por canal (izquierdo, derecho) de una pista
+    
+    El panorama actúa como balance: atenúa el canal contrario sin subir
+    nunca el propio por encima de la ganancia indicada.
+    """
+    gain = settings.get("gain", 1.0)
+    pan = settings.get("pan", 0.0)
+    return np.array([gain * min(1.0, 1.0 - pan), gain * min(1.0, 1.0 + pan)], dtype=np.float32)
+
+
+def mix_blocks(stem_paths: Dict[str, str], settings: Dict[str, Dict]) -> Iterator[np.ndarray]:
+    """
+    Mezclar pistas bloque a bloque
+    
+    Args:
+        stem_paths: Diccionario {stem: ruta o referencia a un contenedor}
+        settings: Ajustes por pista (las no indicadas suenan a ganancia 1)
+        
+    Yields:
+        Bloques estéreo float32 de la mezcla
+    """
+    active = [
+        stem for stem in sorted(stem_paths)
+        if not settings.get(stem, {}).get("mute") and settings.get(stem, {}).get("gain", 1.0) > 0
+    ]
+    if not active:
+        raise ValueError("No hay pistas activas en la mezcla")
+    
+    # Matriz (pistas, canales) con la ganancia de cada pista
+    gains = np.stack([_stem_gains(settings.get(stem, {})) for stem in active])
+    
+    aligned = _aligned_blocks([stem_paths[stem] for stem in active])
+    try:
+        for blocks in aligned:
+            frames = max((len(block) for block in blocks if block is not None), default=0)
+            if frames == 0:
+                break
+            
+            # Acumular directamente desde los bloques (vistas del mapa en
+            # memoria si las pistas están en la caché de audio decodificado)
+            mixed = np.zeros((frames, CHANNELS), dtype=np.float32)
+            for block, gain in zip(blocks, gains):
+                if block is not None:
+                    mixed[:len(block)] += block * gain
+            np.clip(mixed, -1.0, 1.0, out=mixed)
+            yield mixed
+    finally:
+        aligned.close()
+
+
+def _aligned_blocks(paths: List[str]) -> Iterator[List[Optional[np.ndarray]]]:
+    """
+    Bloques alineados de varias pistas (None para las que ya terminaron)
+    
+    Las pistas de un mismo contenedor se leen juntas; el resto, cada una con
+    su propio decodificador. En ambos casos pasando por la caché de audio
+    decodificado.
+    """
+    refs = [split_stem_ref(path) for path in paths]
+    containers = {container for container, _ in refs}
+    if len(containers) == 1 and all(stem is not None for _, stem in refs):
+        decoder = cached_container_blocks(containers.pop(), [stem for _, stem in refs])
+        try:
+            yield from decoder
+        finally:
+            decoder.close()
+        return
+    
+    decoders = [cached_blocks(path) for path in paths]
+    try:
+        while True:
+            blocks = [next(decoder, None) for decoder in decoders]
+            if all(block is None for block in blocks):
+                break
+            yield blocks
+    finally:
+        for decoder in decoders:
+            decoder.close()
+
+
+def apply_normalization(
+    artist: str,
+    song: str,
+    stem_paths: Dict[str, str],
+    settings: Dict[str, Dict]
+) -> Dict[str, Dict]:
+    """
+    Multiplicar la ganancia de cada pista por la de normalización de la canción
+    
+    Si la canción no se ha medido todavía se mide ahora (una sola vez).
+    """
+    song_path = resolve_song_folder(artist, song) + ".mp3"
+    loudness = ensure_loudness(song_path) if os.path.exists(song_path) else None
+    factor = gain_to_linear(loudness["gain_db"]) if loudness else 1.0
+    if factor == 1.0:
+        return settings
+    
+    normalized = {}
+    for stem in stem_paths:
+        stem_settings = dict(settings.get(stem, {}))
+        stem_settings["gain"] = stem_settings.get("gain", 1.0) * factor
+        normalized[stem] = stem_settings
+    return normalized
+
+
+def mix_cache_key(
+    artist: str,
+    song: str,
+    stem_paths: Dict[str, str],
+    settings: Dict[str, Dict],
+    output_format: str,
+    bitrate: str
+) -> str:
+    """
+    Clave de caché de una mezcla
+    
+    Incluye tamaño y fecha de cada pista para invalidar la caché si la
+    canción se vuelve a separar.
+    """
+    stems = {
+        stem: [os.path.getsize(source_file(path)), os.path.getmtime(source_file(path))]
+        for stem, path in stem_paths.items()
+    }
+    payload = json.dumps(
+        [artist, song, stems, settings, output_format, bitrate], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def stream_mix(
+    artist: str,
+    song: str,
+    settings: Dict[str, Dict],
+    output_format: str = "mp3",
+    bitrate: str = "192k",
+    normalize: bool = False
+) -> Tuple[Optional[str], Optional[Iterator[bytes]], str]:
+    """
+    Obtener una mezcla, desde caché o generándola en streaming
+    
+    Args:
+        artist: Nombre de la carpeta del artista
+        song: Nombre de la canción
+        settings: Ajustes de mezcla (ver ``parse_mix_settings``)
+        output_format: Formato de salida (mp3, opus)
+        bitrate: Bitrate de la codificación
+        normalize: Aplicar la ganancia de sonoridad de la canción
+        
+    Returns:
+        Tupla (ruta en caché o None, generador de bytes o None, tipo MIME).
+        Si la mezcla ya existe se devuelve sólo la ruta.
+        
+    Raises:
+        ValueError: Si la canción no tiene pistas o los ajustes no son válidos
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Formato no soportado: {output_format}")
+    if not re.fullmatch(r"\d{2,3}k", bitrate):
+        raise ValueError(f"Bitrate no válido: {bitrate}")
+    
+    stem_paths = get_song_stems(artist, song)
+    if not stem_paths:
+        raise ValueError("La canción no tiene pistas separadas")
+    
+    unknown = set(settings) - set(stem_paths)
+    if unknown:
+        raise ValueError(f"Pistas desconocidas: {', '.join(sorted(unknown))}")
+    
+    if normalize:
+        settings = apply_normalization(artist, song, stem_paths, settings)
+    
+    media_type = OUTPUT_FORMATS[output_format][1]
+    key = mix_cache_key(artist, song, stem_paths, settings, output_format, bitrate)
+    cached_path = os.path.join(MIX_CACHE_DIR, f"{key}.{FORMAT_EXTENSIONS[output_format]}")
+    
+    if os.path.exists(cached_path):
+        record_cache("mix", hit=True)
+        try:
+            # Marcar como usada (la caché se recorta por fecha de uso)
+            os.utime(cached_path)
+        except OSError:
+            pass
+        return cached_path, None, media_type
+    record_cache("mix", hit=False)
+    
+    # Validar antes de empezar a enviar la respuesta
+    blocks = mix_blocks(stem_paths, settings)
+    first_block = next(blocks)
+    
+    def all_blocks():
+        try:
+            yield first_block
+            yield from blocks
+        finally:
+            blocks.close()
+    
+    def generate():
+        os.makedirs(MIX_CACHE_DIR, exist_ok=True)
+        temp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        completed = False
+        try:
+            with open(temp_path, "wb") as cache_file:
+                for chunk in encode_blocks(all_blocks(), output_format, bitrate):
+                    cache_file.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                os.replace(temp_path, cached_path)
+            elif os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    return None, generate(), media_type
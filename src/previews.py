@@ -0,0 +1,162 @@
+"""
+Versiones de previsualización segmentadas
+
+Codifica cada canción y pista en Opus de bajo bitrate cortado en segmentos
+cortos independientes, con un manifiesto ``index.json``. Para
+``music/A/Song.mp3`` se genera::
+
+    music/A/Song.preview/
+        index.json
+        seg_00000.opus
+        seg_00001.opus
+        ...
+
+Los segmentos son archivos estáticos pequeños e inmutables, de modo que el
+reproductor puede empezar al instante y saltar a cualquier punto pidiendo
+sólo el segmento que contiene esa posición.
+"""
+import csv
+import json
+import os
+import shutil
+import subprocess
+from typing import Dict, List, Optional
+
+from src.audio_io import ffmpeg_executable, input_args
+from src.config import PREVIEWS_ENABLED, PREVIEW_BITRATE, PREVIEW_SEGMENT_SECONDS
+from src.stem_container import artifact_base, audio_mtime, list_stems
+
+
+PREVIEW_SUFFIX = ".preview"
+MANIFEST_NAME = "index.json"
+MANIFEST_VERSION = 1
+
+
+def preview_dir_for(audio_path: str) -> str:
+    """
+    Carpeta de previsualización de un audio
+    """
+    return artifact_base(audio_path) + PREVIEW_SUFFIX
+
+
+def preview_manifest_for(audio_path: str) -> Optional[str]:
+    """
+    Ruta del manifiesto de previsualización si existe
+    """
+    manifest = os.path.join(preview_dir_for(audio_path), MANIFEST_NAME)
+    return manifest if os.path.exists(manifest) else None
+
+
+def generate_preview(
+    audio_path: str,
+    bitrate: str = PREVIEW_BITRATE,
+    segment_seconds: float = PREVIEW_SEGMENT_SECONDS,
+    force: bool = False
+) -> Optional[str]:
+    """
+    Generar la versión de previsualización segmentada de un audio
+    
+    Args:
+        audio_path: Archivo de audio original
+        bitrate: Bitrate Opus
+        segment_seconds: Duración objetivo de cada segmento
+        force: Regenerar aunque ya exista y esté al día
+        
+    Returns:
+        Ruta del manifiesto o None si falla
+    """
+    output_dir = preview_dir_for(audio_path)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    
+    if (not force and os.path.exists(manifest_path)
+            and os.path.getmtime(manifest_path) >= audio_mtime(audio_path)):
+        return manifest_path
+    
+    # Generar en una carpeta temporal y sustituir al final
+    temp_dir = f"{output_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    
+    segment_list = os.path.join(temp_dir, "segments.csv")
+    cmd = [
+        ffmpeg_executable(), "-v", "error", "-nostdin", "-y",
+        *input_args(audio_path),
+        "-vn", "-c:a", "libopus", "-b:a", bitrate, "-ac", "2",
+        "-f", "segment",
+        "-segment_time", str(segment_seconds),
+        "-segment_format", "ogg",
+        "-segment_list", segment_list,
+        "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        os.path.join(temp_dir, "seg_%05d.opus")
+    ]
+    
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+        
+        segments = _read_segment_list(segment_list, temp_dir)
+        os.remove(segment_list)
+        
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "codec": "opus",
+            "container": "ogg",
+            "bitrate": bitrate,
+            "segment_seconds": segment_seconds,
+            "duration": round(segments[-1]["end"], 3) if segments else 0.0,
+            "segments": segments,
+        }
+        with open(os.path.join(temp_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(temp_dir, output_dir)
+        return manifest_path
+        
+    except Exception as e:
+        print(f"Error al generar previsualización de {audio_path}: {e}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return None
+
+
+def _read_segment_list(segment_list: str, folder: str) -> List[Dict]:
+    """
+    Convertir la lista CSV del muxer de segmentos (archivo,inicio,fin)
+    en las entradas del manifiesto
+    """
+    segments = []
+    with open(segment_list, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            name, start, end = row[0], float(row[1]), float(row[2])
+            segments.append({
+                "file": name,
+                "start": round(start, 3),
+                "end": round(end, 3),
+                "duration": round(end - start, 3),
+                "bytes": os.path.getsize(os.path.join(folder, name)),
+            })
+    return segments
+
+
+def generate_previews_for_song(song_path: str, stems_dir: Optional[str] = None) -> List[str]:
+    """
+    Generar previsualizaciones de una canción y de sus pistas separadas
+    
+    No hace nada salvo que las previsualizaciones estén activadas
+    (``SHELU_PREVIEWS=1``).
+    """
+    if not PREVIEWS_ENABLED:
+        return []
+    
+    manifests = []
+    targets = [song_path] if os.path.exists(song_path) else []
+    if stems_dir:
+        targets += list(list_stems(stems_dir).values())
+    
+    for target in targets:
+        manifest = generate_preview(target)
+        if manifest:
+            manifests.append(manifest)
+    return manifests
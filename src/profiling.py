@@ -0,0 +1,260 @@
+"""
+Perfilado opcional de peticiones y trabajos
+
+Dos perfiladores:
+
+- ``sampling``: un hilo toma muestras de las pilas de los hilos observados
+  cada ``PROFILE_SAMPLE_INTERVAL`` segundos. Apenas añade sobrecarga y se
+  guarda en formato speedscope (https://www.speedscope.app), con un perfil
+  por hilo. Es el que se usa para las peticiones HTTP, porque los endpoints
+  síncronos se ejecutan en otros hilos del threadpool.
+- ``cprofile``: cProfile en el hilo del trabajo, guardado como pstats
+  (``python -m pstats``, snakeviz...). Sólo para trabajos.
+
+Los perfiles se guardan en ``data/profiles/<id>.<formato>`` y se descargan
+con ``GET /api/profile/{id}``.
+"""
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.config import (
+    PROFILING_ENABLED,
+    PROFILE_ALL_JOBS,
+    PROFILE_ROUTES,
+    PROFILER,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_DIR,
+    PROFILE_MAX_FILES,
+)
+
+
+# Cabecera para pedir el perfil de una petición
+PROFILE_HEADER = "x-shelu-profile"
+
+# Extensión de archivo por formato
+PROFILE_FORMATS = {
+    "speedscope": ".speedscope.json",
+    "pstats": ".pstats",
+}
+
+_PROFILE_ID = re.compile(r"^[\w.\-]+$")
+
+# Módulos en los que un hilo está esperando (no trabajando)
+_IDLE_MODULES = ("threading.py", "selectors.py", "queue.py")
+
+Frame = Tuple[str, str, int]
+
+
+def new_profile_id(prefix: str) -> str:
+    """
+    Generar un ID para el perfil de una petición
+    """
+    return f"{prefix}_{time.time():.3f}_{uuid.uuid4().hex[:6]}"
+
+
+def profile_path(profile_id: str, profile_format: str) -> str:
+    """
+    Ruta del archivo de un perfil
+    
+    Raises:
+        ValueError: Si el ID o el formato no son válidos
+    """
+    if not _PROFILE_ID.match(profile_id):
+        raise ValueError("ID de perfil no válido")
+    if profile_format not in PROFILE_FORMATS:
+        raise ValueError(f"Formato no soportado: {profile_format}")
+    return os.path.join(PROFILE_DIR, profile_id + PROFILE_FORMATS[profile_format])
+
+
+def available_formats(profile_id: str) -> List[str]:
+    """
+    Formatos guardados para un perfil
+    """
+    try:
+        return [fmt for fmt in PROFILE_FORMATS if os.path.exists(profile_path(profile_id, fmt))]
+    except ValueError:
+        return []
+
+
+def should_profile_request(path: str, headers) -> bool:
+    """
+    Decidir si se perfila una petición (por cabecera o ruta configurada)
+    """
+    if any(path.startswith(route) for route in PROFILE_ROUTES):
+        return True
+    return PROFILING_ENABLED and headers.get(PROFILE_HEADER) == "1"
+
+
+def should_profile_job(job: Dict) -> bool:
+    """
+    Decidir si se perfila un trabajo
+    """
+    return PROFILE_ALL_JOBS or bool(job.get("profile"))
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo de pilas de hilos
+    
+    Las muestras consecutivas con la misma pila se acumulan en una sola con
+    más peso, así que un trabajo largo ocupa poco en memoria.
+    """
+    
+    def __init__(
+        self,
+        thread_ids: Optional[List[int]] = None,
+        interval: float = PROFILE_SAMPLE_INTERVAL
+    ):
+        # None = todos los hilos salvo el del propio perfilador
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.frames: List[Frame] = []
+        self._frame_index: Dict[Frame, int] = {}
+        # hilo -> [(pila como índices de frames, peso en segundos)]
+        self.samples: Dict[int, List[List]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+    
+    def _run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            frames = sys._current_frames()
+            thread_ids = self.thread_ids if self.thread_ids is not None else list(frames)
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                if self.thread_ids is None and frame.f_code.co_filename.endswith(_IDLE_MODULES):
+                    continue
+                self._record(thread_id, frame, weight)
+    
+    def _record(self, thread_id: int, frame, weight: float):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            index = self._frame_index.get(key)
+            if index is None:
+                index = self._frame_index[key] = len(self.frames)
+                self.frames.append(key)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        
+        samples = self.samples.setdefault(thread_id, [])
+        if samples and samples[-1][0] == stack:
+            samples[-1][1] += weight
+        else:
+            samples.append([stack, weight])
+    
+    def to_speedscope(self, name: str) -> Dict:
+        """
+        Convertir las muestras al formato de archivo de speedscope
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        profiles = []
+        for thread_id, samples in self.samples.items():
+            total = sum(weight for _, weight in samples)
+            profiles.append({
+                "type": "sampled",
+                "name": names.get(thread_id, str(thread_id)),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": [stack for stack, _ in samples],
+                "weights": [weight for _, weight in samples],
+            })
+        
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "shelu-music-studio",
+            "activeProfileIndex": 0,
+            "shared": {
+                "frames": [
+                    {"name": func, "file": file, "line": line}
+                    for func, file, line in self.frames
+                ]
+            },
+            "profiles": profiles,
+        }
+
+
+def _prune_profiles():
+    """
+    Conservar sólo los PROFILE_MAX_FILES perfiles más recientes
+    """
+    files = [os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR)]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def save_sampling_profile(profiler: SamplingProfiler, profile_id: str) -> str:
+    """
+    Guardar un perfil por muestreo en formato speedscope
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = profile_path(profile_id, "speedscope")
+    with open(path, "w") as f:
+        json.dump(profiler.to_speedscope(profile_id), f)
+    _prune_profiles()
+    return path
+
+
+@contextmanager
+def profile_job(profile_id: str, enabled: bool = True) -> Iterator[List[str]]:
+    """
+    Perfilar el bloque en el hilo actual con el perfilador configurado
+    
+    Produce la lista de formatos guardados, que se rellena al salir.
+    """
+    formats: List[str] = []
+    if not enabled:
+        yield formats
+        return
+    
+    if PROFILER == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield formats
+        finally:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(profile_path(profile_id, "pstats"))
+            _prune_profiles()
+            formats.append("pstats")
+        return
+    
+    sampler = SamplingProfiler(thread_ids=[threading.get_ident()])
+    sampler.start()
+    try:
+        yield formats
+    finally:
+        sampler.stop()
+        save_sampling_profile(sampler, profile_id)
+        formats.append("speedscope")
@@ -0,0 +1,257 @@
+"""
+Planificación de la cola: prioridades, reparto justo y control de admisión
+
+Cada trabajo tiene una clase de prioridad (``interactive`` o ``batch``) y
+una clave de reparto (usuario o artista). Al liberarse un hueco:
+
+1. Se elige la clase por *stride scheduling* con los pesos de
+   PRIORITY_WEIGHTS: cada clase avanza ``1 / peso`` en su contador al
+   recibir un hueco y gana la de contador más bajo, así que con 8:1 los
+   trabajos batch siguen avanzando pero nunca bloquean a los interactivos.
+2. Dentro de la clase se reparte igual entre claves (mismo mecanismo con
+   peso 1), para que un reproceso de 500 canciones de un usuario no deje
+   esperando a los demás.
+3. Dentro de la clave, el trabajo más antiguo.
+
+Con SHELU_PREEMPT_BATCH=1 un trabajo interactivo que encuentra todos los
+huecos ocupados puede además desplazar un batch en marcha
+(``select_preemptions``): el batch se cancela, vuelve a la cola y no se
+toma de nuevo hasta que haya empezado el interactivo que lo desplazó.
+
+Los contadores los guarda el almacén de tareas para que todos los procesos
+worker compartan el mismo reparto.
+"""
+import os
+import time
+from typing import Dict, List, Optional
+
+from src.config import (
+    PRIORITY_WEIGHTS,
+    PREEMPT_BATCH,
+    SEPARATION_CAPACITY,
+    SEPARATION_ESTIMATE_SECONDS,
+    ADMISSION_MAX_WAIT,
+)
+
+
+DEFAULT_PRIORITY = "interactive"
+
+# Ventana de tareas terminadas usada para estimar la duración media (segundos)
+DURATION_WINDOW = 6 * 3600
+
+
+class AdmissionRejected(Exception):
+    """
+    La cola está demasiado llena para aceptar el trabajo
+    
+    Attributes:
+        retry_after: Segundos recomendados antes de reintentar
+        estimated_wait: Espera estimada si se hubiera aceptado
+    """
+    
+    def __init__(self, retry_after: float, estimated_wait: float):
+        self.retry_after = retry_after
+        self.estimated_wait = estimated_wait
+        super().__init__(
+            f"Cola llena: espera estimada {estimated_wait:.0f}s. "
+            f"Reintentar en {retry_after:.0f}s"
+        )
+
+
+def validate_priority(priority: Optional[str]) -> str:
+    """
+    Normalizar la clase de prioridad
+    
+    Raises:
+        ValueError: Si la clase no existe
+    """
+    priority = priority or DEFAULT_PRIORITY
+    if priority not in PRIORITY_WEIGHTS:
+        raise ValueError(
+            f"Prioridad no válida: {priority} (opciones: {', '.join(PRIORITY_WEIGHTS)})"
+        )
+    return priority
+
+
+def fair_key_for(user: Optional[str], artist: Optional[str], file_path: str) -> str:
+    """
+    Clave de reparto de un trabajo: el usuario si se indica, si no el artista
+    (o la carpeta de artista de la canción)
+    """
+    return user or artist or os.path.basename(os.path.dirname(file_path))
+
+
+def _stride_pick(
+    candidates: List[str],
+    state: Dict[str, Dict],
+    scope: str,
+    weights: Dict[str, float]
+) -> str:
+    """
+    Elegir el candidato con menor contador y avanzar su contador
+    
+    Los candidatos que estaban inactivos se ponen al día con el tiempo
+    virtual del ámbito para que no acaparen los huecos al volver.
+    """
+    scope_state = state.setdefault(scope, {"vtime": 0.0, "passes": {}})
+    vtime, passes = scope_state["vtime"], scope_state["passes"]
+    
+    def effective(candidate: str) -> float:
+        return max(passes.get(candidate, 0.0), vtime)
+    
+    # A igual contador gana el de más peso (y después el primero de la lista)
+    chosen = min(candidates, key=lambda c: (effective(c), -weights.get(c, 1.0)))
+    current = effective(chosen)
+    passes[chosen] = current + 1.0 / weights.get(chosen, 1.0)
+    scope_state["vtime"] = current
+    
+    # Un contador que no supera el tiempo virtual equivale a no tenerlo
+    for candidate in [c for c, value in passes.items() if value <= current]:
+        del passes[candidate]
+    return chosen
+
+
+def pick_next(queued: List[Dict], state: Dict[str, Dict]) -> Optional[Dict]:
+    """
+    Elegir el siguiente trabajo de la cola
+    
+    Args:
+        queued: Tareas en cola con task_id, type, created_at y opcionalmente
+            priority, fair_key y preempted_by
+        state: Contadores del planificador por ámbito (se actualizan en el
+            sitio y el almacén los guarda)
+        
+    Returns:
+        La tarea elegida o None si la cola está vacía
+    """
+    # Un trabajo desplazado espera a que empiece el que lo desplazó
+    queued_ids = {task["task_id"] for task in queued}
+    queued = [task for task in queued if task.get("preempted_by") not in queued_ids]
+    if not queued:
+        return None
+    
+    # Agrupar por tipo -> clase -> clave
+    by_type: Dict[str, Dict[str, Dict[str, List[Dict]]]] = {}
+    for task in queued:
+        priority = task.get("priority") or DEFAULT_PRIORITY
+        key = task.get("fair_key") or ""
+        by_type.setdefault(task["type"], {}).setdefault(priority, {}).setdefault(key, []).append(task)
+    
+    def oldest(tasks: List[Dict]) -> float:
+        return min(task["created_at"] for task in tasks)
+    
+    # Entre tipos distintos (worker genérico) gana el trabajo más antiguo
+    task_type = min(
+        by_type,
+        key=lambda t: min(oldest(tasks) for keys in by_type[t].values() for tasks in keys.values())
+    )
+    classes = by_type[task_type]
+    
+    priority = _stride_pick(sorted(classes), state, task_type, PRIORITY_WEIGHTS)
+    keys = classes[priority]
+    
+    # Claves ordenadas por su trabajo más antiguo para deshacer empates
+    ordered_keys = sorted(keys, key=lambda k: oldest(keys[k]))
+    key = _stride_pick(ordered_keys, state, f"{task_type}/{priority}", {})
+    
+    return min(keys[key], key=lambda task: task["created_at"])
+
+
+def average_duration(task_store, task_type: str = "separate") -> float:
+    """
+    Duración media de los trabajos terminados recientemente
+    """
+    finished = task_store.list_tasks(
+        statuses=["completed"],
+        task_type=task_type,
+        since=time.time() - DURATION_WINDOW,
+        limit=200
+    )
+    durations = [
+        task["finished_at"] - task["started_at"] for task in finished
+        if task.get("finished_at") and task.get("started_at")
+    ]
+    if not durations:
+        return SEPARATION_ESTIMATE_SECONDS
+    return sum(durations) / len(durations)
+
+
+def estimate_wait(task_store, priority: str, task_type: str = "separate") -> float:
+    """
+    Estimar cuánto esperaría en cola un trabajo nuevo de esta clase
+    
+    Cuenta los trabajos que empezarían antes que él: todos los de su clase y,
+    de las demás, la parte que les corresponde según los pesos.
+    """
+    per_class: Dict[str, int] = {}
+    for task_priority, count in task_store.count_tasks(statuses=["queued"], task_type=task_type, group_by="priority").items():
+        task_priority = task_priority or DEFAULT_PRIORITY
+        per_class[task_priority] = per_class.get(task_priority, 0) + count
+    
+    own = per_class.get(priority, 0)
+    weight = PRIORITY_WEIGHTS[priority]
+    ahead = own
+    for other, count in per_class.items():
+        if other != priority:
+            ahead += min(count, (own + 1) * PRIORITY_WEIGHTS.get(other, 1.0) / weight)
+    
+    running = sum(task_store.count_tasks(statuses=["running"], task_type=task_type).values())
+    capacity = max(1, SEPARATION_CAPACITY)
+    # Si todos los huecos están ocupados, esperar además a que se libere uno
+    # (de media, a mitad de un trabajo)
+    busy = 0.5 if running >= capacity else 0.0
+    return (ahead / capacity + busy) * average_duration(task_store, task_type)
+
+
+def check_admission(task_store, priority: str, task_type: str = "separate"):
+    """
+    Rechazar el trabajo si la espera estimada supera el límite de su clase
+    
+    Raises:
+        AdmissionRejected: Con el tiempo recomendado para reintentar
+    """
+    estimated = estimate_wait(task_store, priority, task_type)
+    limit = ADMISSION_MAX_WAIT[priority]
+    if estimated > limit:
+        raise AdmissionRejected(retry_after=max(1.0, estimated - limit), estimated_wait=estimated)
+
+
+def select_preemptions(task_store, task_type: str = "separate") -> Dict[str, str]:
+    """
+    Elegir los trabajos batch en marcha a desplazar
+    
+    Sólo con SHELU_PREEMPT_BATCH=1 y todos los huecos ocupados. A cada
+    trabajo interactivo en cola que no tenga ya uno desplazado para él se le
+    asigna el batch que empezó más tarde (el que menos trabajo pierde).
+    
+    Returns:
+        {task_id del batch: task_id del interactivo que lo desplaza}
+    """
+    if not PREEMPT_BATCH:
+        return {}
+    
+    # Contar antes de leer: casi siempre hay huecos libres o nada en cola
+    running_count = sum(task_store.count_tasks(statuses=["running"], task_type=task_type).values())
+    if running_count < max(1, SEPARATION_CAPACITY):
+        return {}
+    queued = task_store.count_tasks(statuses=["queued"], task_type=task_type, group_by="priority")
+    if not any((priority or DEFAULT_PRIORITY) != "batch" for priority in queued):
+        return {}
+    
+    running = task_store.list_tasks(statuses=["running"], task_type=task_type, limit=running_count)
+    claimed = {task.get("preempt_requested") for task in running}
+    victims = sorted(
+        (task for task in running
+         if task.get("priority") == "batch"
+         and not task.get("preempt_requested") and not task.get("cancel_requested")),
+        key=lambda task: task.get("started_at") or 0,
+        reverse=True
+    )
+    if not victims:
+        return {}
+    waiting = sorted(
+        (task for task in task_store.list_tasks(statuses=["queued"], task_type=task_type, limit=sum(queued.values()))
+         if (task.get("priority") or DEFAULT_PRIORITY) != "batch" and task["task_id"] not in claimed),
+        key=lambda task: task["created_at"]
+    )
+    return {victim["task_id"]: task["task_id"] for victim, task in zip(victims, waiting)}
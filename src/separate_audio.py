@@ -3,7 +3,10 @@ Módulo para separar audio en múltiples pistas usando Demucs
 """
 import os
 import subprocess
-import sys
+import tempfile
+
+from src.separation_backends import get_backend
+from src.storage import keep_fresh
 
 
 def separate_audio(
@@ -38,9 +41,12 @@ def separate_audio(
         print(f"❌ Error: No se encontró el archivo {input_file}")
         return None
     
-    # Crear carpeta temporal
+    # Crear carpeta temporal propia (_temp puede estar en uso por la API)
     temp_output = os.path.join(output_folder, "_temp")
     os.makedirs(temp_output, exist_ok=True)
+    job_temp = tempfile.mkdtemp(dir=temp_output)
+    # Que la limpieza de temporales no la borre mientras se separa
+    fresh = keep_fresh(job_temp)
     
     print(f"🎵 Separando: {os.path.basename(input_file)}")
     print(f"Modelo: {model}")
@@ -48,22 +54,15 @@ def separate_audio(
     print(f"Dispositivo: {device.upper()}")
     print("Esto puede tomar varios minutos...\n")
     
-    # Construir comando de demucs
-    cmd = [
-        "demucs",
-        "-n", model,
-        "-o", temp_output,
-        "--device", device,
-        input_file
-    ]
-    
     try:
-        # Ejecutar demucs
-        result = subprocess.run(cmd, check=True)
-        
-        # Obtener nombre del archivo sin extensión
+        # Separar con el motor configurado (SHELU_SEPARATION_BACKEND)
         song_name = os.path.splitext(os.path.basename(input_file))[0]
-        temp_dir = os.path.join(temp_output, model, song_name)
+        temp_dir = os.path.join(job_temp, song_name)
+        get_backend().separate_file(
+            input_file,
+            temp_dir,
+            options={"model": model, "device": device, "output_format": "wav", "work_dir": job_temp}
+        )
         
         if os.path.exists(temp_dir):
             # Crear carpeta de destino junto al archivo original
@@ -77,12 +76,6 @@ def separate_audio(
             # Mover carpeta con las pistas al destino final
             shutil.move(temp_dir, final_output_dir)
             
-            # Limpiar carpeta temporal
-            try:
-                shutil.rmtree(temp_output)
-            except:
-                pass
-            
             print("\n✅ Separación completada!")
             print(f"📁 Las pistas se guardaron en: {final_output_dir}\n")
             
@@ -105,6 +98,9 @@ def separate_audio(
         print("\n❌ Error: Demucs no está instalado o no se encuentra en el PATH")
         print("Asegúrate de haber activado el entorno virtual e instalado las dependencias")
         return None
+    finally:
+        fresh.set()
+        shutil.rmtree(job_temp, ignore_errors=True)
 
 
 def separate_all_in_folder(input_folder="music", **kwargs):
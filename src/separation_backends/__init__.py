@@ -0,0 +1,47 @@
+"""
+Motores de separación de pistas
+
+Todos implementan ``SeparationBackend`` (``separate`` sobre audio en memoria
+y ``separate_file`` sobre archivos). Se elige con
+``SHELU_SEPARATION_BACKEND``:
+    
+    demucs_cli  Ejecutable ``demucs`` en un subproceso (por defecto)
+    torch       Demucs dentro del proceso, con el modelo ya cargado
+    onnx        Red de htdemucs exportada, en ONNX Runtime (CPU)
+    null        No separa; reparte la entrada (pruebas)
+"""
+from functools import lru_cache
+from typing import Optional
+
+from src.config import SEPARATION_BACKEND
+from src.separation_backends.base import DEFAULT_MODEL, SeparationBackend, model_stems
+
+
+def _backends():
+    from src.separation_backends.demucs_cli import DemucsCliBackend
+    from src.separation_backends.null_backend import NullBackend
+    from src.separation_backends.onnx_backend import OnnxBackend
+    from src.separation_backends.torch_backend import TorchBackend
+    
+    return {cls.name: cls for cls in (DemucsCliBackend, TorchBackend, OnnxBackend, NullBackend)}
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: Optional[str] = None) -> SeparationBackend:
+    """
+    Motor de separación (uno por proceso y nombre)
+    
+    Args:
+        name: Nombre del motor (por defecto ``SHELU_SEPARATION_BACKEND``)
+    
+    Raises:
+        ValueError: Si el motor no existe
+    """
+    name = name or SEPARATION_BACKEND
+    backends = _backends()
+    if name not in backends:
+        raise ValueError(f"Motor de separación desconocido: {name} (disponibles: {', '.join(backends)})")
+    return backends[name]()
+
+
+__all__ = ["DEFAULT_MODEL", "SeparationBackend", "get_backend", "model_stems"]
@@ -0,0 +1,223 @@
+"""
+Interfaz común de los motores de separación
+"""
+import os
+import subprocess
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.audio_io import SAMPLE_RATE, CHANNELS, decode_file
+from src.cancellation import CANCELLED, JobCancelled, check_cancelled
+from src.capabilities import ffmpeg_executable
+from src.input_cache import ensure_decoded_input
+from src.silence import describe_silent, find_silent_sources
+from src.separation_backends.checkpoints import (
+    checkpoint_key,
+    discard_checkpoint,
+    separate_in_chunks,
+    use_checkpoints,
+)
+
+
+DEFAULT_MODEL = "htdemucs_6s"
+
+# Pistas de cada modelo en el orden en que las devuelve Demucs
+MODEL_STEMS = {
+    "htdemucs_6s": ["drums", "bass", "other", "vocals", "guitar", "piano"],
+}
+DEFAULT_STEMS = ["drums", "bass", "other", "vocals"]
+
+# Argumentos de FFmpeg por formato de archivo de salida
+FILE_FORMATS = {
+    "mp3": ["-c:a", "libmp3lame"],
+    "wav": ["-c:a", "pcm_s16le"],
+    "wav_f32": ["-c:a", "pcm_f32le", "-f", "wav"],
+}
+FILE_EXTENSIONS = {"mp3": "mp3", "wav": "wav", "wav_f32": "wav"}
+
+
+def model_stems(model: str) -> List[str]:
+    """
+    Pistas que genera un modelo de Demucs
+    """
+    return list(MODEL_STEMS.get(model, DEFAULT_STEMS))
+
+
+def two_stem_target(stems: Optional[List[str]]) -> Optional[str]:
+    """
+    Pista de un pedido de dos pistas (``["vocals", "no_vocals"]`` o sólo
+    ``["no_vocals"]``) o None si se piden pistas normales
+    """
+    if not stems:
+        return None
+    targets = {stem[3:] if stem.startswith("no_") else stem for stem in stems}
+    if any(stem.startswith("no_") for stem in stems) and len(targets) == 1:
+        return targets.pop()
+    return None
+
+
+def select_stems(sources: Dict[str, np.ndarray], stems: Optional[List[str]]) -> Dict[str, np.ndarray]:
+    """
+    Elegir las pistas pedidas de todas las separadas
+    
+    ``no_<pista>`` es la suma de todas las demás (como ``--two-stems``).
+    
+    Raises:
+        ValueError: Si se pide una pista que el modelo no genera
+    """
+    if not stems:
+        return sources
+    selected = {}
+    for stem in stems:
+        if stem in sources:
+            selected[stem] = sources[stem]
+        elif stem.startswith("no_") and stem[3:] in sources:
+            selected[stem] = sum(array for name, array in sources.items() if name != stem[3:])
+        else:
+            raise ValueError(f"El modelo no genera la pista '{stem}'")
+    return selected
+
+
+def write_audio(path: str, audio: np.ndarray, output_format: str = "mp3", bitrate: str = "320k"):
+    """
+    Guardar un array (frames, CHANNELS) float32 con FFmpeg
+    """
+    codec_args = list(FILE_FORMATS[output_format])
+    if output_format == "mp3":
+        codec_args += ["-b:a", bitrate]
+    subprocess.run(
+        [ffmpeg_executable(), "-v", "error", "-nostdin", "-y",
+         "-f", "f32le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS), "-i", "-",
+         *codec_args, path],
+        input=np.ascontiguousarray(audio, dtype=np.float32).tobytes(),
+        capture_output=True,
+        check=True
+    )
+
+
+def report_silent_stems(options: Dict, silent: List[Dict]):
+    """
+    Avisar de las pistas silenciosas descartadas (opción ``on_silent_stems``)
+    """
+    on_silent_stems = options.get("on_silent_stems")
+    if on_silent_stems:
+        on_silent_stems(silent)
+
+
+class SeparationBackend:
+    """
+    Motor de separación
+    
+    La operación básica es ``separate``: audio (frames, 2) float32 a 44.1 kHz
+    -> {pista: array (frames, 2)}. ``separate_file`` separa un archivo y
+    guarda las pistas; por defecto decodifica, llama a ``separate`` y
+    codifica cada pista, pero los motores que ya trabajan con archivos (la
+    CLI de Demucs) lo reemplazan para no dar vueltas de más.
+    
+    Opciones (diccionario, todas opcionales):
+        model: Modelo de Demucs (``htdemucs_6s`` por defecto)
+        device: ``cpu`` o ``cuda`` (por defecto el que detecte torch)
+        output_format: ``mp3`` (por defecto), ``wav`` o ``wav_f32``
+        bitrate: Bitrate de los MP3 (``320k``)
+        work_dir: Carpeta bajo la que crear los archivos temporales
+        cache_input: Usar la caché de entradas decodificadas (True)
+        overlap: Solapamiento entre segmentos (0.25)
+        shifts: Desplazamientos aleatorios a promediar (1)
+        checkpoint: Separar los audios de al menos SHELU_CHECKPOINT_MIN_SECONDS
+            por fragmentos guardando cada uno para poder reanudar (False,
+            ver ``checkpoints.py``)
+        on_chunk: Función (hechos, total) llamada tras cada fragmento
+        drop_silent: No guardar las pistas silenciosas (False, ver
+            ``src/silence.py``); ``separate_file`` no las devuelve
+        on_silent_stems: Función llamada con las pistas descartadas
+            (``{"stem", "rms_db", "peak_db"}``) si se usa ``drop_silent``
+    """
+    
+    name = ""
+    
+    def load(self, options: Dict):
+        """Cargar el modelo de antemano (opcional; si no, se carga al separar)"""
+    
+    def separate(self, audio: np.ndarray, stems: Optional[List[str]], options: Dict) -> Dict[str, np.ndarray]:
+        """
+        Separar audio en memoria
+        
+        Args:
+            audio: Array (frames, CHANNELS) float32 a SAMPLE_RATE
+            stems: Pistas a devolver (None = todas las del modelo;
+                ``no_<pista>`` = todo menos esa pista)
+            options: Ver la documentación de la clase
+        
+        Returns:
+            Diccionario {pista: array (frames, CHANNELS) float32}
+        """
+        raise NotImplementedError
+    
+    def separate_file(
+        self,
+        input_file: str,
+        output_dir: str,
+        stems: Optional[List[str]] = None,
+        options: Optional[Dict] = None
+    ) -> Dict[str, str]:
+        """
+        Separar un archivo y guardar cada pista en ``output_dir/<pista>.<ext>``
+        
+        Returns:
+            Diccionario {pista: ruta del archivo}
+        """
+        options = options or {}
+        audio = decode_file(self._input_path(input_file, options))
+        if not use_checkpoints(options, len(audio) / SAMPLE_RATE):
+            return self._write_stems(self.separate(audio, stems, options), output_dir, options)
+        
+        key = checkpoint_key(self.name, input_file, stems, options)
+        try:
+            sources = separate_in_chunks(self, audio, stems, options, key)
+            paths = self._write_stems(sources, output_dir, options)
+        except JobCancelled as e:
+            # Los fragmentos de un trabajo desplazado se conservan para
+            # cuando vuelva a empezar
+            if e.reason == CANCELLED:
+                discard_checkpoint(key)
+            raise
+        discard_checkpoint(key)
+        return paths
+    
+    @staticmethod
+    def _write_stems(sources: Dict[str, np.ndarray], output_dir: str, options: Dict) -> Dict[str, str]:
+        """
+        Guardar cada pista en ``output_dir/<pista>.<ext>``
+        """
+        output_format = options.get("output_format", "mp3")
+        os.makedirs(output_dir, exist_ok=True)
+        if options.get("drop_silent"):
+            # Medir en memoria: las silenciosas no se llegan a codificar
+            silent = find_silent_sources(sources)
+            for entry in silent:
+                describe_silent(entry)
+            report_silent_stems(options, silent)
+            dropped = {entry["stem"] for entry in silent}
+            sources = {stem: array for stem, array in sources.items() if stem not in dropped}
+        paths = {}
+        for stem, array in sources.items():
+            check_cancelled()
+            path = os.path.join(output_dir, f"{stem}.{FILE_EXTENSIONS[output_format]}")
+            write_audio(path, array, output_format, options.get("bitrate", "320k"))
+            paths[stem] = path
+        return paths
+    
+    @staticmethod
+    def _input_path(input_file: str, options: Dict) -> str:
+        """
+        Archivo del que leer la entrada: la versión ya decodificada de la
+        caché de entradas si está activada
+        """
+        if not options.get("cache_input", True):
+            return input_file
+        try:
+            return ensure_decoded_input(input_file) or input_file
+        except Exception as e:
+            print(f"⚠️  No se pudo decodificar la entrada de {input_file}: {e}")
+            return input_file
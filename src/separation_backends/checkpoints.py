@@ -0,0 +1,226 @@
+"""
+Separación por fragmentos con puntos de control
+
+Una separación larga en CPU puede durar más que el tiempo entre dos
+despliegues. Con la opción ``checkpoint``, las entradas de al menos
+SHELU_CHECKPOINT_MIN_SECONDS (desactivado por defecto) se separan en
+fragmentos de unos SHELU_CHECKPOINT_CHUNK_SECONDS segundos y cada fragmento
+separado se guarda en ``data/checkpoints/<clave>/``; si el proceso muere, la
+separación reanudada (el trabajo vuelve a la cola al arrancar) sólo separa
+los fragmentos que faltan. El resto se separa de una vez, que es más rápido.
+
+- Cada fragmento se separa con CONTEXT_SECONDS de audio a cada lado y los
+  vecinos se funden linealmente en la zona común, así que los cortes no se
+  notan.
+- La clave incluye el contenido de la entrada, el motor, el modelo y sus
+  opciones: un punto de control nunca se mezcla con otra separación.
+- Las pistas se guardan en float32 sin comprimir (``.npz``, unos 21 MB por
+  minuto y pista). Se borran al terminar o al cancelar el trabajo; los
+  abandonados los borra ``src/storage.py`` pasado SHELU_PARTIAL_MAX_AGE.
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.audio_io import SAMPLE_RATE, CHANNELS
+from src.cancellation import check_cancelled
+from src.config import CHECKPOINTS_DIR, CHECKPOINT_CHUNK_SECONDS, CHECKPOINT_MIN_SECONDS
+from src.input_cache import content_hash
+
+
+# Audio de contexto a cada lado de un fragmento (segundos)
+CONTEXT_SECONDS = 5.0
+
+MANIFEST_NAME = "manifest.json"
+
+# Opciones que no cambian el resultado de la separación
+_RUNTIME_OPTIONS = ("checkpoint", "on_chunk", "device", "work_dir", "cache_input",
+                    "output_format", "bitrate", "drop_silent", "on_silent_stems")
+
+
+def chunk_bounds(frames: int, chunk_seconds: float = CHECKPOINT_CHUNK_SECONDS) -> List[Tuple[int, int]]:
+    """
+    Límites [inicio, fin) de los fragmentos, sin el contexto
+    
+    Los fragmentos miden lo mismo y lo más parecido posible a
+    ``chunk_seconds``; un audio de menos de 1,5 fragmentos es uno solo.
+    """
+    if chunk_seconds <= 0:
+        return [(0, frames)]
+    # Cada fragmento debe cubrir los fundidos de sus dos lados
+    chunk_frames = max(chunk_seconds, 4 * CONTEXT_SECONDS) * SAMPLE_RATE
+    count = max(1, int(round(frames / chunk_frames)))
+    edges = np.linspace(0, frames, count + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def checkpoints_enabled(options: Dict) -> bool:
+    """
+    Comprobar si una separación puede ir por fragmentos (antes de conocer
+    la duración de la entrada)
+    
+    Args:
+        options: Opciones del motor (``checkpoint`` admite los puntos de control)
+    """
+    return bool(options.get("checkpoint")) and CHECKPOINT_MIN_SECONDS > 0 and CHECKPOINT_CHUNK_SECONDS > 0
+
+
+def use_checkpoints(options: Dict, seconds: Optional[float]) -> bool:
+    """
+    Comprobar si una separación va por fragmentos con puntos de control
+    
+    Args:
+        options: Opciones del motor
+        seconds: Duración de la entrada (None si no se conoce: de una vez)
+    """
+    if not checkpoints_enabled(options) or seconds is None or seconds < CHECKPOINT_MIN_SECONDS:
+        return False
+    return len(chunk_bounds(int(seconds * SAMPLE_RATE))) > 1
+
+
+def checkpoint_key(backend_name: str, input_file: str, stems: Optional[List[str]], options: Dict) -> str:
+    """
+    Clave de los puntos de control de una separación
+    """
+    identity = {
+        "input": content_hash(input_file),
+        "backend": backend_name,
+        "stems": stems,
+        "options": {k: v for k, v in options.items() if k not in _RUNTIME_OPTIONS},
+        "chunk_seconds": CHECKPOINT_CHUNK_SECONDS,
+        "context_seconds": CONTEXT_SECONDS,
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def checkpoint_dir(key: str) -> str:
+    return os.path.join(CHECKPOINTS_DIR, key)
+
+
+def discard_checkpoint(key: str):
+    """
+    Borrar los fragmentos guardados de una separación
+    """
+    shutil.rmtree(checkpoint_dir(key), ignore_errors=True)
+
+
+def _open_checkpoint(directory: str, manifest: Dict):
+    """
+    Preparar la carpeta de puntos de control, vaciándola si es de otra
+    división en fragmentos
+    """
+    path = os.path.join(directory, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            if json.load(f) == manifest:
+                return
+    except (OSError, ValueError):
+        pass
+    
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def _chunk_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"chunk_{index:04d}.npz")
+
+
+def _read_chunk(path: str) -> Optional[Dict[str, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return {stem: data[stem] for stem in data.files}
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Punto de control ilegible, se repite el fragmento: {path} ({e})")
+        return None
+
+
+def _write_chunk(path: str, sources: Dict[str, np.ndarray]):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, **sources)
+    os.replace(temp_path, path)
+
+
+def _fade_weights(start: int, end: int, first: bool, last: bool, context: int) -> np.ndarray:
+    """
+    Peso de cada muestra de un fragmento con su contexto: sube de 0 a 1 a lo
+    largo del solapamiento con el anterior y baja en el del siguiente, de
+    modo que los pesos de dos vecinos suman 1
+    """
+    low = start if first else start - context
+    high = end if last else end + context
+    positions = np.arange(low, high, dtype=np.float64)
+    weights = np.ones(high - low, dtype=np.float64)
+    if not first:
+        weights *= np.clip((positions - (start - context)) / (2 * context), 0, 1)
+    if not last:
+        weights *= np.clip(((end + context) - positions) / (2 * context), 0, 1)
+    return weights.astype(np.float32)
+
+
+def separate_in_chunks(
+    backend,
+    audio: np.ndarray,
+    stems: Optional[List[str]],
+    options: Dict,
+    key: str
+) -> Dict[str, np.ndarray]:
+    """
+    Separar ``audio`` por fragmentos, reutilizando los ya guardados
+    
+    Args:
+        backend: Motor (``SeparationBackend``) que separa cada fragmento
+        audio: Array (frames, CHANNELS) float32 a SAMPLE_RATE
+        stems: Pistas a devolver (como en ``separate``)
+        options: Opciones del motor; ``on_chunk(hechos, total)`` se llama
+            tras cada fragmento
+        key: Clave de ``checkpoint_key``
+    
+    Returns:
+        Diccionario {pista: array (frames, CHANNELS) float32}
+    """
+    frames = len(audio)
+    bounds = chunk_bounds(frames)
+    context = int(CONTEXT_SECONDS * SAMPLE_RATE)
+    directory = checkpoint_dir(key)
+    _open_checkpoint(directory, {"frames": frames, "chunks": [list(b) for b in bounds], "context": context})
+    
+    on_chunk = options.get("on_chunk")
+    chunk_options = {k: v for k, v in options.items()
+                     if k not in ("checkpoint", "on_chunk", "drop_silent", "on_silent_stems")}
+    result: Dict[str, np.ndarray] = {}
+    reused = 0
+    for index, (start, end) in enumerate(bounds):
+        check_cancelled()
+        first, last = index == 0, index == len(bounds) - 1
+        low = start if first else start - context
+        high = end if last else end + context
+        
+        path = _chunk_path(directory, index)
+        sources = _read_chunk(path)
+        if sources is None:
+            sources = backend.separate(audio[low:high], stems, chunk_options)
+            _write_chunk(path, sources)
+        else:
+            reused += 1
+        
+        weights = _fade_weights(start, end, first, last, context)[:, None]
+        for stem, array in sources.items():
+            if stem not in result:
+                result[stem] = np.zeros((frames, CHANNELS), dtype=np.float32)
+            length = min(len(array), high - low)
+            result[stem][low:low + length] += array[:length] * weights[:length]
+        if on_chunk:
+            on_chunk(index + 1, len(bounds))
+    
+    if reused:
+        print(f"♻️  Separación reanudada: {reused}/{len(bounds)} fragmentos ya estaban separados")
+    return result
@@ -0,0 +1,119 @@
+"""
+Separación con el ejecutable ``demucs`` (un proceso por separación)
+
+Es el motor por defecto: no carga torch en la API ni en los workers. Aquí
+está, en un único sitio, cómo se construye la orden y dónde deja Demucs sus
+archivos (``<salida>/<modelo>/<nombre de la entrada>/<pista>.<ext>``).
+"""
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.audio_io import decode_file, probe_duration
+from src.cancellation import run_process
+from src.capabilities import demucs_executable, torch_device
+from src.input_cache import prepare_input
+from src.separation_backends.base import (
+    DEFAULT_MODEL,
+    SeparationBackend,
+    report_silent_stems,
+    select_stems,
+    two_stem_target,
+    write_audio,
+)
+from src.separation_backends.checkpoints import checkpoints_enabled, use_checkpoints
+from src.silence import remove_silent_files
+
+
+class DemucsCliBackend(SeparationBackend):
+    """
+    Ejecuta la CLI de Demucs y recoge sus archivos
+    """
+    
+    name = "demucs_cli"
+    
+    def command(self, input_file: str, work_dir: str, stems: Optional[List[str]], options: Dict) -> List[str]:
+        """
+        Orden de Demucs para separar ``input_file`` dentro de ``work_dir``
+        """
+        cmd = [demucs_executable() or "demucs"]
+        output_format = options.get("output_format", "mp3")
+        if output_format == "mp3":
+            cmd += ["--mp3", "--mp3-bitrate", options.get("bitrate", "320k").rstrip("k")]
+        elif output_format == "wav_f32":
+            cmd += ["--float32"]
+        target = two_stem_target(stems)
+        if target:
+            cmd += ["--two-stems", target]
+        if "shifts" in options:
+            cmd += ["--shifts", str(options["shifts"])]
+        if "overlap" in options:
+            cmd += ["--overlap", str(options["overlap"])]
+        cmd += [
+            "-n", options.get("model", DEFAULT_MODEL),
+            "-d", options.get("device") or torch_device(),
+            "-o", work_dir,
+            input_file,
+        ]
+        return cmd
+    
+    def separate_file(
+        self,
+        input_file: str,
+        output_dir: str,
+        stems: Optional[List[str]] = None,
+        options: Optional[Dict] = None
+    ) -> Dict[str, str]:
+        options = options or {}
+        model = options.get("model", DEFAULT_MODEL)
+        
+        # Audios largos con puntos de control: una ejecución de Demucs por
+        # fragmento (ver SeparationBackend.separate_file). Si no, Demucs
+        # separa de una vez y codifica él mismo las pistas
+        if checkpoints_enabled(options) and use_checkpoints(options, probe_duration(input_file)):
+            return super().separate_file(input_file, output_dir, stems, options)
+        
+        # Carpeta de trabajo en el mismo disco que el destino (las pistas se
+        # mueven sin copiar) salvo que se indique otra
+        parent = options.get("work_dir") or os.path.dirname(os.path.abspath(output_dir))
+        os.makedirs(parent, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=parent) as work_dir:
+            demucs_input = prepare_input(input_file, work_dir) if options.get("cache_input", True) else input_file
+            cmd = self.command(demucs_input, work_dir, stems, options)
+            print(f"Ejecutando: {' '.join(cmd)}")
+            # Se termina el proceso si el trabajo se cancela
+            run_process(cmd, text=True)
+            
+            song_name = os.path.splitext(os.path.basename(demucs_input))[0]
+            separated = os.path.join(work_dir, model, song_name)
+            if not os.path.isdir(separated):
+                raise RuntimeError(f"Demucs no generó {separated}")
+            
+            os.makedirs(output_dir, exist_ok=True)
+            paths = {}
+            for file in sorted(os.listdir(separated)):
+                stem = os.path.splitext(file)[0]
+                if stems and stem not in stems:
+                    continue
+                paths[stem] = os.path.join(output_dir, file)
+                shutil.move(os.path.join(separated, file), paths[stem])
+        
+        if options.get("drop_silent"):
+            # Demucs ya ha codificado las pistas: hay que leerlas para medirlas
+            silent = remove_silent_files(paths)
+            report_silent_stems(options, silent)
+            for entry in silent:
+                del paths[entry["stem"]]
+        return paths
+    
+    def separate(self, audio: np.ndarray, stems: Optional[List[str]], options: Dict) -> Dict[str, np.ndarray]:
+        # Ida y vuelta por archivos WAV float32 (sin pérdidas)
+        options = {**options, "output_format": "wav_f32", "cache_input": False, "drop_silent": False}
+        with tempfile.TemporaryDirectory(dir=options.get("work_dir")) as work_dir:
+            input_file = os.path.join(work_dir, "input.wav")
+            write_audio(input_file, audio, "wav_f32")
+            paths = self.separate_file(input_file, os.path.join(work_dir, "stems"), stems, options)
+            return select_stems({stem: decode_file(path) for stem, path in paths.items()}, stems)
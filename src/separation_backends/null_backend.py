@@ -0,0 +1,29 @@
+"""
+Motor de separación nulo (pruebas)
+
+No separa nada: reparte la entrada a partes iguales entre las pistas del
+modelo, así que la suma de las pistas es exactamente la entrada. Con la
+opción ``latency`` (segundos) simula la duración de una separación real
+(y se puede cancelar durante la espera).
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.cancellation import wait
+from src.separation_backends.base import DEFAULT_MODEL, SeparationBackend, model_stems, select_stems
+
+
+class NullBackend(SeparationBackend):
+    """
+    Pistas = entrada / número de pistas
+    """
+    
+    name = "null"
+    
+    def separate(self, audio: np.ndarray, stems: Optional[List[str]], options: Dict) -> Dict[str, np.ndarray]:
+        if options.get("latency"):
+            wait(float(options["latency"]))
+        names = model_stems(options.get("model", DEFAULT_MODEL))
+        share = (audio / len(names)).astype(np.float32)
+        return select_stems({name: share for name in names}, stems)
@@ -0,0 +1,354 @@
+"""
+Separación con ONNX Runtime (CPU) a partir de modelos htdemucs exportados
+
+El grafo de HTDemucs no se puede exportar tal cual porque trabaja con
+espectrogramas complejos (``torch.stft``). Se exporta sólo la red: entra el
+segmento de audio y su espectrograma ya convertido a canales reales, y
+salen la rama espectral (antes de aplicar la máscara) y la temporal. La
+STFT y la iSTFT se hacen aquí con NumPy, igual que ``HTDemucs._spec`` y
+``HTDemucs._ispec``, así que separar no necesita torch.
+
+Cada modelo se guarda en ``SHELU_ONNX_MODELS_DIR`` como ``<modelo>.json``
+(pistas, tamaño de segmento, parámetros de la STFT y pesos de cada
+miembro, como en ``BagOfModels``) más un ``<modelo>.<n>.onnx`` por
+miembro. Para exportar (necesita torch y demucs)::
+    
+    python -m src.separation_backends.onnx_backend htdemucs [htdemucs_6s ...]
+
+Diferencias con la CLI de Demucs: no se aplican desplazamientos aleatorios
+(``shifts``) y los segmentos se mezclan con la misma ventana triangular que
+``apply_model``.
+"""
+import argparse
+import json
+import math
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.cancellation import check_cancelled
+from src.config import ONNX_MODELS_DIR
+from src.separation_backends.base import DEFAULT_MODEL, SeparationBackend, select_stems
+
+
+# --- STFT equivalente a demucs.spec (torch.stft normalizado, centrado) ---
+
+def _hann(n_fft: int) -> np.ndarray:
+    # Ventana periódica, como torch.hann_window
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+
+
+def stft(x: np.ndarray, n_fft: int, hop: int) -> np.ndarray:
+    """
+    STFT de (..., muestras) -> (..., n_fft // 2 + 1, tramas) complejo
+    """
+    pad = n_fft // 2
+    padded = np.pad(x, [(0, 0)] * (x.ndim - 1) + [(pad, pad)], mode="reflect")
+    frames = sliding_window_view(padded, n_fft, axis=-1)[..., ::hop, :]
+    spectrum = np.fft.rfft(frames * _hann(n_fft), axis=-1) / math.sqrt(n_fft)
+    return np.swapaxes(spectrum, -1, -2).astype(np.complex64)
+
+
+def istft(z: np.ndarray, hop: int, length: int) -> np.ndarray:
+    """
+    iSTFT de (..., frecuencias, tramas) -> (..., length)
+    """
+    n_fft = 2 * (z.shape[-2] - 1)
+    window = _hann(n_fft)
+    frames = np.fft.irfft(np.swapaxes(z, -1, -2) * math.sqrt(n_fft), n=n_fft, axis=-1) * window
+    n_frames = frames.shape[-2]
+    total = n_fft + hop * (n_frames - 1)
+    
+    output = np.zeros(z.shape[:-2] + (total,), dtype=np.float32)
+    envelope = np.zeros(total, dtype=np.float32)
+    for i in range(n_frames):
+        output[..., i * hop:i * hop + n_fft] += frames[..., i, :]
+        envelope[i * hop:i * hop + n_fft] += window ** 2
+    
+    start = n_fft // 2
+    output = output[..., start:start + length]
+    envelope = envelope[start:start + length]
+    return output / np.where(envelope > 1e-11, envelope, 1.0)
+
+
+def _spec(x: np.ndarray, n_fft: int, hop: int) -> np.ndarray:
+    """
+    ``HTDemucs._spec``: espectrograma alineado con la rama temporal
+    """
+    length = x.shape[-1]
+    frames = int(math.ceil(length / hop))
+    pad = hop // 2 * 3
+    x = np.pad(x, [(0, 0)] * (x.ndim - 1) + [(pad, pad + frames * hop - length)], mode="reflect")
+    return stft(x, n_fft, hop)[..., :-1, :][..., 2:2 + frames]
+
+
+def _ispec(z: np.ndarray, hop: int, length: int) -> np.ndarray:
+    """
+    ``HTDemucs._ispec``
+    """
+    z = np.pad(z, [(0, 0)] * (z.ndim - 2) + [(0, 1), (2, 2)])
+    pad = hop // 2 * 3
+    padded_length = hop * int(math.ceil(length / hop)) + 2 * pad
+    return istft(z, hop, padded_length)[..., pad:pad + length]
+
+
+def _to_real_channels(z: np.ndarray) -> np.ndarray:
+    """
+    ``HTDemucs._magnitude`` con CaC: (B, C, F, T) complejo -> (B, 2C, F, T)
+    """
+    b, c, f, t = z.shape
+    return np.stack([z.real, z.imag], axis=2).reshape(b, c * 2, f, t).astype(np.float32)
+
+
+def _to_complex(m: np.ndarray) -> np.ndarray:
+    """
+    ``HTDemucs._mask`` con CaC: (B, S, 2C, F, T) -> (B, S, C, F, T) complejo
+    """
+    b, s, c2, f, t = m.shape
+    m = m.reshape(b, s, c2 // 2, 2, f, t)
+    return m[:, :, :, 0] + 1j * m[:, :, :, 1]
+
+
+def _transition_weight(segment: int) -> np.ndarray:
+    # Ventana triangular de apply_model para mezclar segmentos solapados
+    half = segment // 2
+    weight = np.concatenate([np.arange(1, half + 1), np.arange(segment - half, 0, -1)]).astype(np.float32)
+    return weight / weight.max()
+
+
+# --- Motor ---
+
+@lru_cache(maxsize=2)
+def _load(model_name: str):
+    import onnxruntime
+    
+    manifest_path = os.path.join(ONNX_MODELS_DIR, f"{model_name}.json")
+    if not os.path.exists(manifest_path):
+        raise ValueError(
+            f"No hay modelo ONNX exportado para {model_name} "
+            f"(python -m src.separation_backends.onnx_backend {model_name})"
+        )
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    
+    sessions = [
+        onnxruntime.InferenceSession(
+            os.path.join(ONNX_MODELS_DIR, member["file"]), providers=["CPUExecutionProvider"]
+        )
+        for member in manifest["members"]
+    ]
+    return manifest, sessions
+
+
+class OnnxBackend(SeparationBackend):
+    """
+    Red de HTDemucs en ONNX Runtime con la STFT en NumPy
+    """
+    
+    name = "onnx"
+    
+    def load(self, options: Dict):
+        _load(options.get("model", DEFAULT_MODEL))
+    
+    def separate(self, audio: np.ndarray, stems: Optional[List[str]], options: Dict) -> Dict[str, np.ndarray]:
+        manifest, sessions = _load(options.get("model", DEFAULT_MODEL))
+        
+        mix = np.ascontiguousarray(audio.T, dtype=np.float32)
+        ref = mix.mean(axis=0)
+        mean, std = ref.mean(), ref.std() + 1e-8
+        mix = (mix - mean) / std
+        
+        # Media ponderada de los miembros por pista (BagOfModels)
+        total = np.zeros((len(manifest["sources"]),) + mix.shape, dtype=np.float32)
+        total_weight = np.zeros(len(manifest["sources"]), dtype=np.float32)
+        overlap = float(options.get("overlap", 0.25))
+        for member, session in zip(manifest["members"], sessions):
+            weights = np.asarray(member["weights"], dtype=np.float32)
+            total += self._apply_segments(session, manifest, mix, overlap) * weights[:, None, None]
+            total_weight += weights
+        sources = total / total_weight[:, None, None] * std + mean
+        
+        return select_stems(
+            {name: np.ascontiguousarray(sources[i].T) for i, name in enumerate(manifest["sources"])},
+            stems
+        )
+    
+    @staticmethod
+    def _apply_segments(session, manifest: Dict, mix: np.ndarray, overlap: float) -> np.ndarray:
+        """
+        Pasar la red por segmentos solapados y mezclarlos (como apply_model)
+        """
+        segment = manifest["segment_samples"]
+        stride = max(1, int((1 - overlap) * segment))
+        weight = _transition_weight(segment)
+        length = mix.shape[-1]
+        
+        output = np.zeros((len(manifest["sources"]),) + mix.shape, dtype=np.float32)
+        sum_weight = np.zeros(length, dtype=np.float32)
+        for offset in range(0, length, stride):
+            check_cancelled()
+            chunk = mix[:, offset:offset + segment]
+            chunk_length = chunk.shape[-1]
+            if chunk_length < segment:
+                chunk = np.pad(chunk, [(0, 0), (0, segment - chunk_length)])
+            
+            separated = OnnxBackend._run(session, manifest, chunk)
+            output[..., offset:offset + chunk_length] += separated[..., :chunk_length] * weight[:chunk_length]
+            sum_weight[offset:offset + chunk_length] += weight[:chunk_length]
+            if offset + segment >= length:
+                break
+        return output / sum_weight
+    
+    @staticmethod
+    def _run(session, manifest: Dict, chunk: np.ndarray) -> np.ndarray:
+        """
+        Un segmento (C, muestras) -> (S, C, muestras)
+        """
+        n_fft, hop = manifest["nfft"], manifest["hop_length"]
+        mix = chunk[None]
+        mag = _to_real_channels(_spec(mix, n_fft, hop))
+        spec, wave = session.run(["spec", "wave"], {"mix": mix, "mag": mag})
+        freq_branch = _ispec(_to_complex(spec), hop, chunk.shape[-1])
+        return (freq_branch + wave)[0]
+
+
+# --- Exportación (torch y demucs) ---
+
+def _core_module(model):
+    """
+    Envolver un HTDemucs para exportar su red sin la STFT
+    
+    Sigue ``HTDemucs.forward`` con la entrada ya en un segmento completo y
+    el espectrograma calculado fuera, y devuelve la rama espectral antes de
+    la máscara y la rama temporal ya desnormalizadas.
+    """
+    import torch
+    
+    class HTDemucsCore(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+        
+        def forward(self, mix, mag):
+            m = self.model
+            length = mix.shape[-1]
+            x = mag
+            B, C, Fq, T = x.shape
+            mean = x.mean(dim=(1, 2, 3), keepdim=True)
+            std = x.std(dim=(1, 2, 3), keepdim=True)
+            x = (x - mean) / (1e-5 + std)
+            
+            xt = mix
+            meant = xt.mean(dim=(1, 2), keepdim=True)
+            stdt = xt.std(dim=(1, 2), keepdim=True)
+            xt = (xt - meant) / (1e-5 + stdt)
+            
+            saved, saved_t, lengths, lengths_t = [], [], [], []
+            for idx, encode in enumerate(m.encoder):
+                lengths.append(x.shape[-1])
+                inject = None
+                if idx < len(m.tencoder):
+                    lengths_t.append(xt.shape[-1])
+                    tenc = m.tencoder[idx]
+                    xt = tenc(xt)
+                    if not tenc.empty:
+                        saved_t.append(xt)
+                    else:
+                        inject = xt
+                x = encode(x, inject)
+                if idx == 0 and m.freq_emb is not None:
+                    frs = torch.arange(x.shape[-2], device=x.device)
+                    emb = m.freq_emb(frs).t()[None, :, :, None].expand_as(x)
+                    x = x + m.freq_emb_scale * emb
+                saved.append(x)
+            
+            if m.crosstransformer:
+                if m.bottom_channels:
+                    b, c, f, t = x.shape
+                    x = m.channel_upsampler(x.reshape(b, c, f * t)).reshape(b, -1, f, t)
+                    xt = m.channel_upsampler_t(xt)
+                x, xt = m.crosstransformer(x, xt)
+                if m.bottom_channels:
+                    b, c, f, t = x.shape
+                    x = m.channel_downsampler(x.reshape(b, c, f * t)).reshape(b, -1, f, t)
+                    xt = m.channel_downsampler_t(xt)
+            
+            for idx, decode in enumerate(m.decoder):
+                skip = saved.pop(-1)
+                x, pre = decode(x, skip, lengths.pop(-1))
+                offset = m.depth - len(m.tdecoder)
+                if idx >= offset:
+                    tdec = m.tdecoder[idx - offset]
+                    length_t = lengths_t.pop(-1)
+                    if tdec.empty:
+                        xt, _ = tdec(pre[:, :, 0], None, length_t)
+                    else:
+                        xt, _ = tdec(xt, saved_t.pop(-1), length_t)
+            
+            S = len(m.sources)
+            x = x.view(B, S, -1, Fq, T) * std[:, None] + mean[:, None]
+            xt = xt.view(B, S, -1, length) * stdt[:, None] + meant[:, None]
+            return x, xt
+    
+    return HTDemucsCore(model).eval()
+
+
+def export_model(model_name: str, output_dir: str = ONNX_MODELS_DIR, opset: int = 17) -> str:
+    """
+    Exportar un modelo htdemucs (o una bolsa de ellos) a ONNX
+    
+    Returns:
+        Ruta del manifiesto ``<modelo>.json``
+    """
+    import torch
+    from demucs.apply import BagOfModels
+    from demucs.htdemucs import HTDemucs
+    from demucs.pretrained import get_model
+    
+    model = get_model(model_name)
+    model.eval()
+    members = list(model.models) if isinstance(model, BagOfModels) else [model]
+    weights = model.weights if isinstance(model, BagOfModels) else [[1.0] * len(model.sources)]
+    
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {"model": model_name, "sources": list(model.sources), "members": []}
+    for i, (member, member_weights) in enumerate(zip(members, weights)):
+        if not isinstance(member, HTDemucs):
+            raise ValueError(f"Sólo se pueden exportar modelos HTDemucs ({model_name} usa {type(member).__name__})")
+        segment = int(member.segment * member.samplerate)
+        mix = torch.zeros(1, member.audio_channels, segment)
+        with torch.no_grad():
+            mag = member._magnitude(member._spec(mix))
+        
+        file = f"{model_name}.{i}.onnx"
+        torch.onnx.export(
+            _core_module(member), (mix, mag), os.path.join(output_dir, file),
+            input_names=["mix", "mag"], output_names=["spec", "wave"], opset_version=opset
+        )
+        manifest["members"].append({"file": file, "weights": [float(w) for w in member_weights]})
+        manifest.update(segment_samples=segment, nfft=member.nfft, hop_length=member.hop_length,
+                        samplerate=member.samplerate)
+        print(f"📦 {model_name} [{i + 1}/{len(members)}] -> {file}")
+    
+    manifest_path = os.path.join(output_dir, f"{model_name}.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar modelos htdemucs a ONNX")
+    parser.add_argument("models", nargs="+", help="Modelos (htdemucs, htdemucs_ft, htdemucs_6s)")
+    parser.add_argument("--output", default=ONNX_MODELS_DIR)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+    
+    for model_name in args.models:
+        print(f"✓ {export_model(model_name, args.output, args.opset)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Separación con Demucs dentro del proceso (torch)
+
+Carga el modelo una vez por proceso y lo reutiliza entre separaciones, sin
+lanzar un ejecutable ni pasar por archivos intermedios. torch y demucs se
+importan al usarse por primera vez (la API no los necesita al arrancar).
+
+Reproduce lo que hace la CLI de Demucs: normalizar la entrada con la media
+y desviación de su mezcla mono, ``apply_model`` por segmentos solapados y
+deshacer la normalización.
+
+El trabajo se puede cancelar entre segmentos: un *forward pre-hook* en el
+modelo comprueba el token antes de cada pasada.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.cancellation import check_cancelled
+from src.capabilities import torch_device
+from src.separation_backends.base import DEFAULT_MODEL, SeparationBackend, select_stems
+
+
+@lru_cache(maxsize=2)
+def _load_model(model_name: str, device: str):
+    from demucs.pretrained import get_model
+    
+    model = get_model(model_name)
+    model.to(device)
+    model.eval()
+    return model
+
+
+class TorchBackend(SeparationBackend):
+    """
+    ``demucs.apply.apply_model`` sobre el audio en memoria
+    """
+    
+    name = "torch"
+    
+    def load(self, options: Dict):
+        _load_model(options.get("model", DEFAULT_MODEL), options.get("device") or torch_device())
+    
+    def separate(self, audio: np.ndarray, stems: Optional[List[str]], options: Dict) -> Dict[str, np.ndarray]:
+        import torch
+        from demucs.apply import apply_model
+        
+        device = options.get("device") or torch_device()
+        model = _load_model(options.get("model", DEFAULT_MODEL), device)
+        
+        wav = torch.from_numpy(np.ascontiguousarray(audio.T, dtype=np.float32))
+        ref = wav.mean(0)
+        mean, std = ref.mean(), ref.std() + 1e-8
+        wav = (wav - mean) / std
+        
+        # Punto de cancelación antes de cada segmento (y de cada modelo de
+        # la bolsa, que apply_model recorre por separado)
+        members = getattr(model, "models", None) or [model]
+        hooks = [member.register_forward_pre_hook(lambda *args: check_cancelled()) for member in members]
+        try:
+            with torch.no_grad():
+                sources = apply_model(
+                    model, wav[None],
+                    device=device,
+                    shifts=int(options.get("shifts", 1)),
+                    split=True,
+                    overlap=float(options.get("overlap", 0.25)),
+                    progress=False,
+                )[0]
+        finally:
+            for hook in hooks:
+                hook.remove()
+        sources = (sources * std + mean).cpu().numpy()
+        
+        return select_stems(
+            {name: np.ascontiguousarray(sources[i].T) for i, name in enumerate(model.sources)},
+            stems
+        )
@@ -3,16 +3,27 @@ Servicio de separación de audio con Demucs
 """
 import os
 import subprocess
-from typing import Optional, Dict
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
 import shutil
 
+from src.task_store import TaskStore
+from src.capabilities import torch_device
+from src.analysis import schedule_analysis
+from src.stem_container import publish_stems
+from src.storage import keep_fresh
+from src.library_index import record_silent_stems
+from src.separation_backends import get_backend
+from src.excerpts import discard_excerpts
+
 
 def separate_audio_task(
     task_id: str,
     file_path: str,
     model: str,
     artist: Optional[str],
-    tasks_status: Dict
+    task_store: TaskStore
 ):
     """
     Tarea de separación de audio (ejecutar en segundo plano)
@@ -22,42 +33,67 @@ def separate_audio_task(
         file_path: Ruta del archivo MP3
         model: Modelo de Demucs a usar
         artist: Nombre del artista (opcional, no usado actualmente)
-        tasks_status: Diccionario de estados de tareas
+        task_store: Almacén de estados de tareas
     """
     try:
         print(f"[{task_id}] Iniciando separación de: {file_path}")
         print(f"[{task_id}] Modelo: {model}")
         
         # Actualizar estado
-        tasks_status[task_id]["message"] = "Separando audio con Demucs..."
-        tasks_status[task_id]["progress"] = 10
+        task_store.update(
+            task_id,
+            status="processing",
+            started_at=time.time(),
+            message="Separando audio con Demucs...",
+            progress=10
+        )
+        
+        def chunk_progress(done: int, total: int):
+            task_store.update(
+                task_id,
+                progress=10 + int(80 * done / total),
+                message=f"Separando audio con Demucs ({done}/{total} fragmentos)..."
+            )
         
         # Ejecutar separación (ahora se guarda automáticamente junto al archivo original)
-        output_dir = separate_audio(file_path, model=model, device="cuda")
+        output_dir = separate_audio(file_path, model=model, device=torch_device(), on_progress=chunk_progress)
         
         if output_dir:
             print(f"[{task_id}] Separación exitosa en: {output_dir}")
             # Completar tarea
-            tasks_status[task_id]["status"] = "completed"
-            tasks_status[task_id]["progress"] = 100
-            tasks_status[task_id]["message"] = "Separación completada"
-            tasks_status[task_id]["output_dir"] = output_dir
+            task_store.update(
+                task_id,
+                status="completed",
+                progress=100,
+                message="Separación completada",
+                output_dir=output_dir,
+                finished_at=time.time()
+            )
         else:
             print(f"[{task_id}] Error: No se obtuvo directorio de salida")
-            tasks_status[task_id]["status"] = "error"
-            tasks_status[task_id]["message"] = "Error al separar el audio"
+            task_store.update(
+                task_id,
+                status="error",
+                message="Error al separar el audio",
+                finished_at=time.time()
+            )
             
     except Exception as e:
         print(f"[{task_id}] Excepción: {str(e)}")
-        tasks_status[task_id]["status"] = "error"
-        tasks_status[task_id]["message"] = f"Error: {str(e)}"
+        task_store.update(
+            task_id,
+            status="error",
+            message=f"Error: {str(e)}",
+            finished_at=time.time()
+        )
 
 
 def separate_audio(
     input_file: str,
     model: str = "htdemucs_6s",
     device: str = "cpu",
-    output_folder: str = "separated"
+    output_folder: str = "separated",
+    on_progress: Optional[Callable[[int, int], None]] = None
 ) -> Optional[str]:
     """
     Separar audio en pistas usando Demucs
@@ -67,6 +103,8 @@ def separate_audio(
         model: Modelo de Demucs (htdemucs_6s, htdemucs, htdemucs_ft, mdx_extra)
         device: Dispositivo (cpu, cuda)
         output_folder: Carpeta de salida (temporal, se reorganizará)
+        on_progress: Función (fragmentos hechos, total) para las canciones
+            largas, que se separan por fragmentos con puntos de control
         
     Returns:
         Ruta de la carpeta de salida o None si falla
@@ -75,36 +113,41 @@ def separate_audio(
         print(f"Error: El archivo {input_file} no existe")
         return None
     
+    # Carpeta temporal propia de esta separación: _temp la comparten los
+    # trabajos en marcha y dos artistas pueden tener canciones con el mismo
+    # nombre
+    temp_output = os.path.join(output_folder, "_temp")
+    os.makedirs(temp_output, exist_ok=True)
+    job_temp = tempfile.mkdtemp(dir=temp_output)
+    # Que la limpieza de temporales no la borre mientras se separa
+    fresh = keep_fresh(job_temp)
+    
     try:
-        # Crear carpeta temporal para Demucs
-        temp_output = os.path.join(output_folder, "_temp")
-        os.makedirs(temp_output, exist_ok=True)
-        
-        # Comando de Demucs
-        cmd = [
-            "demucs",
-            "--mp3",
-            "--mp3-bitrate", "320",
-            "-n", model,
-            "-d", device,
-            "-o", temp_output,
-            input_file
-        ]
-        
-        print(f"Ejecutando: {' '.join(cmd)}")
-        
-        # Ejecutar Demucs
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
-        # La estructura de salida de Demucs es:
-        # temp_output/model_name/song_name/stem.mp3
+        # Separar con el motor configurado (SHELU_SEPARATION_BACKEND); las
+        # pistas quedan en job_temp/song_name/stem.mp3
         song_name = os.path.splitext(os.path.basename(input_file))[0]
-        temp_dir = os.path.join(temp_output, model, song_name)
+        temp_dir = os.path.join(job_temp, song_name)
+        silent: List[Dict] = []
+        get_backend().separate_file(
+            input_file,
+            temp_dir,
+            options={
+                "model": model,
+                "device": device,
+                "output_format": "mp3",
+                "bitrate": "320k",
+                "work_dir": job_temp,
+                # Las entradas largas (SHELU_CHECKPOINT_MIN_SECONDS) van por
+                # fragmentos: si el proceso muere, la separación reanudada
+                # sólo repite los que faltan
+                "checkpoint": True,
+                "on_chunk": on_progress,
+                # Las pistas casi vacías (guitar/piano sin esos instrumentos)
+                # no se guardan ni se empaquetan
+                "drop_silent": True,
+                "on_silent_stems": silent.extend,
+            }
+        )
         
         if os.path.exists(temp_dir):
             # Crear carpeta de destino junto al archivo original
@@ -118,25 +161,37 @@ def separate_audio(
             # Mover carpeta con las pistas al destino final
             shutil.move(temp_dir, final_output_dir)
             
-            # Limpiar carpeta temporal
-            try:
-                shutil.rmtree(temp_output)
-            except:
-                pass
+            # Registrar las descartadas (reemplaza las de una separación anterior)
+            record_silent_stems(input_file, silent)
+            
+            # Empaquetar en un único contenedor si así está configurado
+            # (SHELU_STEM_STORAGE=container); las funciones siguientes
+            # encuentran las pistas en cualquiera de los dos formatos
+            publish_stems(final_output_dir)
+            
+            # Tempo y tonalidad en segundo plano (no retrasa la separación)
+            schedule_analysis(input_file, final_output_dir)
+            
+            # Las previsualizaciones de fragmentos ya no hacen falta
+            discard_excerpts(input_file)
             
             print(f"✓ Audio separado en: {final_output_dir}")
             return final_output_dir
         else:
             print(f"✗ No se encontró la carpeta de salida: {temp_dir}")
             return None
-            
+    
     except subprocess.CalledProcessError as e:
         print(f"Error al ejecutar Demucs: {e}")
-        print(f"Salida: {e.output}")
+        print(f"Salida: {e.stderr or e.output}")
         return None
     except Exception as e:
         print(f"Error inesperado: {e}")
         return None
+    finally:
+        # También si se cancela (JobCancelled no pasa por los except)
+        fresh.set()
+        shutil.rmtree(job_temp, ignore_errors=True)
 
 
 def organize_separated_files(output_dir: str, artist: str) -> str:
@@ -170,8 +225,8 @@ def organize_separated_files(output_dir: str, artist: str) -> str:
         return output_dir
 
 
-def get_separation_status(task_id: str, tasks_status: Dict) -> Dict:
+def get_separation_status(task_id: str, task_store: TaskStore) -> Dict:
     """
     Obtener estado de una separación
     """
-    return tasks_status.get(task_id, {"status": "not_found"})
+    return task_store.get(task_id) or {"status": "not_found"}
@@ -0,0 +1,246 @@
+"""
+Detección de pistas silenciosas
+
+``htdemucs_6s`` genera siempre ``guitar`` y ``piano`` aunque la canción no
+tenga esos instrumentos: archivos a 320 kbps llenos de casi-silencio que se
+guardan, se listan y se envían al reproductor. Tras separar, cada pista se
+mide (RMS y pico en una pasada por bloques con NumPy) y las que quedan por
+debajo de ``SHELU_SILENT_STEM_RMS_DB`` y ``SHELU_SILENT_STEM_PEAK_DB`` se
+borran antes de publicar. El índice de la biblioteca guarda cuáles se
+descartaron y con qué nivel, para que el árbol las muestre atenuadas.
+
+Los motores que separan en memoria (y la CLI de Demucs por fragmentos)
+miden cada pista sobre el array antes de codificarla
+(``SeparationBackend._write_stems``), así que las silenciosas ni se
+codifican. La CLI de Demucs separando de una vez escribe ella misma los MP3:
+esos se decodifican para medirlos y se borran. En ambos casos la medida se
+detiene en cuanto un bloque supera el umbral de pico, así que en las pistas
+con contenido sólo se leen los primeros segundos.
+
+Uso para revisar la biblioteca existente (sin ``--remove`` sólo informa)::
+    
+    python -m src.silence [--remove]
+"""
+import argparse
+import math
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.audio_io import decode_blocks
+from src.config import SILENT_STEM_PEAK_DB, SILENT_STEM_RMS_DB
+from src.library_index import record_silent_stems
+from src.stem_container import has_stems, list_stems
+
+
+# Frecuencia de la medida (sobra para distinguir silencio de contenido)
+MEASURE_SAMPLE_RATE = 22050
+
+# Frames por bloque al medir un array en memoria
+ARRAY_BLOCK_FRAMES = 65536
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac')
+
+
+def _to_db(value: float) -> Optional[float]:
+    return round(20 * math.log10(value), 2) if value > 0 else None
+
+
+def _describe_levels(entry: Dict) -> str:
+    if entry["peak_db"] is None:
+        return "silencio digital"
+    return f"RMS {entry['rms_db']} dBFS, pico {entry['peak_db']} dBFS"
+
+
+def measure_levels(audio_path: str, stop_above_peak_db: Optional[float] = None) -> Dict:
+    """
+    Medir el nivel RMS y el pico de un audio
+    
+    Args:
+        audio_path: Archivo o referencia a una pista de un contenedor
+        stop_above_peak_db: Dejar de decodificar en cuanto el pico supere
+            este nivel (el RMS devuelto es entonces el del tramo leído)
+    
+    Returns:
+        Diccionario con rms_db, peak_db (None si es silencio digital) y
+        complete (False si la medida se detuvo antes del final)
+    """
+    blocks = decode_blocks(audio_path, sample_rate=MEASURE_SAMPLE_RATE)
+    try:
+        return _measure_blocks(blocks, stop_above_peak_db)
+    finally:
+        blocks.close()
+
+
+def measure_array_levels(audio: np.ndarray, stop_above_peak_db: Optional[float] = None) -> Dict:
+    """
+    Medir el nivel RMS y el pico de una pista en memoria (como ``measure_levels``)
+    
+    Args:
+        audio: Array (frames, canales) float32
+    """
+    blocks = (audio[start:start + ARRAY_BLOCK_FRAMES] for start in range(0, len(audio), ARRAY_BLOCK_FRAMES))
+    return _measure_blocks(blocks, stop_above_peak_db)
+
+
+def _measure_blocks(blocks: Iterable[np.ndarray], stop_above_peak_db: Optional[float]) -> Dict:
+    stop_peak = 10 ** (stop_above_peak_db / 20) if stop_above_peak_db is not None else None
+    sum_squares = 0.0
+    samples = 0
+    peak = 0.0
+    complete = True
+    
+    for block in blocks:
+        flat = np.ascontiguousarray(block, dtype=np.float32).ravel()
+        sum_squares += float(np.dot(flat, flat))
+        samples += flat.size
+        peak = max(peak, float(np.abs(flat).max(initial=0.0)))
+        if stop_peak is not None and peak > stop_peak:
+            complete = False
+            break
+    
+    rms = math.sqrt(sum_squares / samples) if samples else 0.0
+    return {"rms_db": _to_db(rms), "peak_db": _to_db(peak), "complete": complete}
+
+
+def is_silent(levels: Dict) -> bool:
+    """
+    Comprobar si unas medidas corresponden a una pista silenciosa
+    """
+    if not levels["complete"]:
+        return False
+    rms_db = levels["rms_db"] if levels["rms_db"] is not None else -math.inf
+    peak_db = levels["peak_db"] if levels["peak_db"] is not None else -math.inf
+    return rms_db < SILENT_STEM_RMS_DB and peak_db < SILENT_STEM_PEAK_DB
+
+
+def find_silent_stems(stems: Dict[str, str]) -> List[Dict]:
+    """
+    Detectar las pistas silenciosas de una canción
+    
+    Args:
+        stems: Diccionario {stem: ruta}
+    
+    Returns:
+        Lista de {"stem", "rms_db", "peak_db"}. Nunca incluye todas las
+        pistas: si la canción entera es silencio se conservan.
+    """
+    levels = {}
+    for stem, path in sorted(stems.items()):
+        try:
+            levels[stem] = measure_levels(path, stop_above_peak_db=SILENT_STEM_PEAK_DB)
+        except Exception as e:
+            print(f"Error al medir el nivel de {path}: {e}")
+    return _silent_entries(levels, len(stems))
+
+
+def find_silent_sources(sources: Dict[str, np.ndarray]) -> List[Dict]:
+    """
+    Detectar las pistas silenciosas de una separación en memoria (antes de
+    codificarlas; mismo resultado que ``find_silent_stems``)
+    
+    Args:
+        sources: Diccionario {stem: array (frames, canales)}
+    """
+    levels = {
+        stem: measure_array_levels(audio, stop_above_peak_db=SILENT_STEM_PEAK_DB)
+        for stem, audio in sorted(sources.items())
+    }
+    return _silent_entries(levels, len(sources))
+
+
+def _silent_entries(levels: Dict[str, Dict], total: int) -> List[Dict]:
+    silent = [
+        {"stem": stem, "rms_db": stem_levels["rms_db"], "peak_db": stem_levels["peak_db"]}
+        for stem, stem_levels in levels.items() if is_silent(stem_levels)
+    ]
+    # Si la canción entera es silencio se conservan todas
+    if len(silent) == total:
+        return []
+    return silent
+
+
+def describe_silent(entry: Dict):
+    print(f"🔇 Pista silenciosa descartada: {entry['stem']} ({_describe_levels(entry)})")
+
+
+def remove_silent_files(stems: Dict[str, str]) -> List[Dict]:
+    """
+    Borrar las pistas silenciosas de un conjunto de archivos
+    
+    Args:
+        stems: Diccionario {stem: ruta}
+    
+    Returns:
+        Pistas borradas ({"stem", "rms_db", "peak_db"})
+    """
+    silent = find_silent_stems(stems)
+    for entry in silent:
+        os.remove(stems[entry["stem"]])
+        describe_silent(entry)
+    return silent
+
+
+def _folder_stem_files(stems_folder: str) -> Dict[str, str]:
+    return {
+        os.path.splitext(file)[0]: os.path.join(stems_folder, file)
+        for file in sorted(os.listdir(stems_folder))
+        if file.lower().endswith(AUDIO_EXTENSIONS)
+    }
+
+
+def drop_silent_stems(stems_folder: str, song_path: str, remove: bool = True) -> List[Dict]:
+    """
+    Descartar las pistas silenciosas recién separadas de una canción
+    
+    Se llama con las pistas todavía en carpeta (antes de empaquetarlas o
+    generar sus formas de onda) y registra el resultado en el índice,
+    reemplazando lo que hubiera de una separación anterior.
+    
+    Args:
+        stems_folder: Carpeta con un archivo por pista
+        song_path: MP3 original de la canción
+        remove: Borrar los archivos y registrarlos (si no, sólo se detectan)
+    
+    Returns:
+        Pistas descartadas ({"stem", "rms_db", "peak_db"})
+    """
+    if not os.path.isdir(stems_folder):
+        return []
+    
+    stems = _folder_stem_files(stems_folder)
+    if not remove:
+        return find_silent_stems(stems)
+    silent = remove_silent_files(stems)
+    record_silent_stems(song_path, silent)
+    return silent
+
+
+def main():
+    from src.file_manager import list_songs
+    
+    parser = argparse.ArgumentParser(description="Detectar pistas silenciosas en la biblioteca")
+    parser.add_argument("--remove", action="store_true",
+                        help="Borrar las pistas silenciosas (sólo pistas en carpeta)")
+    args = parser.parse_args()
+    
+    # list_songs recorre también las carpetas de pistas (que no tienen
+    # pistas propias y se saltan)
+    for song in list_songs():
+        stems_folder = os.path.splitext(song["file_path"])[0]
+        if not has_stems(stems_folder):
+            continue
+        if os.path.isdir(stems_folder):
+            silent = drop_silent_stems(stems_folder, song["file_path"], remove=args.remove)
+            if args.remove:
+                continue
+        else:
+            # Quitar un flujo de un contenedor exige volver a empaquetarlo
+            silent = find_silent_stems(list_stems(stems_folder))
+        for entry in silent:
+            print(f"🔇 {song['file_path']}: {entry['stem']} ({_describe_levels(entry)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Almacenamiento compacto de pistas en un único contenedor
+
+En lugar de la carpeta ``music/<artist>/<song>/`` con un MP3 por pista, las
+pistas de una canción pueden guardarse en un solo Matroska de audio
+multipista junto al original::
+    
+    music/<artist>/<song>.stems.mka
+
+Cada pista es un flujo de audio copiado sin recodificar (el MP3 de Demucs
+tal cual) y el índice de pistas (``SHELU_STEMS=vocals:mp3:1105,...``:
+nombre, códec y muestras iniciales a descartar) va en los metadatos globales
+del archivo. El índice se guarda además en ``data/library.db`` para listar
+la biblioteca sin abrir cada contenedor.
+
+Al copiar un MP3 a Matroska se pierde la cabecera LAME que indica el retardo
+del codificador, así que al decodificar el flujo aparecen unos cientos de
+muestras de relleno al principio. Al empaquetar se mide ese relleno
+comparando con el MP3 original y los decodificadores lo descartan, de modo
+que cada pista queda alineada muestra a muestra con la versión en carpeta.
+
+El resto de módulos se refieren a una pista del contenedor con una
+referencia ``<contenedor>#<pista>`` (``stem_ref``); ``audio_io`` la
+decodifica eligiendo el flujo y ``mixdown`` decodifica todas las pistas de
+una canción con un único FFmpeg.
+
+Uso para convertir carpetas existentes::
+    
+    python -m src.stem_container [--artist NOMBRE] [--keep-folders]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.capabilities import ffmpeg_executable
+from src.config import CACHE_DIR, STEM_STORAGE
+from src.library_index import get_stem_index, record_stem_index
+from src.metrics import record_cache
+
+
+CONTAINER_EXTENSION = ".stems.mka"
+STEMS_TAG = "SHELU_STEMS"
+STEM_EXTENSIONS = (".mp3", ".wav")
+STEM_CACHE_DIR = os.path.join(CACHE_DIR, "stems")
+
+# Códec de los flujos según la extensión de la pista original
+_CODECS = {".mp3": "mp3", ".wav": "pcm"}
+
+# Búsqueda del relleno inicial: segundos decodificados, muestras comparadas
+# y desplazamiento máximo (el retardo de LAME ronda las 1105 muestras)
+PADDING_PROBE_SECONDS = 5
+PADDING_WINDOW = 4096
+MAX_PADDING = 8192
+
+
+def container_path_for(stems_folder: str) -> str:
+    """
+    Ruta del contenedor de las pistas de una canción (``music/A/Song`` ->
+    ``music/A/Song.stems.mka``)
+    """
+    return stems_folder.rstrip("/\\") + CONTAINER_EXTENSION
+
+
+def is_container(path: str) -> bool:
+    return path.endswith(CONTAINER_EXTENSION)
+
+
+def stem_ref(container: str, stem: str) -> str:
+    """
+    Referencia a una pista dentro de un contenedor
+    """
+    return f"{container}#{stem}"
+
+
+def split_stem_ref(path: str) -> Tuple[str, Optional[str]]:
+    """
+    Separar una referencia en (contenedor, pista)
+    
+    Las rutas normales (aunque contengan ``#``) devuelven (ruta, None).
+    """
+    base, sep, stem = path.rpartition("#")
+    if sep and is_container(base) and stem:
+        return base, stem
+    return path, None
+
+
+def source_file(path: str) -> str:
+    """
+    Archivo real de una ruta o referencia
+    """
+    return split_stem_ref(path)[0]
+
+
+def audio_mtime(path: str) -> float:
+    """
+    Fecha de modificación del archivo de una ruta o referencia
+    """
+    return os.path.getmtime(source_file(path))
+
+
+def artifact_base(path: str) -> str:
+    """
+    Prefijo de los archivos derivados (picos, previsualización) de un audio
+    
+    ``music/A/Song/drums.mp3`` -> ``music/A/Song/drums`` y
+    ``music/A/Song.stems.mka#drums`` -> ``music/A/Song.stems.drums``
+    """
+    container, stem = split_stem_ref(path)
+    if stem is None:
+        return os.path.splitext(path)[0]
+    return container[:-len(CONTAINER_EXTENSION)] + ".stems." + stem
+
+
+def _format_tag(index: List[Dict]) -> str:
+    return ",".join(f"{e['name']}:{e['codec']}:{e['skip']}" for e in index)
+
+
+def _read_tag(container: str) -> List[Dict]:
+    """
+    Leer el índice de pistas de los metadatos del contenedor
+    """
+    result = subprocess.run(
+        [ffmpeg_executable(), "-v", "error", "-nostdin", "-i", container, "-f", "ffmetadata", "-"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition("=")
+        if key.upper() == STEMS_TAG:
+            stems = []
+            for item in filter(None, value.split(",")):
+                name, codec, skip = (item.split(":") + ["mp3", "0"])[:3]
+                stems.append({"name": name, "codec": codec, "skip": int(skip or 0)})
+            return stems
+    raise ValueError(f"El contenedor no tiene índice de pistas: {container}")
+
+
+def read_stem_index(container: str, indexes: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """
+    Pistas de un contenedor en orden de flujo
+    
+    Args:
+        container: Ruta del contenedor
+        indexes: Índices ya leídos con ``get_all_stem_indexes`` (listados),
+            para no consultar el índice una vez por canción
+    
+    Returns:
+        Lista de {"name", "codec"} (el flujo de audio i es la pista i)
+    """
+    mtime = os.path.getmtime(container)
+    if indexes is not None:
+        cached = indexes.get(container.replace('\\', '/'))
+    else:
+        cached = get_stem_index(container)
+    if cached and cached["mtime"] >= mtime:
+        return cached["stems"]
+    
+    stems = _read_tag(container)
+    record_stem_index(container, stems, mtime)
+    return stems
+
+
+def stream_info(container: str, stem: str) -> Tuple[int, int]:
+    """
+    Índice del flujo de audio de una pista y muestras iniciales a descartar
+    
+    Raises:
+        KeyError: Si el contenedor no tiene esa pista
+    """
+    for index, entry in enumerate(read_stem_index(container)):
+        if entry["name"] == stem:
+            return index, entry.get("skip", 0)
+    raise KeyError(f"Pista no encontrada en {container}: {stem}")
+
+
+def stream_index(container: str, stem: str) -> int:
+    """
+    Índice del flujo de audio de una pista
+    
+    Raises:
+        KeyError: Si el contenedor no tiene esa pista
+    """
+    return stream_info(container, stem)[0]
+
+
+def _folder_stems(stems_folder: str) -> Dict[str, str]:
+    stems = {}
+    for stem_file in sorted(os.listdir(stems_folder)):
+        name, extension = os.path.splitext(stem_file)
+        if extension in STEM_EXTENSIONS:
+            stems[name] = os.path.join(stems_folder, stem_file)
+    return stems
+
+
+def list_stems(stems_folder: str, indexes: Optional[Dict[str, Dict]] = None) -> Dict[str, str]:
+    """
+    Pistas de una canción en cualquiera de los dos formatos
+    
+    La carpeta tiene preferencia si existen ambas (separación más reciente
+    todavía sin convertir).
+    
+    Args:
+        stems_folder: Carpeta de pistas (``music/<artist>/<song>``)
+        indexes: Índices de contenedores ya leídos (ver ``read_stem_index``)
+    
+    Returns:
+        Diccionario {pista: ruta o referencia al contenedor}
+    """
+    if os.path.isdir(stems_folder):
+        return _folder_stems(stems_folder)
+    
+    container = container_path_for(stems_folder)
+    if os.path.isfile(container):
+        return {entry["name"]: stem_ref(container, entry["name"]) for entry in read_stem_index(container, indexes)}
+    return {}
+
+
+def has_stems(stems_folder: str) -> bool:
+    """
+    Comprobar si una canción tiene pistas (carpeta o contenedor)
+    """
+    return os.path.isdir(stems_folder) or os.path.isfile(container_path_for(stems_folder))
+
+
+def remove_container(stems_folder: str):
+    """
+    Borrar el contenedor de una canción y sus archivos derivados (al volver a
+    separarla en carpeta)
+    """
+    container = container_path_for(stems_folder)
+    if not os.path.exists(container):
+        return
+    for entry in read_stem_index(container):
+        base = artifact_base(stem_ref(container, entry["name"]))
+        for suffix in (".peaks", ".preview"):
+            if os.path.isdir(base + suffix):
+                shutil.rmtree(base + suffix, ignore_errors=True)
+            elif os.path.exists(base + suffix):
+                os.remove(base + suffix)
+    os.remove(container)
+
+
+def _decode_mono(input_args: List[str], seconds: float) -> np.ndarray:
+    result = subprocess.run(
+        [ffmpeg_executable(), "-v", "error", "-nostdin", *input_args,
+         "-t", str(seconds), "-f", "f32le", "-ac", "1", "-"],
+        capture_output=True,
+        check=True
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def _leading_padding(original: str, container: str, index: int) -> int:
+    """
+    Muestras de relleno que el flujo copiado tiene de más al principio
+    
+    Busca el desplazamiento con el que el flujo del contenedor coincide con
+    el archivo original a partir de su primera muestra audible.
+    """
+    expected = _decode_mono(["-i", original], PADDING_PROBE_SECONDS)
+    copied = _decode_mono(["-i", container, "-map", f"0:a:{index}"], PADDING_PROBE_SECONDS + 1)
+    audible = np.flatnonzero(np.abs(expected) > 1e-3)
+    if not len(audible):
+        return 0
+    
+    first = audible[0]
+    window = expected[first:first + PADDING_WINDOW]
+    for shift in range(min(MAX_PADDING, len(copied) - first - len(window)) + 1):
+        if np.abs(copied[first + shift:first + shift + len(window)] - window).max() < 1e-5:
+            return shift
+    print(f"⚠️  No se pudo alinear {original} en {container}; se usa sin recorte")
+    return 0
+
+
+def pack_stems(stems_folder: str, keep_folder: bool = False) -> str:
+    """
+    Empaquetar las pistas de una carpeta en un contenedor (sin recodificar)
+    
+    Args:
+        stems_folder: Carpeta con las pistas
+        keep_folder: No borrar la carpeta al terminar
+    
+    Returns:
+        Ruta del contenedor
+    
+    Raises:
+        ValueError: Si la carpeta no tiene pistas
+        subprocess.CalledProcessError: Si FFmpeg falla
+    """
+    stems = _folder_stems(stems_folder)
+    if not stems:
+        raise ValueError(f"No hay pistas en {stems_folder}")
+    
+    container = container_path_for(stems_folder)
+    muxed_path = f"{container}.{os.getpid()}.mux.tmp"
+    temp_path = f"{container}.{os.getpid()}.tmp"
+    
+    cmd = [ffmpeg_executable(), "-v", "error", "-nostdin", "-y"]
+    for path in stems.values():
+        cmd += ["-i", path]
+    for i, name in enumerate(stems):
+        cmd += ["-map", f"{i}:a", f"-metadata:s:a:{i}", f"title={name}"]
+    
+    try:
+        subprocess.run([*cmd, "-c", "copy", "-f", "matroska", muxed_path], capture_output=True, check=True)
+        
+        # El relleno sólo se conoce tras copiar los flujos: medirlo y
+        # escribir el índice con una segunda copia (sin recodificar)
+        index = [
+            {
+                "name": name,
+                "codec": _CODECS[os.path.splitext(path)[1]],
+                "skip": _leading_padding(path, muxed_path, i),
+            }
+            for i, (name, path) in enumerate(stems.items())
+        ]
+        subprocess.run(
+            [ffmpeg_executable(), "-v", "error", "-nostdin", "-y", "-i", muxed_path,
+             "-map", "0", "-c", "copy", "-metadata", f"{STEMS_TAG}={_format_tag(index)}",
+             "-f", "matroska", temp_path],
+            capture_output=True,
+            check=True
+        )
+        os.replace(temp_path, container)
+    finally:
+        for path in (muxed_path, temp_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    record_stem_index(container, index, os.path.getmtime(container))
+    if not keep_folder:
+        shutil.rmtree(stems_folder)
+    return container
+
+
+def publish_stems(stems_folder: str) -> Dict[str, str]:
+    """
+    Guardar las pistas recién separadas en el formato configurado
+    
+    Con ``SHELU_STEM_STORAGE=container`` se empaquetan; en ambos casos se
+    elimina un contenedor anterior de la misma canción.
+    
+    Returns:
+        Diccionario {pista: ruta o referencia}
+    """
+    if STEM_STORAGE == "container":
+        pack_stems(stems_folder)
+    else:
+        remove_container(stems_folder)
+    return list_stems(stems_folder)
+
+
+def extract_stem(container: str, stem: str, output_path: str):
+    """
+    Extraer una pista como MP3 independiente (copiando el flujo si ya es MP3)
+    """
+    index = stream_index(container, stem)
+    codec = read_stem_index(container)[index]["codec"]
+    codec_args = ["-c", "copy"] if codec == "mp3" else ["-c:a", "libmp3lame", "-b:a", "320k"]
+    subprocess.run(
+        [ffmpeg_executable(), "-v", "error", "-nostdin", "-y", "-i", container,
+         "-map", f"0:a:{index}", *codec_args, "-f", "mp3", output_path],
+        capture_output=True,
+        check=True
+    )
+
+
+def playable_file(path: str) -> str:
+    """
+    Archivo que se puede servir tal cual para una ruta o referencia
+    
+    Las pistas de un contenedor se extraen una vez (copia del flujo, sin
+    recodificar) a ``data/cache/stems`` para servirlas con peticiones de
+    rango; la caché se invalida si el contenedor cambia.
+    """
+    container, stem = split_stem_ref(path)
+    if stem is None:
+        return path
+    
+    key = hashlib.sha256(
+        f"{container}|{stem}|{os.path.getmtime(container)}".encode("utf-8")
+    ).hexdigest()[:32]
+    cached_path = os.path.join(STEM_CACHE_DIR, f"{key}.mp3")
+    if os.path.exists(cached_path):
+        record_cache("stem", hit=True)
+        return cached_path
+    
+    record_cache("stem", hit=False)
+    os.makedirs(STEM_CACHE_DIR, exist_ok=True)
+    temp_path = f"{cached_path}.{os.getpid()}.tmp"
+    try:
+        extract_stem(container, stem, temp_path)
+        os.replace(temp_path, cached_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return cached_path
+
+
+def main():
+    from src.waveform import generate_peaks
+    
+    parser = argparse.ArgumentParser(description="Convertir carpetas de pistas al formato contenedor")
+    parser.add_argument("--artist", default=None, help="Convertir sólo este artista")
+    parser.add_argument("--keep-folders", action="store_true", help="No borrar las carpetas convertidas")
+    args = parser.parse_args()
+    
+    music_dir = "music"
+    artists = [args.artist] if args.artist else sorted(os.listdir(music_dir))
+    converted = 0
+    for artist in artists:
+        artist_path = os.path.join(music_dir, artist)
+        if not os.path.isdir(artist_path):
+            continue
+        for item in sorted(os.listdir(artist_path)):
+            stems_folder = os.path.join(artist_path, os.path.splitext(item)[0])
+            if not item.endswith(".mp3") or not os.path.isdir(stems_folder):
+                continue
+            try:
+                container = pack_stems(stems_folder, keep_folder=args.keep_folders)
+            except Exception as e:
+                print(f"Error al convertir {stems_folder}: {e}")
+                continue
+            for entry in read_stem_index(container):
+                generate_peaks(stem_ref(container, entry["name"]))
+            converted += 1
+            print(f"📦 {stems_folder} -> {container}")
+    print(f"✓ {converted} canciones convertidas")
+
+
+if __name__ == "__main__":
+    main()
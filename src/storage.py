@@ -0,0 +1,612 @@
+"""
+Presupuestos de disco de los archivos regenerables
+
+Todo lo que se deriva del audio original se puede volver a generar: pistas
+separadas, previsualizaciones, picos y las cachés de ``data/cache``. Este
+módulo mide cuánto ocupa cada clase, aplica un presupuesto por clase
+(``STORAGE_BUDGETS_MB``) y otro conjunto (``SHELU_STORAGE_BUDGET_MB``)
+borrando primero lo usado hace más tiempo, y limpia lo que queda tras una
+caída: ``separated/_temp``, archivos ``*.<pid>.tmp``, carpetas ``tmp*`` de
+``tempfile``, descargas ``.part`` y puntos de control de separaciones
+(``data/checkpoints``) abandonados y picos o previsualizaciones
+cuyo audio ya no existe. Los originales (``music/<artist>/<song>.mp3``) se
+cuentan pero nunca se borran, ni tampoco lo que no se puede regenerar: las
+pistas de una canción cuyo original ya no está y las carpetas del formato
+anterior (``separated/``).
+
+El último uso de los archivos de la biblioteca se registra por canción
+(``record_access``: reproducir, mezclar, pedir la forma de onda...); el de
+las cachés es su fecha de modificación, que actualizan al usarse.
+
+Uso::
+    
+    python -m src.storage                      # uso por clase
+    python -m src.storage --gc                 # temporales y huérfanos
+    python -m src.storage --enforce [--dry-run]
+"""
+import argparse
+import atexit
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.config import (
+    CHECKPOINTS_DIR,
+    DOWNLOADS_DIR,
+    DECODED_CACHE_DIR,
+    EXCERPTS_DIR,
+    EXPORTS_DIR,
+    INPUT_CACHE_DIR,
+    MIX_CACHE_DIR,
+    MUSIC_DIR,
+    PARTIAL_MAX_AGE_SECONDS,
+    SEPARATED_DIR,
+    STORAGE_BUDGETS_MB,
+    STORAGE_MIN_IDLE_SECONDS,
+    STORAGE_TOTAL_BUDGET_MB,
+    TEMP_MAX_AGE_SECONDS,
+)
+from src.library_index import get_all_song_access, record_silent_stems, record_song_accesses
+from src.metrics import STORAGE_EVICTED_BYTES
+from src.previews import PREVIEW_SUFFIX
+from src.stem_container import (
+    CONTAINER_EXTENSION,
+    STEM_CACHE_DIR,
+    STEM_EXTENSIONS,
+    is_container,
+    remove_container,
+    source_file,
+)
+from src.waveform import PEAKS_EXTENSION
+
+
+ORIGINALS = "originals"
+
+# Clases regenerables en el orden en que se aplican sus presupuestos
+ARTIFACT_CLASSES = ["stems", "previews", "peaks", "mix", "stem_cache", "decoded", "inputs", "excerpts", "exports"]
+
+# Cachés cuyas entradas son los archivos o carpetas de primer nivel
+CACHE_DIRS = {
+    "mix": MIX_CACHE_DIR,
+    "stem_cache": STEM_CACHE_DIR,
+    "decoded": DECODED_CACHE_DIR,
+    "inputs": INPUT_CACHE_DIR,
+    "exports": EXPORTS_DIR,
+}
+
+# Temporales: ``<archivo>.<pid>[.<hilo>].tmp`` y carpetas de ``tempfile``
+_TEMP_SUFFIX = re.compile(r"(\.\d+)+\.tmp$")
+TEMP_DIR_PREFIX = "tmp"
+
+# Cada proceso acumula los usos y los guarda juntos como mucho una vez por
+# minuto (una sola escritura para todas las canciones usadas)
+ACCESS_RECORD_INTERVAL = 60
+_pending_access: Dict[str, float] = {}
+_access_flush = {"at": 0.0}
+_recorded_lock = threading.Lock()
+
+# Uso por clase ya calculado (timestamp, uso) para cached_storage_usage
+USAGE_CACHE_SECONDS = 60
+_usage_cache: Optional[Tuple[float, Dict[str, Dict]]] = None
+_usage_lock = threading.Lock()
+
+MB = 1024 * 1024
+
+
+def song_file_for(path: str) -> Optional[str]:
+    """
+    Original de la canción a la que pertenece un archivo de la biblioteca
+    
+    ``music/A/Song/drums.preview/0001.ogg``, ``music/A/Song.stems.mka#drums``
+    o ``music/A/Song.peaks`` -> ``music/A/Song.mp3``; None si no está en
+    ``MUSIC_DIR``.
+    """
+    relative = os.path.relpath(os.path.normpath(source_file(path)), os.path.normpath(MUSIC_DIR))
+    parts = relative.replace('\\', '/').split('/')
+    if len(parts) < 2 or parts[0] in ("..", "."):
+        return None
+    
+    artist, name = parts[0], parts[1]
+    if ".stems." in name:
+        name = name.split(".stems.")[0]
+    else:
+        base, extension = os.path.splitext(name)
+        if extension in (".mp3", PEAKS_EXTENSION, PREVIEW_SUFFIX):
+            name = base
+    return os.path.join(MUSIC_DIR, artist, name + ".mp3").replace('\\', '/')
+
+
+def record_access(path: str):
+    """
+    Registrar que se ha usado un archivo de la biblioteca (su canción pasa a
+    ser la última en borrarse)
+    """
+    song = song_file_for(path)
+    if not song:
+        return
+    now = time.time()
+    with _recorded_lock:
+        _pending_access[song] = now
+        if now - _access_flush["at"] < ACCESS_RECORD_INTERVAL:
+            return
+    flush_access()
+
+
+def flush_access():
+    """
+    Guardar los usos acumulados por ``record_access``
+    """
+    global _pending_access
+    with _recorded_lock:
+        pending, _pending_access = _pending_access, {}
+        _access_flush["at"] = time.time()
+    if not pending:
+        return
+    try:
+        record_song_accesses(pending)
+    except Exception as e:
+        print(f"⚠️  No se pudo registrar el uso de {len(pending)} canciones: {e}")
+
+
+atexit.register(flush_access)
+
+
+# --- Inventario ---
+
+def _usage(path: str) -> Tuple[int, float]:
+    """
+    Bytes y fecha de modificación más reciente de un archivo o carpeta
+    """
+    try:
+        newest = os.path.getmtime(path)
+    except OSError:
+        return 0, 0
+    if not os.path.isdir(path):
+        return os.path.getsize(path), newest
+    
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                stat = os.stat(os.path.join(root, file))
+            except OSError:
+                continue
+            total += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return total, newest
+
+
+def _artifact(
+    artifact_class: str,
+    path: str,
+    song: Optional[str],
+    access: Dict[str, float],
+    evictable: bool = True
+) -> Dict:
+    size, modified = _usage(path)
+    return {
+        "class": artifact_class,
+        "path": path,
+        "bytes": size,
+        "last_used": max(modified, access.get(song, 0) if song else 0),
+        "song": song,
+        "evictable": evictable,
+    }
+
+
+def _has_original(song: Optional[str]) -> bool:
+    """
+    Comprobar si se pueden volver a separar las pistas de una canción
+    """
+    return bool(song) and os.path.exists(song)
+
+
+def _derived_sources(path: str) -> List[str]:
+    """
+    Audios de los que puede venir un archivo de picos o previsualización
+    """
+    suffix = PEAKS_EXTENSION if path.endswith(PEAKS_EXTENSION) else PREVIEW_SUFFIX
+    base = path[:-len(suffix)]
+    if ".stems." in os.path.basename(base):
+        return [base.rsplit(".stems.", 1)[0] + CONTAINER_EXTENSION]
+    return [base + extension for extension in (".mp3",) + STEM_EXTENSIONS]
+
+
+def _scan_stems_folder(folder: str, song: str, access: Dict[str, float]) -> List[Dict]:
+    """
+    Pistas de una carpeta (una sola entrada, sólo el audio) y sus derivados
+    """
+    artifacts = []
+    stems_bytes, modified = 0, 0
+    for item in sorted(os.listdir(folder)):
+        path = os.path.join(folder, item)
+        if _TEMP_SUFFIX.search(item):
+            continue
+        if item.endswith(PEAKS_EXTENSION):
+            artifacts.append(_artifact("peaks", path, song, access))
+        elif item.endswith(PREVIEW_SUFFIX):
+            artifacts.append(_artifact("previews", path, song, access))
+        elif os.path.splitext(item)[1] in STEM_EXTENSIONS:
+            size, stem_modified = _usage(path)
+            stems_bytes += size
+            modified = max(modified, stem_modified)
+    if stems_bytes:
+        artifacts.insert(0, {
+            "class": "stems",
+            "path": folder,
+            "bytes": stems_bytes,
+            "last_used": max(modified, access.get(song, 0)),
+            "song": song,
+            "evictable": _has_original(song),
+        })
+    return artifacts
+
+
+def _scan_music(access: Dict[str, float]) -> List[Dict]:
+    artifacts = []
+    if not os.path.isdir(MUSIC_DIR):
+        return artifacts
+    
+    for artist in sorted(os.listdir(MUSIC_DIR)):
+        artist_dir = os.path.join(MUSIC_DIR, artist)
+        if not os.path.isdir(artist_dir):
+            continue
+        for item in sorted(os.listdir(artist_dir)):
+            path = os.path.join(artist_dir, item)
+            if _TEMP_SUFFIX.search(item):
+                continue
+            song = song_file_for(path)
+            if item.endswith(CONTAINER_EXTENSION):
+                artifact_class = "stems"
+            elif item.endswith(PEAKS_EXTENSION):
+                artifact_class = "peaks"
+            elif item.endswith(PREVIEW_SUFFIX):
+                artifact_class = "previews"
+            elif os.path.isdir(path):
+                artifacts.extend(_scan_stems_folder(path, song, access))
+                continue
+            elif item.endswith(".mp3"):
+                artifact_class = ORIGINALS
+            else:
+                continue
+            evictable = artifact_class != ORIGINALS and (artifact_class != "stems" or _has_original(song))
+            artifacts.append(_artifact(artifact_class, path, song, access, evictable))
+    return artifacts
+
+
+def _scan_separated(access: Dict[str, float]) -> List[Dict]:
+    """
+    Carpetas ``separated/<artist>/<song>/`` del formato anterior (se cuentan
+    pero no se borran: su original puede tener otro nombre o no existir)
+    """
+    artifacts = []
+    if not os.path.isdir(SEPARATED_DIR):
+        return artifacts
+    for artist in sorted(os.listdir(SEPARATED_DIR)):
+        artist_dir = os.path.join(SEPARATED_DIR, artist)
+        if artist == "_temp" or not os.path.isdir(artist_dir):
+            continue
+        for song_name in sorted(os.listdir(artist_dir)):
+            path = os.path.join(artist_dir, song_name)
+            if os.path.isdir(path):
+                song = os.path.join(MUSIC_DIR, artist, song_name + ".mp3").replace('\\', '/')
+                artifacts.append(_artifact("stems", path, song, access, evictable=False))
+    return artifacts
+
+
+def _is_temp_name(name: str) -> bool:
+    return bool(_TEMP_SUFFIX.search(name)) or name.startswith(TEMP_DIR_PREFIX)
+
+
+def _scan_caches() -> List[Dict]:
+    artifacts = []
+    for artifact_class, folder in CACHE_DIRS.items():
+        if not os.path.isdir(folder):
+            continue
+        for item in sorted(os.listdir(folder)):
+            if not _is_temp_name(item):
+                artifacts.append(_artifact(artifact_class, os.path.join(folder, item), None, {}))
+    
+    # Fragmentos: excerpts/<canción>/<ventana>/
+    if os.path.isdir(EXCERPTS_DIR):
+        for song_key in sorted(os.listdir(EXCERPTS_DIR)):
+            song_dir = os.path.join(EXCERPTS_DIR, song_key)
+            if _is_temp_name(song_key) or not os.path.isdir(song_dir):
+                continue
+            for item in sorted(os.listdir(song_dir)):
+                if not _is_temp_name(item):
+                    artifacts.append(_artifact("excerpts", os.path.join(song_dir, item), None, {}))
+    return artifacts
+
+
+def scan_artifacts() -> List[Dict]:
+    """
+    Inventario de los archivos de la biblioteca y las cachés
+    
+    Returns:
+        Lista de {"class", "path", "bytes", "last_used", "song", "evictable"}
+    """
+    flush_access()
+    access = get_all_song_access()
+    return _scan_music(access) + _scan_separated(access) + _scan_caches()
+
+
+def storage_usage(artifacts: Optional[List[Dict]] = None) -> Dict[str, Dict]:
+    """
+    Uso de disco por clase (originales incluidos) y su presupuesto
+    
+    Returns:
+        Diccionario {clase: {"bytes", "size_mb", "items", "budget_mb"}}
+        (budget_mb None = sin límite)
+    """
+    if artifacts is None:
+        artifacts = scan_artifacts()
+    usage = {
+        artifact_class: {"bytes": 0, "items": 0, "budget_mb": STORAGE_BUDGETS_MB.get(artifact_class) or None}
+        for artifact_class in [ORIGINALS] + ARTIFACT_CLASSES
+    }
+    for artifact in artifacts:
+        entry = usage[artifact["class"]]
+        entry["bytes"] += artifact["bytes"]
+        entry["items"] += 1
+    for entry in usage.values():
+        entry["size_mb"] = round(entry["bytes"] / MB, 2)
+    return usage
+
+
+def cached_storage_usage(max_age: float = USAGE_CACHE_SECONDS) -> Dict[str, Dict]:
+    """
+    ``storage_usage`` recalculado como mucho cada ``max_age`` segundos (para
+    /metrics, que se consulta a menudo)
+    """
+    global _usage_cache
+    with _usage_lock:
+        if _usage_cache is None or time.time() - _usage_cache[0] > max_age:
+            _usage_cache = (time.time(), storage_usage())
+        return _usage_cache[1]
+
+
+# --- Presupuestos ---
+
+def _remove(artifact: Dict):
+    path = artifact["path"]
+    if artifact["class"] == "stems" and is_container(path):
+        # También borra los picos y previsualizaciones de sus pistas
+        remove_container(path[:-len(CONTAINER_EXTENSION)])
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    if artifact["class"] == "stems" and artifact["song"]:
+        record_silent_stems(artifact["song"], [])
+
+
+def _contained(artifact: Dict, other: Dict) -> bool:
+    """
+    Comprobar si ``other`` desaparece al borrar ``artifact``
+    """
+    path = artifact["path"]
+    if artifact["class"] == "stems" and is_container(path):
+        prefix = path[:-len(CONTAINER_EXTENSION)] + ".stems."
+    else:
+        prefix = path.rstrip("/\\") + os.sep
+    return other is not artifact and other["path"].startswith(prefix)
+
+
+def _evict(artifact: Dict, artifacts: List[Dict], freed: Dict[str, int], dry_run: bool) -> bool:
+    """
+    Borrar un archivo regenerable (y lo que contenga) salvo que se haya
+    usado hace poco
+    
+    Returns:
+        True si se ha borrado
+    """
+    if artifact.get("evicted") or artifact["last_used"] > time.time() - STORAGE_MIN_IDLE_SECONDS:
+        return False
+    if not dry_run:
+        try:
+            _remove(artifact)
+        except OSError as e:
+            print(f"⚠️  No se pudo borrar {artifact['path']}: {e}")
+            return False
+    
+    for entry in [artifact] + [other for other in artifacts if _contained(artifact, other)]:
+        if entry.get("evicted"):
+            continue
+        entry["evicted"] = True
+        freed[entry["class"]] = freed.get(entry["class"], 0) + entry["bytes"]
+        if not dry_run:
+            STORAGE_EVICTED_BYTES.inc(entry["bytes"], **{"class": entry["class"]})
+    return True
+
+
+def _trim(candidates: List[Dict], artifacts: List[Dict], budget_bytes: float, freed: Dict[str, int], dry_run: bool):
+    """
+    Borrar los candidatos usados hace más tiempo hasta quedar dentro del límite
+    
+    Lo que no se puede regenerar cuenta para el límite pero no se borra.
+    """
+    candidates = [artifact for artifact in candidates if not artifact.get("evicted")]
+    total = sum(artifact["bytes"] for artifact in candidates)
+    for artifact in sorted(candidates, key=lambda entry: entry["last_used"]):
+        if total <= budget_bytes:
+            break
+        if artifact.get("evicted"):
+            # Ya borrado al borrar la carpeta que lo contenía
+            total -= artifact["bytes"]
+            continue
+        if artifact["evictable"] and _evict(artifact, artifacts, freed, dry_run):
+            total -= artifact["bytes"]
+
+
+def enforce_budgets(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Aplicar los presupuestos por clase y el conjunto
+    
+    Args:
+        dry_run: Sólo calcular qué se borraría
+    
+    Returns:
+        Bytes liberados por clase
+    """
+    artifacts = [artifact for artifact in scan_artifacts() if artifact["class"] != ORIGINALS]
+    freed: Dict[str, int] = {}
+    
+    for artifact_class in ARTIFACT_CLASSES:
+        budget_mb = STORAGE_BUDGETS_MB.get(artifact_class, 0)
+        if budget_mb > 0:
+            candidates = [artifact for artifact in artifacts if artifact["class"] == artifact_class]
+            _trim(candidates, artifacts, budget_mb * MB, freed, dry_run)
+    
+    if STORAGE_TOTAL_BUDGET_MB > 0:
+        _trim(artifacts, artifacts, STORAGE_TOTAL_BUDGET_MB * MB, freed, dry_run)
+    return freed
+
+
+# --- Limpieza de temporales y huérfanos ---
+
+def keep_fresh(path: str) -> threading.Event:
+    """
+    Renovar la fecha de modificación de una carpeta de trabajo mientras se usa
+    
+    ``collect_garbage`` borra los temporales que no cambian en
+    TEMP_MAX_AGE_SECONDS, y una separación larga (la CLI de Demucs no escribe
+    nada hasta terminar) puede pasar ese tiempo sin tocar su carpeta. Un
+    hilo la toca cada cuarto de ese tiempo hasta que se activa el evento
+    devuelto.
+    """
+    done = threading.Event()
+    
+    def touch():
+        while not done.wait(TEMP_MAX_AGE_SECONDS / 4):
+            try:
+                os.utime(path)
+            except OSError:
+                return
+    
+    threading.Thread(target=touch, name="keep-fresh", daemon=True).start()
+    return done
+
+
+def _remove_path(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def _stale_temp_paths() -> List[str]:
+    """
+    Temporales cuya última escritura es anterior a ``TEMP_MAX_AGE_SECONDS``
+    """
+    candidates = []
+    separation_temp = os.path.join(SEPARATED_DIR, "_temp")
+    if os.path.isdir(separation_temp):
+        candidates += [os.path.join(separation_temp, item) for item in os.listdir(separation_temp)]
+    
+    work_dirs = list(CACHE_DIRS.values()) + [EXCERPTS_DIR]
+    if os.path.isdir(EXCERPTS_DIR):
+        work_dirs += [os.path.join(EXCERPTS_DIR, item) for item in os.listdir(EXCERPTS_DIR)
+                      if os.path.isdir(os.path.join(EXCERPTS_DIR, item)) and not _is_temp_name(item)]
+    for folder in work_dirs:
+        if os.path.isdir(folder):
+            candidates += [os.path.join(folder, item) for item in os.listdir(folder) if _is_temp_name(item)]
+    
+    if os.path.isdir(MUSIC_DIR):
+        for root, dirs, files in os.walk(MUSIC_DIR):
+            candidates += [os.path.join(root, name) for name in files + dirs if _TEMP_SUFFIX.search(name)]
+            # No hace falta entrar en las previsualizaciones ni en los temporales
+            dirs[:] = [name for name in dirs if not name.endswith(PREVIEW_SUFFIX) and not _TEMP_SUFFIX.search(name)]
+    
+    limit = time.time() - TEMP_MAX_AGE_SECONDS
+    return [path for path in candidates if _usage(path)[1] < limit]
+
+
+def collect_garbage(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Borrar temporales abandonados, descargas parciales y puntos de control
+    antiguos y picos o previsualizaciones cuyo audio ya no existe
+    
+    Returns:
+        Bytes liberados por tipo ("temp", "partials", "orphans")
+    """
+    removed = {"temp": 0, "partials": 0, "orphans": 0}
+    targets = [("temp", path) for path in _stale_temp_paths()]
+    
+    # Trabajo a medias que un reintento o un trabajo reanudado aprovecharía
+    limit = time.time() - PARTIAL_MAX_AGE_SECONDS
+    for folder in (DOWNLOADS_DIR, CHECKPOINTS_DIR):
+        if os.path.isdir(folder):
+            for item in os.listdir(folder):
+                path = os.path.join(folder, item)
+                if _usage(path)[1] < limit:
+                    targets.append(("partials", path))
+    
+    idle_limit = time.time() - STORAGE_MIN_IDLE_SECONDS
+    for artifact in _scan_music({}):
+        if artifact["class"] in ("peaks", "previews") and artifact["last_used"] < idle_limit:
+            if not any(os.path.exists(source) for source in _derived_sources(artifact["path"])):
+                targets.append(("orphans", artifact["path"]))
+    
+    for kind, path in targets:
+        size = _usage(path)[0]
+        if not dry_run:
+            try:
+                _remove_path(path)
+            except OSError as e:
+                print(f"⚠️  No se pudo borrar {path}: {e}")
+                continue
+        removed[kind] += size
+    return removed
+
+
+def format_size(size: int) -> str:
+    if size >= MB / 10:
+        return f"{size / MB:.1f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+def maintain_storage() -> Dict[str, int]:
+    """
+    Limpieza completa: temporales y huérfanos, después los presupuestos
+    
+    Returns:
+        Bytes liberados por clase o tipo
+    """
+    freed = collect_garbage()
+    for artifact_class, size in enforce_budgets().items():
+        freed[artifact_class] = freed.get(artifact_class, 0) + size
+    freed = {name: size for name, size in freed.items() if size}
+    if freed:
+        summary = ", ".join(f"{name} {format_size(size)}" for name, size in freed.items())
+        print(f"🧹 Espacio liberado: {summary}")
+    return freed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Uso de disco y limpieza de archivos regenerables")
+    parser.add_argument("--gc", action="store_true", help="Borrar temporales abandonados y derivados huérfanos")
+    parser.add_argument("--enforce", action="store_true", help="Aplicar los presupuestos de disco")
+    parser.add_argument("--dry-run", action="store_true", help="Mostrar lo que se borraría sin borrar nada")
+    args = parser.parse_args()
+    
+    if args.gc:
+        for kind, size in collect_garbage(dry_run=args.dry_run).items():
+            print(f"🧹 {kind}: {format_size(size)}")
+    if args.enforce:
+        for artifact_class, size in enforce_budgets(dry_run=args.dry_run).items():
+            print(f"🧹 {artifact_class}: {format_size(size)}")
+    
+    print(f"💾 Uso por clase{' (simulación)' if args.dry_run else ''}:")
+    for artifact_class, entry in storage_usage().items():
+        budget = f"{entry['budget_mb']:.0f} MB" if entry["budget_mb"] else "sin límite"
+        if artifact_class == ORIGINALS:
+            budget = "nunca se borran"
+        print(f"  {artifact_class:<11} {entry['size_mb']:10.1f} MB  {entry['items']:6d}  ({budget})")
+
+
+if __name__ == "__main__":
+    main()
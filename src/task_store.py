@@ -0,0 +1,1071 @@
+"""
+Almacén de estado de tareas
+
+Guarda el estado de descargas y separaciones para que la API lo consulte.
+La implementación SQLite se comparte entre procesos (varios workers de
+uvicorn) y sobrevive a reinicios: es el registro de trabajos del que se
+reanudan al arrancar los que quedaron a medias. La de memoria sirve para un
+único proceso.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.cancellation import PREEMPTED
+from src.scheduling import pick_next
+from src.config import (
+    MAX_RESUMES,
+    RESUME_INTERRUPTED,
+    TASK_HEARTBEAT_TIMEOUT,
+    TASK_STORE_BACKEND,
+    TASKS_DB,
+    TASK_TTL_SECONDS,
+    TASK_MAX_FINISHED,
+)
+
+
+# Estados en los que una tarea ya no cambia
+FINISHED_STATUSES = ("completed", "error", "interrupted", "cancelled")
+
+# Estados de una tarea que está en marcha
+RUNNING_STATUSES = ("downloading", "processing")
+
+# Estados de una tarea que espera su turno
+QUEUED_STATUSES = ("queued",)
+
+# Grupos de estados aceptados como filtro además de los estados concretos
+STATUS_GROUPS = {
+    "running": RUNNING_STATUSES,
+    "queued": QUEUED_STATUSES,
+    "finished": FINISHED_STATUSES,
+}
+
+# Ventana de tareas recientes usada para las métricas de cola (segundos)
+QUEUE_STATS_WINDOW = 3600
+
+
+# Campos por los que se pueden contar tareas (columna o expresión en SQLite)
+GROUP_FIELDS = {
+    "status": "status",
+    "type": "type",
+    "priority": "json_extract(data, '$.priority')",
+}
+
+
+def expand_statuses(statuses: Optional[List[str]]) -> Optional[List[str]]:
+    """
+    Expandir grupos de estados (running, queued, finished) a estados concretos
+    """
+    if not statuses:
+        return None
+    expanded = []
+    for status in statuses:
+        expanded.extend(STATUS_GROUPS.get(status, (status,)))
+    return expanded
+
+
+def _job_matches(task: Dict, match: Dict) -> bool:
+    """
+    Comprobar si los argumentos (``job``) de una tarea coinciden con ``match``
+    """
+    job = task.get("job") or {}
+    return all(job.get(key) == value for key, value in match.items())
+
+
+_instance = {"pid": None, "id": None}
+_host = {"id": None}
+
+
+def instance_id() -> str:
+    """
+    Identificador de este proceso en el registro de trabajos
+    
+    El PID no sirve para saber si el dueño de una tarea sigue vivo: se
+    repite (PID 1 en cada arranque de un contenedor, PIDs reciclados). Este
+    identificador es único por arranque y se regenera tras un fork.
+    """
+    pid = os.getpid()
+    if _instance["pid"] != pid:
+        _instance.update(pid=pid, id=f"{pid}-{uuid.uuid4().hex[:12]}")
+    return _instance["id"]
+
+
+def host_id() -> str:
+    """
+    Identificador del espacio de PIDs de este proceso
+    
+    Dos procesos con el mismo ``host_id`` ven los mismos PIDs, así que el PID
+    de uno sirve para saber si el otro sigue vivo. Incluye el espacio de
+    nombres de PIDs (Linux) porque dos contenedores pueden compartir nombre
+    de máquina (red del host) y tener cada uno su PID 1.
+    """
+    if _host["id"] is None:
+        try:
+            namespace = os.readlink("/proc/self/ns/pid")
+        except OSError:
+            namespace = ""
+        _host["id"] = f"{socket.gethostname()}/{namespace}"
+    return _host["id"]
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    """
+    Comprobar si existe un proceso con ese PID (no que sea el mismo proceso)
+    """
+    if not pid:
+        return False
+    
+    if os.name == "nt":
+        # En Windows os.kill(pid, 0) envía CTRL_C_EVENT, así que se consulta
+        # el código de salida del proceso
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _queue_summary(by_status: Dict[str, int], waits: List[float]) -> Dict:
+    """
+    Construir el resumen de cola común a todos los almacenes
+    """
+    return {
+        "running": sum(by_status.get(status, 0) for status in RUNNING_STATUSES),
+        "queued": sum(by_status.get(status, 0) for status in QUEUED_STATUSES),
+        "by_status": by_status,
+        "avg_wait_seconds": round(sum(waits) / len(waits), 2) if waits else None,
+        "max_wait_seconds": round(max(waits), 2) if waits else None,
+    }
+
+
+class TaskStore:
+    """
+    Interfaz común de los almacenes de tareas
+    
+    Cada tarea es un diccionario con al menos ``task_id``, ``type``,
+    ``status``, ``created_at`` y ``updated_at``; el resto de campos
+    (``progress``, ``message``, ``file_path``...) son libres.
+    """
+    
+    def create(self, task_id: str, task_type: str, **fields) -> Dict:
+        """Crear una tarea y devolver su estado"""
+        raise NotImplementedError
+    
+    def create_unique(self, task_id: str, task_type: str, match: Dict, **fields) -> Tuple[Dict, bool]:
+        """
+        Crear una tarea salvo que haya otra del mismo tipo en cola o en
+        marcha cuyo ``job`` coincida con ``match``
+        
+        La búsqueda y la creación son atómicas entre procesos: dos peticiones
+        iguales a la vez acaban en la misma tarea.
+        
+        Returns:
+            Tupla (estado de la tarea, True si se ha creado)
+        """
+        raise NotImplementedError
+    
+    def get(self, task_id: str) -> Optional[Dict]:
+        """Obtener el estado de una tarea o None si no existe"""
+        raise NotImplementedError
+    
+    def update(self, task_id: str, **fields) -> Optional[Dict]:
+        """Actualizar campos de una tarea y devolver el estado resultante"""
+        raise NotImplementedError
+    
+    def claim_next(self, task_types: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Tomar la siguiente tarea en cola para ejecutarla en este proceso
+        
+        El orden lo decide ``src/scheduling.py`` (prioridad y reparto justo
+        por ``priority`` y ``fair_key``). La tarea pasa a ``processing`` con
+        ``started_at`` y queda asociada al proceso actual, de forma atómica
+        entre procesos.
+        
+        Args:
+            task_types: Tipos de tarea aceptados (None para cualquiera)
+            
+        Returns:
+            Estado de la tarea tomada o None si no hay ninguna en cola
+        """
+        raise NotImplementedError
+    
+    def list_tasks(
+        self,
+        ids: Optional[List[str]] = None,
+        statuses: Optional[List[str]] = None,
+        task_type: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 500
+    ) -> List[Dict]:
+        """
+        Listar tareas filtradas, de la más reciente a la más antigua
+        
+        Args:
+            ids: IDs concretos a devolver
+            statuses: Estados o grupos de estados (running, queued, finished)
+            task_type: Tipo de tarea (download, separate)
+            since: Sólo tareas modificadas desde este timestamp
+            limit: Máximo de tareas devueltas
+        """
+        raise NotImplementedError
+    
+    def count_tasks(
+        self,
+        statuses: Optional[List[str]] = None,
+        task_type: Optional[str] = None,
+        group_by: str = "status"
+    ) -> Dict[Optional[str], int]:
+        """
+        Contar tareas filtradas agrupadas por un campo (sin leerlas)
+        
+        Args:
+            statuses: Estados o grupos de estados (running, queued, finished)
+            task_type: Tipo de tarea (download, separate)
+            group_by: Campo por el que agrupar (status, type o priority)
+        
+        Returns:
+            Diccionario {valor del campo: número de tareas} (None si la
+            tarea no tiene ese campo)
+        """
+        raise NotImplementedError
+    
+    def queue_stats(self) -> Dict:
+        """
+        Obtener métricas agregadas de la cola
+        
+        Returns:
+            Diccionario con tareas en marcha, en cola, recuentos por estado
+            y espera media (inicio - creación) de las tareas recientes
+        """
+        raise NotImplementedError
+    
+    def current_cursor(self) -> int:
+        """Cursor del último cambio registrado"""
+        raise NotImplementedError
+    
+    def changes_since(self, cursor: int) -> Tuple[int, List[Dict]]:
+        """
+        Obtener las tareas modificadas después de ``cursor``
+        
+        Returns:
+            Tupla (nuevo cursor, lista de tareas cambiadas)
+        """
+        raise NotImplementedError
+    
+    def cancel(self, task_id: str) -> Optional[Dict]:
+        """
+        Cancelar una tarea
+        
+        Una tarea en cola pasa a ``cancelled`` al momento (de forma atómica
+        con ``claim_next``, así que ningún worker llega a tomarla). A una en
+        marcha se le marca ``cancel_requested`` y el ``JobWorker`` que la
+        ejecuta la detiene en su siguiente punto de cancelación. Las
+        terminadas no cambian.
+        
+        Returns:
+            Estado resultante o None si la tarea no existe
+        """
+        raise NotImplementedError
+    
+    def finish_stopped(self, task_id: str, reason: str) -> Optional[Dict]:
+        """
+        Dejar en su estado final un trabajo detenido por su ``CancelToken``
+        
+        Un trabajo desplazado vuelve a la cola salvo que entretanto se haya
+        pedido cancelarlo; si no, pasa a ``cancelled``. La comprobación y la
+        escritura son atómicas, así que no pisa una cancelación que llegue a
+        la vez ni una tarea que ya no está en cola o en marcha.
+        
+        Args:
+            task_id: ID de la tarea
+            reason: "cancelled" o "preempted" (``JobCancelled.reason``)
+        
+        Returns:
+            Estado resultante o None si la tarea no existe o ya no estaba activa
+        """
+        raise NotImplementedError
+    
+    def evict_expired(self) -> int:
+        """Eliminar tareas terminadas caducadas y devolver cuántas"""
+        raise NotImplementedError
+    
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """
+        Tomar o renovar un turno exclusivo entre procesos
+        
+        Sirve para las tareas periódicas que sólo debe hacer un proceso (la
+        limpieza del almacenamiento, p. ej.): el que tiene el turno lo
+        renueva en cada pasada y otro lo toma si pasan ``ttl`` segundos sin
+        renovarlo.
+        
+        Returns:
+            True si este proceso tiene el turno
+        """
+        raise NotImplementedError
+    
+    def heartbeat(self):
+        """
+        Renovar el latido de este proceso (``JobWorker`` lo llama cada
+        TASK_HEARTBEAT_INTERVAL mientras está en marcha)
+        """
+        raise NotImplementedError
+    
+    def recover_interrupted(self) -> int:
+        """
+        Recuperar las tareas en marcha cuyo proceso murió
+        
+        El dueño de una tarea se da por muerto si no es este proceso y no ha
+        latido en TASK_HEARTBEAT_TIMEOUT. Si además comparte máquina con este
+        proceso (``host_id``), también si su PID ya no existe o es el de este
+        proceso (otro arranque con el mismo PID). Un dueño de otra máquina o
+        contenedor que late está vivo aunque tenga nuestro PID. Los trabajos
+        de la cola (con ``job``) vuelven a ``queued`` para que los retome un
+        worker (ver ``_recovered_fields``); el resto pasa a ``interrupted``.
+        
+        Returns:
+            Número de tareas recuperadas
+        """
+        raise NotImplementedError
+    
+    @staticmethod
+    def _new_task(task_id: str, task_type: str, fields: Dict) -> Dict:
+        now = time.time()
+        return {
+            **fields,
+            "task_id": task_id,
+            "type": task_type,
+            "status": fields.get("status", "processing"),
+            "created_at": now,
+            "updated_at": now,
+        }
+    
+    @staticmethod
+    def _recovered_fields(task: Dict) -> Dict:
+        """
+        Campos de una tarea en marcha cuyo proceso murió
+        
+        Se reencola salvo que se hubiera pedido cancelarla, no sea un trabajo
+        de la cola o ya se haya reanudado MAX_RESUMES veces (podría ser ella
+        la que tumba el proceso).
+        """
+        if task.get("cancel_requested"):
+            return {"status": "cancelled", "message": "Cancelada", "finished_at": time.time()}
+        resumes = task.get("resumes", 0)
+        if RESUME_INTERRUPTED and task.get("job") is not None and resumes < MAX_RESUMES:
+            return {
+                "status": "queued",
+                "message": "En cola (se reanuda tras el reinicio)...",
+                "resumes": resumes + 1,
+                "preempt_requested": None,
+            }
+        return {
+            "status": "interrupted",
+            "message": "Interrumpida: el servidor se reinició",
+        }
+    
+    @staticmethod
+    def _cancel_fields(task: Dict) -> Dict:
+        """Campos que cambian al cancelar ``task`` (vacío si ya terminó)"""
+        if task["status"] in QUEUED_STATUSES:
+            return {
+                "status": "cancelled",
+                "message": "Cancelada",
+                "finished_at": time.time(),
+            }
+        if task["status"] in RUNNING_STATUSES:
+            return {"cancel_requested": True, "message": "Cancelando..."}
+        return {}
+    
+    @staticmethod
+    def _stopped_fields(task: Dict, reason: str) -> Dict:
+        """Campos que cambian al detener ``task`` (vacío si ya no está activa)"""
+        if task["status"] not in QUEUED_STATUSES + RUNNING_STATUSES:
+            return {}
+        if reason == PREEMPTED and not task.get("cancel_requested"):
+            # Vuelve a la cola; empieza de cero cuando lo tome un worker
+            return {
+                "status": "queued",
+                "progress": 0,
+                "message": "En cola (desplazada por un trabajo prioritario)...",
+                "preempted_by": task.get("preempt_requested"),
+                "preempt_requested": None,
+                "preemptions": task.get("preemptions", 0) + 1,
+            }
+        return {
+            "status": "cancelled",
+            "message": "Cancelada",
+            "finished_at": time.time(),
+        }
+    
+    @staticmethod
+    def _claimed_fields() -> Dict:
+        return {
+            "status": "processing",
+            "message": "Iniciando...",
+            "started_at": time.time(),
+        }
+
+
+class MemoryTaskStore(TaskStore):
+    """
+    Almacén en memoria (un solo proceso, se pierde al reiniciar)
+    """
+    
+    def __init__(self, ttl: float = TASK_TTL_SECONDS, max_finished: int = TASK_MAX_FINISHED):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._tasks: Dict[str, Dict] = {}
+        self._seqs: Dict[str, int] = {}
+        self._seq = 0
+        self._scheduler_state: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+    
+    def create(self, task_id: str, task_type: str, **fields) -> Dict:
+        task = self._new_task(task_id, task_type, fields)
+        with self._lock:
+            self._tasks[task_id] = task
+            self._touch(task_id)
+            return dict(task)
+    
+    def create_unique(self, task_id: str, task_type: str, match: Dict, **fields) -> Tuple[Dict, bool]:
+        task = self._new_task(task_id, task_type, fields)
+        with self._lock:
+            for existing in self._tasks.values():
+                if (existing["type"] == task_type
+                        and existing["status"] in (*QUEUED_STATUSES, *RUNNING_STATUSES)
+                        and _job_matches(existing, match)):
+                    return dict(existing), False
+            self._tasks[task_id] = task
+            self._touch(task_id)
+            return dict(task), True
+    
+    def get(self, task_id: str) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task else None
+    
+    def update(self, task_id: str, **fields) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            task.update(fields)
+            task["updated_at"] = time.time()
+            self._touch(task_id)
+            return dict(task)
+    
+    def claim_next(self, task_types: Optional[List[str]] = None) -> Optional[Dict]:
+        with self._lock:
+            queued = [
+                task for task in self._tasks.values()
+                if task["status"] in QUEUED_STATUSES
+                and (task_types is None or task["type"] in task_types)
+            ]
+            task = pick_next(queued, self._scheduler_state)
+            if task is None:
+                return None
+            task.update(self._claimed_fields())
+            task["updated_at"] = time.time()
+            self._touch(task["task_id"])
+            return dict(task)
+    
+    def cancel(self, task_id: str) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            fields = self._cancel_fields(task)
+            if fields:
+                task.update(fields)
+                task["updated_at"] = time.time()
+                self._touch(task_id)
+            return dict(task)
+    
+    def finish_stopped(self, task_id: str, reason: str) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            fields = self._stopped_fields(task, reason)
+            if not fields:
+                return None
+            task.update(fields)
+            task["updated_at"] = time.time()
+            self._touch(task_id)
+            return dict(task)
+    
+    def list_tasks(
+        self,
+        ids: Optional[List[str]] = None,
+        statuses: Optional[List[str]] = None,
+        task_type: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 500
+    ) -> List[Dict]:
+        statuses = expand_statuses(statuses)
+        with self._lock:
+            tasks = [
+                dict(task) for task_id, task in self._tasks.items()
+                if (ids is None or task_id in ids)
+                and (statuses is None or task["status"] in statuses)
+                and (task_type is None or task["type"] == task_type)
+                and (since is None or task["updated_at"] >= since)
+            ]
+        tasks.sort(key=lambda task: task["updated_at"], reverse=True)
+        return tasks[:limit]
+    
+    def count_tasks(
+        self,
+        statuses: Optional[List[str]] = None,
+        task_type: Optional[str] = None,
+        group_by: str = "status"
+    ) -> Dict[Optional[str], int]:
+        if group_by not in GROUP_FIELDS:
+            raise ValueError(f"No se puede agrupar por {group_by}")
+        statuses = expand_statuses(statuses)
+        counts: Dict[Optional[str], int] = {}
+        with self._lock:
+            for task in self._tasks.values():
+                if statuses is not None and task["status"] not in statuses:
+                    continue
+                if task_type is not None and task["type"] != task_type:
+                    continue
+                value = task.get(group_by)
+                counts[value] = counts.get(value, 0) + 1
+        return counts
+    
+    def queue_stats(self) -> Dict:
+        with self._lock:
+            tasks = list(self._tasks.values())
+        
+        by_status: Dict[str, int] = {}
+        for task in tasks:
+            by_status[task["status"]] = by_status.get(task["status"], 0) + 1
+        
+        recent = time.time() - QUEUE_STATS_WINDOW
+        waits = [
+            task["started_at"] - task["created_at"] for task in tasks
+            if task.get("started_at") and task["created_at"] >= recent
+        ]
+        return _queue_summary(by_status, waits)
+    
+    def current_cursor(self) -> int:
+        with self._lock:
+            return self._seq
+    
+    def changes_since(self, cursor: int) -> Tuple[int, List[Dict]]:
+        with self._lock:
+            changed = sorted(
+                (seq, task_id) for task_id, seq in self._seqs.items() if seq > cursor
+            )
+            return self._seq, [dict(self._tasks[task_id]) for _, task_id in changed]
+    
+    def evict_expired(self) -> int:
+        with self._lock:
+            finished = sorted(
+                (task["updated_at"], task_id)
+                for task_id, task in self._tasks.items()
+                if task["status"] in FINISHED_STATUSES
+            )
+            cutoff = time.time() - self.ttl
+            excess = len(finished) - self.max_finished
+            evicted = [
+                task_id for i, (updated_at, task_id) in enumerate(finished)
+                if updated_at < cutoff or i < excess
+            ]
+            for task_id in evicted:
+                del self._tasks[task_id]
+                del self._seqs[task_id]
+            return len(evicted)
+    
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        # Un único proceso
+        return True
+    
+    def heartbeat(self):
+        # Las tareas viven y mueren con este proceso
+        pass
+    
+    def recover_interrupted(self) -> int:
+        # Nada sobrevive a un reinicio en memoria
+        return 0
+    
+    def _touch(self, task_id: str):
+        self._seq += 1
+        self._seqs[task_id] = self._seq
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Almacén persistente en SQLite compartido entre procesos
+    
+    Cada cambio incrementa un contador global (``seq``) para que los streams
+    de progreso puedan pedir sólo lo modificado desde su último cursor.
+    """
+    
+    def __init__(
+        self,
+        db_path: str = TASKS_DB,
+        ttl: float = TASK_TTL_SECONDS,
+        max_finished: int = TASK_MAX_FINISHED
+    ):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._local = threading.local()
+        
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # executescript gestiona su propia transacción
+        self._connection().executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                owner_pid INTEGER,
+                owner_instance TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                seq INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_seq ON tasks(seq);
+            CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, updated_at);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters (name, value) VALUES ('seq', 0);
+            CREATE TABLE IF NOT EXISTS scheduler_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                state TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS instances (
+                instance_id TEXT PRIMARY KEY,
+                pid INTEGER NOT NULL,
+                host TEXT,
+                heartbeat_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """
+        )
+        # Registros creados antes de que existiera owner_instance
+        columns = [row["name"] for row in self._connection().execute("PRAGMA table_info(tasks)")]
+        if "owner_instance" not in columns:
+            self._connection().execute("ALTER TABLE tasks ADD COLUMN owner_instance TEXT")
+        columns = [row["name"] for row in self._connection().execute("PRAGMA table_info(instances)")]
+        if "host" not in columns:
+            self._connection().execute("ALTER TABLE instances ADD COLUMN host TEXT")
+    
+    def _connection(self) -> sqlite3.Connection:
+        # Una conexión por hilo y proceso (no se comparten tras un fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        # Bloqueo de escritura desde el inicio para leer-modificar-escribir
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'seq'")
+        return conn.execute("SELECT value FROM counters WHERE name = 'seq'").fetchone()[0]
+    
+    @staticmethod
+    def _row_to_task(row: sqlite3.Row) -> Dict:
+        return {
+            **json.loads(row["data"]),
+            "task_id": row["task_id"],
+            "type": row["type"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+    
+    def _write(self, conn: sqlite3.Connection, task: Dict, owner: Tuple[Optional[int], Optional[str]]):
+        """
+        Guardar una tarea con su dueño: (PID, instancia) o (None, None)
+        """
+        data = {k: v for k, v in task.items()
+                if k not in ("task_id", "type", "status", "created_at", "updated_at")}
+        conn.execute(
+            """
+            INSERT INTO tasks (task_id, type, status, data, owner_pid, owner_instance, created_at, updated_at, seq)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE SET
+                type = excluded.type,
+                status = excluded.status,
+                data = excluded.data,
+                owner_pid = excluded.owner_pid,
+                owner_instance = excluded.owner_instance,
+                updated_at = excluded.updated_at,
+                seq = excluded.seq
+            """,
+            (
+                task["task_id"], task["type"], task["status"],
+                json.dumps(data, default=str), *owner,
+                task["created_at"], task["updated_at"], self._next_seq(conn),
+            ),
+        )
+    
+    @staticmethod
+    def _row_owner(row: sqlite3.Row) -> Tuple[Optional[int], Optional[str]]:
+        return row["owner_pid"], row["owner_instance"]
+    
+    @staticmethod
+    def _beat(conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT OR REPLACE INTO instances (instance_id, pid, host, heartbeat_at) VALUES (?, ?, ?, ?)",
+            (instance_id(), os.getpid(), host_id(), time.time()),
+        )
+    
+    @staticmethod
+    def _initial_owner(task: Dict) -> Tuple[Optional[int], Optional[str]]:
+        # Las tareas en cola no pertenecen a ningún proceso hasta que se toman
+        if task["status"] in QUEUED_STATUSES:
+            return None, None
+        return os.getpid(), instance_id()
+    
+    def create(self, task_id: str, task_type: str, **fields) -> Dict:
+        task = self._new_task(task_id, task_type, fields)
+        with self._transaction() as conn:
+            self._write(conn, task, self._initial_owner(task))
+        return task
+    
+    def create_unique(self, task_id: str, task_type: str, match: Dict, **fields) -> Tuple[Dict, bool]:
+        task = self._new_task(task_id, task_type, fields)
+        active = (*QUEUED_STATUSES, *RUNNING_STATUSES)
+        # BEGIN IMMEDIATE: ningún otro proceso puede crear la misma tarea
+        # entre la búsqueda y la inserción
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM tasks WHERE type = ? AND status IN ({','.join('?' * len(active))})",
+                (task_type, *active),
+            ).fetchall()
+            for row in rows:
+                existing = self._row_to_task(row)
+                if _job_matches(existing, match):
+                    return existing, False
+            self._write(conn, task, self._initial_owner(task))
+        return task, True
+    
+    def get(self, task_id: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return self._row_to_task(row) if row else None
+    
+    def update(self, task_id: str, **fields) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            task = self._row_to_task(row)
+            task.update(fields)
+            task["updated_at"] = time.time()
+            self._write(conn, task, self._row_owner(row))
+        return task
+    
+    def claim_next(self, task_types: Optional[List[str]] = None) -> Optional[Dict]:
+        conditions = [f"status IN ({','.join('?' * len(QUEUED_STATUSES))})"]
+        params: List = list(QUEUED_STATUSES)
+        if task_types is not None:
+            conditions.append(f"type IN ({','.join('?' * len(task_types))})")
+            params.extend(task_types)
+        
+        # Comprobación de sólo lectura antes de tomar el bloqueo de escritura:
+        # los workers sin trabajo preguntan cada ``JOB_POLL_INTERVAL``
+        pending = self._connection().execute(
+            f"SELECT 1 FROM tasks WHERE {' AND '.join(conditions)} LIMIT 1", params
+        ).fetchone()
+        if pending is None:
+            return None
+        
+        with self._transaction() as conn:
+            queued = [
+                dict(row) for row in conn.execute(
+                    f"""
+                    SELECT task_id, type, created_at,
+                           json_extract(data, '$.priority') AS priority,
+                           json_extract(data, '$.fair_key') AS fair_key,
+                           json_extract(data, '$.preempted_by') AS preempted_by
+                    FROM tasks WHERE {' AND '.join(conditions)}
+                    """,
+                    params,
+                )
+            ]
+            if not queued:
+                return None
+            
+            state_row = conn.execute("SELECT state FROM scheduler_state WHERE id = 1").fetchone()
+            state = json.loads(state_row["state"]) if state_row else {}
+            chosen = pick_next(queued, state)
+            if chosen is None:
+                # Sólo quedan trabajos desplazados esperando a los suyos
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO scheduler_state (id, state) VALUES (1, ?)",
+                (json.dumps(state),),
+            )
+            
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE task_id = ?", (chosen["task_id"],)
+            ).fetchone()
+            task = self._row_to_task(row)
+            task.update(self._claimed_fields())
+            task["updated_at"] = time.time()
+            self._write(conn, task, (os.getpid(), instance_id()))
+            # El latido se registra antes de que nadie pueda comprobarlo
+            self._beat(conn)
+        return task
+    
+    def cancel(self, task_id: str) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            task = self._row_to_task(row)
+            fields = self._cancel_fields(task)
+            if fields:
+                task.update(fields)
+                task["updated_at"] = time.time()
+                self._write(conn, task, self._row_owner(row))
+        return task
+    
+    def finish_stopped(self, task_id: str, reason: str) -> Optional[Dict]:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            task = self._row_to_task(row)
+            fields = self._stopped_fields(task, reason)
+            if not fields:
+                return None
+            task.update(fields)
+            task["updated_at"] = time.time()
+            self._write(conn, task, self._row_owner(row))
+        return task
+    
+    def list_tasks(
+        self,
+        ids: Optional[List[str]] = None,
+        statuses: Optional[List[str]] = None,
+        task_type: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 500
+    ) -> List[Dict]:
+        conditions, params = [], []
+        if ids is not None:
+            conditions.append(f"task_id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        statuses = expand_statuses(statuses)
+        if statuses is not None:
+            conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if task_type is not None:
+            conditions.append("type = ?")
+            params.append(task_type)
+        if since is not None:
+            conditions.append("updated_at >= ?")
+            params.append(since)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection().execute(
+            f"SELECT * FROM tasks {where} ORDER BY updated_at DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [self._row_to_task(row) for row in rows]
+    
+    def count_tasks(
+        self,
+        statuses: Optional[List[str]] = None,
+        task_type: Optional[str] = None,
+        group_by: str = "status"
+    ) -> Dict[Optional[str], int]:
+        if group_by not in GROUP_FIELDS:
+            raise ValueError(f"No se puede agrupar por {group_by}")
+        conditions, params = [], []
+        statuses = expand_statuses(statuses)
+        if statuses is not None:
+            conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if task_type is not None:
+            conditions.append("type = ?")
+            params.append(task_type)
+        
+        column = GROUP_FIELDS[group_by]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection().execute(
+            f"SELECT {column} AS value, COUNT(*) AS total FROM tasks {where} GROUP BY {column}",
+            params,
+        )
+        return {row["value"]: row["total"] for row in rows}
+    
+    def queue_stats(self) -> Dict:
+        conn = self._connection()
+        by_status = {
+            row["status"]: row["total"]
+            for row in conn.execute(
+                "SELECT status, COUNT(*) AS total FROM tasks GROUP BY status"
+            )
+        }
+        waits = [
+            row[0] for row in conn.execute(
+                """
+                SELECT json_extract(data, '$.started_at') - created_at FROM tasks
+                WHERE json_extract(data, '$.started_at') IS NOT NULL AND created_at >= ?
+                """,
+                (time.time() - QUEUE_STATS_WINDOW,),
+            )
+        ]
+        return _queue_summary(by_status, waits)
+    
+    def current_cursor(self) -> int:
+        return self._connection().execute(
+            "SELECT value FROM counters WHERE name = 'seq'"
+        ).fetchone()[0]
+    
+    def changes_since(self, cursor: int) -> Tuple[int, List[Dict]]:
+        rows = self._connection().execute(
+            "SELECT * FROM tasks WHERE seq > ? ORDER BY seq", (cursor,)
+        ).fetchall()
+        if rows:
+            return rows[-1]["seq"], [self._row_to_task(row) for row in rows]
+        return cursor, []
+    
+    def evict_expired(self) -> int:
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        with self._transaction() as conn:
+            expired = conn.execute(
+                f"DELETE FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*FINISHED_STATUSES, time.time() - self.ttl),
+            ).rowcount
+            # Límite duro por si llegan muchas tareas dentro del TTL
+            excess = conn.execute(
+                f"""
+                DELETE FROM tasks WHERE task_id IN (
+                    SELECT task_id FROM tasks WHERE status IN ({placeholders})
+                    ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (*FINISHED_STATUSES, self.max_finished),
+            ).rowcount
+        return expired + excess
+    
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row["owner"] != instance_id() and row["expires_at"] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, instance_id(), now + ttl),
+            )
+        return True
+    
+    def heartbeat(self):
+        with self._transaction() as conn:
+            self._beat(conn)
+    
+    @staticmethod
+    def _owner_alive(
+        owner_pid: Optional[int],
+        owner_instance: Optional[str],
+        beat: Optional[sqlite3.Row]
+    ) -> bool:
+        if owner_instance is not None and owner_instance == instance_id():
+            return True
+        if owner_instance is None or beat is None:
+            return False
+        if time.time() - beat["heartbeat_at"] > TASK_HEARTBEAT_TIMEOUT:
+            return False
+        if beat["host"] != host_id():
+            # Otra máquina o contenedor: sus PIDs no son los nuestros
+            return True
+        # Un PID lo tiene un solo proceso vivo: si es el nuestro, el dueño
+        # era un arranque anterior (p. ej. PID 1 en un contenedor)
+        return owner_pid != os.getpid() and _pid_alive(owner_pid)
+    
+    def recover_interrupted(self) -> int:
+        placeholders = ",".join("?" * len(RUNNING_STATUSES))
+        recovered = 0
+        with self._transaction() as conn:
+            beats = {
+                row["instance_id"]: row
+                for row in conn.execute("SELECT instance_id, host, heartbeat_at FROM instances")
+            }
+            rows = conn.execute(
+                f"SELECT * FROM tasks WHERE status IN ({placeholders})",
+                RUNNING_STATUSES,
+            ).fetchall()
+            for row in rows:
+                if self._owner_alive(row["owner_pid"], row["owner_instance"], beats.get(row["owner_instance"])):
+                    continue
+                task = self._row_to_task(row)
+                task.update(self._recovered_fields(task))
+                task["updated_at"] = time.time()
+                self._write(conn, task, (None, None))
+                recovered += 1
+            # Olvidar los procesos que ya no laten
+            conn.execute(
+                "DELETE FROM instances WHERE heartbeat_at < ? AND instance_id != ?",
+                (time.time() - TASK_HEARTBEAT_TIMEOUT, instance_id()),
+            )
+        return recovered
+
+
+def get_task_store() -> TaskStore:
+    """
+    Crear el almacén de tareas configurado (SHELU_TASK_STORE)
+    """
+    if TASK_STORE_BACKEND == "memory":
+        return MemoryTaskStore()
+    return SQLiteTaskStore()
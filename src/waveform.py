@@ -0,0 +1,251 @@
+"""
+Picos de forma de onda precalculados
+
+Calcula una pirámide de picos mínimo/máximo (varios niveles de zoom) con
+NumPy y la guarda en un archivo binario compacto junto al audio
+(``cancion.mp3`` -> ``cancion.peaks``; las pistas de un contenedor usan
+``cancion.stems.<pista>.peaks``), para dibujar la forma de onda sin
+descargar ni decodificar el MP3 en el navegador.
+
+Formato del archivo (little-endian)::
+
+    b"SHPK"  versión(u8)  niveles(u8)  sample_rate(u32)  frames(u64)
+    por nivel:  frames_por_pico(u32)  picos(u32)
+    datos:      por nivel, picos * (min int8, max int8)
+"""
+import os
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.audio_io import decode_blocks, SAMPLE_RATE
+from src.metrics import record_cache
+from src.stem_container import artifact_base, audio_mtime, list_stems
+
+
+PEAKS_MAGIC = b"SHPK"
+PEAKS_VERSION = 1
+PEAKS_EXTENSION = ".peaks"
+
+# Frames por pico del nivel más detallado y factor entre niveles
+BASE_FRAMES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+LEVELS = 5
+
+_HEADER = struct.Struct("<4sBBIQ")
+_LEVEL = struct.Struct("<II")
+_LEVEL_RESPONSE = struct.Struct("<4sBIIQI")
+
+
+def peaks_path_for(audio_path: str) -> str:
+    """
+    Ruta del archivo de picos de un audio
+    """
+    return artifact_base(audio_path) + PEAKS_EXTENSION
+
+
+def compute_peak_levels(
+    blocks: Iterable[np.ndarray],
+    base: int = BASE_FRAMES_PER_PEAK,
+    factor: int = LEVEL_FACTOR,
+    levels: int = LEVELS
+) -> Tuple[List[np.ndarray], int]:
+    """
+    Calcular la pirámide de picos a partir de bloques de audio
+    
+    Args:
+        blocks: Bloques (frames, canales) float32
+        base: Frames por pico del primer nivel
+        factor: Reducción entre niveles consecutivos
+        levels: Número de niveles
+        
+    Returns:
+        Tupla (lista de arrays (picos, 2) int8 con min/max, frames totales)
+    """
+    mins, maxs = [], []
+    carry = np.zeros(0, dtype=np.float32)
+    total_frames = 0
+    
+    for block in blocks:
+        total_frames += len(block)
+        # Mono conservando los extremos de cualquier canal
+        low = block.min(axis=1)
+        high = block.max(axis=1)
+        mono = np.concatenate([carry, np.stack([low, high], axis=1).ravel()])
+        
+        usable = (len(mono) // (2 * base)) * 2 * base
+        if usable:
+            bins = mono[:usable].reshape(-1, base, 2)
+            mins.append(bins[:, :, 0].min(axis=1))
+            maxs.append(bins[:, :, 1].max(axis=1))
+        carry = mono[usable:]
+    
+    if len(carry):
+        rest = carry.reshape(-1, 2)
+        mins.append(rest[:, 0].min(keepdims=True))
+        maxs.append(rest[:, 1].max(keepdims=True))
+    
+    level_min = np.concatenate(mins) if mins else np.zeros(0, dtype=np.float32)
+    level_max = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.float32)
+    
+    pyramid = []
+    for _ in range(levels):
+        pyramid.append(_quantize(level_min, level_max))
+        
+        # Siguiente nivel: min/max de grupos de ``factor`` picos
+        pad = (-len(level_min)) % factor
+        if pad:
+            level_min = np.concatenate([level_min, np.full(pad, level_min[-1])])
+            level_max = np.concatenate([level_max, np.full(pad, level_max[-1])])
+        level_min = level_min.reshape(-1, factor).min(axis=1) if len(level_min) else level_min
+        level_max = level_max.reshape(-1, factor).max(axis=1) if len(level_max) else level_max
+    
+    return pyramid, total_frames
+
+
+def _quantize(level_min: np.ndarray, level_max: np.ndarray) -> np.ndarray:
+    """
+    Convertir picos float [-1, 1] a pares int8
+    """
+    pairs = np.stack([level_min, level_max], axis=1) if len(level_min) else np.zeros((0, 2))
+    return np.clip(np.round(pairs * 127), -127, 127).astype(np.int8)
+
+
+def write_peaks(
+    peaks_path: str,
+    pyramid: List[np.ndarray],
+    total_frames: int,
+    sample_rate: int = SAMPLE_RATE,
+    base: int = BASE_FRAMES_PER_PEAK,
+    factor: int = LEVEL_FACTOR
+):
+    """
+    Guardar una pirámide de picos en disco (escritura atómica)
+    """
+    temp_path = f"{peaks_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(pyramid), sample_rate, total_frames))
+        for i, level in enumerate(pyramid):
+            f.write(_LEVEL.pack(base * factor ** i, len(level)))
+        for level in pyramid:
+            f.write(level.tobytes())
+    os.replace(temp_path, peaks_path)
+
+
+def read_peaks(peaks_path: str) -> Dict:
+    """
+    Leer un archivo de picos
+    
+    Returns:
+        Diccionario con sample_rate, frames y levels (lista de dicts con
+        frames_per_peak y peaks como array (n, 2) int8)
+    """
+    with open(peaks_path, "rb") as f:
+        data = f.read()
+    
+    magic, version, n_levels, sample_rate, total_frames = _HEADER.unpack_from(data, 0)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError(f"Archivo de picos no válido: {peaks_path}")
+    
+    offset = _HEADER.size
+    level_info = []
+    for _ in range(n_levels):
+        level_info.append(_LEVEL.unpack_from(data, offset))
+        offset += _LEVEL.size
+    
+    levels = []
+    for frames_per_peak, count in level_info:
+        peaks = np.frombuffer(data, dtype=np.int8, count=count * 2, offset=offset).reshape(-1, 2)
+        levels.append({"frames_per_peak": frames_per_peak, "peaks": peaks})
+        offset += count * 2
+    
+    return {"sample_rate": sample_rate, "frames": total_frames, "levels": levels}
+
+
+def generate_peaks(audio_path: str, force: bool = False) -> Optional[str]:
+    """
+    Generar el archivo de picos de un audio si no existe o está desactualizado
+    
+    Args:
+        audio_path: Archivo de audio
+        force: Regenerar aunque ya exista
+        
+    Returns:
+        Ruta del archivo de picos o None si falla
+    """
+    peaks_path = peaks_path_for(audio_path)
+    try:
+        if (not force and os.path.exists(peaks_path)
+                and os.path.getmtime(peaks_path) >= audio_mtime(audio_path)):
+            record_cache("peaks", hit=True)
+            return peaks_path
+        
+        record_cache("peaks", hit=False)
+        pyramid, total_frames = compute_peak_levels(decode_blocks(audio_path))
+        write_peaks(peaks_path, pyramid, total_frames)
+        return peaks_path
+    except Exception as e:
+        print(f"Error al generar picos de {audio_path}: {e}")
+        return None
+
+
+def audio_duration(audio_path: str) -> Optional[float]:
+    """
+    Duración en segundos de un audio según la cabecera de su archivo de picos
+    
+    Returns:
+        Duración o None si el audio no tiene picos
+    """
+    try:
+        with open(peaks_path_for(audio_path), "rb") as f:
+            magic, version, _, sample_rate, total_frames = _HEADER.unpack(f.read(_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION or not sample_rate:
+        return None
+    return total_frames / sample_rate
+
+
+def generate_peaks_for_folder(folder: str) -> List[str]:
+    """
+    Generar los picos de todas las pistas de una canción (carpeta o
+    contenedor)
+    """
+    generated = []
+    for stem_path in list_stems(folder).values():
+        peaks_path = generate_peaks(stem_path)
+        if peaks_path:
+            generated.append(peaks_path)
+    return generated
+
+
+def encode_peak_level(peaks_path: str, level: Optional[int] = None, width: Optional[int] = None) -> bytes:
+    """
+    Extraer un único nivel de un archivo de picos listo para enviar
+    
+    Si se indica ``width`` se elige el nivel más grueso que tenga al menos
+    ese número de picos (lo justo para dibujar a ese ancho en píxeles).
+    
+    Formato (little-endian)::
+    
+        b"SHPK"  versión(u8)  frames_por_pico(u32)  sample_rate(u32)
+        frames(u64)  picos(u32)  datos: picos * (min int8, max int8)
+    """
+    info = read_peaks(peaks_path)
+    levels = info["levels"]
+    
+    if level is None:
+        level = 0
+        if width:
+            for i, candidate in enumerate(levels):
+                if len(candidate["peaks"]) >= width:
+                    level = i
+    level = min(max(level, 0), len(levels) - 1)
+    
+    chosen = levels[level]
+    header = _LEVEL_RESPONSE.pack(
+        PEAKS_MAGIC, PEAKS_VERSION, chosen["frames_per_peak"],
+        info["sample_rate"], info["frames"], len(chosen["peaks"])
+    )
+    return header + chosen["peaks"].tobytes()
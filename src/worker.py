@@ -0,0 +1,83 @@
+"""
+Proceso worker de trabajos pesados
+
+Ejecuta las descargas, separaciones, fragmentos, exportaciones y derivados
+encolados por la API cuando ésta se arranca con SHELU_JOB_MODE=external. Se
+pueden lanzar varios procesos; se reparten los trabajos a través del almacén
+de tareas SQLite.
+
+Uso:
+    python -m src.worker [--download-slots N] [--separation-slots N] [--excerpt-slots N]
+                         [--export-slots N] [--artifact-slots N]
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+
+# Añadir la raíz del proyecto al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.analysis import shutdown_analysis_pool
+from src.config import (
+    ARTIFACT_SLOTS,
+    DOWNLOAD_SLOTS,
+    EXCERPT_SLOTS,
+    EXPORT_SLOTS,
+    SEPARATION_SLOTS,
+    TASK_STORE_BACKEND,
+)
+from src.jobs import JobWorker
+from src.metrics import start_snapshot_writer
+from src.task_store import get_task_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de descargas y separaciones")
+    parser.add_argument("--download-slots", type=int, default=DOWNLOAD_SLOTS,
+                        help="Descargas simultáneas en este proceso")
+    parser.add_argument("--separation-slots", type=int, default=SEPARATION_SLOTS,
+                        help="Separaciones simultáneas en este proceso")
+    parser.add_argument("--excerpt-slots", type=int, default=EXCERPT_SLOTS,
+                        help="Separaciones de fragmentos simultáneas en este proceso")
+    parser.add_argument("--export-slots", type=int, default=EXPORT_SLOTS,
+                        help="Exportaciones por lotes simultáneas en este proceso")
+    parser.add_argument("--artifact-slots", type=int, default=ARTIFACT_SLOTS,
+                        help="Trabajos de formas de onda, previsualizaciones y sonoridad simultáneos")
+    args = parser.parse_args()
+    
+    if TASK_STORE_BACKEND == "memory":
+        print("❌ Error: el worker necesita el almacén compartido (SHELU_TASK_STORE=sqlite)")
+        sys.exit(1)
+    
+    task_store = get_task_store()
+    recovered = task_store.recover_interrupted()
+    if recovered:
+        print(f"⚠️  {recovered} tareas interrumpidas recuperadas (los trabajos vuelven a la cola)")
+    
+    worker = JobWorker(task_store, slots={
+        "download": args.download_slots,
+        "separate": args.separation_slots,
+        "excerpt": args.excerpt_slots,
+        "export": args.export_slots,
+        "artifacts": args.artifact_slots,
+    })
+    
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    
+    print(f"🔧 Worker {os.getpid()} esperando trabajos...")
+    worker.start()
+    start_snapshot_writer()
+    while not stop.wait(1):
+        pass
+    
+    print(f"🛑 Worker {os.getpid()} deteniéndose, esperando trabajos en curso...")
+    worker.stop()
+    shutdown_analysis_pool()
+
+
+if __name__ == "__main__":
+    main()
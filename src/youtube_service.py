@@ -1,11 +1,23 @@
 """
 Servicio de búsqueda y descarga de YouTube
 """
-import yt_dlp
+import glob
 import os
 import re
+import shutil
+import threading
+from concurrent.futures import Future
 from typing import List, Dict, Optional
-from src.download_music import find_ffmpeg
+from src.cancellation import JobCancelled, check_cancelled
+from src.capabilities import ffmpeg_location, deno_location
+from src.config import DOWNLOADS_DIR
+from src import library_index
+from src.metrics import record_cache
+
+
+# Descargas en curso por video_id (para que peticiones simultáneas se unan)
+_inflight_lock = threading.Lock()
+_inflight_downloads: Dict[str, Future] = {}
 
 
 def search_youtube(query: str, max_results: int = 5) -> List[Dict]:
@@ -19,6 +31,9 @@ def search_youtube(query: str, max_results: int = 5) -> List[Dict]:
     Returns:
         Lista de diccionarios con información de videos
     """
+    # Importación diferida: yt-dlp tarda en cargar y la API no lo necesita al arrancar
+    import yt_dlp
+    
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
@@ -67,6 +82,10 @@ def download_audio(
     """
     Descargar audio de YouTube
     
+    Si el video ya está en la biblioteca se reutiliza el archivo existente,
+    y si otra petición ya lo está descargando se espera a esa misma descarga
+    en lugar de lanzar una segunda.
+    
     Args:
         video_id: ID del video de YouTube
         title: Título del video
@@ -76,6 +95,64 @@ def download_audio(
     Returns:
         Ruta del archivo descargado o None si falla
     """
+    existing = _find_downloaded(video_id)
+    record_cache("library", hit=bool(existing))
+    if existing:
+        print(f"✓ Audio ya descargado: {existing}")
+        return existing
+    
+    with _inflight_lock:
+        future = _inflight_downloads.get(video_id)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight_downloads[video_id] = future
+    
+    if not is_owner:
+        print(f"↻ Esperando descarga en curso de {video_id}")
+        return future.result()
+    
+    file_path = None
+    try:
+        # Puede haber terminado otra descarga entre la comprobación y el registro
+        file_path = _find_downloaded(video_id) or _download_audio(
+            video_id, title, artist, output_folder
+        )
+        return file_path
+    finally:
+        with _inflight_lock:
+            _inflight_downloads.pop(video_id, None)
+        future.set_result(file_path)
+
+
+def _find_downloaded(video_id: str) -> Optional[str]:
+    """
+    Buscar en el índice un archivo ya descargado para el video
+    """
+    try:
+        track = library_index.get_track_by_video(video_id)
+    except Exception as e:
+        print(f"Error al consultar el índice: {e}")
+        return None
+    
+    if track and os.path.exists(track['file_path']):
+        return track['file_path']
+    return None
+
+
+def _download_audio(
+    video_id: str,
+    title: str,
+    artist: Optional[str],
+    output_folder: str
+) -> Optional[str]:
+    """
+    Descargar el audio en la carpeta de staging y moverlo a la biblioteca
+    
+    La descarga se guarda como ``DOWNLOADS_DIR/<video_id>.*`` para que un
+    ``.part`` interrumpido se reanude en el siguiente intento aunque cambie
+    el título o el artista. Si el trabajo se cancela se borra lo descargado.
+    """
     try:
         # Crear estructura de carpetas
         if artist:
@@ -86,80 +163,123 @@ def download_audio(
             output_path = output_folder
             os.makedirs(output_path, exist_ok=True)
         
+        os.makedirs(DOWNLOADS_DIR, exist_ok=True)
+        
         # Sanitizar título
         safe_title = sanitize_filename(title)
+        file_path = _library_path(output_path, safe_title, video_id)
+        staged_path = os.path.join(DOWNLOADS_DIR, f"{video_id}.mp3")
         
-        # Buscar FFmpeg
-        ffmpeg_location = find_ffmpeg()
-        
-        # Buscar Deno en ubicaciones comunes de Windows
-        deno_paths = [
-            os.path.expandvars(r'%USERPROFILE%\.deno\bin\deno.exe'),
-            os.path.expandvars(r'%LOCALAPPDATA%\deno\bin\deno.exe'),
-            r'C:\Program Files\deno\deno.exe',
-            # Ruta de instalación de WinGet
-            os.path.expandvars(r'%LOCALAPPDATA%\Microsoft\WinGet\Packages\DenoLand.Deno_Microsoft.Winget.Source_8wekyb3d8bbwe\deno.exe'),
-        ]
-        deno_location = None
-        for deno_path in deno_paths:
-            if os.path.exists(deno_path):
-                deno_location = deno_path
-                break
-        
-        # Configurar opciones de descarga mejoradas
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'outtmpl': os.path.join(output_path, f'{safe_title}.%(ext)s'),
-            'quiet': False,
-            'no_warnings': False,
-            # Opciones para evitar errores 403
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android', 'web'],
-                    'player_skip': ['webpage', 'configs'],
-                }
-            },
-            # Headers y opciones de seguridad
-            'nocheckcertificate': True,
-            'allow_unplayable_formats': False,
-        }
-        
-        # Agregar runtime de JavaScript si está disponible
-        if deno_location:
-            # Configurar el runtime de JavaScript para el extractor de YouTube
-            if 'extractor_args' not in ydl_opts:
-                ydl_opts['extractor_args'] = {}
-            if 'youtube' not in ydl_opts['extractor_args']:
-                ydl_opts['extractor_args']['youtube'] = {}
-            
-            # Usar la opción correcta para el runtime
-            ydl_opts['extractor_args']['youtube']['js_runtimes'] = f'deno:{deno_location}'
-            print(f"✓ Deno encontrado en: {deno_location}")
+        # Un MP3 ya convertido en staging (p.ej. el servidor cayó al moverlo)
+        # no necesita descargarse de nuevo
+        if not os.path.exists(staged_path):
+            _run_ytdlp(video_id)
         
-        if ffmpeg_location:
-            ydl_opts['ffmpeg_location'] = ffmpeg_location
-        
-        # Descargar
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        if not os.path.exists(staged_path):
+            print(f"✗ No se encontró el archivo: {staged_path}")
+            return None
         
-        # Ruta del archivo resultante
-        file_path = os.path.join(output_path, f"{safe_title}.mp3")
+        try:
+            os.replace(staged_path, file_path)
+        except OSError:
+            # Staging y biblioteca en distintos discos
+            shutil.move(staged_path, file_path)
+        library_index.record_track(video_id, file_path, artist, title)
         
-        if os.path.exists(file_path):
-            print(f"✓ Audio descargado: {file_path}")
-            return file_path
-        else:
-            print(f"✗ No se encontró el archivo: {file_path}")
-            return None
-            
+        print(f"✓ Audio descargado: {file_path}")
+        return file_path
+    
+    except JobCancelled:
+        _discard_staging(video_id)
+        raise
     except Exception as e:
         print(f"Error al descargar: {e}")
         return None
+
+
+def _library_path(output_path: str, safe_title: str, video_id: str) -> str:
+    """
+    Ruta del MP3 en la biblioteca sin pisar la de otro video
+    
+    Si ya existe ``<título>.mp3`` y no es de este video (otra canción con el
+    mismo artista y título, o un archivo que no se descargó de YouTube), se
+    usa ``<título> [<video_id>].mp3``.
+    """
+    file_path = os.path.join(output_path, f"{safe_title}.mp3")
+    if not os.path.exists(file_path):
+        return file_path
+    
+    owner = library_index.get_track_by_file(file_path)
+    if owner and owner['video_id'] == video_id:
+        return file_path
+    print(f"⚠️  {file_path} ya es de otra canción, se guarda con el ID del video")
+    return os.path.join(output_path, f"{safe_title} [{video_id}].mp3")
+
+
+def _discard_staging(video_id: str):
+    """
+    Borrar lo descargado de un video en staging (``.part`` incluidos)
+    """
+    for path in glob.glob(os.path.join(glob.escape(DOWNLOADS_DIR), f"{glob.escape(video_id)}.*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    print(f"🗑️  Descarga cancelada: {video_id}")
+
+
+def _run_ytdlp(video_id: str):
+    """
+    Ejecutar yt-dlp para un video dejando el MP3 en la carpeta de staging
+    """
+    import yt_dlp
+    
+    # Herramientas descubiertas una vez por proceso (src/capabilities.py)
+    ffmpeg_dir = ffmpeg_location()
+    deno_path = deno_location()
+    
+    # Configurar opciones de descarga mejoradas
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': '192',
+        }],
+        'outtmpl': os.path.join(DOWNLOADS_DIR, f'{video_id}.%(ext)s'),
+        'quiet': False,
+        'no_warnings': False,
+        # Reanudar descargas interrumpidas desde el .part
+        'continuedl': True,
+        'nopart': False,
+        'retries': 10,
+        'fragment_retries': 10,
+        # Opciones para evitar errores 403
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+        'extractor_args': {
+            'youtube': {
+                'player_client': ['android', 'web'],
+                'player_skip': ['webpage', 'configs'],
+            }
+        },
+        # Headers y opciones de seguridad
+        'nocheckcertificate': True,
+        'allow_unplayable_formats': False,
+        # Puntos de cancelación: cada bloque descargado y cada conversión
+        'progress_hooks': [lambda status: check_cancelled()],
+        'postprocessor_hooks': [lambda status: check_cancelled()],
+    }
+    
+    # Agregar runtime de JavaScript si está disponible
+    if deno_path:
+        # Usar la opción correcta para el runtime
+        ydl_opts['extractor_args']['youtube']['js_runtimes'] = f'deno:{deno_path}'
+        print(f"✓ Deno encontrado en: {deno_path}")
+    
+    if ffmpeg_dir:
+        ydl_opts['ffmpeg_location'] = ffmpeg_dir
+    
+    # Descargar
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([url])
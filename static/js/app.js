@@ -9,6 +9,11 @@ let selectedTracks = [];
 let playQueue = [];
 let currentTrackIndex = 0;
 let audioPlayers = []; // Array de reproductores para múltiples pistas
+let taskListeners = {}; // Callbacks por tarea (taskId -> función)
+let untrackedTaskUpdates = {}; // Eventos recibidos antes de registrar la tarea
+let taskStream = null; // Conexión SSE con el servidor
+let taskStreamIds = new Set(); // Tareas que envía la conexión actual
+let taskPollingTimer = null; // Polling de respaldo si no hay SSE
 
 // Inicialización
 document.addEventListener('DOMContentLoaded', () => {
@@ -17,7 +22,7 @@ document.addEventListener('DOMContentLoaded', () => {
     initLibrary();
     initModal();
     initExplorer();
-    startTaskPolling();
+    startTaskUpdates();
 });
 
 // === TABS ===
@@ -152,13 +157,30 @@ async function handleDownload(e) {
         
         const data = await response.json();
         
-        if (data.success) {
-            currentTasks[data.task_id] = {
+        if (data.success && response.status === 202) {
+            // La descarga sigue en marcha: se sigue desde el stream de tareas
+            btn.textContent = 'En cola...';
+            trackTask(data.task_id, {
+                type: 'download',
+                title,
+                status: data.status
+            }, (task) => {
+                if (task.status === 'completed') {
+                    btn.textContent = '✓ Descargado';
+                    btn.classList.remove('btn-success');
+                    btn.classList.add('btn-secondary');
+                } else if (FINISHED_STATUSES.includes(task.status)) {
+                    btn.textContent = '✗ Error';
+                    btn.disabled = false;
+                }
+            });
+        } else if (data.success) {
+            trackTask(data.task_id, {
                 type: 'download',
                 title,
                 status: 'completed',
                 file_path: data.file_path
-            };
+            });
             
             btn.textContent = '✓ Descargado';
             btn.classList.remove('btn-success');
@@ -361,53 +383,140 @@ async function startSeparation() {
         const data = await response.json();
         
         if (data.success) {
-            currentTasks[data.task_id] = {
+            trackTask(data.task_id, {
                 type: 'separation',
                 title: currentSongForSeparation.title,
-                status: 'processing',
+                status: 'queued',
                 progress: 0
-            };
+            });
             
             document.getElementById('separateModal').classList.remove('active');
             
             // Cambiar a tab de tareas
             document.querySelector('.tab[data-tab="tasks"]').click();
             
-            alert('Separación iniciada. Puedes ver el progreso en la pestaña "Tareas"');
+            alert('Separación en cola. Puedes ver el progreso en la pestaña "Tareas"');
         } else {
-            throw new Error('Error al iniciar separación');
+            // 429: la cola está llena, el servidor indica cuándo reintentar
+            throw new Error(data.detail || 'Error al iniciar separación');
         }
     } catch (error) {
         console.error('Error al separar:', error);
-        alert('Error al iniciar la separación');
+        alert(`Error al iniciar la separación: ${error.message}`);
     }
 }
 
 // === TAREAS ===
+const FINISHED_STATUSES = ['completed', 'error', 'interrupted', 'cancelled'];
+
+function startTaskUpdates() {
+    // Sin soporte de SSE en el navegador, usar polling
+    if (!window.EventSource) {
+        startTaskPolling();
+        return;
+    }
+    
+    // El servidor sólo envía las tareas pedidas: al seguir una nueva se
+    // reabre la conexión (ver trackTask)
+    taskStreamIds = new Set(Object.keys(currentTasks));
+    const ids = [...taskStreamIds].join(',');
+    taskStream = new EventSource(`${API_URL}/tasks/stream?ids=${encodeURIComponent(ids)}`);
+    
+    taskStream.addEventListener('task', (e) => {
+        const data = JSON.parse(e.data);
+        applyTaskUpdate(data.task_id, data);
+    });
+    
+    taskStream.addEventListener('open', () => {
+        // El stream volvió: detener el polling de respaldo si estaba activo
+        stopTaskPolling();
+    });
+    
+    taskStream.onerror = () => {
+        // EventSource reintenta solo; si queda cerrado (p.ej. el servidor no
+        // tiene el endpoint) pasar a polling
+        if (taskStream.readyState === EventSource.CLOSED) {
+            console.warn('Stream de tareas no disponible, usando polling');
+            taskStream = null;
+            startTaskPolling();
+        }
+    };
+}
+
 function startTaskPolling() {
-    setInterval(updateTasks, 2000);
+    if (taskPollingTimer) return;
+    taskPollingTimer = setInterval(updateTasks, 2000);
 }
 
-async function updateTasks() {
-    for (const taskId in currentTasks) {
-        if (currentTasks[taskId].status === 'processing') {
-            try {
-                const response = await fetch(`${API_URL}/task/${taskId}`);
-                const data = await response.json();
-                
-                currentTasks[taskId] = {
-                    ...currentTasks[taskId],
-                    ...data
-                };
-            } catch (error) {
-                console.error('Error al actualizar tarea:', error);
-            }
+function stopTaskPolling() {
+    if (!taskPollingTimer) return;
+    clearInterval(taskPollingTimer);
+    taskPollingTimer = null;
+}
+
+// Registrar una tarea y (opcionalmente) un callback para sus cambios
+function trackTask(taskId, task, onUpdate) {
+    currentTasks[taskId] = task;
+    if (onUpdate) taskListeners[taskId] = onUpdate;
+    
+    if (taskStream && !taskStreamIds.has(taskId)) {
+        taskStream.close();
+        taskStream = null;
+        startTaskUpdates();
+    }
+    
+    // El stream puede adelantarse a la respuesta que nos dio el taskId
+    const early = untrackedTaskUpdates[taskId];
+    delete untrackedTaskUpdates[taskId];
+    if (early) {
+        applyTaskUpdate(taskId, early);
+    } else {
+        renderTasks();
+    }
+}
+
+function applyTaskUpdate(taskId, data) {
+    if (!currentTasks[taskId]) {
+        // Guardar sólo los más recientes (el stream incluye tareas de otros)
+        untrackedTaskUpdates[taskId] = data;
+        const keys = Object.keys(untrackedTaskUpdates);
+        if (keys.length > 50) delete untrackedTaskUpdates[keys[0]];
+        return;
+    }
+    
+    currentTasks[taskId] = {
+        ...currentTasks[taskId],
+        ...data
+    };
+    
+    const listener = taskListeners[taskId];
+    if (listener) {
+        listener(currentTasks[taskId]);
+        if (FINISHED_STATUSES.includes(currentTasks[taskId].status)) {
+            delete taskListeners[taskId];
         }
     }
     
     renderTasks();
 }
 
+async function updateTasks() {
+    const pending = Object.keys(currentTasks)
+        .filter(taskId => !FINISHED_STATUSES.includes(currentTasks[taskId].status));
+    
+    if (pending.length === 0) return;
+    
+    try {
+        // Una sola petición para todas las tareas pendientes
+        const response = await fetch(`${API_URL}/tasks?ids=${encodeURIComponent(pending.join(','))}`);
+        const data = await response.json();
+        
+        (data.tasks || []).forEach(task => applyTaskUpdate(task.task_id, task));
+    } catch (error) {
+        console.error('Error al actualizar tareas:', error);
+    }
+}
+
 function renderTasks() {
     const container = document.getElementById('tasksList');
     const tasks = Object.entries(currentTasks);
@@ -426,7 +535,12 @@ function renderTasks() {
                         ${task.type === 'download' ? '⬇️ Descarga' : '🎵 Separación'}
                     </div>
                 </div>
-                <div class="task-status ${task.status}">${getStatusText(task.status)}</div>
+                <div>
+                    <span class="task-status ${task.status}">${getStatusText(task.status)}</span>
+                    ${FINISHED_STATUSES.includes(task.status) ? '' : `
+                        <button class="task-cancel" title="Cancelar" onclick="cancelTask('${taskId}')">✕</button>
+                    `}
+                </div>
             </div>
             <div>${task.message || ''}</div>
             ${task.progress !== undefined ? `
@@ -440,14 +554,29 @@ function renderTasks() {
 
 function getStatusText(status) {
     const statusMap = {
+        'queued': 'En cola',
         'downloading': 'Descargando',
         'processing': 'Procesando',
         'completed': 'Completado',
-        'error': 'Error'
+        'error': 'Error',
+        'interrupted': 'Interrumpida',
+        'cancelled': 'Cancelada'
     };
     return statusMap[status] || status;
 }
 
+async function cancelTask(taskId) {
+    try {
+        const response = await fetch(`${API_URL}/task/${encodeURIComponent(taskId)}`, { method: 'DELETE' });
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.detail || `HTTP ${response.status}`);
+        applyTaskUpdate(taskId, data.task);
+    } catch (error) {
+        console.error('Error al cancelar:', error);
+        alert(`No se pudo cancelar la tarea: ${error.message}`);
+    }
+}
+
 // === UTILIDADES ===
 function escapeHtml(text) {
     const div = document.createElement('div');
@@ -532,6 +661,15 @@ function renderMusicTree(tree) {
     });
 }
 
+const STEM_ICONS = {
+    'vocals': '🎤',
+    'drums': '🥁',
+    'bass': '🎸',
+    'guitar': '🎸',
+    'piano': '🎹',
+    'other': '🎼'
+};
+
 function renderSong(artistName, song) {
     const songId = `${artistName}-${song.name}`.replace(/[^a-zA-Z0-9]/g, '_');
     
@@ -560,38 +698,51 @@ function renderSong(artistName, song) {
                     <span class="tree-icon">▶</span>
                     <span class="tree-song-name">🎵 ${escapeHtml(song.name)}</span>
                     <span class="tree-song-badge">${song.stems.length} pistas</span>
+                    ${song.bpm ? `<span class="tree-song-badge">${Math.round(song.bpm)} BPM</span>` : ''}
+                    ${song.key ? `<span class="tree-song-badge">${escapeHtml(song.key)}</span>` : ''}
                 </div>
             </div>
             <div class="tree-stems" id="song-${songId}">
                 ${song.stems.map(stem => renderStem(artistName, song.name, stem)).join('')}
+                ${(song.silent_stems || []).map(entry => renderSilentStem(entry)).join('')}
             </div>
         </div>
     `;
 }
 
 function renderStem(artistName, songName, stem) {
-    const stemIcons = {
-        'vocals': '🎤',
-        'drums': '🥁',
-        'bass': '🎸',
-        'guitar': '🎸',
-        'piano': '🎹',
-        'other': '🎼'
-    };
-    
-    const icon = stemIcons[stem.name] || '🎵';
-    const size = (stem.size / (1024 * 1024)).toFixed(2);
+    const icon = STEM_ICONS[stem.name] || '🎵';
+    // Las pistas de un contenedor multipista no tienen tamaño propio
+    const size = stem.size != null ? `${(stem.size / (1024 * 1024)).toFixed(2)} MB` : '';
     const trackId = `${artistName}-${songName}-${stem.name}`.replace(/[^a-zA-Z0-9]/g, '_');
     
     return `
         <div class="tree-stem">
             <div class="tree-stem-info">
                 <input type="checkbox" class="stem-checkbox" id="check-${trackId}"
-                       onchange="toggleTrackSelection('${trackId}', '${escapeHtml(artistName)}', '${escapeHtml(songName)}', '${escapeHtml(stem.name)}', '${stem.file_path}')">
+                       onchange="toggleTrackSelection('${trackId}', '${escapeHtml(artistName)}', '${escapeHtml(songName)}', '${escapeHtml(stem.name)}', '${stem.file_path}', '${escapeHtml(stem.stream_url || '/' + stem.file_path)}')">
                 <span class="stem-icon">${icon}</span>
                 <span class="stem-name">${escapeHtml(stem.name)}</span>
             </div>
-            <span class="stem-size">${size} MB</span>
+            <canvas class="stem-waveform" data-peaks-url="${escapeHtml(stem.peaks_url || '')}"></canvas>
+            <span class="stem-size">${size}</span>
+        </div>
+    `;
+}
+
+// Pista descartada al separar por estar vacía: se muestra atenuada y sin
+// casilla (no hay archivo que reproducir)
+function renderSilentStem(entry) {
+    const icon = STEM_ICONS[entry.stem] || '🎵';
+    const level = entry.peak_db != null ? `Pico ${entry.peak_db} dBFS` : 'Silencio digital';
+    
+    return `
+        <div class="tree-stem tree-stem-silent" title="${escapeHtml(level)}">
+            <div class="tree-stem-info">
+                <span class="stem-icon">${icon}</span>
+                <span class="stem-name">${escapeHtml(entry.stem)}</span>
+            </div>
+            <span class="stem-size">🔇 Vacía</span>
         </div>
     `;
 }
@@ -612,9 +763,55 @@ function toggleSong(songId) {
     element.classList.toggle('show');
     header.querySelector('.tree-icon').style.transform = 
         element.classList.contains('show') ? 'rotate(90deg)' : '';
+    
+    // Dibujar las formas de onda al desplegar (sólo la primera vez)
+    if (element.classList.contains('show')) {
+        element.querySelectorAll('canvas.stem-waveform:not([data-drawn])').forEach(drawWaveform);
+    }
 }
 
-function toggleTrackSelection(trackId, artist, song, stem, filePath) {
+// === FORMAS DE ONDA ===
+// Los picos llegan precalculados del servidor (unos pocos KB por pista):
+// cabecera de 25 bytes + pares (min, max) int8
+async function drawWaveform(canvas) {
+    const url = canvas.dataset.peaksUrl;
+    if (!url) return;
+    canvas.dataset.drawn = 'true';
+    
+    const width = canvas.clientWidth || 200;
+    const height = canvas.clientHeight || 32;
+    canvas.width = width * window.devicePixelRatio;
+    canvas.height = height * window.devicePixelRatio;
+    
+    try {
+        const response = await fetch(`${url}?width=${width}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        
+        const buffer = await response.arrayBuffer();
+        const view = new DataView(buffer);
+        const count = view.getUint32(21, true);
+        const peaks = new Int8Array(buffer, 25, count * 2);
+        
+        const ctx = canvas.getContext('2d');
+        const mid = canvas.height / 2;
+        const scale = mid / 127;
+        const step = canvas.width / Math.max(count, 1);
+        
+        ctx.fillStyle = getComputedStyle(document.documentElement)
+            .getPropertyValue('--primary-light').trim() || '#818cf8';
+        
+        for (let i = 0; i < count; i++) {
+            const low = peaks[i * 2];
+            const high = peaks[i * 2 + 1];
+            const top = mid - high * scale;
+            ctx.fillRect(i * step, top, Math.max(step, 1), Math.max((high - low) * scale, 1));
+        }
+    } catch (error) {
+        console.error('Error al cargar forma de onda:', error);
+    }
+}
+
+function toggleTrackSelection(trackId, artist, song, stem, filePath, streamUrl) {
     const checkbox = document.getElementById(`check-${trackId}`);
     
     if (checkbox.checked) {
@@ -624,6 +821,7 @@ function toggleTrackSelection(trackId, artist, song, stem, filePath) {
             song,
             stem,
             filePath,
+            streamUrl,
             displayName: `${artist} - ${song} [${stem}]`
         });
     } else {
@@ -704,15 +902,58 @@ function startPlayback() {
     playQueue = [...selectedTracks];
     updateQueueList();
     
-    // Crear un reproductor para cada pista
-    audioPlayers = playQueue.map((track, index) => {
-        const audio = new Audio(`/${track.filePath}`);
-        audio.volume = 1.0;
+    createAudioPlayers(playQueue);
+    
+    console.log('audioPlayers creados:', audioPlayers.length);
+    
+    // Actualizar UI
+    const npTitle = document.getElementById('npTitle');
+    if (npTitle) {
+        npTitle.textContent = `${playQueue.length} pista${playQueue.length > 1 ? 's' : ''}`;
+    }
+    
+    // Reproducir todas las pistas simultáneamente
+    console.log(`Reproduciendo ${audioPlayers.length} pistas...`);
+    audioPlayers.forEach((audio, idx) => {
+        audio.play().then(() => {
+            console.log(`Audio ${idx + 1} reproduciendo`);
+        }).catch(error => {
+            console.error(`Error al reproducir audio ${idx + 1}:`, error);
+        });
+    });
+    
+    isPlaying = true;
+    console.log('isPlaying =', isPlaying, 'audioPlayers.length =', audioPlayers.length);
+    updatePlayerUI();
+}
+
+// Si todas las pistas son de la misma canción, el servidor las mezcla en un
+// único stream (sincronizado y con una sola descarga); si no, un reproductor
+// por pista
+function createAudioPlayers(tracks, startTime = 0) {
+    // En modo vista previa cada pista usa su versión Opus segmentada
+    const previewUrls = isPreviewMode() ? tracks.map(getPreviewUrl) : [];
+    const usePreviews = previewUrls.length > 0 && previewUrls.every(Boolean);
+    
+    const mixUrl = usePreviews ? null : getMixUrl(tracks);
+    const sources = mixUrl
+        ? [{ url: mixUrl, displayName: `Mezcla (${tracks.length} pistas)` }]
+        : tracks.map((track, i) => ({
+            url: usePreviews ? previewUrls[i] : track.streamUrl,
+            displayName: track.displayName
+        }));
+    
+    audioPlayers = sources.map((source, index) => {
+        const audio = usePreviews ? new SegmentedAudio(source.url) : new Audio(source.url);
+        // La mezcla del servidor ya viene normalizada
+        audio.volume = mixUrl ? 1.0 : getNormalizationVolume(tracks[index]);
+        audio.dataset.mixed = mixUrl ? 'true' : 'false';
+        if (startTime > 0) audio.currentTime = startTime;
         
-        console.log(`Creando reproductor ${index + 1}/${playQueue.length}: ${track.displayName}`);
+        console.log(`Creando reproductor ${index + 1}/${sources.length}: ${source.displayName}`);
         
         audio.addEventListener('error', (e) => {
-            console.error(`Error al cargar ${track.displayName}:`, e);
+            console.error(`Error al cargar ${source.displayName}:`, e);
         });
         
         // Evento cuando termina la reproducción
@@ -738,28 +979,165 @@ function startPlayback() {
         
         return audio;
     });
+}
+
+function getMixUrl(tracks) {
+    if (tracks.length < 2) return null;
+    
+    const { artist, song } = tracks[0];
+    if (!tracks.every(track => track.artist === artist && track.song === song)) return null;
+    
+    const songData = musicTree?.artists
+        .find(a => a.name === artist)?.songs
+        .find(s => s.name === song);
+    if (!songData) return null;
+    
+    // Silenciar las pistas de la canción que no están seleccionadas
+    const selected = new Set(tracks.map(track => track.stem));
+    const muted = songData.stems.map(stem => stem.name).filter(name => !selected.has(name));
+    const params = new URLSearchParams();
+    if (muted.length) params.set('mute', muted.join(','));
+    if (isNormalizeMode()) params.set('normalize', 'true');
+    const query = params.toString() ? `?${params}` : '';
+    
+    return `${API_URL}/mix/${encodeURIComponent(artist)}/${encodeURIComponent(song)}${query}`;
+}
+
+function isNormalizeMode() {
+    const toggle = document.getElementById('normalizeToggle');
+    return Boolean(toggle && toggle.checked);
+}
+
+// Volumen que aplica la ganancia de sonoridad de la canción (la misma para
+// todas sus pistas, para no cambiar el balance). HTMLAudioElement no pasa de
+// 1.0, así que sólo se atenúa; la mezcla del servidor aplica la ganancia completa
+function getNormalizationVolume(track) {
+    if (!isNormalizeMode()) return 1.0;
+    const songData = musicTree?.artists
+        .find(a => a.name === track.artist)?.songs
+        .find(s => s.name === track.song);
+    const gainDb = songData?.gain_db;
+    if (gainDb === null || gainDb === undefined) return 1.0;
+    return Math.min(1.0, Math.pow(10, gainDb / 20));
+}
+
+function isPreviewMode() {
+    const toggle = document.getElementById('previewModeToggle');
+    return Boolean(toggle && toggle.checked);
+}
+
+function getPreviewUrl(track) {
+    const songData = musicTree?.artists
+        .find(a => a.name === track.artist)?.songs
+        .find(s => s.name === track.song);
+    const stem = songData?.stems.find(s => s.name === track.stem);
+    return stem?.preview_url || null;
+}
+
+// Reproductor de previsualizaciones segmentadas (index.json + seg_*.opus).
+// Imita la parte de HTMLAudioElement que usa el reproductor: sólo descarga
+// el segmento que suena y precarga el siguiente, así que empieza al instante
+// y un salto sólo pide el segmento de destino.
+class SegmentedAudio {
+    constructor(manifestUrl) {
+        this.baseUrl = manifestUrl.slice(0, manifestUrl.lastIndexOf('/') + 1);
+        this.dataset = {};
+        this.duration = NaN;
+        this.paused = true;
+        this.index = 0;
+        this.listeners = {};
+        this.pendingSeek = null;
+        this.audio = new Audio();
+        
+        this.audio.addEventListener('timeupdate', () => this.emit('timeupdate'));
+        this.audio.addEventListener('ended', () => this.advance());
+        this.audio.addEventListener('error', (e) => this.emit('error', e));
+        
+        this.ready = fetch(manifestUrl)
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then(manifest => {
+                this.manifest = manifest;
+                this.duration = manifest.duration;
+                const start = this.pendingSeek || 0;
+                this.load(this.segmentAt(start), start);
+                this.emit('loadedmetadata');
+            })
+            .catch(error => this.emit('error', error));
+    }
     
-    console.log('audioPlayers creados:', audioPlayers.length);
+    get volume() { return this.audio.volume; }
+    set volume(value) { this.audio.volume = value; }
     
-    // Actualizar UI
-    const npTitle = document.getElementById('npTitle');
-    if (npTitle) {
-        npTitle.textContent = `${playQueue.length} pista${playQueue.length > 1 ? 's' : ''}`;
+    get currentTime() {
+        if (!this.manifest) return this.pendingSeek || 0;
+        return this.manifest.segments[this.index].start + this.audio.currentTime;
     }
     
-    // Reproducir todas las pistas simultáneamente
-    console.log(`Reproduciendo ${audioPlayers.length} pistas...`);
-    audioPlayers.forEach((audio, idx) => {
-        audio.play().then(() => {
-            console.log(`Audio ${idx + 1} reproduciendo`);
-        }).catch(error => {
-            console.error(`Error al reproducir audio ${idx + 1}:`, error);
-        });
-    });
+    set currentTime(time) {
+        if (!this.manifest) {
+            this.pendingSeek = time;
+            return;
+        }
+        const index = this.segmentAt(time);
+        if (index === this.index && this.audio.src) {
+            this.audio.currentTime = time - this.manifest.segments[index].start;
+        } else {
+            this.load(index, time);
+            if (!this.paused) this.audio.play().catch(console.error);
+        }
+    }
     
-    isPlaying = true;
-    console.log('isPlaying =', isPlaying, 'audioPlayers.length =', audioPlayers.length);
-    updatePlayerUI();
+    segmentAt(time) {
+        const segments = this.manifest.segments;
+        const index = segments.findIndex(segment => time < segment.end);
+        return index === -1 ? segments.length - 1 : index;
+    }
+    
+    load(index, time) {
+        const segment = this.manifest.segments[index];
+        this.index = index;
+        this.audio.src = this.baseUrl + segment.file;
+        this.audio.currentTime = Math.max(0, time - segment.start);
+        
+        // Precargar el siguiente segmento en la caché HTTP
+        const next = this.manifest.segments[index + 1];
+        if (next) fetch(this.baseUrl + next.file).catch(() => {});
+    }
+    
+    advance() {
+        if (this.index + 1 >= this.manifest.segments.length) {
+            this.paused = true;
+            this.emit('ended');
+            return;
+        }
+        this.load(this.index + 1, this.manifest.segments[this.index + 1].start);
+        if (!this.paused) this.audio.play().catch(console.error);
+    }
+    
+    play() {
+        this.paused = false;
+        return this.ready.then(() => this.audio.play());
+    }
+    
+    pause() {
+        this.paused = true;
+        this.audio.pause();
+    }
+    
+    addEventListener(type, callback) {
+        (this.listeners[type] = this.listeners[type] || []).push(callback);
+    }
+    
+    emit(type, detail) {
+        (this.listeners[type] || []).forEach(callback => callback(detail));
+    }
+}
+
+function isMixedPlayback() {
+    return audioPlayers.length > 0 && audioPlayers[0].dataset.mixed === 'true';
 }
 
 function togglePlayPause() {
@@ -952,6 +1330,26 @@ function updateQueueList() {
 function removeFromQueue(index, event) {
     if (event) event.stopPropagation();
     
+    // Con mezcla en el servidor hay que pedir una mezcla nueva sin esa pista
+    if (isMixedPlayback()) {
+        const position = audioPlayers[0].currentTime;
+        const wasPlaying = isPlaying;
+        stopAllAudio();
+        playQueue.splice(index, 1);
+        
+        if (playQueue.length === 0) {
+            clearQueue();
+            return;
+        }
+        
+        createAudioPlayers(playQueue, position);
+        if (wasPlaying) audioPlayers.forEach(audio => audio.play().catch(console.error));
+        updateQueueList();
+        document.getElementById('npTitle').textContent = `${playQueue.length} pistas`;
+        updatePlayerUI();
+        return;
+    }
+    
     // Detener y eliminar el reproductor específico
     if (audioPlayers[index]) {
         audioPlayers[index].pause();
@@ -1011,35 +1409,33 @@ async function separateSong(artistName, songName, songPath, btn) {
             const taskId = data.task_id;
             btn.innerHTML = '⏳ 0%';
             
-            const checkProgress = setInterval(async () => {
-                try {
-                    const progressResponse = await fetch(`${API_URL}/task/${taskId}`);
-                    const progressData = await progressResponse.json();
+            trackTask(taskId, {
+                type: 'separation',
+                title: songName,
+                status: 'queued',
+                progress: 0
+            }, (task) => {
+                if (task.status === 'completed') {
+                    btn.innerHTML = '✅ Completado';
                     
-                    console.log('Progreso:', progressData);
+                    // Actualizar árbol después de 2 segundos
+                    setTimeout(() => {
+                        loadMusicTree();
+                    }, 2000);
                     
-                    if (progressData.status === 'completed') {
-                        clearInterval(checkProgress);
-                        btn.innerHTML = '✅ Completado';
-                        
-                        // Actualizar árbol después de 2 segundos
-                        setTimeout(() => {
-                            loadMusicTree();
-                        }, 2000);
-                        
-                    } else if (progressData.status === 'error') {
-                        clearInterval(checkProgress);
-                        btn.disabled = false;
-                        btn.innerHTML = originalText;
-                        alert(`Error al separar: ${progressData.message || progressData.error || 'Error desconocido'}`);
-                        
-                    } else if (progressData.progress !== undefined) {
-                        btn.innerHTML = `⏳ ${Math.round(progressData.progress)}%`;
-                    }
-                } catch (error) {
-                    console.error('Error al verificar progreso:', error);
+                } else if (task.status === 'error') {
+                    btn.disabled = false;
+                    btn.innerHTML = originalText;
+                    alert(`Error al separar: ${task.message || task.error || 'Error desconocido'}`);
+
+                } else if (FINISHED_STATUSES.includes(task.status)) {
+                    btn.disabled = false;
+                    btn.innerHTML = originalText;
+
+                } else if (task.progress !== undefined) {
+                    btn.innerHTML = `⏳ ${Math.round(task.progress)}%`;
                 }
-            }, 1000);
+            });
             
         } else {
             throw new Error(data.message || 'No se recibió task_id del servidor');
@@ -0,0 +1,155 @@
+"""
+Pruebas de la cancelación y el desplazamiento de trabajos en marcha
+
+Uso::
+    
+    python test_cancellation.py
+"""
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from src import youtube_service
+from src.cancellation import CancelToken, JobCancelled, cancellable, run_process, wait
+from src.jobs import JobWorker
+from src.task_store import MemoryTaskStore, TaskStore
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def _wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Tiempo de espera agotado"
+        time.sleep(0.05)
+
+
+def test_run_process_kills_process_group():
+    with tempfile.TemporaryDirectory() as folder:
+        pid_file = os.path.join(folder, "child.pid")
+        token = CancelToken()
+        errors: List[BaseException] = []
+        
+        def run():
+            try:
+                with cancellable(token):
+                    # El hijo en segundo plano es como los workers de demucs
+                    run_process(["sh", "-c", f"sleep 30 & echo $! > {pid_file}; sleep 30"])
+            except BaseException as e:
+                errors.append(e)
+        
+        thread = threading.Thread(target=run)
+        thread.start()
+        _wait_for(lambda: os.path.exists(pid_file) and open(pid_file).read().strip())
+        child = int(open(pid_file).read())
+        
+        started = time.monotonic()
+        token.cancel()
+        thread.join(10)
+        assert not thread.is_alive() and time.monotonic() - started < 5
+        assert len(errors) == 1 and isinstance(errors[0], JobCancelled)
+        _wait_for(lambda: not _alive(child), timeout=2)
+
+
+def test_run_process_without_job():
+    assert run_process(["sh", "-c", "echo ok"]).stdout == b"ok\n"
+    try:
+        run_process(["sh", "-c", "exit 3"])
+    except subprocess.CalledProcessError as e:
+        assert e.returncode == 3
+    else:
+        raise AssertionError("Se esperaba CalledProcessError")
+
+
+def _start_job(store: TaskStore, scratch: Dict[str, str]):
+    """Tomar un trabajo y ejecutarlo en un hilo con un manejador que no acaba"""
+    def handler(task_id: str, job: Dict, task_store: TaskStore):
+        folder = tempfile.mkdtemp()
+        scratch[task_id] = folder
+        try:
+            while True:
+                wait(0.05)
+        finally:
+            os.rmdir(folder)
+    
+    worker = JobWorker(store, slots={})
+    task = store.claim_next()
+    thread = threading.Thread(target=worker._run_job, args=(task, handler))
+    thread.start()
+    _wait_for(lambda: task["task_id"] in scratch)
+    return worker, thread
+
+
+def test_cancel_running_job():
+    store = MemoryTaskStore()
+    store.create("job", "separate", status="queued", job={})
+    scratch: Dict[str, str] = {}
+    worker, thread = _start_job(store, scratch)
+    
+    assert store.cancel("job")["cancel_requested"]
+    worker._check_cancellations()
+    thread.join(5)
+    assert not thread.is_alive()
+    task = store.get("job")
+    assert task["status"] == "cancelled" and task["finished_at"]
+    assert not os.path.exists(scratch["job"])
+
+
+def test_preempt_running_job():
+    store = MemoryTaskStore()
+    store.create("batch", "separate", status="queued", job={}, priority="batch")
+    scratch: Dict[str, str] = {}
+    worker, thread = _start_job(store, scratch)
+    store.create("urgent", "separate", status="queued", job={}, priority="interactive")
+    
+    store.update("batch", preempt_requested="urgent")
+    worker._check_cancellations()
+    thread.join(5)
+    assert not thread.is_alive()
+    # Vuelve a la cola esperando a que empiece el que la desplazó
+    task = store.get("batch")
+    assert task["status"] == "queued" and task["preempted_by"] == "urgent" and task["preemptions"] == 1
+    assert not os.path.exists(scratch["batch"])
+    assert store.claim_next()["task_id"] == "urgent"
+
+
+def test_cancelled_download_discards_staging():
+    token = CancelToken()
+    previous = youtube_service._run_ytdlp, youtube_service.DOWNLOADS_DIR
+    
+    def run(video_id: str):
+        # Descarga a medias que sólo termina si se cancela
+        with open(os.path.join(youtube_service.DOWNLOADS_DIR, f"{video_id}.webm.part"), "wb") as f:
+            f.write(b"partial")
+        token.cancel()
+        wait(5)
+    
+    with tempfile.TemporaryDirectory() as folder:
+        youtube_service._run_ytdlp = run
+        youtube_service.DOWNLOADS_DIR = os.path.join(folder, "downloads")
+        try:
+            with cancellable(token):
+                youtube_service._download_audio("cancelme", "Song", "Artist", os.path.join(folder, "music"))
+        except JobCancelled:
+            pass
+        else:
+            raise AssertionError("Se esperaba JobCancelled")
+        finally:
+            youtube_service._run_ytdlp, youtube_service.DOWNLOADS_DIR = previous
+        assert os.listdir(os.path.join(folder, "downloads")) == []
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
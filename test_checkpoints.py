@@ -0,0 +1,71 @@
+"""
+Pruebas de la división en fragmentos de las separaciones con puntos de control
+
+Uso::
+    
+    python test_checkpoints.py
+"""
+import numpy as np
+
+from src.audio_io import SAMPLE_RATE
+from src.config import CHECKPOINT_MIN_SECONDS
+from src.separation_backends.checkpoints import CONTEXT_SECONDS, _fade_weights, chunk_bounds, use_checkpoints
+
+
+def test_chunk_bounds_cover_audio():
+    frames = 10 * 60 * SAMPLE_RATE + 123
+    bounds = chunk_bounds(frames, chunk_seconds=120)
+    assert len(bounds) == 5
+    assert bounds[0][0] == 0 and bounds[-1][1] == frames
+    # Contiguos, sin huecos ni solapes
+    for (_, end), (start, _) in zip(bounds, bounds[1:]):
+        assert end == start
+    sizes = [end - start for start, end in bounds]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_chunk_bounds_short_audio_is_one_chunk():
+    # Menos de 1,5 fragmentos: uno solo
+    assert chunk_bounds(170 * SAMPLE_RATE, chunk_seconds=120) == [(0, 170 * SAMPLE_RATE)]
+    assert chunk_bounds(1000, chunk_seconds=0) == [(0, 1000)]
+
+
+def test_chunk_bounds_minimum_size():
+    # Cada fragmento cubre al menos los fundidos de sus dos lados
+    bounds = chunk_bounds(60 * SAMPLE_RATE, chunk_seconds=1)
+    assert all(end - start >= 4 * CONTEXT_SECONDS * SAMPLE_RATE - 1 for start, end in bounds)
+
+
+def test_fade_weights_sum_to_one():
+    frames = 600 * SAMPLE_RATE
+    context = int(CONTEXT_SECONDS * SAMPLE_RATE)
+    bounds = chunk_bounds(frames, chunk_seconds=120)
+    total = np.zeros(frames, dtype=np.float64)
+    for index, (start, end) in enumerate(bounds):
+        first, last = index == 0, index == len(bounds) - 1
+        low = start if first else start - context
+        weights = _fade_weights(start, end, first, last, context)
+        assert len(weights) == (end if last else end + context) - low
+        total[low:low + len(weights)] += weights
+    assert np.allclose(total, 1.0, atol=1e-5)
+
+
+def test_fade_weights_single_chunk():
+    weights = _fade_weights(0, 1000, True, True, 100)
+    assert len(weights) == 1000 and np.all(weights == 1.0)
+
+
+
+def test_checkpoints_off_by_default():
+    # Sin SHELU_CHECKPOINT_MIN_SECONDS se separa de una vez aunque se pida
+    if CHECKPOINT_MIN_SECONDS == 0:
+        assert not use_checkpoints({"checkpoint": True}, 3600)
+    assert not use_checkpoints({}, 3600)
+    assert not use_checkpoints({"checkpoint": True}, None)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,101 @@
+"""
+Pruebas de las descargas: peticiones simultáneas del mismo video y archivos
+de la biblioteca con el mismo nombre
+
+Uso::
+    
+    python test_downloads.py
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from src import library_index, youtube_service
+from src.jobs import submit_unique_job
+from src.task_store import SQLiteTaskStore
+
+
+@contextmanager
+def _fake_ytdlp(calls: List[str], delay: float = 0.0) -> Iterator[str]:
+    """Sustituir yt-dlp por una descarga que escribe el MP3 en staging"""
+    previous = youtube_service._run_ytdlp, youtube_service.DOWNLOADS_DIR
+    
+    def run(video_id: str):
+        calls.append(video_id)
+        time.sleep(delay)
+        with open(os.path.join(youtube_service.DOWNLOADS_DIR, f"{video_id}.mp3"), "wb") as f:
+            f.write(video_id.encode())
+    
+    with tempfile.TemporaryDirectory() as folder:
+        youtube_service._run_ytdlp = run
+        youtube_service.DOWNLOADS_DIR = os.path.join(folder, "downloads")
+        try:
+            yield os.path.join(folder, "music")
+        finally:
+            youtube_service._run_ytdlp, youtube_service.DOWNLOADS_DIR = previous
+
+
+def test_concurrent_downloads_share_one_run():
+    calls: List[str] = []
+    video_id = f"v{uuid.uuid4().hex[:8]}"
+    with _fake_ytdlp(calls, delay=0.3) as music:
+        results: List[str] = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                youtube_service.download_audio(video_id, "Song", "Artist", music)
+            ))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert calls == [video_id]
+        assert len(results) == 4 and len(set(results)) == 1 and os.path.exists(results[0])
+
+
+def test_concurrent_submissions_share_one_job():
+    with tempfile.TemporaryDirectory() as folder:
+        store = SQLiteTaskStore(os.path.join(folder, "tasks.db"))
+        created: List[bool] = []
+        
+        def submit():
+            _, new = submit_unique_job(store, "download", {"video_id": "same", "title": "Song"}, ["video_id"])
+            created.append(new)
+            store._connection().close()
+        
+        threads = [threading.Thread(target=submit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(created) == [False] * 7 + [True]
+        assert len(store.list_tasks(task_type="download")) == 1
+        store._connection().close()
+
+
+def test_download_keeps_other_video_file():
+    calls: List[str] = []
+    old_id, new_id = f"o{uuid.uuid4().hex[:8]}", f"n{uuid.uuid4().hex[:8]}"
+    with _fake_ytdlp(calls) as music:
+        first = youtube_service.download_audio(old_id, "Song", "Artist", music)
+        second = youtube_service.download_audio(new_id, "Song", "Artist", music)
+        assert first == os.path.join(music, "Artist", "Song.mp3")
+        assert second == os.path.join(music, "Artist", f"Song [{new_id}].mp3")
+        with open(first, "rb") as f:
+            assert f.read() == old_id.encode()
+        assert library_index.get_track_by_video(new_id)["file_path"] == second.replace('\\', '/')
+        # Volver a descargar el mismo video reutiliza su archivo
+        os.remove(first)
+        assert youtube_service.download_audio(old_id, "Song", "Artist", music) == first
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,68 @@
+"""
+Pruebas de la medida de sonoridad (EBU R128) y la ganancia de normalización
+
+Uso::
+    
+    python test_loudness.py
+"""
+import numpy as np
+
+from src.loudness import MAX_GAIN_DB, MEASURE_SAMPLE_RATE, gain_to_linear, measure_blocks, normalization_gain
+
+
+def _sine(level_db: float, seconds: float, frequency: float = 997.0) -> np.ndarray:
+    t = np.arange(int(seconds * MEASURE_SAMPLE_RATE)) / MEASURE_SAMPLE_RATE
+    mono = 10 ** (level_db / 20) * np.sin(2 * np.pi * frequency * t)
+    return np.stack([mono, mono], axis=1).astype(np.float32)
+
+
+def _blocks(audio: np.ndarray, size: int = 65536):
+    for start in range(0, len(audio), size):
+        yield audio[start:start + size]
+
+
+def test_reference_sine():
+    # Seno estéreo de 1 kHz a -23 dBFS: -23 LUFS (EBU Tech 3341)
+    measured = measure_blocks(_blocks(_sine(-23.0, 20)))
+    assert abs(measured["integrated_lufs"] + 23.0) < 0.1
+    assert abs(measured["true_peak_db"] + 23.0) < 0.1
+
+
+def test_block_size_does_not_matter():
+    audio = _sine(-18.0, 10, frequency=440.0)
+    reference = measure_blocks(_blocks(audio))
+    for size in (1000, 4801, 200000):
+        assert measure_blocks(_blocks(audio, size)) == reference
+
+
+def test_silence_and_short_audio():
+    silence = np.zeros((MEASURE_SAMPLE_RATE * 5, 2), dtype=np.float32)
+    assert measure_blocks(_blocks(silence)) == {"integrated_lufs": None, "true_peak_db": None}
+    assert measure_blocks(_blocks(_sine(-20.0, 0.2)))["integrated_lufs"] is None
+    assert measure_blocks(iter([]))["integrated_lufs"] is None
+
+
+def test_gating_ignores_quiet_passages():
+    # Un tramo muy bajo (bajo la puerta relativa) no baja la medida
+    loud = _sine(-20.0, 10)
+    quiet = _sine(-60.0, 10)
+    alone = measure_blocks(_blocks(loud))["integrated_lufs"]
+    mixed = measure_blocks(_blocks(np.concatenate([loud, quiet])))["integrated_lufs"]
+    assert abs(alone - mixed) < 0.1
+
+
+def test_normalization_gain():
+    assert normalization_gain(None, None) == 0.0
+    assert normalization_gain(-20.0, -10.0, target=-14.0, ceiling=-1.0) == 6.0
+    # El pico real limita la ganancia
+    assert normalization_gain(-20.0, -3.0, target=-14.0, ceiling=-1.0) == 2.0
+    assert normalization_gain(-80.0, -60.0, target=-14.0, ceiling=-1.0) == MAX_GAIN_DB
+    assert abs(gain_to_linear(-6.0) - 0.501) < 0.001
+    assert gain_to_linear(None) == 1.0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
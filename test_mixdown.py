@@ -0,0 +1,54 @@
+"""
+Pruebas de los ajustes de mezcla de /api/mix
+
+Uso::
+    
+    python test_mixdown.py
+"""
+import numpy as np
+
+from src.mixdown import MAX_GAIN, _stem_gains, parse_mix_settings
+
+
+def test_parse_empty():
+    assert parse_mix_settings() == {}
+    assert parse_mix_settings("", "", "") == {}
+
+
+def test_parse_gain_mute_pan():
+    settings = parse_mix_settings("vocals:0.5, drums:1.2", "bass,other", "drums:-0.25")
+    assert settings == {
+        "vocals": {"gain": 0.5},
+        "drums": {"gain": 1.2, "pan": -0.25},
+        "bass": {"mute": True},
+        "other": {"mute": True},
+    }
+
+
+def test_parse_clamps_values():
+    settings = parse_mix_settings("vocals:10,drums:-1", pan="vocals:3,drums:-3")
+    assert settings["vocals"] == {"gain": MAX_GAIN, "pan": 1.0}
+    assert settings["drums"] == {"gain": 0.0, "pan": -1.0}
+
+
+def test_parse_rejects_bad_numbers():
+    for gain, pan in (("vocals:loud", None), (None, "drums:left"), ("vocals", None)):
+        try:
+            parse_mix_settings(gain, pan=pan)
+        except ValueError:
+            continue
+        raise AssertionError(f"Se esperaba ValueError con gain={gain!r} pan={pan!r}")
+
+
+def test_pan_is_balance():
+    # El panorama atenúa el canal contrario sin subir el propio
+    assert np.allclose(_stem_gains({}), [1.0, 1.0])
+    assert np.allclose(_stem_gains({"gain": 0.5, "pan": -1.0}), [0.5, 0.0])
+    assert np.allclose(_stem_gains({"pan": 0.5}), [0.5, 1.0])
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,118 @@
+"""
+Pruebas del planificador de la cola y del control de admisión
+
+Uso::
+    
+    python test_scheduling.py
+"""
+import time
+
+from src import scheduling
+from src.config import ADMISSION_MAX_WAIT, SEPARATION_CAPACITY, SEPARATION_ESTIMATE_SECONDS
+from src.scheduling import AdmissionRejected, check_admission, estimate_wait, pick_next, select_preemptions
+from src.task_store import MemoryTaskStore
+
+
+def _task(task_id, created_at, priority="interactive", fair_key="", preempted_by=None, task_type="separate"):
+    return {
+        "task_id": task_id,
+        "type": task_type,
+        "created_at": created_at,
+        "priority": priority,
+        "fair_key": fair_key,
+        "preempted_by": preempted_by,
+    }
+
+
+def _drain(queued, state):
+    order = []
+    queued = list(queued)
+    while queued:
+        task = pick_next(queued, state)
+        order.append(task["task_id"])
+        queued.remove(task)
+    return order
+
+
+def test_pick_next_empty():
+    assert pick_next([], {}) is None
+
+
+def test_pick_next_oldest_in_key():
+    queued = [_task("b", 2), _task("a", 1), _task("c", 3)]
+    assert _drain(queued, {}) == ["a", "b", "c"]
+
+
+def test_pick_next_weights_classes():
+    # Con pesos 8:1, los batch avanzan pero no bloquean a los interactivos
+    queued = [_task(f"b{i}", i, "batch") for i in range(20)]
+    queued += [_task(f"i{i}", 100 + i, "interactive") for i in range(20)]
+    first = _drain(queued, {})[:9]
+    assert sum(task_id.startswith("i") for task_id in first) == 8
+
+
+def test_pick_next_fair_between_keys():
+    # Un usuario con muchos trabajos no deja esperando a otro
+    queued = [_task(f"a{i}", i, fair_key="ana") for i in range(10)]
+    queued.append(_task("b0", 50, fair_key="beto"))
+    assert "b0" in _drain(queued, {})[:2]
+
+
+def test_pick_next_skips_preempted_until_preemptor_starts():
+    queued = [_task("batch", 1, "batch", preempted_by="inter"), _task("inter", 2)]
+    assert pick_next(queued, {})["task_id"] == "inter"
+    # Sólo queda el desplazado esperando a otro desplazado: nada que tomar
+    assert pick_next([_task("x", 1, preempted_by="y"), _task("y", 2, preempted_by="x")], {}) is None
+
+
+def test_check_admission():
+    store = MemoryTaskStore()
+    check_admission(store, "interactive")
+    assert estimate_wait(store, "interactive") == 0
+    
+    # Suficientes trabajos en cola para superar el límite interactivo
+    count = int(ADMISSION_MAX_WAIT["interactive"] / SEPARATION_ESTIMATE_SECONDS * max(1, SEPARATION_CAPACITY)) + 2
+    now = time.time()
+    for i in range(count):
+        store.create(f"t{i}", "separate", status="queued", priority="interactive", created_at=now + i)
+    try:
+        check_admission(store, "interactive")
+    except AdmissionRejected as e:
+        assert e.retry_after >= 1 and e.estimated_wait > ADMISSION_MAX_WAIT["interactive"]
+    else:
+        raise AssertionError("Se esperaba AdmissionRejected")
+    # La clase batch admite esperas mucho más largas
+    check_admission(store, "batch")
+
+
+def test_select_preemptions():
+    previous = scheduling.PREEMPT_BATCH, scheduling.SEPARATION_CAPACITY
+    scheduling.PREEMPT_BATCH, scheduling.SEPARATION_CAPACITY = True, 2
+    try:
+        store = MemoryTaskStore()
+        now = time.time()
+        store.create("early", "separate", status="processing", priority="batch", started_at=now - 60)
+        store.create("late", "separate", status="processing", priority="batch", started_at=now - 10)
+        store.create("bulk", "separate", status="queued", priority="batch", created_at=now)
+        # Sólo trabajos batch en cola: nadie desplaza a nadie
+        assert select_preemptions(store) == {}
+        
+        store.create("urgent", "separate", status="queued", priority="interactive", created_at=now)
+        # Se desplaza el que empezó más tarde, y sólo una vez
+        assert select_preemptions(store) == {"late": "urgent"}
+        store.update("late", preempt_requested="urgent")
+        assert select_preemptions(store) == {}
+        
+        # Con huecos libres no hace falta desplazar
+        store.update("early", status="completed")
+        store.create("other", "separate", status="queued", priority="interactive", created_at=now + 1)
+        assert select_preemptions(store) == {}
+    finally:
+        scheduling.PREEMPT_BATCH, scheduling.SEPARATION_CAPACITY = previous
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
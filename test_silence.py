@@ -0,0 +1,64 @@
+"""
+Pruebas de la detección de pistas silenciosas antes de codificarlas
+
+Uso::
+    
+    python test_silence.py
+"""
+import os
+import tempfile
+
+import numpy as np
+
+from src.audio_io import SAMPLE_RATE
+from src.separation_backends.base import SeparationBackend
+from src.silence import find_silent_sources, measure_array_levels
+
+
+def _tone(level_db: float, seconds: float = 3.0) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    mono = 10 ** (level_db / 20) * np.sin(2 * np.pi * 440 * t)
+    return np.stack([mono, mono], axis=1).astype(np.float32)
+
+
+class _FakeBackend(SeparationBackend):
+    """Devuelve una voz y dos pistas casi vacías sin separar nada"""
+    
+    name = "fake"
+    
+    def separate(self, audio, stems, options):
+        return {"vocals": _tone(-10), "guitar": _tone(-90), "piano": np.zeros_like(_tone(-10))}
+
+
+def test_measure_array_levels():
+    levels = measure_array_levels(_tone(-20))
+    assert abs(levels["peak_db"] + 20) < 0.1 and levels["complete"]
+    assert measure_array_levels(np.zeros((1000, 2), dtype=np.float32))["peak_db"] is None
+    # Deja de medir al superar el pico indicado
+    assert not measure_array_levels(_tone(-20), stop_above_peak_db=-35)["complete"]
+
+
+def test_find_silent_sources():
+    silent = find_silent_sources({"vocals": _tone(-10), "guitar": _tone(-90)})
+    assert [entry["stem"] for entry in silent] == ["guitar"]
+    # Si todo es silencio se conserva todo
+    assert find_silent_sources({"a": _tone(-90), "b": _tone(-95)}) == []
+
+
+def test_write_stems_skips_silent():
+    sources = _FakeBackend().separate(None, None, {})
+    reported = []
+    with tempfile.TemporaryDirectory() as folder:
+        paths = SeparationBackend._write_stems(
+            sources, folder, {"output_format": "wav", "drop_silent": True, "on_silent_stems": reported.extend}
+        )
+        assert sorted(paths) == ["vocals"]
+        assert sorted(os.listdir(folder)) == ["vocals.wav"]
+    assert sorted(entry["stem"] for entry in reported) == ["guitar", "piano"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
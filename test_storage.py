@@ -0,0 +1,127 @@
+"""
+Pruebas de la selección de lo que se borra al aplicar los presupuestos de
+disco
+
+Uso::
+    
+    python test_storage.py
+"""
+import os
+import tempfile
+import time
+
+from src import storage
+from src.config import MUSIC_DIR, STORAGE_MIN_IDLE_SECONDS
+from src.storage import MB, _scan_stems_folder, _trim, keep_fresh
+
+
+def _entry(path, size_mb, age_days, evictable=True, artifact_class="stems"):
+    return {
+        "class": artifact_class,
+        "path": path,
+        "bytes": int(size_mb * MB),
+        "last_used": time.time() - age_days * 86400,
+        "song": None,
+        "evictable": evictable,
+    }
+
+
+def _evicted(artifacts):
+    return [artifact["path"] for artifact in artifacts if artifact.get("evicted")]
+
+
+def test_trim_evicts_least_recently_used_first():
+    artifacts = [
+        _entry("music/A/new", 10, 1),
+        _entry("music/A/old", 10, 30),
+        _entry("music/A/mid", 10, 10),
+    ]
+    freed = {}
+    _trim(artifacts, artifacts, 15 * MB, freed, dry_run=True)
+    assert _evicted(artifacts) == ["music/A/old", "music/A/mid"]
+    assert freed == {"stems": 20 * MB}
+
+
+def test_trim_keeps_unregenerable_and_recent():
+    recent_days = STORAGE_MIN_IDLE_SECONDS / 86400 / 2
+    artifacts = [
+        _entry("separated/A/legacy", 50, 90, evictable=False),
+        _entry("music/A/orphan", 50, 60, evictable=False),
+        _entry("music/A/recent", 50, recent_days),
+        _entry("music/A/idle", 50, 30),
+    ]
+    freed = {}
+    _trim(artifacts, artifacts, 0, freed, dry_run=True)
+    # Lo no regenerable cuenta para el límite pero no se borra
+    assert _evicted(artifacts) == ["music/A/idle"]
+
+
+def test_trim_counts_contained_artifacts():
+    folder = os.path.join("music", "A", "Song")
+    artifacts = [
+        _entry(folder, 10, 30),
+        _entry(os.path.join(folder, "vocals.peaks"), 1, 40, artifact_class="peaks"),
+    ]
+    freed = {}
+    _trim(artifacts, artifacts, 0, freed, dry_run=True)
+    # Los picos de la carpeta se van con ella
+    assert freed == {"stems": 10 * MB, "peaks": 1 * MB}
+
+
+def test_stems_evictable_only_with_original():
+    root = tempfile.mkdtemp()
+    folder = os.path.join(root, "Song")
+    os.makedirs(folder)
+    with open(os.path.join(folder, "vocals.mp3"), "wb") as f:
+        f.write(b"\0" * 1024)
+    song = folder + ".mp3"
+    
+    stems = _scan_stems_folder(folder, song, {})[0]
+    assert stems["class"] == "stems" and not stems["evictable"]
+    
+    with open(song, "wb") as f:
+        f.write(b"\0")
+    assert _scan_stems_folder(folder, song, {})[0]["evictable"]
+
+
+
+def test_keep_fresh_protects_working_dirs():
+    previous = storage.TEMP_MAX_AGE_SECONDS
+    storage.TEMP_MAX_AGE_SECONDS = 0.4
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            old = time.time() - 3600
+            os.utime(folder, (old, old))
+            fresh = keep_fresh(folder)
+            time.sleep(0.3)
+            fresh.set()
+            assert os.path.getmtime(folder) > time.time() - 1
+    finally:
+        storage.TEMP_MAX_AGE_SECONDS = previous
+
+
+def test_record_access_batches_writes():
+    written = []
+    previous = storage.record_song_accesses
+    storage.record_song_accesses = lambda accesses: written.append(dict(accesses))
+    try:
+        storage.flush_access()
+        written.clear()
+        song = os.path.join(MUSIC_DIR, "A", "Song.mp3").replace('\\', '/')
+        other = os.path.join(MUSIC_DIR, "B", "Other.mp3").replace('\\', '/')
+        storage.record_access(os.path.join(MUSIC_DIR, "A", "Song", "drums.mp3"))
+        storage.record_access(song)
+        storage.record_access(other)
+        # Se acaba de guardar: se acumulan hasta el siguiente intervalo
+        assert written == []
+        storage.flush_access()
+        assert len(written) == 1 and sorted(written[0]) == [song, other]
+    finally:
+        storage.record_song_accesses = previous
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
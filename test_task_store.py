@@ -0,0 +1,210 @@
+"""
+Pruebas del almacén de tareas SQLite: toma de trabajos y recuperación de
+tareas huérfanas
+
+Uso::
+    
+    python test_task_store.py
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from src.config import MAX_RESUMES, RESUME_INTERRUPTED, TASK_HEARTBEAT_TIMEOUT
+from src.task_store import MemoryTaskStore, SQLiteTaskStore, host_id, instance_id
+
+
+@contextmanager
+def _store() -> Iterator[SQLiteTaskStore]:
+    with tempfile.TemporaryDirectory() as folder:
+        store = SQLiteTaskStore(os.path.join(folder, "tasks.db"))
+        try:
+            yield store
+        finally:
+            store._connection().close()
+            store._local.conn = None
+
+
+def _set_owner(store: SQLiteTaskStore, task_id: str, pid: int, owner: str, heartbeat_at: float, host: str = None):
+    """Simular que la tarea es de otro proceso con ese latido (en esta máquina salvo ``host``)"""
+    with sqlite3.connect(store.db_path) as conn:
+        conn.execute(
+            "UPDATE tasks SET owner_pid = ?, owner_instance = ? WHERE task_id = ?",
+            (pid, owner, task_id),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO instances (instance_id, pid, host, heartbeat_at) VALUES (?, ?, ?, ?)",
+            (owner, pid, host or host_id(), heartbeat_at),
+        )
+
+
+def test_claim_next():
+    with _store() as store:
+        assert store.claim_next() is None
+        store.create("old", "separate", status="queued", job={})
+        time.sleep(0.01)
+        store.create("new", "separate", status="queued", job={})
+        store.create("dl", "download", status="queued", job={})
+        
+        task = store.claim_next(["separate"])
+        assert task["task_id"] == "old" and task["status"] == "processing"
+        assert store.get("old")["status"] == "processing"
+        assert store.claim_next(["separate"])["task_id"] == "new"
+        assert store.claim_next(["separate"]) is None
+        assert store.claim_next(["download"])["task_id"] == "dl"
+
+
+def test_claim_next_only_preempted_left():
+    with _store() as store:
+        store.create("a", "separate", status="queued", job={}, preempted_by="b")
+        store.create("b", "separate", status="queued", job={}, preempted_by="a")
+        assert store.claim_next() is None
+
+
+def test_claim_next_idle_skips_write_lock():
+    with _store() as store:
+        store.create("dl", "download", status="queued", job={})
+        # Otro proceso escribiendo: un worker sin trabajo de su tipo no espera
+        writer = sqlite3.connect(store.db_path, timeout=0)
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.monotonic()
+            assert store.claim_next(["separate"]) is None
+            assert time.monotonic() - started < 1
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+        assert store.claim_next(["download"])["task_id"] == "dl"
+
+
+def test_count_tasks():
+    with _store() as store:
+        store.create("a", "separate", status="queued", job={}, priority="batch")
+        store.create("b", "separate", status="queued", job={}, priority="interactive")
+        store.create("c", "separate", status="queued", job={})
+        store.create("d", "download", status="downloading", job={})
+        store.create("e", "separate", status="completed")
+        assert store.count_tasks(statuses=["queued"], task_type="separate", group_by="priority") == {
+            "batch": 1, "interactive": 1, None: 1
+        }
+        assert store.count_tasks(statuses=["running", "queued"], group_by="type") == {"separate": 3, "download": 1}
+        assert store.count_tasks() == {"queued": 3, "downloading": 1, "completed": 1}
+
+
+def _check_listing(store):
+    store.create("q1", "separate", status="queued")
+    for task_id, task_type, status, wait in (
+        ("d1", "download", "downloading", 10),
+        ("p1", "separate", "processing", 20),
+        ("c1", "separate", "completed", 5),
+    ):
+        created = store.create(task_id, task_type, status=status)
+        store.update(task_id, started_at=created["created_at"] + wait)
+    store.update("q1", progress=0)
+    
+    assert {task["task_id"] for task in store.list_tasks(ids=["q1", "c1", "missing"])} == {"q1", "c1"}
+    assert {task["task_id"] for task in store.list_tasks(statuses=["running"])} == {"d1", "p1"}
+    assert [task["task_id"] for task in store.list_tasks(statuses=["running", "queued"], task_type="separate")] == ["q1", "p1"]
+    assert [task["task_id"] for task in store.list_tasks(since=store.get("q1")["updated_at"])] == ["q1"]
+    # De la más reciente a la más antigua
+    assert [task["task_id"] for task in store.list_tasks(limit=2)] == ["q1", "c1"]
+    
+    stats = store.queue_stats()
+    assert stats["running"] == 2 and stats["queued"] == 1
+    assert stats["by_status"] == {"queued": 1, "downloading": 1, "processing": 1, "completed": 1}
+    assert abs(stats["avg_wait_seconds"] - (10 + 20 + 5) / 3) < 0.1
+    assert abs(stats["max_wait_seconds"] - 20) < 0.1
+
+
+def test_list_tasks_and_queue_stats():
+    with _store() as store:
+        _check_listing(store)
+    _check_listing(MemoryTaskStore())
+
+
+def test_create_unique():
+    with _store() as store:
+        first, created = store.create_unique("t1", "download", {"video_id": "v"}, status="queued", job={"video_id": "v"})
+        assert created
+        again, created = store.create_unique("t2", "download", {"video_id": "v"}, status="queued", job={"video_id": "v"})
+        assert not created and again["task_id"] == "t1"
+        store.update("t1", status="completed")
+        _, created = store.create_unique("t3", "download", {"video_id": "v"}, status="queued", job={"video_id": "v"})
+        assert created
+
+
+def test_recover_keeps_own_and_live_tasks():
+    with _store() as store:
+        store.create("mine", "separate", status="queued", job={})
+        store.claim_next()
+        store.create("peer", "separate", status="processing", job={})
+        # Proceso vivo (el padre) que ha latido hace poco
+        _set_owner(store, "peer", os.getppid(), "peer-instance", time.time())
+        assert store.recover_interrupted() == 0
+        assert store.get("mine")["status"] == "processing"
+        assert store.get("peer")["status"] == "processing"
+
+
+def test_recover_dead_owners():
+    with _store() as store:
+        store.create("job", "separate", status="processing", job={})
+        store.create("plain", "separate", status="processing")
+        store.create("cancel", "separate", status="processing", job={}, cancel_requested=True)
+        store.create("same_pid", "separate", status="processing", job={})
+        stale = time.time() - TASK_HEARTBEAT_TIMEOUT - 1
+        for task_id in ("job", "plain", "cancel"):
+            _set_owner(store, task_id, os.getppid(), f"{task_id}-instance", stale)
+        # Mismo PID que este proceso pero otro arranque (PID reciclado)
+        _set_owner(store, "same_pid", os.getpid(), "old-boot", time.time())
+        
+        assert store.recover_interrupted() == 4
+        expected = "queued" if RESUME_INTERRUPTED and MAX_RESUMES > 0 else "interrupted"
+        assert store.get("job")["status"] == expected
+        assert store.get("same_pid")["status"] == expected
+        assert store.get("plain")["status"] == "interrupted"
+        assert store.get("cancel")["status"] == "cancelled"
+
+
+def test_recover_keeps_live_peer_with_same_pid_elsewhere():
+    # Dos contenedores con data/ compartido, ambos con el mismo PID
+    with _store() as store:
+        store.create("peer", "separate", status="processing", job={})
+        _set_owner(store, "peer", os.getpid(), "other-container", time.time(), host="otro/pid:[1]")
+        assert store.recover_interrupted() == 0
+        assert store.get("peer")["status"] == "processing"
+        
+        # Deja de latir: muerto aunque sea de otra máquina
+        _set_owner(store, "peer", os.getpid(), "other-container", time.time() - TASK_HEARTBEAT_TIMEOUT - 1, host="otro/pid:[1]")
+        assert store.recover_interrupted() == 1
+
+
+def test_heartbeat():
+    with _store() as store:
+        store.heartbeat()
+        with sqlite3.connect(store.db_path) as conn:
+            row = conn.execute(
+                "SELECT pid, host, heartbeat_at FROM instances WHERE instance_id = ?", (instance_id(),)
+            ).fetchone()
+        assert row[0] == os.getpid() and row[1] == host_id() and time.time() - row[2] < 5
+
+
+def test_finish_stopped():
+    with _store() as store:
+        store.create("t", "separate", status="processing", job={}, preempt_requested="i")
+        task = store.finish_stopped("t", "preempted")
+        assert task["status"] == "queued" and task["preempted_by"] == "i" and task["preemptions"] == 1
+        # Cancelada mientras se detenía: no vuelve a la cola
+        store.update("t", status="processing", cancel_requested=True)
+        assert store.finish_stopped("t", "preempted")["status"] == "cancelled"
+        # Ya terminada: no se toca
+        assert store.finish_stopped("t", "cancelled") is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,68 @@
+"""
+Pruebas del filtro del stream de progreso de tareas (/api/tasks/stream)
+
+Uso::
+    
+    python test_task_stream.py
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List
+
+from src.jobs import stream_filter
+from src.task_store import SQLiteTaskStore
+
+
+@contextmanager
+def _store() -> Iterator[SQLiteTaskStore]:
+    with tempfile.TemporaryDirectory() as folder:
+        store = SQLiteTaskStore(os.path.join(folder, "tasks.db"))
+        try:
+            yield store
+        finally:
+            store._connection().close()
+            store._local.conn = None
+
+
+def _streamed(store: SQLiteTaskStore, cursor: int, wanted) -> List[str]:
+    """IDs de los cambios que se enviarían a partir de ``cursor``"""
+    _, changed = store.changes_since(cursor)
+    return sorted(task["task_id"] for task in filter(wanted, changed))
+
+
+def test_ids_filter_every_change():
+    with _store() as store:
+        store.create("mine", "separate", status="queued")
+        store.create("other", "separate", status="queued")
+        cursor = store.current_cursor()
+        store.update("mine", progress=10)
+        store.update("other", progress=10)
+        assert _streamed(store, cursor, stream_filter(["mine"], None)) == ["mine"]
+
+
+def test_internal_types_hidden_by_default():
+    with _store() as store:
+        cursor = store.current_cursor()
+        store.create("song", "separate", status="queued")
+        store.create("zip", "artifacts", status="queued")
+        assert _streamed(store, cursor, stream_filter(None, None)) == ["song"]
+        # Pedidas por ID o por tipo sí se envían
+        assert _streamed(store, cursor, stream_filter(["zip"], None)) == ["zip"]
+        assert _streamed(store, cursor, stream_filter(None, ["artifacts"])) == ["zip"]
+
+
+def test_type_filter():
+    with _store() as store:
+        cursor = store.current_cursor()
+        store.create("song", "separate", status="queued")
+        store.create("dl", "download", status="queued")
+        assert _streamed(store, cursor, stream_filter(None, ["download"])) == ["dl"]
+        assert _streamed(store, cursor, stream_filter(["song", "dl"], ["download"])) == ["dl"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")